@@ -0,0 +1,400 @@
+# app/archive.py
+"""
+Archiwum opinii w kroku k4 - zimny magazyn plików i osobny indeks treści.
+
+Opinie w archiwum (k4) są rzadko otwierane, a ich pliki, teksty i wpisy
+indeksów spowalniają listy i wyszukiwanie bieżących opinii. Archiwizacja
+opinii (wraz z dokumentami i wynikami OCR):
+- kompresuje pliki do ARCHIVE_DIR (zstd, bez biblioteki zstandard - gzip)
+  z zachowaniem czasu modyfikacji, a oryginały usuwa z FILES_DIR (plik
+  wspólny z dokumentem spoza archiwum - app/blobs.py - pozostaje),
+- przenosi teksty z magazynu tekstów (app/text_store.py) do ARCHIVE_DIR/text,
+- przenosi treść z indeksu pełnotekstowego do indeksu archiwum (archive_fts),
+- oznacza dokumenty kolumną archived_at.
+
+Dokumenty w archiwum są domyślnie pomijane przez listy, wyszukiwanie
+i podpowiedzi - wyszukiwanie obejmuje je po zaznaczeniu "W tym archiwum"
+(parametr include_archive). Pobranie pliku dekompresuje go w locie.
+
+Przywrócenie odwraca archiwizację: następuje samo przy zmianie kroku opinii
+na k1-k3 oraz przed operacjami wymagającymi pliku (podgląd, OCR, edycja,
+nowe dokumenty). Czas modyfikacji plików jest odtwarzany, więc teksty
+w magazynie tekstów pozostają aktualne i nie są wyodrębniane ponownie.
+Osadzenia (app/semantic_index.py) nie są przenoszone - archiwum jest pomijane
+przez filtry list, a nie przez indeks wektorowy.
+
+Archiwizacja opinii k4 bez zmian od ARCHIVE_AFTER_DAYS dni (np. z crona):
+    python -m app.archive
+    python -m app.archive --opinion 123        # wybrana opinia (krok k4)
+    python -m app.archive --restore 123        # przywrócenie opinii
+    python -m app.archive --dry-run            # tylko lista opinii do archiwizacji
+"""
+
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from sqlmodel import Session, select
+
+from app.db import BASE_DIR, FILES_DIR, engine, raw_connection
+from app.models import Document
+from app.text_store import TEXT_STORE_DIR
+
+logger = logging.getLogger("archive")
+
+# Kompresja zstd (opcjonalna biblioteka zstandard), w przeciwnym razie gzip
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", str(BASE_DIR / "archive")))
+ARCHIVE_TEXT_DIR = ARCHIVE_DIR / "text"
+
+ARCHIVE_STEP = "k4"
+ACTIVE_STEPS = ("k1", "k2", "k3")
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))    # Opinia k4 bez zmian od tylu dni
+ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+GZIP_LEVEL = 6
+COPY_BUFFER = 1024 * 1024
+
+ZSTD_SUFFIX, GZIP_SUFFIX = ".zst", ".gz"
+ARCHIVE_SUFFIX = ZSTD_SUFFIX if HAS_ZSTD else GZIP_SUFFIX
+
+
+class ArchiveError(Exception):
+    """Opinii nie można zarchiwizować ani przywrócić."""
+
+
+@dataclass
+class ArchiveResult:
+    opinion_id: int
+    doc_count: int          # Dokumenty opinii (z wynikami OCR)
+    file_count: int         # Przeniesione pliki
+    bytes_before: int = 0   # Rozmiar plików przed kompresją
+    bytes_after: int = 0    # Rozmiar plików w archiwum
+
+
+# ==================== PLIKI ====================
+
+def archived_path(stored_filename: str) -> Optional[Path]:
+    """Plik dokumentu w archiwum (zstd lub gzip) - None, gdy go nie ma."""
+    for suffix in (ZSTD_SUFFIX, GZIP_SUFFIX):
+        path = ARCHIVE_DIR / f"{stored_filename}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def _compress(source: Path, target: Path):
+    """Kompresuje plik (atomowo) z zachowaniem czasu modyfikacji oryginału."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f"{target.name}.tmp")
+    try:
+        with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+            if target.suffix == ZSTD_SUFFIX:
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst, read_size=COPY_BUFFER)
+            else:
+                with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=GZIP_LEVEL) as packed:
+                    shutil.copyfileobj(src, packed, COPY_BUFFER)
+        shutil.copystat(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def open_archived(path: Path):
+    """Strumień binarny zdekompresowanej zawartości pliku z archiwum."""
+    if path.suffix == ZSTD_SUFFIX:
+        if not HAS_ZSTD:
+            raise ArchiveError(f"Plik {path.name} wymaga biblioteki zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return gzip.open(path, "rb")
+
+
+def iter_archived(path: Path) -> Iterator[bytes]:
+    """Zawartość pliku z archiwum w blokach (pobieranie bez przywracania opinii)."""
+    with open_archived(path) as stream:
+        while chunk := stream.read(COPY_BUFFER):
+            yield chunk
+
+
+def _decompress(source: Path, target: Path):
+    """Odtwarza plik z archiwum (atomowo) z czasem modyfikacji sprzed archiwizacji."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f"{target.name}.tmp")
+    try:
+        with open_archived(source) as src, open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER)
+        stat = source.stat()
+        os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmp_path, target)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _move_texts(doc_ids: List[int], source_dir: Path, target_dir: Path):
+    """Przenosi pliki magazynu tekstów dokumentów (nazwa = wersja tekstu, bez zmian)."""
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for doc_id in doc_ids:
+        for path in source_dir.glob(f"{doc_id}-*.txt.gz"):
+            shutil.move(str(path), str(target_dir / path.name))
+
+
+# ==================== OPINIE ====================
+
+def opinion_id_of(session: Session, doc: Document) -> Optional[int]:
+    """Opinia dokumentu: sama opinia, opinia nadrzędna albo opinia dokumentu źródłowego OCR."""
+    if doc.is_main:
+        return doc.id
+    if doc.parent_id is not None:
+        return doc.parent_id
+    if doc.ocr_parent_id is not None:
+        source = session.get(Document, doc.ocr_parent_id)
+        return opinion_id_of(session, source) if source is not None else None
+    return None
+
+
+def _opinion_documents(session: Session, opinion_id: int) -> List[Document]:
+    """Opinia, jej dokumenty i ich wyniki OCR (dokumenty OCR TXT nie mają parent_id)."""
+    docs = list(session.exec(
+        select(Document).where((Document.id == opinion_id) | (Document.parent_id == opinion_id))
+    ))
+    doc_ids = {doc.id for doc in docs}
+    ocr_docs = session.exec(
+        select(Document).where(Document.ocr_parent_id.in_(doc_ids), Document.id.notin_(doc_ids))
+    ).all()
+    return docs + list(ocr_docs)
+
+
+def _stored_files(docs: List[Document]) -> List[str]:
+    return sorted({doc.stored_filename for doc in docs if not doc.stored_filename.endswith(".empty")})
+
+
+def archive_opinion(opinion_id: int) -> ArchiveResult:
+    """
+    Przenosi opinię w kroku k4 do archiwum.
+
+    Kolejność chroni przed utratą danych przy przerwaniu: najpierw kopie plików
+    w archiwum, potem jedna transakcja (oznaczenie dokumentów i przeniesienie
+    treści między indeksami), na końcu usunięcie oryginałów.
+
+    Raises:
+        ArchiveError: brak opinii, inny krok niż k4, OCR w toku
+    """
+    from app.blobs import remove_hot_file
+    from app.search_index import move_to_archive_index
+
+    with Session(engine) as session:
+        opinion = session.get(Document, opinion_id)
+        if opinion is None or not opinion.is_main:
+            raise ArchiveError(f"Nie znaleziono opinii {opinion_id}")
+        if opinion.step != ARCHIVE_STEP:
+            raise ArchiveError(f"Opinia {opinion_id} nie jest w kroku {ARCHIVE_STEP}")
+        if opinion.archived_at is not None:
+            raise ArchiveError(f"Opinia {opinion_id} jest już w archiwum")
+        docs = _opinion_documents(session, opinion_id)
+        if any(doc.ocr_status in ("pending", "running") for doc in docs):
+            raise ArchiveError(f"Opinia {opinion_id} ma dokumenty w kolejce OCR")
+
+    doc_ids = [doc.id for doc in docs]
+    result = ArchiveResult(opinion_id, len(docs), 0)
+    moved = []
+    for stored_filename in _stored_files(docs):
+        source = FILES_DIR / stored_filename
+        # Wspólny plik magazynu (app/blobs.py) mógł trafić do archiwum z inną opinią
+        target = archived_path(stored_filename)
+        if target is None:
+            if not source.exists():
+                continue
+            target = ARCHIVE_DIR / f"{stored_filename}{ARCHIVE_SUFFIX}"
+            _compress(source, target)
+        moved.append(stored_filename)
+        if source.exists():
+            result.bytes_before += source.stat().st_size
+        result.bytes_after += target.stat().st_size
+
+    placeholders = ",".join("?" * len(doc_ids))
+    with raw_connection() as conn:
+        conn.execute(f"UPDATE document SET archived_at = ? WHERE id IN ({placeholders})",
+                     (datetime.now().isoformat(sep=" "), *doc_ids))
+        move_to_archive_index(conn, doc_ids)
+
+    # Plik wspólny z dokumentem spoza archiwum zostaje w FILES_DIR
+    for stored_filename in moved:
+        remove_hot_file(stored_filename)
+    _move_texts(doc_ids, TEXT_STORE_DIR, ARCHIVE_TEXT_DIR)
+
+    result.file_count = len(moved)
+    logger.info(f"🗄️ [ARCHIVE] Opinia {opinion_id}: {result.doc_count} dokumentów, {result.file_count} plików, "
+                f"{result.bytes_before / 1024 / 1024:.1f} MB -> {result.bytes_after / 1024 / 1024:.1f} MB")
+    return result
+
+
+def restore_opinion(opinion_id: int) -> ArchiveResult:
+    """
+    Przywraca opinię z archiwum: pliki, teksty i treść w indeksie pełnotekstowym.
+    Opinia spoza archiwum - bez zmian.
+
+    Raises:
+        ArchiveError: brak opinii albo pliku w archiwum
+    """
+    from app.search_index import restore_from_archive_index
+
+    with Session(engine) as session:
+        opinion = session.get(Document, opinion_id)
+        if opinion is None or not opinion.is_main:
+            raise ArchiveError(f"Nie znaleziono opinii {opinion_id}")
+        docs = [doc for doc in _opinion_documents(session, opinion_id) if doc.archived_at is not None]
+
+    result = ArchiveResult(opinion_id, len(docs), 0)
+    if not docs:
+        return result
+
+    doc_ids = [doc.id for doc in docs]
+    restored = []
+    for stored_filename in _stored_files(docs):
+        target = FILES_DIR / stored_filename
+        source = archived_path(stored_filename)
+        if source is None:
+            if target.exists():
+                continue        # Archiwizacja przerwana przed usunięciem oryginału
+            raise ArchiveError(f"Brak pliku {stored_filename} w archiwum")
+        if not target.exists():
+            _decompress(source, target)
+        restored.append((stored_filename, source))
+        result.bytes_after += source.stat().st_size
+        result.bytes_before += target.stat().st_size
+    _move_texts(doc_ids, ARCHIVE_TEXT_DIR, TEXT_STORE_DIR)
+
+    placeholders = ",".join("?" * len(doc_ids))
+    with raw_connection() as conn:
+        restore_from_archive_index(conn, doc_ids)
+        conn.execute(f"UPDATE document SET archived_at = NULL WHERE id IN ({placeholders})", doc_ids)
+
+        # Kopia w archiwum zostaje dla dokumentów innych opinii w archiwum (wspólne pliki)
+        shared = {stored_filename for stored_filename, _ in restored if conn.execute(
+            "SELECT 1 FROM document WHERE stored_filename = ? AND archived_at IS NOT NULL LIMIT 1",
+            (stored_filename,)
+        ).fetchone() is not None}
+
+    for stored_filename, source in restored:
+        if stored_filename not in shared:
+            source.unlink(missing_ok=True)
+
+    result.file_count = len(restored)
+    logger.info(f"🗄️ [ARCHIVE] Przywrócono opinię {opinion_id}: {result.doc_count} dokumentów, "
+                f"{result.file_count} plików")
+    return result
+
+
+def ensure_restored(doc: Optional[Document]):
+    """
+    Przywraca z archiwum opinię dokumentu przed operacją wymagającą pliku w FILES_DIR
+    (podgląd, OCR, edycja, nowe dokumenty). Zmienia stan `doc` na przywrócony.
+    """
+    if doc is None or doc.archived_at is None:
+        return
+    with Session(engine) as session:
+        opinion_id = opinion_id_of(session, doc)
+    if opinion_id is not None:
+        restore_opinion(opinion_id)
+    doc.archived_at = None
+
+
+def restore_if_active(doc_id: int, step: str):
+    """Przywraca opinię dokumentu z archiwum, gdy krok zmienia się na aktywny (k1-k3)."""
+    if step not in ACTIVE_STEPS:
+        return
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        if doc is None or doc.archived_at is None:
+            return
+    ensure_restored(doc)
+
+
+def archive_candidates(session: Session, older_than_days: int = ARCHIVE_AFTER_DAYS) -> List[int]:
+    """Opinie k4 spoza archiwum bez zmian (opinii i jej dokumentów) od `older_than_days` dni."""
+    from app.models import OpinionStats
+
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    query = (select(Document.id, Document.upload_time, Document.last_modified, OpinionStats.last_activity)
+             .outerjoin(OpinionStats, OpinionStats.opinion_id == Document.id)
+             .where(Document.is_main == True, Document.step == ARCHIVE_STEP,  # noqa: E712
+                    Document.archived_at == None)  # noqa: E711
+             .order_by(Document.id))
+    candidates = []
+    for opinion_id, *timestamps in session.exec(query):
+        latest = max((value for value in timestamps if value is not None), default=None)
+        if latest is None or latest <= cutoff:
+            candidates.append(opinion_id)
+    return candidates
+
+
+def archive_stale_opinions(older_than_days: int = ARCHIVE_AFTER_DAYS, dry_run: bool = False) -> List[ArchiveResult]:
+    """Archiwizuje opinie k4 bez zmian od `older_than_days` dni."""
+    with Session(engine) as session:
+        candidates = archive_candidates(session, older_than_days)
+
+    results = []
+    for opinion_id in candidates:
+        if dry_run:
+            results.append(ArchiveResult(opinion_id, 0, 0))
+            continue
+        try:
+            results.append(archive_opinion(opinion_id))
+        except ArchiveError as e:
+            logger.warning(f"🗄️ [ARCHIVE] {e}")
+    return results
+
+
+# ==================== CLI ====================
+
+def main(argv=None) -> int:
+    from app.db import init_db
+
+    parser = argparse.ArgumentParser(description="Archiwum opinii w kroku k4 (zimny magazyn plików)")
+    parser.add_argument("--opinion", type=int, help="archiwizuj wybraną opinię")
+    parser.add_argument("--restore", type=int, help="przywróć opinię z archiwum")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f"opinie k4 bez zmian od tylu dni (domyślnie {ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--dry-run", action="store_true", help="tylko wypisz opinie do archiwizacji")
+    args = parser.parse_args(argv)
+
+    init_db()
+    try:
+        if args.restore is not None:
+            result = restore_opinion(args.restore)
+            print(f"Przywrócono opinię {result.opinion_id}: {result.doc_count} dokumentów, {result.file_count} plików")
+            return 0
+        if args.opinion is not None:
+            results = [archive_opinion(args.opinion)]
+        else:
+            results = archive_stale_opinions(args.days, args.dry_run)
+    except ArchiveError as e:
+        print(f"Błąd: {e}", file=sys.stderr)
+        return 1
+
+    for result in results:
+        if args.dry_run:
+            print(f"Opinia {result.opinion_id}")
+        else:
+            print(f"Opinia {result.opinion_id}: {result.doc_count} dokumentów, {result.file_count} plików, "
+                  f"{result.bytes_before / 1024 / 1024:.1f} MB -> {result.bytes_after / 1024 / 1024:.1f} MB")
+    print(f"Kodek: {'zstd' if HAS_ZSTD else 'gzip (brak biblioteki zstandard)'}, opinii: {len(results)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,8 +20,33 @@ os.environ['TORCH_USE_CUDA_DSA'] = '1'
 
 import asyncio
 import logging
-from typing import Dict, List, Set
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Set, Optional, Tuple
 from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from tasks.ocr.config import (
+    WATCHDOG_TIMEOUT_SECONDS,
+    WATCHDOG_SECONDS_PER_PAGE,
+    WATCHDOG_INTERVAL_SECONDS,
+    OCR_MAX_WORKERS,
+    WORKER_MAX_JOBS,
+    WORKER_MAX_RSS_MB,
+    WORKER_MAX_GPU_MB,
+    OCR_MAX_ATTEMPTS,
+    OCR_BATCH_MAX_DOCS,
+    OCR_BATCH_SMALL_DOC_PAGES,
+)
+
+# psutil jest opcjonalny - bez niego supervisor nie sprawdza RSS procesów
+try:
+    import psutil
+
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
 
 # Konfiguracja logowania
 logging.basicConfig(level=logging.INFO)
@@ -38,14 +63,54 @@ active_tasks: Dict[str, Set[int]] = {
     "ocr": set(),
 }
 
-# ✅ NOWE: Process Pool dla OCR
-ocr_executor = None
+# Zadania OCR przekazane do procesu:
+# doc_id -> {"future", "cancel_event", "started_at", "time_limit", "requeue_reason", "batch", "slot", "executor"}
+# Dokumenty z jednego zadania batchowego dzielą future i listę "batch"
+running_jobs: Dict[int, dict] = {}
+
+# Dokumenty pobrane z kolejki przy składaniu batcha, ale do niego niepasujące -
+# dispatcher uruchamia je przed kolejnymi pozycjami z kolejki
+_held_back: deque = deque()
+
+# Liczba prób OCR przerwanych przez watchdog (doc_id -> próby)
+ocr_attempts: Dict[int, int] = {}
+
+# Ostatnie zużycie pamięci raportowane przez procesy OCR (pid -> statystyki)
+worker_stats: Dict[int, dict] = {}
+
+# ✅ NOWE: Process Pool dla OCR - osobny jednoprocesowy executor na każdy slot puli.
+# Ubicie zawieszonego procesu psuje tylko executor jego slotu (slot -> executor),
+# który jest zastępowany nowym - zadania w pozostałych slotach pracują dalej
+ocr_slots: Dict[int, ProcessPoolExecutor] = {}
+
+# PID procesu wykonującego zadanie, zgłaszany przez proces na starcie
+# (proxy dict z multiprocessing.Manager, klucz: pierwszy doc_id zadania)
+_job_pids = None
 
+# Kolejka zdarzeń postępu z procesów OCR (proxy z multiprocessing.Manager) i wątek ją opróżniający
+ocr_event_queue = None
+_event_pump_stop = threading.Event()
 
-def get_ocr_executor():
-    """Lazy initialization of ProcessPoolExecutor."""
-    global ocr_executor
-    if ocr_executor is None:
+# Ustawiane przez supervisor - nowe zadania czekają, aż pula zostanie odnowiona
+_recycle_requested: Optional[str] = None
+
+# Manager multiprocessing - dostarcza Event-y współdzielone z procesami OCR
+_mp_manager = None
+
+
+def get_mp_manager():
+    """Lazy initialization of multiprocessing Manager (spawn-safe Event proxies)."""
+    global _mp_manager
+    if _mp_manager is None:
+        _mp_manager = mp.Manager()
+        logger.info("✅ [BACKGROUND] Utworzono multiprocessing Manager dla sygnałów anulowania")
+    return _mp_manager
+
+
+def get_ocr_executor(slot: int) -> ProcessPoolExecutor:
+    """Lazy initialization of ProcessPoolExecutor slotu puli OCR."""
+    executor = ocr_slots.get(slot)
+    if executor is None:
         # Sprawdź aktualną metodę multiprocessing
         current_method = mp.get_start_method()
         logger.info(f"🔧 [BACKGROUND] Multiprocessing method: {current_method}")
@@ -54,12 +119,26 @@ def get_ocr_executor():
             logger.warning(
                 f"⚠️ [BACKGROUND] UWAGA: Używam '{current_method}' zamiast 'spawn' - może powodować problemy z CUDA")
 
-        # Użyj max 2 procesy dla OCR żeby nie przeciążyć serwera
-        max_workers = min(2, mp.cpu_count())
-        ocr_executor = ProcessPoolExecutor(max_workers=max_workers)
+        # max_tasks_per_child - proces jest zastępowany nowym po N zadaniach
+        executor = ProcessPoolExecutor(max_workers=1, max_tasks_per_child=WORKER_MAX_JOBS)
+        ocr_slots[slot] = executor
         logger.info(
-            f"✅ [BACKGROUND] Utworzono ProcessPoolExecutor dla OCR z {max_workers} procesami (method: {current_method})")
-    return ocr_executor
+            f"✅ [BACKGROUND] Utworzono ProcessPoolExecutor dla slotu OCR {slot + 1}/{get_ocr_max_workers()} "
+            f"(method: {current_method}, recykling co {WORKER_MAX_JOBS} zadań)")
+    return executor
+
+
+def _get_job_pids():
+    """Lazy initialization of współdzielonego słownika PID-ów zadań."""
+    global _job_pids
+    if _job_pids is None:
+        _job_pids = get_mp_manager().dict()
+    return _job_pids
+
+
+def get_ocr_max_workers() -> int:
+    """Zwraca liczbę procesów (slotów) OCR w puli - max 2, żeby nie przeciążyć serwera."""
+    return max(1, min(OCR_MAX_WORKERS, mp.cpu_count()))
 
 
 async def enqueue_ocr_task(doc_id: int):
@@ -87,12 +166,38 @@ def remove_active_task(queue_name: str, task_id: int):
         logger.info(f"Usunięto zadanie {task_id} z aktywnych zadań {queue_name}")
 
 
+def cancel_ocr_task(doc_id: int) -> str:
+    """
+    Anuluje zadanie OCR dla dokumentu.
+
+    Zadanie oczekujące w kolejce jest usuwane z aktywnych (worker je pominie),
+    a uruchomione dostaje sygnał przez współdzielony Event - pipeline przerywa
+    pracę na granicy strony lub tokenu i sprząta częściowe wyniki.
+
+    Returns:
+        str: "running", "queued" lub "not_found"
+    """
+    job = running_jobs.get(doc_id)
+    if job is not None:
+        job["cancel_event"].set()
+        logger.info(f"🛑 Wysłano sygnał anulowania OCR do procesu dla dokumentu {doc_id}")
+        return "running"
+
+    if doc_id in active_tasks["ocr"]:
+        remove_active_task("ocr", doc_id)
+        logger.info(f"🛑 Anulowano oczekujące zadanie OCR dla dokumentu {doc_id}")
+        return "queued"
+
+    return "not_found"
+
+
 # ✅ NOWE: Synchroniczna funkcja OCR dla ProcessPool
-def run_ocr_in_process(doc_id: int) -> dict:
+def run_ocr_in_process(doc_id: int, cancel_event=None, event_queue=None, job_pids=None) -> dict:
     """
     Synchroniczna funkcja OCR uruchamiana w osobnym procesie.
     UWAGA: Ta funkcja nie może używać asyncio ani SQLModel Session!
     """
+    _report_worker_pid(job_pids, doc_id)
     try:
         logger.info(f"🔄 [PROCES] Rozpoczynam OCR dla dokumentu {doc_id}")
 
@@ -104,13 +209,16 @@ def run_ocr_in_process(doc_id: int) -> dict:
         from tasks.ocr.pipeline import process_document_sync
 
         # Wywołaj nową sync wrapper function
-        result = process_document_sync(doc_id)
+        result = process_document_sync(doc_id, cancel_event=cancel_event, event_queue=event_queue)
 
         if result["success"]:
             logger.info(f"✅ [PROCES] OCR zakończony dla dokumentu {doc_id}")
+        elif result.get("cancelled"):
+            logger.info(f"🛑 [PROCES] OCR anulowany dla dokumentu {doc_id}")
         else:
             logger.error(f"❌ [PROCES] OCR failed dla dokumentu {doc_id}: {result.get('error', 'Unknown error')}")
 
+        result["worker"] = _collect_worker_stats()
         return result
 
     except Exception as e:
@@ -124,6 +232,73 @@ def run_ocr_in_process(doc_id: int) -> dict:
         return {"success": False, "error": error_msg, "doc_id": doc_id}
 
 
+def run_ocr_batch_in_process(doc_ids: List[int], cancel_events: Dict[int, object], event_queue=None,
+                             job_pids=None) -> dict:
+    """
+    OCR kilku małych dokumentów w jednym procesie - strony wszystkich dokumentów
+    trafiają do wspólnych batchy modelu (tasks/ocr/scheduler.py).
+    """
+    _report_worker_pid(job_pids, doc_ids[0])
+    try:
+        logger.info(f"🔄 [PROCES] Rozpoczynam batch OCR dla dokumentów {doc_ids}")
+
+        from tasks.ocr.scheduler import process_documents_batch_sync
+
+        result = process_documents_batch_sync(doc_ids, cancel_events=cancel_events, event_queue=event_queue)
+
+        done = sum(1 for r in result["results"].values() if r.get("success"))
+        logger.info(f"✅ [PROCES] Batch OCR zakończony: {done}/{len(doc_ids)} dokumentów")
+
+        result["worker"] = _collect_worker_stats()
+        return result
+
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"❌ [PROCES] Globalny błąd batch OCR dla dokumentów {doc_ids}: {error_msg}")
+
+        import traceback
+        traceback.print_exc()
+
+        return {
+            "success": False,
+            "error": error_msg,
+            "results": {doc_id: {"success": False, "error": error_msg, "doc_id": doc_id} for doc_id in doc_ids},
+        }
+
+
+def _report_worker_pid(job_pids, job_key: int):
+    """Zgłasza PID procesu wykonującego zadanie - supervisor ubija tylko ten proces."""
+    if job_pids is None:
+        return
+    try:
+        job_pids[job_key] = os.getpid()
+    except Exception as e:
+        logger.warning(f"⚠️ [PROCES] Nie można zgłosić PID zadania {job_key}: {e}")
+
+
+def _collect_worker_stats() -> dict:
+    """Zbiera zużycie pamięci bieżącego procesu OCR (wywoływane w procesie worker)."""
+    stats = {"pid": os.getpid(), "rss_mb": None, "gpu_reserved_mb": None}
+
+    try:
+        # /proc/self/statm: rozmiar RSS w stronach pamięci
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        stats["rss_mb"] = rss_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        pass
+
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        try:
+            if torch.cuda.is_available():
+                stats["gpu_reserved_mb"] = torch.cuda.memory_reserved() / (1024 * 1024)
+        except Exception:
+            pass
+
+    return stats
+
+
 # ✅ POPRAWIONY: Asynchroniczny worker OCR
 async def ocr_worker():
     """Worker przetwarzający zadania OCR z kolejki - UŻYWA OSOBNYCH PROCESÓW."""
@@ -131,28 +306,38 @@ async def ocr_worker():
 
     while True:
         try:
-            # Pobierz dokument z kolejki (z krótkim timeoutem)
-            try:
-                doc_id = await asyncio.wait_for(task_queues["ocr"].get(), timeout=0.1)
-            except asyncio.TimeoutError:
-                # Brak zadań w kolejce - oddaj kontrolę do pętli zdarzeń
-                await asyncio.sleep(0.1)
+            # Nie przekazuj zadań do puli, gdy wszystkie procesy są zajęte lub pula
+            # czeka na recykling - czas w kolejce executora nie liczy się do watchdoga
+            if _recycle_requested or _busy_workers() >= get_ocr_max_workers():
+                await asyncio.sleep(0.5)
                 continue
 
-            logger.info(f"📤 Przekazuję dokument {doc_id} do procesu OCR")
-
-            # ✅ URUCHOM OCR W OSOBNYM PROCESIE (nie blokuje event loop!)
-            loop = asyncio.get_event_loop()
-            executor = get_ocr_executor()
-
-            # Uruchom OCR w osobnym procesie asynchronicznie
-            ocr_future = loop.run_in_executor(executor, run_ocr_in_process, doc_id)
-
-            # ✅ NIE CZEKAJ na wynik - uruchom fire-and-forget
-            asyncio.create_task(_handle_ocr_result(ocr_future, doc_id))
-
-            # Oznacz zadanie jako pobrane z kolejki
-            task_queues["ocr"].task_done()
+            # Pobierz dokument z kolejki (z krótkim timeoutem)
+            doc_id = _next_held_back()
+            if doc_id is None:
+                try:
+                    doc_id = await asyncio.wait_for(task_queues["ocr"].get(), timeout=0.1)
+                except asyncio.TimeoutError:
+                    # Brak zadań w kolejce - oddaj kontrolę do pętli zdarzeń
+                    await asyncio.sleep(0.1)
+                    continue
+
+                # Oznacz zadanie jako pobrane z kolejki
+                task_queues["ocr"].task_done()
+
+                # Pomiń zadania anulowane w kolejce lub duplikaty już przekazane do procesu
+                if not _is_dispatchable(doc_id):
+                    logger.info(f"⏭️ Pomijam dokument {doc_id} - zadanie anulowane lub już uruchomione")
+                    continue
+
+            # Małe dokumenty łączymy z kolejnymi małymi dokumentami z kolejki
+            batch = [doc_id]
+            if OCR_BATCH_MAX_DOCS > 1:
+                batch = await _collect_batch(doc_id)
+                if not batch:
+                    continue
+
+            _dispatch_ocr_job(batch)
 
             # Oddaj kontrolę do pętli zdarzeń
             await asyncio.sleep(0)
@@ -162,23 +347,522 @@ async def ocr_worker():
             await asyncio.sleep(1)
 
 
+def _is_dispatchable(doc_id: int) -> bool:
+    return doc_id in active_tasks["ocr"] and doc_id not in running_jobs
+
+
+def _next_held_back() -> Optional[int]:
+    """Zwraca pierwszy odłożony dokument, który nadal czeka na OCR."""
+    while _held_back:
+        doc_id = _held_back.popleft()
+        if _is_dispatchable(doc_id):
+            return doc_id
+    return None
+
+
+def get_ocr_queue_snapshot() -> Dict[str, list]:
+    """
+    Stan kolejki OCR w kolejności obsługi.
+
+    Returns:
+        dict: {"running": [[doc_id, ...] per zadanie w puli], "queued": [doc_id, ...]}
+    """
+    running = []
+    seen_futures = set()
+    for doc_id, job in running_jobs.items():
+        if id(job["future"]) not in seen_futures:
+            seen_futures.add(id(job["future"]))
+            running.append(list(job.get("batch") or [doc_id]))
+
+    queued = []
+    for doc_id in list(_held_back) + list(task_queues["ocr"]._queue):
+        if _is_dispatchable(doc_id) and doc_id not in queued:
+            queued.append(doc_id)
+
+    return {"running": running, "queued": queued}
+
+
+def _busy_slots() -> Set[int]:
+    """Sloty puli z uruchomionym zadaniem (batch kilku dokumentów zajmuje jeden slot)."""
+    return {job["slot"] for job in running_jobs.values()}
+
+
+def _busy_workers() -> int:
+    """Liczba zadań w puli (batch kilku dokumentów zajmuje jeden proces)."""
+    return len(_busy_slots())
+
+
+def _count_pages_from_files(files: Dict[int, Tuple[str, Optional[str]]]) -> Dict[int, Optional[int]]:
+    """Liczby stron z plików dokumentów bez page_count (blokujące - w wątku)."""
+    from app.db import FILES_DIR
+    from tasks.ocr.scheduler import count_document_pages
+
+    pages = {}
+    for doc_id, (stored_filename, mime_type) in files.items():
+        try:
+            pages[doc_id] = count_document_pages(FILES_DIR / stored_filename, mime_type)
+        except Exception as e:
+            logger.warning(f"⚠️ Nie można ustalić liczby stron dokumentu {doc_id}: {e}")
+            pages[doc_id] = None
+    return pages
+
+
+async def _document_page_counts(doc_ids: List[int]) -> Dict[int, Optional[int]]:
+    """
+    Liczby stron dokumentów - page_count z analizy wstępnej (jedno zapytanie).
+    Pliki czytane są tylko dla dokumentów bez page_count, w wątku poza pętlą zdarzeń.
+    """
+    from sqlmodel import Session, select
+    from app.db import engine
+    from app.models import Document
+
+    with Session(engine) as session:
+        rows = session.exec(
+            select(Document.id, Document.page_count, Document.stored_filename, Document.mime_type)
+            .where(Document.id.in_(doc_ids))
+        ).all()
+
+    pages = {doc_id: page_count for doc_id, page_count, _, _ in rows}
+    missing = {doc_id: (stored_filename, mime_type)
+               for doc_id, page_count, stored_filename, mime_type in rows if page_count is None}
+    if missing:
+        pages.update(await asyncio.to_thread(_count_pages_from_files, missing))
+    return pages
+
+
+async def _collect_batch(doc_id: int) -> List[int]:
+    """
+    Łączy mały dokument z kolejnymi małymi dokumentami z kolejki (najwyżej
+    OCR_BATCH_SMALL_DOC_PAGES stron) we wspólny batch. Duży dokument i dokumenty
+    po nim wracają na początek kolejki (odłożone) i są uruchamiane jako następne.
+    """
+    candidates = []
+    while len(candidates) < OCR_BATCH_MAX_DOCS - 1 and not task_queues["ocr"].empty():
+        candidate = task_queues["ocr"].get_nowait()
+        task_queues["ocr"].task_done()
+        if _is_dispatchable(candidate) and candidate != doc_id and candidate not in candidates:
+            candidates.append(candidate)
+
+    pages = await _document_page_counts([doc_id, *candidates])
+
+    def is_small(candidate: int) -> bool:
+        count = pages.get(candidate)
+        return count is not None and count <= OCR_BATCH_SMALL_DOC_PAGES
+
+    batch = [doc_id]
+    if not is_small(doc_id):
+        _held_back.extend(candidates)
+    else:
+        for position, candidate in enumerate(candidates):
+            if not is_small(candidate):
+                _held_back.extend(candidates[position:])
+                break
+            batch.append(candidate)
+
+    # Anulowanie w trakcie ustalania liczby stron
+    return [candidate for candidate in batch if _is_dispatchable(candidate)]
+
+
+def _dispatch_ocr_job(doc_ids: List[int]):
+    """Przekazuje dokument (lub batch małych dokumentów) do procesu OCR."""
+    loop = asyncio.get_event_loop()
+    busy = _busy_slots()
+    slot = next(slot for slot in range(get_ocr_max_workers()) if slot not in busy)
+    executor = get_ocr_executor(slot)
+    cancel_events = {doc_id: get_mp_manager().Event() for doc_id in doc_ids}
+    job_pids = _get_job_pids()
+
+    # ✅ URUCHOM OCR W OSOBNYM PROCESIE (nie blokuje event loop!)
+    if len(doc_ids) == 1:
+        logger.info(f"📤 Przekazuję dokument {doc_ids[0]} do procesu OCR (slot {slot})")
+        ocr_future = loop.run_in_executor(executor, run_ocr_in_process, doc_ids[0], cancel_events[doc_ids[0]],
+                                          ocr_event_queue, job_pids)
+    else:
+        logger.info(f"📤 Przekazuję batch dokumentów {doc_ids} do procesu OCR (slot {slot})")
+        ocr_future = loop.run_in_executor(executor, run_ocr_batch_in_process, doc_ids, cancel_events,
+                                          ocr_event_queue, job_pids)
+
+    # Limit watchdoga liczony raz przy przekazaniu - nie przy każdym sprawdzeniu
+    time_limit = _job_time_limit(doc_ids)
+    started_at = time.monotonic()
+    for doc_id in doc_ids:
+        running_jobs[doc_id] = {
+            "future": ocr_future,
+            "cancel_event": cancel_events[doc_id],
+            "started_at": started_at,
+            "time_limit": time_limit,
+            "requeue_reason": None,
+            "batch": doc_ids,
+            "slot": slot,
+            "executor": executor,
+        }
+
+    # ✅ NIE CZEKAJ na wynik - uruchom fire-and-forget
+    asyncio.create_task(_handle_ocr_result(ocr_future, doc_ids))
+
+
 # ✅ NOWE: Handler dla rezultatu OCR
-async def _handle_ocr_result(ocr_future, doc_id: int):
-    """Obsługuje wynik OCR z osobnego procesu."""
+async def _handle_ocr_result(ocr_future, doc_ids: List[int]):
+    """Obsługuje wynik OCR (pojedynczy dokument lub batch) z osobnego procesu."""
+    jobs = {doc_id: running_jobs.get(doc_id) or {} for doc_id in doc_ids}
     try:
         # Czekaj na wynik z procesu
         result = await ocr_future
 
-        if result["success"]:
-            logger.info(f"✅ OCR sukces dla dokumentu {doc_id}")
-        else:
-            logger.error(f"❌ OCR błąd dla dokumentu {doc_id}: {result.get('error', 'Nieznany błąd')}")
-
+        _record_worker_stats(result.get("worker"))
+
+        # Wynik batcha zawiera wyniki per dokument
+        doc_results = result.get("results") or {doc_ids[0]: result}
+
+        # Pomiar czasu zadania dla modelu ETA (tylko udane dokumenty)
+        succeeded = [doc_id for doc_id in doc_ids if doc_results.get(doc_id, {}).get("success")]
+        started_at = jobs[doc_ids[0]].get("started_at")
+        if started_at and len(succeeded) == len(doc_ids):
+            from app.ocr_estimator import record_ocr_timing
+            await asyncio.to_thread(record_ocr_timing, succeeded, time.monotonic() - started_at)
+
+        for doc_id in doc_ids:
+            doc_result = doc_results.get(doc_id, {})
+            if doc_result.get("success"):
+                logger.info(f"✅ OCR sukces dla dokumentu {doc_id}")
+            elif doc_result.get("cancelled"):
+                logger.info(f"🛑 OCR anulowany dla dokumentu {doc_id}")
+            else:
+                logger.error(f"❌ OCR błąd dla dokumentu {doc_id}: {doc_result.get('error', 'Nieznany błąd')}")
+
+    except BrokenProcessPool as e:
+        # Proces slotu zakończył się w trakcie zadania (ubity przez supervisor lub awaria) -
+        # executor slotu jest bezużyteczny, kolejne zadanie dostanie nowy
+        logger.error(f"❌ Proces OCR dokumentów {doc_ids} zakończył się w trakcie pracy: {str(e)}")
+        job = jobs[doc_ids[0]]
+        if job:
+            _discard_slot_executor(job["slot"], job["executor"])
+        for job in jobs.values():
+            if job and not job.get("requeue_reason"):
+                job["requeue_reason"] = "worker_died"
     except Exception as e:
-        logger.error(f"❌ Błąd obsługi wyniku OCR dla dokumentu {doc_id}: {str(e)}")
+        logger.error(f"❌ Błąd obsługi wyniku OCR dla dokumentów {doc_ids}: {str(e)}")
     finally:
         # Usuń z aktywnych zadań
-        remove_active_task("ocr", doc_id)
+        for doc_id in doc_ids:
+            running_jobs.pop(doc_id, None)
+            remove_active_task("ocr", doc_id)
+        _forget_job_pid(doc_ids[0])
+
+    # Zadanie przerwane przez supervisor (ubity proces) - wróć do kolejki
+    for doc_id, job in jobs.items():
+        if job.get("requeue_reason"):
+            await _requeue_interrupted_job(doc_id, job)
+        else:
+            ocr_attempts.pop(doc_id, None)
+
+
+def _record_worker_stats(stats: Optional[dict]):
+    """Zapamiętuje statystyki pamięci procesu i zleca recykling po przekroczeniu progów."""
+    if not stats or not stats.get("pid"):
+        return
+
+    worker_stats[stats["pid"]] = {**stats, "reported_at": time.time()}
+
+    gpu_mb = stats.get("gpu_reserved_mb")
+    if WORKER_MAX_GPU_MB and gpu_mb and gpu_mb > WORKER_MAX_GPU_MB:
+        request_pool_recycle(f"pamięć GPU procesu {stats['pid']}: {gpu_mb:.0f}MB > {WORKER_MAX_GPU_MB}MB")
+
+    rss_mb = stats.get("rss_mb")
+    if WORKER_MAX_RSS_MB and rss_mb and rss_mb > WORKER_MAX_RSS_MB:
+        request_pool_recycle(f"RSS procesu {stats['pid']}: {rss_mb:.0f}MB > {WORKER_MAX_RSS_MB}MB")
+
+
+def _set_document_ocr_state(doc_id: int, status: str, info: str):
+    """Ustawia status OCR dokumentu z procesu głównego (po interwencji supervisora)."""
+    from sqlmodel import Session
+    from app.db import engine
+    from app.models import Document
+    from app.ocr_events import notify_ocr_state
+    from app.ocr_jobs import close_open_ocr_job
+
+    try:
+        with Session(engine) as session:
+            doc = session.get(Document, doc_id)
+            if not doc:
+                return
+            # Próba przerwana przez supervisora zostaje w historii jako nieudana
+            close_open_ocr_job(session, doc_id, "fail", info)
+            doc.ocr_status = status
+            doc.ocr_progress_info = info
+            if status != "running":
+                doc.ocr_progress = 0.0 if status == "pending" else doc.ocr_progress
+                doc.ocr_current_page = None
+            session.add(doc)
+            session.commit()
+
+            notify_ocr_state(doc_id, status=doc.ocr_status, info=doc.ocr_progress_info,
+                             progress=doc.ocr_progress, current_page=doc.ocr_current_page)
+    except Exception as e:
+        logger.error(f"❌ Błąd aktualizacji statusu dokumentu {doc_id}: {str(e)}")
+
+
+def _get_document_ocr_status(doc_id: int) -> Optional[str]:
+    from sqlmodel import Session
+    from app.db import engine
+    from app.models import Document
+
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        return doc.ocr_status if doc else None
+
+
+async def _requeue_interrupted_job(doc_id: int, job: dict):
+    """Ponownie kolejkuje dokument, którego proces został ubity przez supervisor."""
+    reason = job["requeue_reason"]
+
+    cancel_event = job.get("cancel_event")
+    try:
+        cancelled = cancel_event is not None and cancel_event.is_set()
+    except Exception:
+        cancelled = False
+
+    if cancelled:
+        _set_document_ocr_state(doc_id, "none", "OCR anulowany")
+        ocr_attempts.pop(doc_id, None)
+        return
+
+    # Dokument z batcha mógł zostać zapisany, zanim proces został ubity
+    if _get_document_ocr_status(doc_id) in ("done", "fail", None):
+        ocr_attempts.pop(doc_id, None)
+        return
+
+    # Próba liczy się dokumentom zadania, którego proces się zawiesił lub padł
+    if reason in ("timeout", "worker_died"):
+        ocr_attempts[doc_id] = ocr_attempts.get(doc_id, 0) + 1
+
+    attempts = ocr_attempts.get(doc_id, 0)
+    if attempts >= OCR_MAX_ATTEMPTS:
+        logger.error(f"❌ Dokument {doc_id} przekroczył limit {OCR_MAX_ATTEMPTS} prób OCR - oznaczam jako błąd")
+        _set_document_ocr_state(doc_id, "fail", f"Błąd: przekroczono limit czasu OCR ({attempts} prób)")
+        ocr_attempts.pop(doc_id, None)
+        return
+
+    logger.warning(f"🔁 Ponownie kolejkuję dokument {doc_id} (powód: {reason}, próba {attempts + 1}/{OCR_MAX_ATTEMPTS})")
+    _set_document_ocr_state(
+        doc_id, "pending",
+        f"Ponowienie po restarcie procesu OCR (próba {attempts + 1}/{OCR_MAX_ATTEMPTS})"
+    )
+    await enqueue_ocr_task(doc_id)
+
+
+# ==================== SUPERVISOR PULI OCR ====================
+
+def request_pool_recycle(reason: str):
+    """Zleca łagodny recykling puli - nowe zadania czekają, aż bieżące się zakończą."""
+    global _recycle_requested
+    if _recycle_requested is None:
+        logger.warning(f"♻️ [SUPERVISOR] Zlecono recykling puli OCR: {reason}")
+        _recycle_requested = reason
+
+
+def _executor_processes(executor: Optional[ProcessPoolExecutor]) -> list:
+    """Zwraca procesy robocze executora (atrybut prywatny ProcessPoolExecutor)."""
+    if executor is None:
+        return []
+    return list((getattr(executor, "_processes", None) or {}).values())
+
+
+def _pool_processes() -> list:
+    """Zwraca procesy robocze wszystkich slotów puli."""
+    return [process for executor in list(ocr_slots.values()) for process in _executor_processes(executor)]
+
+
+def _job_pid(job_key: int) -> Optional[int]:
+    """PID zgłoszony przez proces wykonujący zadanie (None, gdy zadanie jeszcze nie ruszyło)."""
+    if _job_pids is None:
+        return None
+    try:
+        return _job_pids.get(job_key)
+    except Exception as e:
+        logger.warning(f"⚠️ [SUPERVISOR] Nie można odczytać PID zadania {job_key}: {e}")
+        return None
+
+
+def _forget_job_pid(job_key: int):
+    if _job_pids is None:
+        return
+    try:
+        _job_pids.pop(job_key, None)
+    except Exception:
+        pass
+
+
+def _discard_slot_executor(slot: int, executor: ProcessPoolExecutor):
+    """Porzuca executor slotu - kolejne zadanie w tym slocie dostanie nowy proces."""
+    if ocr_slots.get(slot) is executor:
+        del ocr_slots[slot]
+    for process in _executor_processes(executor):
+        worker_stats.pop(process.pid, None)
+    try:
+        executor.shutdown(wait=False, cancel_futures=True)
+    except Exception as e:
+        logger.warning(f"⚠️ [SUPERVISOR] Błąd zamykania executora slotu {slot}: {e}")
+
+
+def _job_time_limit(doc_ids: List[int]) -> float:
+    """Limit czasu ściennego zadania - bazowy plus zapas na każdą stronę wszystkich dokumentów."""
+    from sqlmodel import Session
+    from app.db import engine
+    from app.models import Document
+    from app.ocr_jobs import get_open_ocr_jobs
+
+    total_pages = 0
+    try:
+        with Session(engine) as session:
+            jobs = get_open_ocr_jobs(session, doc_ids)
+            for doc_id in doc_ids:
+                doc = session.get(Document, doc_id)
+                job = jobs.get(doc_id)
+                pages = (job and job.total_pages) or (doc and (doc.page_count or doc.ocr_total_pages))
+                total_pages += pages or 0
+    except Exception as e:
+        logger.warning(f"⚠️ [SUPERVISOR] Nie można odczytać liczby stron dokumentów {doc_ids}: {e}")
+
+    return WATCHDOG_TIMEOUT_SECONDS + total_pages * WATCHDOG_SECONDS_PER_PAGE
+
+
+def _kill_ocr_worker(job: dict, reason: str):
+    """
+    Ubija proces zawieszonego zadania (PID zgłoszony przez proces) i porzuca executor
+    jego slotu. Zadanie wraca do kolejki po BrokenProcessPool w _handle_ocr_result,
+    zadania w pozostałych slotach pracują dalej.
+    """
+    batch = job["batch"]
+    processes = _executor_processes(job["executor"])
+    pid = _job_pid(batch[0])
+    # Proces slotu jest jeden; PID z rejestru chroni przed ubiciem procesu, który
+    # zdążył zastąpić poprzedni (max_tasks_per_child)
+    targets = [process for process in processes if pid is None or process.pid == pid]
+
+    logger.error(f"💀 [SUPERVISOR] Ubijam proces OCR slotu {job['slot']} "
+                 f"(PID {pid or [process.pid for process in targets]}): {reason}")
+
+    for process in targets:
+        try:
+            process.kill()
+        except Exception as e:
+            logger.warning(f"⚠️ [SUPERVISOR] Nie można ubić procesu {process.pid}: {e}")
+
+    _discard_slot_executor(job["slot"], job["executor"])
+
+
+def _check_hung_jobs():
+    """Wykrywa zadania przekraczające limit czasu i ubija wyłącznie ich procesy."""
+    now = time.monotonic()
+    checked = set()
+
+    for doc_id, job in list(running_jobs.items()):
+        if id(job["future"]) in checked or job.get("requeue_reason"):
+            continue
+        checked.add(id(job["future"]))
+
+        batch = job.get("batch") or [doc_id]
+        elapsed = now - job["started_at"]
+        limit = job["time_limit"]
+        if elapsed > limit:
+            for batch_doc_id in batch:
+                if batch_doc_id in running_jobs:
+                    running_jobs[batch_doc_id]["requeue_reason"] = "timeout"
+            _kill_ocr_worker(job, f"zawieszone dokumenty {batch} ({elapsed:.0f}s > {limit:.0f}s)")
+
+
+def _check_worker_memory():
+    """Sprawdza RSS procesów puli (psutil) i zleca recykling po przekroczeniu progu."""
+    if not HAS_PSUTIL or not WORKER_MAX_RSS_MB:
+        return
+
+    for process in _pool_processes():
+        try:
+            rss_mb = psutil.Process(process.pid).memory_info().rss / (1024 * 1024)
+        except Exception:
+            continue
+
+        stats = worker_stats.setdefault(process.pid, {"pid": process.pid})
+        stats["rss_mb"] = rss_mb
+
+        if rss_mb > WORKER_MAX_RSS_MB:
+            request_pool_recycle(f"RSS procesu {process.pid}: {rss_mb:.0f}MB > {WORKER_MAX_RSS_MB}MB")
+
+
+def _recycle_idle_pool():
+    """Wykonuje zleconą wymianę puli, gdy nie ma już uruchomionych zadań."""
+    global _recycle_requested
+
+    if not _recycle_requested or running_jobs:
+        return
+
+    logger.info(f"♻️ [SUPERVISOR] Wymieniam pulę OCR ({_recycle_requested})")
+    for executor in list(ocr_slots.values()):
+        executor.shutdown(wait=False)
+    ocr_slots.clear()
+    _recycle_requested = None
+    worker_stats.clear()
+
+
+async def ocr_supervisor():
+    """Pilnuje puli OCR: limity czasu dokumentów, recykling po przekroczeniu pamięci."""
+    logger.info(f"🛡️ [SUPERVISOR] Uruchomiono supervisor OCR (interwał {WATCHDOG_INTERVAL_SECONDS}s)")
+
+    while True:
+        try:
+            await asyncio.sleep(WATCHDOG_INTERVAL_SECONDS)
+
+            if running_jobs:
+                _check_hung_jobs()
+                _check_worker_memory()
+
+            _recycle_idle_pool()
+
+            await _admit_deferred_documents()
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ [SUPERVISOR] Błąd supervisora OCR: {str(e)}")
+
+
+async def _admit_deferred_documents():
+    """Kolejkuje dokumenty odłożone przez backpressure, gdy kolejka się zwolni."""
+    from app.ocr_estimator import collect_deferred_documents
+
+    for doc_id in collect_deferred_documents():
+        logger.info(f"📥 [SUPERVISOR] Przyjmuję odłożony dokument {doc_id} do kolejki OCR")
+        await enqueue_ocr_task(doc_id)
+
+
+def get_ocr_pool_status() -> dict:
+    """Zwraca stan puli OCR (do debugowania)."""
+    now = time.monotonic()
+    return {
+        "max_workers": get_ocr_max_workers(),
+        "max_tasks_per_child": WORKER_MAX_JOBS,
+        "executor_alive": bool(ocr_slots),
+        "slots": {slot: [process.pid for process in _executor_processes(executor)]
+                  for slot, executor in ocr_slots.items()},
+        "worker_pids": [process.pid for process in _pool_processes()],
+        "recycle_requested": _recycle_requested,
+        "queued": len(active_tasks["ocr"]) - len(running_jobs),
+        "held_back": list(_held_back),
+        "running": {
+            doc_id: {
+                "elapsed_seconds": round(now - job["started_at"], 1),
+                "time_limit_seconds": round(job["time_limit"], 1),
+                "requeue_reason": job.get("requeue_reason"),
+                "batch": job.get("batch"),
+                "slot": job.get("slot"),
+                "pid": _job_pid(job["batch"][0]),
+            }
+            for doc_id, job in running_jobs.items()
+        },
+        "attempts": dict(ocr_attempts),
+        "worker_stats": worker_stats,
+    }
 
 
 # ✅ POPRAWIONA: Funkcja startująca workery
@@ -195,18 +879,60 @@ async def start_background_workers():
         logger.warning(
             f"⚠️ [BACKGROUND] UWAGA: Multiprocessing używa '{current_method}' - może powodować problemy z CUDA")
 
-    # Uruchom worker OCR
+    # Zdarzenia postępu z procesów OCR → szyna zdarzeń (strumienie SSE)
+    _start_event_pump()
+
+    # Uruchom worker OCR, supervisor puli procesów i dystrybucję powiadomień
     asyncio.create_task(ocr_worker())
+    asyncio.create_task(ocr_supervisor())
+    asyncio.create_task(notification_worker())
     logger.info("🚀 Uruchomiono workery zadań w tle z ProcessPoolExecutor")
 
 
+def _start_event_pump():
+    """Tworzy kolejkę zdarzeń dla procesów OCR i wątek przekazujący je do szyny zdarzeń."""
+    global ocr_event_queue
+    from app.ocr_events import ocr_event_bus, start_worker_event_pump
+
+    ocr_event_bus.bind_loop(asyncio.get_running_loop())
+    ocr_event_queue = get_mp_manager().Queue()
+    _event_pump_stop.clear()
+    start_worker_event_pump(ocr_event_queue, _event_pump_stop)
+
+
+async def notification_worker():
+    """Rozsyła zdarzenia z kolejki powiadomień do subskrybentów (strumienie SSE)."""
+    from app.ocr_events import ocr_event_bus
+
+    logger.info("🚀 Uruchomiono worker powiadomień OCR")
+
+    while True:
+        try:
+            event = await task_queues["notifications"].get()
+            ocr_event_bus.publish(event)
+            task_queues["notifications"].task_done()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Błąd w workerze powiadomień: {str(e)}")
+
+
 # ✅ NOWE: Cleanup przy wyłączaniu
 async def cleanup_background_workers():
-    """Zamyka executor przy wyłączaniu aplikacji."""
-    global ocr_executor
-    if ocr_executor:
+    """Zamyka executory slotów przy wyłączaniu aplikacji."""
+    global _mp_manager, _job_pids
+    if ocr_slots:
         logger.info("🛑 Zamykam ProcessPoolExecutor...")
-        ocr_executor.shutdown(wait=True)
+        for executor in list(ocr_slots.values()):
+            executor.shutdown(wait=True)
+        ocr_slots.clear()
         logger.info("🛑 Zamknięto ProcessPoolExecutor")
     else:
-        logger.info("🛑 ProcessPoolExecutor już zamknięty")
\ No newline at end of file
+        logger.info("🛑 ProcessPoolExecutor już zamknięty")
+
+    _event_pump_stop.set()
+
+    if _mp_manager is not None:
+        _mp_manager.shutdown()
+        _mp_manager = None
+        _job_pids = None
\ No newline at end of file
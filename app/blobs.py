@@ -0,0 +1,361 @@
+# app/blobs.py
+"""
+Magazyn plików adresowany treścią - deduplikacja plików dokumentów.
+
+Przesłany plik trafia do FILES_DIR/blobs pod nazwą ze skrótu SHA-256
+zawartości (blobs/ab/<sha256><rozszerzenie>) i ta nazwa jest stored_filename
+dokumentu. Identyczny plik dołączony do kilku opinii zajmuje miejsce raz -
+nowy dokument wskazuje istniejący plik. Tabela file_blob liczy dokumenty
+wskazujące plik (ref_count utrzymują wyzwalacze SQLite na tabeli document,
+także przy zapisach procesu OCR przez surowe zapytania), a plik jest
+usuwany dopiero, gdy nie wskazuje go żaden dokument (release_file).
+
+Plik w magazynie nie jest zmieniany - nazwa pochodzi z zawartości. Nowa
+wersja pliku dokumentu (aktualizacja w app/routes/updates.py, PDF z warstwą
+tekstową po OCR - replace_document_file) trafia do magazynu jako osobny plik,
+a poprzedni jest zwalniany. Dokument zachowuje file_sha256 z chwili przyjęcia.
+
+Wynik OCR pliku: po zakończeniu OCR wiersz file_blob zapamiętuje dokument
+OCR TXT i konfigurację modelu OCR (ocr_config_key). Nowy dokument z tym
+samym plikiem otrzymuje kopię wyniku od razu zamiast trafiać do kolejki
+OCR - o ile konfiguracja modelu od tego czasu się nie zmieniła.
+
+Pliki sprzed magazynu (nazwy uuid) należą do jednego dokumentu i pozostają
+bez zmian. Przeniesienie ich do magazynu (z usunięciem powtórzeń):
+    python -m app.blobs --convert
+    python -m app.blobs --stats
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from app.db import FILES_DIR, engine, raw_connection
+from app.models import Document, FileBlob
+
+BLOB_PREFIX = "blobs"
+
+# Umieszczanie i usuwanie plików w magazynie (wątki procesu aplikacji)
+_lock = threading.Lock()
+# Pliki umieszczone w magazynie, których dokumenty nie są jeszcze zapisane
+_pinned: Counter = Counter()
+
+
+def _ref_count_sql(row: str, delta: str) -> str:
+    return f"UPDATE file_blob SET ref_count = ref_count {delta} 1 WHERE stored_filename = {row}.stored_filename;"
+
+
+TRIGGERS = {
+    "file_blob_document_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS file_blob_document_insert AFTER INSERT ON document
+        BEGIN {_ref_count_sql("NEW", "+")} END
+    """,
+    "file_blob_document_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS file_blob_document_delete AFTER DELETE ON document
+        BEGIN {_ref_count_sql("OLD", "-")} END
+    """,
+    "file_blob_document_update": f"""
+        CREATE TRIGGER IF NOT EXISTS file_blob_document_update AFTER UPDATE OF stored_filename ON document
+        WHEN OLD.stored_filename IS NOT NEW.stored_filename
+        BEGIN {_ref_count_sql("OLD", "-")} {_ref_count_sql("NEW", "+")} END
+    """,
+}
+
+
+def create_blob_schema(connection):
+    """Tabela plików magazynu i wyzwalacze liczników (migracja schematu)."""
+    FileBlob.__table__.create(connection, checkfirst=True)
+    for ddl in TRIGGERS.values():
+        connection.exec_driver_sql(ddl)
+
+
+def blob_filename(sha256: str, suffix: str) -> str:
+    return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256}{suffix.lower()}"
+
+
+def is_blob(stored_filename: str) -> bool:
+    return stored_filename.startswith(f"{BLOB_PREFIX}/")
+
+
+def ocr_config_key() -> str:
+    """Konfiguracja modelu OCR, od której zależy wynik (model, instrukcja, limit tokenów, DPI)."""
+    from tasks.ocr.config import DEFAULT_OCR_INSTRUCTION, DPI, MAX_NEW_TOKENS, OCR_MODEL_PATH
+
+    digest = hashlib.sha256(f"{DEFAULT_OCR_INSTRUCTION}|{MAX_NEW_TOKENS}|{DPI}".encode("utf-8")).hexdigest()
+    return f"{OCR_MODEL_PATH}@{digest[:12]}"
+
+
+# ==================== PLIKI ====================
+
+@dataclass
+class StoredFile:
+    stored_filename: str
+    reused: bool            # Plik o tej zawartości był już w magazynie
+
+
+def _link_or_copy(source: Path, target: Path):
+    """Dowiązanie twarde (bez kopiowania danych), a na innym systemie plików kopia."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def store_file(path: Path, sha256: str, size: int, link: bool = False) -> StoredFile:
+    """
+    Umieszcza zapisany plik w magazynie pod nazwą z jego skrótu - gdy plik
+    o tej zawartości już istnieje, nowa kopia jest usuwana. Plik pozostaje
+    przypięty (release_file go nie usunie) do unpin(), czyli do zapisania
+    dokumentów, które go wskazują.
+
+    Przy link=True plik źródłowy zostaje (dowiązanie albo kopia w magazynie)
+    - upload wznawialny (app/uploads.py) usuwa go dopiero po zapisaniu dokumentów.
+    """
+    stored_filename = blob_filename(sha256, path.suffix)
+    target = FILES_DIR / stored_filename
+    with _lock:
+        with raw_connection() as conn:
+            cursor = conn.execute("""
+                INSERT INTO file_blob (stored_filename, sha256, size, ref_count, created_at)
+                VALUES (?, ?, ?, 0, ?) ON CONFLICT(stored_filename) DO NOTHING
+            """, (stored_filename, sha256, size, datetime.utcnow().isoformat(sep=" ")))
+            reused = cursor.rowcount == 0
+        # Wspólny plik może być tylko w archiwum (wszystkie dokumenty w archiwum) - wtedy nowa kopia zostaje
+        if target.exists():
+            if not link:
+                path.unlink(missing_ok=True)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if link:
+                _link_or_copy(path, target)
+            else:
+                os.replace(path, target)
+        _pinned[stored_filename] += 1
+    return StoredFile(stored_filename, reused)
+
+
+def unpin(stored_filenames: Iterable[str]):
+    """Zwalnia pliki przypięte przez store_file."""
+    with _lock:
+        for stored_filename in stored_filenames:
+            _pinned[stored_filename] -= 1
+            if _pinned[stored_filename] <= 0:
+                del _pinned[stored_filename]
+
+
+def release_file(stored_filename: Optional[str]) -> bool:
+    """
+    Usuwa plik, którego nie wskazuje już żaden dokument (po usunięciu dokumentu
+    albo podmianie jego pliku) - razem z kopią w archiwum. Pliki sprzed magazynu
+    należą do jednego dokumentu i są usuwane zawsze. Zwraca True, gdy usunięto.
+    """
+    from app.archive import archived_path
+
+    if not stored_filename or stored_filename.endswith(".empty"):
+        return False
+    with _lock:
+        if is_blob(stored_filename):
+            if _pinned.get(stored_filename):
+                return False
+            with raw_connection() as conn:
+                row = conn.execute("SELECT ref_count FROM file_blob WHERE stored_filename = ?",
+                                   (stored_filename,)).fetchone()
+                if row is not None and row[0] > 0:
+                    return False
+                conn.execute("DELETE FROM file_blob WHERE stored_filename = ?", (stored_filename,))
+        for path in (FILES_DIR / stored_filename, archived_path(stored_filename)):
+            if path is not None:
+                path.unlink(missing_ok=True)
+    return True
+
+
+def replace_document_file(doc_id: int, path: Path) -> Optional[str]:
+    """
+    Wskazuje jako plik dokumentu nowy plik (PDF z warstwą tekstową po OCR) -
+    plik trafia do magazynu, poprzedni pozostaje bez zmian. Wywoływane w procesie
+    OCR; poprzedni plik zwalnia proces główny (release_file), który zna pliki
+    przypięte przez trwające uploady. Zwraca nazwę poprzedniego pliku.
+    """
+    from app.duplicates import file_sha256
+
+    stored = store_file(path, file_sha256(path), path.stat().st_size)
+    try:
+        with raw_connection() as conn:
+            row = conn.execute("SELECT stored_filename FROM document WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE document SET stored_filename = ? WHERE id = ?", (stored.stored_filename, doc_id))
+    finally:
+        unpin([stored.stored_filename])
+    if row is None:
+        release_file(stored.stored_filename)
+        return None
+    return row[0]
+
+
+def remove_hot_file(stored_filename: str) -> bool:
+    """
+    Usuwa plik z FILES_DIR po przeniesieniu dokumentów do archiwum (app/archive.py)
+    - chyba że wskazuje go dokument spoza archiwum albo właśnie przyjmowany upload.
+    """
+    with _lock:
+        if _pinned.get(stored_filename):
+            return False
+        with raw_connection() as conn:
+            in_use = conn.execute(
+                "SELECT 1 FROM document WHERE stored_filename = ? AND archived_at IS NULL LIMIT 1",
+                (stored_filename,)
+            ).fetchone()
+        if in_use is not None:
+            return False
+        (FILES_DIR / stored_filename).unlink(missing_ok=True)
+    return True
+
+
+# ==================== WYNIKI OCR ====================
+
+def record_ocr_result(conn, doc_id: int, ocr_doc_id: int):
+    """
+    Zapamiętuje wynik OCR dokumentu jako wynik OCR jego pliku (surowe połączenie
+    procesu OCR) - także pliku przyjętego, gdy dokument wskazuje już PDF z warstwą tekstową.
+    """
+    conn.execute("""
+        UPDATE file_blob SET ocr_doc_id = ?, ocr_config = ?
+        WHERE stored_filename = (SELECT stored_filename FROM document WHERE id = ?)
+           OR sha256 = (SELECT file_sha256 FROM document WHERE id = ?)
+    """, (ocr_doc_id, ocr_config_key(), doc_id, doc_id))
+
+
+def find_blob_ocr(session: Session, stored_filename: str) -> Optional[Tuple[Document, Document]]:
+    """
+    Gotowy wynik OCR pliku dla bieżącej konfiguracji modelu OCR.
+    Zwraca (dokument źródłowy, jego dokument OCR TXT) - jak find_reusable_ocr.
+    """
+    if not is_blob(stored_filename):
+        return None
+    blob = session.get(FileBlob, stored_filename)
+    if blob is None or blob.ocr_doc_id is None or blob.ocr_config != ocr_config_key():
+        return None
+    ocr_txt = session.get(Document, blob.ocr_doc_id)
+    if ocr_txt is None or ocr_txt.ocr_parent_id is None or not (FILES_DIR / ocr_txt.stored_filename).exists():
+        return None
+    source = session.get(Document, ocr_txt.ocr_parent_id)
+    if source is None or source.ocr_status != "done":
+        return None
+    # Dokument źródłowy przyjęty z tym plikiem (po OCR może wskazywać PDF z warstwą tekstową)
+    if source.stored_filename != stored_filename and source.file_sha256 != blob.sha256:
+        return None
+    return source, ocr_txt
+
+
+# ==================== PLIKI SPRZED MAGAZYNU ====================
+
+def _rename_text_sidecars(session: Session, old_versions: dict):
+    """Teksty dokumentów w magazynie tekstów pod wersją nowego pliku (ta sama zawartość)."""
+    from app.text_store import document_text_version, sidecar_path
+
+    for doc_id, old_version in old_versions.items():
+        old_path = sidecar_path(doc_id, old_version)
+        if old_path.exists():
+            os.replace(old_path, sidecar_path(doc_id, document_text_version(session.get(Document, doc_id))))
+
+
+def convert_legacy_files() -> Tuple[int, int]:
+    """
+    Przenosi pliki dokumentów sprzed magazynu do magazynu; powtórzenia zawartości
+    są usuwane. Pomija wyniki OCR (edytowalne w miejscu), kopie historyczne
+    i dokumenty w archiwum. Zwraca (przeniesione pliki, usunięte powtórzenia).
+    """
+    from app.duplicates import file_sha256
+    from app.text_store import document_text_version
+
+    with Session(engine) as session:
+        stored_filenames = list(dict.fromkeys(session.exec(
+            select(Document.stored_filename)
+            .where(Document.archived_at == None,  # noqa: E711
+                   (Document.doc_type == None) | (Document.doc_type != "OCR TXT"),  # noqa: E711
+                   ~Document.stored_filename.startswith(f"{BLOB_PREFIX}/"),
+                   ~Document.stored_filename.startswith("history/"),
+                   ~Document.stored_filename.endswith(".empty"))
+            .order_by(Document.id)
+        )))
+
+    converted = duplicates = 0
+    for old_filename in stored_filenames:
+        source = FILES_DIR / old_filename
+        if not source.exists():
+            continue
+        sha256 = file_sha256(source)
+        stored_filename = blob_filename(sha256, source.suffix)
+        target = FILES_DIR / stored_filename
+
+        with Session(engine) as session:
+            docs = session.exec(select(Document).where(Document.stored_filename == old_filename)).all()
+            old_versions = {doc.id: document_text_version(doc) for doc in docs}
+
+        with _lock:
+            if target.exists():
+                duplicates += 1
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                _link_or_copy(source, target)
+            with raw_connection() as conn:
+                conn.execute("""
+                    INSERT INTO file_blob (stored_filename, sha256, size, ref_count, created_at)
+                    VALUES (?, ?, ?, 0, ?) ON CONFLICT(stored_filename) DO NOTHING
+                """, (stored_filename, sha256, target.stat().st_size, datetime.utcnow().isoformat(sep=" ")))
+                conn.execute("UPDATE document SET stored_filename = ? WHERE stored_filename = ?",
+                             (stored_filename, old_filename))
+            source.unlink(missing_ok=True)
+
+        with Session(engine) as session:
+            _rename_text_sidecars(session, old_versions)
+        converted += 1
+    return converted, duplicates
+
+
+def blob_stats() -> dict:
+    """Liczba plików magazynu, dokumentów i zaoszczędzone miejsce."""
+    with raw_connection() as conn:
+        files, documents, size, saved = conn.execute("""
+            SELECT COUNT(*), COALESCE(SUM(ref_count), 0), COALESCE(SUM(size), 0),
+                   COALESCE(SUM(size * MAX(ref_count - 1, 0)), 0)
+            FROM file_blob
+        """).fetchone()
+    return {"files": files, "documents": documents, "bytes": size, "saved_bytes": saved}
+
+
+# ==================== CLI ====================
+
+def main(argv=None) -> int:
+    from app.db import init_db
+
+    parser = argparse.ArgumentParser(description="Magazyn plików adresowany treścią")
+    parser.add_argument("--convert", action="store_true", help="przenieś pliki sprzed magazynu do magazynu")
+    parser.add_argument("--stats", action="store_true", help="wypisz statystyki magazynu")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.convert:
+        converted, duplicates = convert_legacy_files()
+        print(f"Przeniesiono plików: {converted}, usunięte powtórzenia: {duplicates}")
+    if args.stats or not args.convert:
+        stats = blob_stats()
+        print(f"Pliki: {stats['files']}, dokumenty: {stats['documents']}, "
+              f"rozmiar: {stats['bytes'] / 1024 / 1024:.1f} MB, "
+              f"zaoszczędzone: {stats['saved_bytes'] / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
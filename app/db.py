@@ -1,4 +1,7 @@
+from contextlib import contextmanager
 from pathlib import Path
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 from sqlmodel import create_engine, SQLModel
 import os, pathlib, logging
 
@@ -8,6 +11,11 @@ BASE_DIR = pathlib.Path(__file__).resolve().parent.parent
 FILES_DIR = BASE_DIR / "files"
 FILES_DIR.mkdir(parents=True, exist_ok=True)
 
+# Parametry połączeń SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))  # Czekanie na blokadę zapisu
+SQLITE_POOL_SIZE = 5            # Stałe połączenia w puli procesu
+SQLITE_MAX_OVERFLOW = 10        # Dodatkowe połączenia przy chwilowym obciążeniu
+
 # Konfiguracja logowania
 logging.basicConfig(
     level=logging.INFO,
@@ -15,66 +23,88 @@ logging.basicConfig(
 )
 logger = logging.getLogger("db")
 
+
+def get_db_path() -> Path:
+    """
+    Zwraca ścieżkę pliku bazy SQLite wynikającą z DB_URL.
+
+    Jedyne miejsce ustalające położenie bazy - względna ścieżka w DB_URL
+    liczona jest od katalogu projektu, niezależnie od katalogu roboczego.
+    """
+    database = make_url(DB_URL).database
+    path = Path(database)
+    if not path.is_absolute():
+        path = BASE_DIR / path
+    return path
+
+
+def _resolved_db_url() -> str:
+    """DB_URL z bezwzględną ścieżką pliku bazy (dla SQLite)."""
+    url = make_url(DB_URL)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return DB_URL
+    return url.set(database=str(get_db_path())).render_as_string(hide_password=False)
+
+
 # Konfiguracja połączenia do bazy danych
 engine = create_engine(
-    DB_URL, 
-    connect_args={"check_same_thread": False},
+    _resolved_db_url(),
+    connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    pool_size=SQLITE_POOL_SIZE,
+    max_overflow=SQLITE_MAX_OVERFLOW,
     echo=False  # Zmień na True, aby włączyć logowanie SQL
 )
 
-# W db.py, w funkcji init_db(), dodaj kod migracji dla pola note
-# Znajdź istniejący fragment z migracją i aktualizuj go:
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """
+    Ustawienia każdego nowego połączenia SQLite:
+    WAL - odczyty nie blokują się z zapisem procesu OCR,
+    synchronous=NORMAL - bez fsync przy każdym commicie (bezpieczne w trybie WAL),
+    busy_timeout - zapis czeka na zwolnienie blokady zamiast zgłaszać "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+@contextmanager
+def raw_connection():
+    """
+    Połączenie DB-API (sqlite3) z puli silnika - dla kodu wykonującego surowe zapytania
+    (procesy OCR). Zatwierdza transakcję przy wyjściu, wycofuje przy błędzie
+    i oddaje połączenie do puli procesu.
+    """
+    conn = engine.raw_connection()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 
 def init_db():
     """Inicjalizacja bazy danych i aktualizacja schematu."""
     logger.info("Inicjalizacja bazy danych...")
     
     # Importujemy tutaj, aby uniknąć cyklicznych importów
-    from app.models import Document
+    import app.models  # noqa: F401 - rejestracja tabel w SQLModel.metadata
+    from app.migrations import run_migrations
     
     # Tworzenie tabel, jeśli nie istnieją
     SQLModel.metadata.create_all(engine)
     
-    # Sprawdzenie, czy potrzebna jest migracja dla istniejących dokumentów
+    # Wersjonowane migracje schematu (app/migrations.py)
     try:
-        from sqlalchemy import inspect
-        inspector = inspect(engine)
-        
-        # Sprawdź, czy kolumny content_type, mime_type, note istnieją
-        existing_columns = {col['name'] for col in inspector.get_columns('document')}
-        needed_columns = {'content_type', 'mime_type', 'ocr_confidence', 'note'}
-        
-        # Jeśli brakuje którejś kolumny, dodaj ją
-        missing_columns = needed_columns - existing_columns
-        if missing_columns:
-            logger.info(f"Brakujące kolumny: {missing_columns}")
-            
-            # Wykonaj migrację - dodaj brakujące kolumny
-            from sqlalchemy import Column, String, Float
-            from sqlalchemy.sql import text
-            
-            with engine.connect() as connection:
-                if 'content_type' in missing_columns:
-                    logger.info("Dodawanie kolumny 'content_type'...")
-                    connection.execute(text("ALTER TABLE document ADD COLUMN content_type VARCHAR DEFAULT 'document'"))
-                
-                if 'mime_type' in missing_columns:
-                    logger.info("Dodawanie kolumny 'mime_type'...")
-                    connection.execute(text("ALTER TABLE document ADD COLUMN mime_type VARCHAR"))
-                
-                if 'ocr_confidence' in missing_columns:
-                    logger.info("Dodawanie kolumny 'ocr_confidence'...")
-                    connection.execute(text("ALTER TABLE document ADD COLUMN ocr_confidence FLOAT"))
-                    
-                if 'note' in missing_columns:
-                    logger.info("Dodawanie kolumny 'note'...")
-                    connection.execute(text("ALTER TABLE document ADD COLUMN note VARCHAR"))
-                
-                connection.commit()
-            
-            logger.info("Migracja zakończona pomyślnie")
+        run_migrations(engine)
     except Exception as e:
         logger.error(f"Błąd podczas migracji: {str(e)}")
-        # Kontynuuj mimo błędu - najgorsze co się stanie to brak nowych kolumn
+        # Kontynuuj mimo błędu - migracja zostanie ponowiona przy następnym starcie
     
     logger.info("Inicjalizacja bazy danych zakończona")
@@ -65,7 +65,32 @@ def detect_mime_type(file_path):
             pass
     
     # Fallback - używamy rozszerzenia pliku
-    suffix = file_path.suffix.lower()
+    return mime_type_from_name(file_path)
+
+def detect_mime_type_from_bytes(head: bytes, filename: str) -> str:
+    """
+    Wykrywa MIME type na podstawie początku zawartości pliku (np. pierwszego
+    bloku przesyłanego pliku - bez ponownego czytania pliku z dysku).
+    Bez biblioteki python-magic bazuje na rozszerzeniu nazwy pliku.
+    
+    Args:
+        head: Początkowe bajty pliku
+        filename: Nazwa pliku (fallback)
+    
+    Returns:
+        str: MIME type pliku
+    """
+    if HAS_MAGIC and head:
+        try:
+            return magic.from_buffer(head, mime=True)
+        except Exception as e:
+            print(f"Błąd wykrywania MIME type: {e}")
+
+    return mime_type_from_name(filename)
+
+def mime_type_from_name(file_path) -> str:
+    """MIME type na podstawie rozszerzenia pliku."""
+    suffix = Path(file_path).suffix.lower()
     if suffix in ALLOWED_EXTENSIONS:
         return ALLOWED_EXTENSIONS[suffix]
     
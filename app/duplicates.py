@@ -0,0 +1,507 @@
+# app/duplicates.py
+"""
+Wykrywanie duplikatów dokumentów - identycznych plików i prawie identycznych tekstów.
+
+Te same akta trafiają często do kilku opinii. Każdy dokument otrzymuje:
+- skrót SHA-256 pliku (document.file_sha256) - identyczne pliki, także skany bez tekstu,
+- sygnaturę MinHash tekstu całego dokumentu (strona 0) i każdej strony osobno
+  (tabela document_minhash) - tekst to wynik OCR, a bez niego tekst pliku.
+
+Sygnatura to MINHASH_PERMUTATIONS minimów skrótów n-gramów słów (shingli) tekstu
+po ujednoliceniu (małe litery, bez znaków diakrytycznych i interpunkcji). Odsetek
+równych pozycji dwóch sygnatur przybliża podobieństwo Jaccarda zbiorów n-gramów.
+Sygnatura dzielona jest na LSH_BANDS pasm - skrót każdego pasma to kubełek LSH
+(tabela minhash_band). Kandydaci na duplikat to dokumenty dzielące z dokumentem
+choć jeden kubełek - wyszukanie kosztuje kilka odczytów indeksu zamiast porównania
+z całym korpusem; podobieństwo liczone jest tylko dla kandydatów.
+
+Sygnatury powstają przy przyjęciu pliku (analiza w puli procesów, jeszcze przed
+kolejką OCR), w app/ingest.py oraz po zakończeniu OCR. Dokumenty sprzed
+wprowadzenia modułu:
+    python -m app.duplicates --rebuild
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session, delete, select
+
+from app.db import engine, FILES_DIR
+from app.models import Document, DocumentMinhash, MinhashBand
+from app.search import normalize_text_for_search
+
+logger = logging.getLogger("duplicates")
+
+# Parametry sygnatury: n-gramy SHINGLE_WORDS słów, 128 permutacji = 16 pasm po 8 wierszy.
+# Para o podobieństwie s trafia do wspólnego kubełka z prawdopodobieństwem
+# 1 - (1 - s^8)^16: dla s = 0.8 to 0.9996, dla s = 0.5 - 0.06.
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+# Teksty krótsze (pusta strona, sam nagłówek) nie dostają sygnatury
+MIN_SHINGLES = 8
+
+# Podobieństwo, od którego dokument/strona jest duplikatem
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.8"))
+
+# Podobieństwo całego tekstu, od którego wolno skopiować wynik OCR duplikatu
+OCR_REUSE_THRESHOLD = float(os.getenv("OCR_REUSE_THRESHOLD", "0.95"))
+
+# Maksymalna liczba duplikatów zwracanych dla dokumentu
+MAX_DUPLICATES = 20
+
+# Rozmiar bloku n-gramów przy liczeniu minimów (ogranicza pamięć macierzy)
+_SIGNATURE_BLOCK = 4096
+# Parametry IN (...) w jednym zapytaniu
+_QUERY_CHUNK = 500
+
+# Stałe ziarna permutacji - sygnatury są porównywalne między procesami i uruchomieniami
+_SEEDS = np.random.default_rng(0x5EED_D0C5).integers(1, 2 ** 63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+# Mnożniki pozycji słowa w n-gramie (skrót n-gramu z skrótów słów)
+_POSITION_MULTIPLIERS = np.random.default_rng(0x5EED_0001).integers(
+    1, 2 ** 63, size=SHINGLE_WORDS, dtype=np.uint64) | np.uint64(1)
+
+
+# ==================== SYGNATURY ====================
+
+def _fmix64(values: np.ndarray) -> np.ndarray:
+    """Mieszanie bitów (finalizer MurmurHash3) - tania permutacja wartości 64-bitowych."""
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xFF51AFD7ED558CCD)
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xC4CEB9FE1A85EC53)
+    return values ^ (values >> np.uint64(33))
+
+
+def _word_hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Unikalne skróty n-gramów słów ujednoliconego tekstu."""
+    words = normalize_text_for_search(text).split()
+    if len(words) < SHINGLE_WORDS:
+        return np.empty(0, dtype=np.uint64)
+
+    vocabulary: Dict[str, int] = {}
+    for word in words:
+        if word not in vocabulary:
+            vocabulary[word] = _word_hash(word)
+    word_hashes = np.array([vocabulary[word] for word in words], dtype=np.uint64)
+    count = len(words) - SHINGLE_WORDS + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    for position, multiplier in enumerate(_POSITION_MULTIPLIERS):
+        shingles += word_hashes[position:position + count] * multiplier
+    return np.unique(shingles)
+
+
+def minhash_signature(shingles: np.ndarray) -> np.ndarray:
+    """Sygnatura MinHash (uint32) zbioru skrótów n-gramów."""
+    signature = np.full(MINHASH_PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(shingles), _SIGNATURE_BLOCK):
+        block = shingles[start:start + _SIGNATURE_BLOCK, None] ^ _SEEDS[None, :]
+        np.minimum(signature, _fmix64(block).min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def signature_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Szacowane podobieństwo Jaccarda tekstów - odsetek równych pozycji sygnatur."""
+    return float(np.count_nonzero(a == b)) / MINHASH_PERMUTATIONS
+
+
+def band_buckets(signature: np.ndarray) -> List[int]:
+    """Kubełki LSH sygnatury - skrót numeru i wartości każdego pasma (int64 dla SQLite)."""
+    buckets = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, "little", signed=True))
+    return buckets
+
+
+@dataclass
+class Fingerprint:
+    """Skrót pliku i sygnatury tekstu dokumentu: strona -> (sygnatura, liczba n-gramów)."""
+    sha256: Optional[str] = None
+    signatures: Dict[int, Tuple[np.ndarray, int]] = field(default_factory=dict)
+    source: str = "file"
+
+
+def compute_signatures(pages: List[str]) -> Dict[int, Tuple[np.ndarray, int]]:
+    """Sygnatury całego tekstu (strona 0) i poszczególnych stron (od 1, gdy stron jest kilka)."""
+    texts = {0: "\n".join(pages)}
+    if len(pages) > 1:
+        texts.update((number, text) for number, text in enumerate(pages, start=1))
+
+    signatures = {}
+    for page, text in texts.items():
+        shingles = shingle_hashes(text)
+        if len(shingles) >= MIN_SHINGLES:
+            signatures[page] = (minhash_signature(shingles), len(shingles))
+    return signatures
+
+
+# ==================== TEKST DOKUMENTU ====================
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def split_ocr_pages(text: str) -> List[str]:
+    """Teksty stron wyniku OCR (nagłówki '=== Strona N ===')."""
+    from app.text_extraction import OCR_PAGE_HEADER_RE
+
+    parts = OCR_PAGE_HEADER_RE.split(text)
+    # [tekst przed pierwszym nagłówkiem, numer, tekst, numer, tekst, ...]
+    pages = [page.strip() for page in parts[2::2]]
+    return pages or [text.strip()]
+
+
+def file_page_texts(path: Path, mime_type: Optional[str]) -> List[str]:
+    """Teksty stron pliku (PDF stronami, pozostałe pliki tekstowe w całości)."""
+    from app.text_extraction import extract_text_from_word, WORD_READ_ERROR_PREFIX
+    from app.text_store import decode_text_bytes
+
+    if mime_type == "application/pdf":
+        import PyPDF2
+        try:
+            with open(path, "rb") as f:
+                return [page.extract_text() or "" for page in PyPDF2.PdfReader(f).pages]
+        except Exception as e:
+            logger.warning(f"⚠️ [DUPLICATES] Nie można odczytać stron PDF {path.name}: {e}")
+            return []
+    if mime_type and "word" in mime_type:
+        text = extract_text_from_word(path)
+        return [] if text.startswith(WORD_READ_ERROR_PREFIX) else [text]
+    if mime_type == "text/plain":
+        return [decode_text_bytes(path.read_bytes())]
+    return []
+
+
+def fingerprint_file(path: Path, mime_type: Optional[str], sha256: Optional[str] = None) -> Fingerprint:
+    """
+    Skrót i sygnatury tekstu przesłanego pliku (w puli procesów, przed utworzeniem dokumentu).
+    Skrót policzony przy zapisie pliku (app/uploads.py) nie jest liczony ponownie.
+    """
+    return Fingerprint(sha256=sha256 or file_sha256(path),
+                       signatures=compute_signatures(file_page_texts(path, mime_type)))
+
+
+def has_fingerprint(doc: Document) -> bool:
+    """Czy dokument podlega wykrywaniu duplikatów (wyniki OCR należą do dokumentu źródłowego)."""
+    return not doc.stored_filename.endswith(".empty") and not (
+        doc.doc_type == "OCR TXT" and doc.ocr_parent_id is not None
+    )
+
+
+# ==================== ZAPIS ====================
+
+def save_fingerprint(session: Session, doc_id: int, fingerprint: Fingerprint):
+    """Zapisuje sygnatury dokumentu i jego kubełki LSH (zastępując poprzednie). Bez commit."""
+    session.exec(delete(MinhashBand).where(MinhashBand.doc_id == doc_id))
+    session.exec(delete(DocumentMinhash).where(DocumentMinhash.doc_id == doc_id))
+    session.flush()
+
+    for page, (signature, shingle_count) in fingerprint.signatures.items():
+        session.add(DocumentMinhash(doc_id=doc_id, page=page, signature=signature.tobytes(),
+                                    shingle_count=shingle_count, source=fingerprint.source))
+        for bucket in dict.fromkeys(band_buckets(signature)):
+            session.add(MinhashBand(bucket=bucket, doc_id=doc_id, page=page))
+
+
+def update_document_fingerprint(session: Session, doc: Document, file_pages: Optional[List[str]] = None):
+    """
+    Aktualizuje skrót pliku i sygnatury dokumentu (w procesie puli app/ingest.py).
+
+    Tekstem jest wynik OCR, a bez niego tekst pliku. Sygnatury tekstu pliku
+    policzone przy przyjęciu pliku nie są liczone ponownie (parsowanie PDF stronami).
+
+    Args:
+        file_pages: teksty stron PDF, jeśli wywołujący już je odczytał
+    """
+    from app.text_extraction import get_file_text, get_ocr_text_for_document
+
+    if not has_fingerprint(doc):
+        return
+    path = FILES_DIR / doc.stored_filename
+    if not path.exists():
+        return
+    if doc.file_sha256 is None:
+        doc.file_sha256 = file_sha256(path)
+        session.add(doc)
+
+    ocr_text = get_ocr_text_for_document(doc.id, session)
+    if ocr_text.strip():
+        fingerprint = Fingerprint(signatures=compute_signatures(split_ocr_pages(ocr_text)), source="ocr")
+    else:
+        stored_source = session.exec(
+            select(DocumentMinhash.source).where(DocumentMinhash.doc_id == doc.id)
+        ).first()
+        if stored_source == "file":
+            return
+        if doc.mime_type == "application/pdf":
+            pages = file_pages if file_pages is not None else file_page_texts(path, doc.mime_type)
+        else:
+            pages = [get_file_text(doc) or ""]
+        fingerprint = Fingerprint(signatures=compute_signatures(pages))
+    save_fingerprint(session, doc.id, fingerprint)
+
+
+def remove_fingerprints(doc_ids: Iterable[int]):
+    """Usuwa sygnatury usuniętych dokumentów."""
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return
+    with Session(engine) as session:
+        session.exec(delete(MinhashBand).where(MinhashBand.doc_id.in_(doc_ids)))
+        session.exec(delete(DocumentMinhash).where(DocumentMinhash.doc_id.in_(doc_ids)))
+        session.commit()
+
+
+# ==================== WYSZUKIWANIE ====================
+
+@dataclass
+class DuplicateMatch:
+    """Duplikat dokumentu: identyczny plik lub podobny tekst całości albo stron."""
+    doc_id: int
+    exact: bool = False                 # Identyczny plik (SHA-256)
+    similarity: float = 0.0             # Podobieństwo całego tekstu (0-1)
+    pages: List[Tuple[int, int, float]] = field(default_factory=list)  # (strona, strona duplikatu, podobieństwo)
+
+    @property
+    def score(self) -> float:
+        return 1.0 if self.exact else self.similarity
+
+    def to_dict(self) -> dict:
+        return {
+            "doc_id": self.doc_id,
+            "exact": self.exact,
+            "similarity": round(self.similarity, 3),
+            "pages": [{"page": page, "duplicate_page": other_page, "similarity": round(similarity, 3)}
+                      for page, other_page, similarity in self.pages],
+        }
+
+
+def _chunks(items: List, size: int = _QUERY_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _candidates(session: Session, buckets: Dict[int, List[int]], whole: bool,
+                exclude_doc_id: Optional[int]) -> Dict[Tuple[int, int], List[int]]:
+    """(dokument, strona) kandydatów ze wspólnym kubełkiem -> strony sprawdzanego dokumentu."""
+    candidates: Dict[Tuple[int, int], set] = {}
+    for chunk in _chunks(list(buckets)):
+        query = select(MinhashBand.bucket, MinhashBand.doc_id, MinhashBand.page).where(
+            MinhashBand.bucket.in_(chunk),
+            MinhashBand.page == 0 if whole else MinhashBand.page > 0,
+        )
+        if exclude_doc_id is not None:
+            query = query.where(MinhashBand.doc_id != exclude_doc_id)
+        for bucket, doc_id, page in session.exec(query):
+            candidates.setdefault((doc_id, page), set()).update(buckets[bucket])
+    return {key: sorted(pages) for key, pages in candidates.items()}
+
+
+def _load_signatures(session: Session, keys: List[Tuple[int, int]]) -> Dict[Tuple[int, int], np.ndarray]:
+    signatures = {}
+    wanted = set(keys)
+    for chunk in _chunks(sorted({doc_id for doc_id, _ in keys})):
+        rows = session.exec(
+            select(DocumentMinhash.doc_id, DocumentMinhash.page, DocumentMinhash.signature)
+            .where(DocumentMinhash.doc_id.in_(chunk))
+        )
+        for doc_id, page, signature in rows:
+            if (doc_id, page) in wanted:
+                signatures[(doc_id, page)] = np.frombuffer(signature, dtype=np.uint32)
+    return signatures
+
+
+def find_duplicates(session: Session, fingerprint: Fingerprint, exclude_doc_id: Optional[int] = None,
+                    limit: int = MAX_DUPLICATES) -> List[DuplicateMatch]:
+    """Duplikaty w korpusie: identyczne pliki oraz dokumenty/strony o podobnym tekście."""
+    matches: Dict[int, DuplicateMatch] = {}
+
+    if fingerprint.sha256:
+        query = select(Document.id).where(Document.file_sha256 == fingerprint.sha256)
+        if exclude_doc_id is not None:
+            query = query.where(Document.id != exclude_doc_id)
+        for doc_id in session.exec(query):
+            matches[doc_id] = DuplicateMatch(doc_id=doc_id, exact=True, similarity=1.0)
+
+    for whole in (True, False):
+        buckets: Dict[int, List[int]] = {}
+        for page, (signature, _) in fingerprint.signatures.items():
+            if (page == 0) == whole:
+                for bucket in band_buckets(signature):
+                    buckets.setdefault(bucket, []).append(page)
+        if not buckets:
+            continue
+
+        candidates = _candidates(session, buckets, whole, exclude_doc_id)
+        stored = _load_signatures(session, list(candidates))
+        for (doc_id, other_page), pages in candidates.items():
+            other_signature = stored.get((doc_id, other_page))
+            if other_signature is None:
+                continue
+            for page in pages:
+                similarity = signature_similarity(fingerprint.signatures[page][0], other_signature)
+                if similarity < DUPLICATE_THRESHOLD:
+                    continue
+                match = matches.setdefault(doc_id, DuplicateMatch(doc_id=doc_id))
+                if whole:
+                    match.similarity = max(match.similarity, similarity)
+                else:
+                    match.pages.append((page, other_page, similarity))
+
+    for match in matches.values():
+        match.pages.sort()
+    ranked = sorted(matches.values(), key=lambda m: (m.score, len(m.pages)), reverse=True)
+    return ranked[:limit]
+
+
+def stored_fingerprint(session: Session, doc: Document) -> Fingerprint:
+    """Skrót i sygnatury zapisanego dokumentu."""
+    rows = session.exec(select(DocumentMinhash).where(DocumentMinhash.doc_id == doc.id))
+    return Fingerprint(
+        sha256=doc.file_sha256,
+        signatures={row.page: (np.frombuffer(row.signature, dtype=np.uint32), row.shingle_count) for row in rows},
+    )
+
+
+def get_document_duplicates(session: Session, doc: Document) -> List[dict]:
+    """Duplikaty zapisanego dokumentu z podstawowymi danymi (API i szczegóły dokumentu)."""
+    if not has_fingerprint(doc):
+        return []
+    matches = find_duplicates(session, stored_fingerprint(session, doc), exclude_doc_id=doc.id)
+    documents = {d.id: d for d in session.exec(select(Document).where(Document.id.in_([m.doc_id for m in matches])))}
+
+    result = []
+    for match in matches:
+        duplicate = documents.get(match.doc_id)
+        if duplicate is None or not has_fingerprint(duplicate):
+            continue
+        result.append({
+            **match.to_dict(),
+            "original_filename": duplicate.original_filename,
+            "doc_type": duplicate.doc_type,
+            "parent_id": duplicate.parent_id,
+            "ocr_status": duplicate.ocr_status,
+        })
+    return result
+
+
+# ==================== PONOWNE UŻYCIE OCR ====================
+
+def find_reusable_ocr(session: Session, matches: List[DuplicateMatch],
+                      page_count: Optional[int]) -> Optional[Tuple[Document, Document]]:
+    """
+    Duplikat z gotowym wynikiem OCR, który można skopiować: identyczny plik albo
+    tekst podobny co najmniej w OCR_REUSE_THRESHOLD przy tej samej liczbie stron.
+    Zwraca (dokument źródłowy, jego dokument OCR TXT).
+    """
+    for match in matches:
+        if not match.exact and match.similarity < OCR_REUSE_THRESHOLD:
+            continue
+        source = session.get(Document, match.doc_id)
+        if source is None or source.ocr_status != "done":
+            continue
+        if not match.exact and source.page_count != page_count:
+            continue
+        ocr_txt = session.exec(
+            select(Document)
+            .where(Document.ocr_parent_id == source.id, Document.doc_type == "OCR TXT")
+            .order_by(Document.upload_time.desc())
+        ).first()
+        if ocr_txt is not None and (FILES_DIR / ocr_txt.stored_filename).exists():
+            return source, ocr_txt
+    return None
+
+
+def copy_ocr_result(session: Session, doc: Document, source: Document, ocr_txt: Document) -> Document:
+    """Kopiuje wynik OCR duplikatu jako wynik OCR dokumentu i oznacza OCR jako zakończony. Bez commit."""
+    import shutil
+    import uuid
+
+    txt_filename = f"{uuid.uuid4().hex}.txt"
+    shutil.copyfile(FILES_DIR / ocr_txt.stored_filename, FILES_DIR / txt_filename)
+
+    copy = Document(
+        sygnatura=doc.sygnatura,
+        doc_type="OCR TXT",
+        original_filename=f"{Path(doc.original_filename).stem}.txt",
+        stored_filename=txt_filename,
+        step=doc.step,
+        ocr_status="done",
+        ocr_parent_id=doc.id,
+        ocr_confidence=ocr_txt.ocr_confidence,
+        mime_type="text/plain",
+        content_type="document",
+        comments=f"Wynik OCR skopiowany z duplikatu - dokument {source.id}",
+    )
+    session.add(copy)
+
+    doc.ocr_status = "done"
+    doc.ocr_confidence = source.ocr_confidence
+    doc.ocr_progress_info = None
+    session.add(doc)
+    return copy
+
+
+# ==================== PRZEBUDOWA ====================
+
+def rebuild_fingerprints(missing_only: bool = True) -> int:
+    """Skróty i sygnatury dokumentów (bez sygnatur lub wszystkich). Zwraca liczbę dokumentów."""
+    with Session(engine) as session:
+        query = select(Document.id)
+        if missing_only:
+            fingerprinted = select(DocumentMinhash.doc_id)
+            query = query.where((Document.file_sha256 == None) | Document.id.not_in(fingerprinted))  # noqa: E711
+        doc_ids = list(session.exec(query.order_by(Document.id)))
+
+    done = 0
+    for doc_id in doc_ids:
+        with Session(engine) as session:
+            doc = session.get(Document, doc_id)
+            if doc is None or not has_fingerprint(doc):
+                continue
+            try:
+                if not missing_only:
+                    session.exec(delete(DocumentMinhash).where(DocumentMinhash.doc_id == doc_id))
+                update_document_fingerprint(session, doc)
+                session.commit()
+                done += 1
+            except Exception as e:
+                logger.warning(f"⚠️ [DUPLICATES] Błąd sygnatury dokumentu {doc_id}: {e}")
+    return done
+
+
+def main(argv=None) -> int:
+    from app.db import init_db
+
+    parser = argparse.ArgumentParser(description="Sygnatury dokumentów do wykrywania duplikatów")
+    parser.add_argument("--rebuild", action="store_true", help="policz sygnatury dokumentów, które ich nie mają")
+    parser.add_argument("--all", action="store_true", help="przelicz sygnatury wszystkich dokumentów")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.rebuild or args.all:
+        print(f"✅ Sygnatury policzone dla {rebuild_fingerprints(missing_only=not args.all)} dokumentów")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
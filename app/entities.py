@@ -0,0 +1,431 @@
+# app/entities.py
+"""
+Indeks encji w treści dokumentów: numery PESEL, daty, sygnatury akt i osoby.
+
+Po wyodrębnieniu tekstu i po OCR (app/ingest.py) treść dokumentu (tekst pliku
++ wyniki OCR, jak w indeksie pełnotekstowym) przechodzi przez skompilowane
+wzorce i trafia do tabeli document_entity jako (typ, wartość znormalizowana,
+dokument, strona, pozycja w treści). Indeks (entity_type, value, doc_id) sprawia,
+że wyszukanie encji i "inne dokumenty z tym numerem PESEL" to odczyt indeksu
+zamiast przeglądania tekstu wszystkich dokumentów.
+
+Normalizacja:
+- PESEL - 11 cyfr (bez separatorów), tylko z poprawną sumą kontrolną i datą urodzenia,
+- data - RRRR-MM-DD (zapis liczbowy, ISO, słowny "12 marca 2020 r." i rzymski "12 III 2020"),
+- sygnatura akt - "II K 123/20" (wydział, repertorium wielkimi literami, rok dwucyfrowy),
+  także sygnatury prokuratorskie "PR 1 DS. 123/20",
+- osoba - imię i nazwisko po słowie wskazującym (Pan, oskarżony, badana, biegły...),
+  małymi literami bez znaków diakrytycznych (bez odmiany przez przypadki).
+
+Przebudowa dla dokumentów sprzed wprowadzenia indeksu:
+    python -m app.entities --rebuild
+"""
+
+import argparse
+import bisect
+import html
+import logging
+import re
+import sys
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlmodel import Session, delete, func, select
+
+from app.db import engine
+from app.models import Document, DocumentEntity
+from app.search import remove_polish_diacritics
+
+logger = logging.getLogger("entities")
+
+ENTITY_TYPES = {
+    "pesel": "PESEL",
+    "case": "Sygnatura akt",
+    "date": "Data",
+    "person": "Osoba",
+}
+
+# Limit zapisanych wystąpień na dokument (zabezpieczenie przed tabelami dat itp.)
+MAX_ENTITIES_PER_DOCUMENT = 5000
+
+# Kontekst fragmentu treści wokół encji (znaki z każdej strony)
+ENTITY_SNIPPET_CONTEXT = 80
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class Entity(NamedTuple):
+    entity_type: str
+    value: str
+    start: int
+    end: int
+    page: Optional[int] = None
+
+
+# ==================== WZORCE ====================
+
+_UPPER = "A-ZĄĆĘŁŃÓŚŹŻ"
+_LOWER = "a-ząćęłńóśźż"
+
+_PESEL_RE = re.compile(r"(?<![\d/.-])\d{11}(?![\d/-])|(?i:pesel)\W{0,3}((?:\d[ -]?){10}\d)(?!\d)")
+_PESEL_WEIGHTS = (1, 3, 7, 9, 1, 3, 7, 9, 1, 3)
+# Przesunięcie miesiąca w numerze PESEL -> stulecie urodzenia
+_PESEL_CENTURIES = {80: 1800, 0: 1900, 20: 2000, 40: 2100, 60: 2200}
+
+_MONTH_NAMES = {
+    "stycznia": 1, "lutego": 2, "marca": 3, "kwietnia": 4, "maja": 5, "czerwca": 6, "lipca": 7,
+    "sierpnia": 8, "września": 9, "października": 10, "listopada": 11, "grudnia": 12,
+}
+_ROMAN_MONTHS = {roman: number for number, roman in enumerate(
+    ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII"], start=1)}
+# Nazwy miesięcy także bez znaków diakrytycznych (OCR, teksty pisane bez polskich liter)
+_MONTHS = {**_MONTH_NAMES, **{remove_polish_diacritics(name): number for name, number in _MONTH_NAMES.items()}}
+
+_DATE_NUMERIC_RE = re.compile(r"(?<![\d.])(\d{1,2})([./-])(\d{1,2})\2(\d{4})(?![\d])")
+_DATE_ISO_RE = re.compile(r"(?<![\d.-])(\d{4})-(\d{2})-(\d{2})(?![\d])")
+_DATE_WORDS_RE = re.compile(
+    r"(?<!\d)(\d{1,2})\s+((?i:" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")|"
+    r"(?:XII|XI|X|IX|VIII|VII|VI|V|IV|III|II|I))\.?\s+(\d{4})(?!\d)"
+)
+
+# Sygnatura sądowa: wydział (rzymski), repertorium, numer/rok - np. "II K 123/20", "I ACa 1234/2019"
+_CASE_RE = re.compile(
+    rf"(?<![\w/])([IVXL]{{1,5}})\s+([{_UPPER}][{_UPPER}{_LOWER}]{{0,4}})\s+(\d{{1,6}})\s*/\s*(\d{{4}}|\d{{2}})(?![\d/])"
+)
+# Sygnatura prokuratorska: "PR 1 Ds. 123/2020", "1 Ds 45/21"
+_PROSECUTOR_CASE_RE = re.compile(
+    r"(?<![\w/])(?:(P[ROKA])\s+)?(\d{1,4})\s+(?i:ds)\.?\s*(\d{1,6})\s*/\s*(\d{4}|\d{2})(?![\d/])"
+)
+
+# Osoba: słowo wskazujące + imię i nazwisko (nazwisko także wielkimi literami lub dwuczłonowe)
+_NAME_WORD = rf"[{_UPPER}][{_LOWER}]+"
+_SURNAME_WORD = rf"[{_UPPER}](?:[{_LOWER}]+|[{_UPPER}]+)(?:-[{_UPPER}](?:[{_LOWER}]+|[{_UPPER}]+))?"
+_PERSON_TRIGGERS = (
+    r"pan|pani|pana|panu|panem|panią|"
+    r"oskarżon(?:y|a|ego|ej|emu)|podejrzan(?:y|a|ego|ej)|"
+    r"powód|powódka|powoda|powódki|pozwan(?:y|a|ego|ej)|"
+    r"badan(?:y|a|ego|ej)|pacjent(?:ka|a|ki|em)?|"
+    r"świadek|świadka|małoletni(?:a|ego|ej)?|"
+    r"uczestni(?:k|czka|ka|czki)|wnioskodaw(?:ca|czyni|cy)|"
+    r"biegł(?:y|a|ego|ej)|sędzi(?:a|ego|ny)|prokurator(?:a)?|"
+    r"SSO|SSR|SSA|adw\.|r\.\s?pr\.|mec\.|dr|lek\.(?:\s?med\.)?|"
+    r"imię\s+i\s+nazwisko:?"
+)
+_PERSON_RE = re.compile(
+    rf"(?<![{_UPPER}{_LOWER}])(?i:{_PERSON_TRIGGERS})\s+({_NAME_WORD})\s+({_SURNAME_WORD})(?![{_LOWER}{_UPPER}])"
+)
+# Wyrazy pisane wielką literą po słowach wskazujących, które nie są imionami
+_NOT_NAMES = {
+    "sad", "sadu", "sadowy", "sadowa", "sadowego", "okregowy", "okregowego", "rejonowy", "rejonowego",
+    "apelacyjny", "apelacyjnego", "prokuratura", "prokuratury", "rzeczypospolitej", "skarb", "skarbu",
+    "panstwa", "szpital", "szpitala", "doktor", "profesor", "prof", "psycholog", "psychiatra",
+}
+
+
+# ==================== NORMALIZACJA ====================
+
+def normalize_pesel(raw: str) -> Optional[str]:
+    """11 cyfr numeru PESEL albo None, gdy suma kontrolna lub data urodzenia są błędne."""
+    digits = re.sub(r"\D", "", raw)
+    if len(digits) != 11:
+        return None
+    values = [int(char) for char in digits]
+    if (10 - sum(w * v for w, v in zip(_PESEL_WEIGHTS, values)) % 10) % 10 != values[10]:
+        return None
+    month = values[2] * 10 + values[3]
+    century = _PESEL_CENTURIES.get(month // 20 * 20)
+    try:
+        date(century + values[0] * 10 + values[1], month % 20, values[4] * 10 + values[5])
+    except (TypeError, ValueError):
+        return None
+    return digits
+
+
+def _iso_date(year: int, month: int, day: int) -> Optional[str]:
+    if not 1900 <= year <= 2100:
+        return None
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _short_year(year: str) -> str:
+    return year[-2:]
+
+
+def normalize_case_number(department: str, repertory: str, number: str, year: str) -> str:
+    return f"{department.upper()} {repertory.upper()} {int(number)}/{_short_year(year)}"
+
+
+def normalize_person(first_name: str, surname: str) -> Optional[str]:
+    words = [remove_polish_diacritics(word).lower() for word in (first_name, surname)]
+    if any(word.split("-")[0] in _NOT_NAMES for word in words):
+        return None
+    return " ".join(words)
+
+
+# ==================== WYODRĘBNIANIE ====================
+
+def _find_pesels(text: str) -> Iterable[Tuple[str, str, int, int]]:
+    for match in _PESEL_RE.finditer(text):
+        group = 1 if match.group(1) else 0
+        value = normalize_pesel(match.group(group))
+        if value:
+            yield "pesel", value, match.start(group), match.end(group)
+
+
+def _find_dates(text: str) -> Iterable[Tuple[str, str, int, int]]:
+    for match in _DATE_NUMERIC_RE.finditer(text):
+        value = _iso_date(int(match.group(4)), int(match.group(3)), int(match.group(1)))
+        if value:
+            yield "date", value, match.start(), match.end()
+    for match in _DATE_ISO_RE.finditer(text):
+        value = _iso_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if value:
+            yield "date", value, match.start(), match.end()
+    for match in _DATE_WORDS_RE.finditer(text):
+        month_name = match.group(2)
+        month = _MONTHS.get(month_name.lower()) or _ROMAN_MONTHS.get(month_name)
+        value = _iso_date(int(match.group(3)), month, int(match.group(1)))
+        if value:
+            yield "date", value, match.start(), match.end()
+
+
+def _find_case_numbers(text: str) -> Iterable[Tuple[str, str, int, int]]:
+    for match in _CASE_RE.finditer(text):
+        yield "case", normalize_case_number(*match.groups()), match.start(), match.end()
+    for match in _PROSECUTOR_CASE_RE.finditer(text):
+        unit, department, number, year = match.groups()
+        prefix = f"{unit.upper()} " if unit else ""
+        yield "case", f"{prefix}{int(department)} DS. {int(number)}/{_short_year(year)}", match.start(), match.end()
+
+
+def _find_persons(text: str) -> Iterable[Tuple[str, str, int, int]]:
+    for match in _PERSON_RE.finditer(text):
+        value = normalize_person(match.group(1), match.group(2))
+        if value:
+            yield "person", value, match.start(1), match.end(2)
+
+
+_EXTRACTORS = (_find_pesels, _find_case_numbers, _find_dates, _find_persons)
+
+
+def page_starts(content: str, file_pages: Optional[List[str]] = None) -> List[Tuple[int, int]]:
+    """
+    Początki stron w treści dokumentu: (pozycja, numer strony), rosnąco.
+    Strony tekstu PDF odnajdywane są po początku tekstu strony, strony wyniku
+    OCR - po nagłówkach '=== Strona N ==='.
+    """
+    from app.text_extraction import OCR_PAGE_HEADER_RE
+    from app.text_store import normalize_text
+
+    starts = []
+    position = 0
+    for number, page_text in enumerate(file_pages or [], start=1):
+        probe = normalize_text(page_text).strip()[:40]
+        found = content.find(probe, position) if probe else -1
+        if found >= 0:
+            starts.append((found, number))
+            position = found + len(probe)
+    starts.extend((match.end(), int(match.group(1))) for match in OCR_PAGE_HEADER_RE.finditer(content))
+    return sorted(starts)
+
+
+def extract_entities(content: str, file_pages: Optional[List[str]] = None) -> List[Entity]:
+    """Encje treści dokumentu z numerami stron (gdy da się je ustalić), w kolejności wystąpienia."""
+    if not content:
+        return []
+    starts = page_starts(content, file_pages)
+    offsets = [start for start, _ in starts]
+
+    entities = []
+    for extractor in _EXTRACTORS:
+        for entity_type, value, start, end in extractor(content):
+            index = bisect.bisect_right(offsets, start) - 1
+            entities.append(Entity(entity_type, value, start, end, starts[index][1] if index >= 0 else None))
+
+    entities.sort(key=lambda entity: (entity.start, -entity.end))
+    return entities[:MAX_ENTITIES_PER_DOCUMENT]
+
+
+def parse_entity_query(term: str, entity_type: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """
+    Rozpoznaje wpisaną wartość jako encję: (typ, wartość znormalizowana) albo None.
+    Bez podanego typu rozpoznawane są PESEL, sygnatura akt i data (osoba tylko jawnie).
+    """
+    term = (term or "").strip()
+    if not term:
+        return None
+    if entity_type == "person":
+        words = term.split()
+        return ("person", " ".join(remove_polish_diacritics(word).lower() for word in words)) if words else None
+
+    # Sygnatura wpisana małymi literami ("ii k 123/20") - repertorium i tak jest normalizowane do wielkich
+    found = [*_find_pesels(term), *_find_case_numbers(term), *_find_case_numbers(term.upper()), *_find_dates(term)]
+    for found_type, value, start, end in found:
+        if start == 0 and end == len(term) and entity_type in (None, found_type):
+            return found_type, value
+    # PESEL wpisany z separatorami ("440514-01359")
+    if entity_type in (None, "pesel") and re.fullmatch(r"[\d\s-]+", term) and normalize_pesel(term):
+        return "pesel", normalize_pesel(term)
+    return None
+
+
+# ==================== INDEKS ====================
+
+def has_entities(doc: Document) -> bool:
+    """Czy treść dokumentu podlega indeksowaniu encji (wyniki OCR należą do dokumentu źródłowego)."""
+    return not doc.stored_filename.endswith(".empty") and not (
+        doc.doc_type == "OCR TXT" and doc.ocr_parent_id is not None
+    )
+
+
+def index_document_entities(session: Session, doc: Document, content: str,
+                            file_pages: Optional[List[str]] = None) -> int:
+    """Zastępuje encje dokumentu wyodrębnionymi z jego treści (w procesie puli app/ingest.py). Bez commit."""
+    session.exec(delete(DocumentEntity).where(DocumentEntity.doc_id == doc.id))
+    if not has_entities(doc):
+        return 0
+
+    entities = extract_entities(content, file_pages)
+    session.add_all(
+        DocumentEntity(doc_id=doc.id, entity_type=entity.entity_type, value=entity.value,
+                       page=entity.page, start_offset=entity.start, end_offset=entity.end)
+        for entity in entities
+    )
+    return len(entities)
+
+
+def remove_entities(doc_ids: Iterable[int]):
+    """Usuwa encje usuniętych dokumentów."""
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return
+    with Session(engine) as session:
+        session.exec(delete(DocumentEntity).where(DocumentEntity.doc_id.in_(doc_ids)))
+        session.commit()
+
+
+# ==================== WYSZUKIWANIE ====================
+
+def find_entity_documents(session: Session, entity_type: str, value: str,
+                          doc_ids: Optional[Iterable[int]] = None) -> Dict[int, List[DocumentEntity]]:
+    """Dokumenty, w których występuje encja: doc_id -> wystąpienia (indeks entity_type, value, doc_id)."""
+    query = (select(DocumentEntity)
+             .where(DocumentEntity.entity_type == entity_type, DocumentEntity.value == value)
+             .order_by(DocumentEntity.doc_id, DocumentEntity.start_offset))
+    if doc_ids is not None:
+        query = query.where(DocumentEntity.doc_id.in_(list(doc_ids)))
+
+    found: Dict[int, List[DocumentEntity]] = {}
+    for entity in session.exec(query):
+        found.setdefault(entity.doc_id, []).append(entity)
+    return found
+
+
+def get_document_entities(session: Session, doc_id: int) -> List[dict]:
+    """
+    Encje dokumentu (bez powtórzeń) z pierwszym wystąpieniem i liczbą innych
+    dokumentów, w których występują - jedno zapytanie po indeksie.
+    """
+    rows = session.exec(
+        select(DocumentEntity.entity_type, DocumentEntity.value, func.count(),
+               func.min(DocumentEntity.page), func.min(DocumentEntity.start_offset))
+        .where(DocumentEntity.doc_id == doc_id)
+        .group_by(DocumentEntity.entity_type, DocumentEntity.value)
+    ).all()
+    if not rows:
+        return []
+
+    other = DocumentEntity.__table__.alias("other")
+    mine = DocumentEntity.__table__.alias("mine")
+    other_counts = {
+        (entity_type, value): count for entity_type, value, count in session.exec(
+            select(mine.c.entity_type, mine.c.value, func.count(func.distinct(other.c.doc_id)))
+            .join(other, (other.c.entity_type == mine.c.entity_type) & (other.c.value == mine.c.value)
+                  & (other.c.doc_id != doc_id))
+            .where(mine.c.doc_id == doc_id)
+            .group_by(mine.c.entity_type, mine.c.value)
+        )
+    }
+
+    order = list(ENTITY_TYPES)
+    entities = [
+        {"type": entity_type, "label": ENTITY_TYPES.get(entity_type, entity_type), "value": value,
+         "occurrences": occurrences, "first_page": first_page, "first_offset": first_offset,
+         "other_documents": other_counts.get((entity_type, value), 0)}
+        for entity_type, value, occurrences, first_page, first_offset in rows
+    ]
+    entities.sort(key=lambda e: (order.index(e["type"]) if e["type"] in order else len(order),
+                                 -e["other_documents"], e["first_offset"]))
+    return entities
+
+
+def entity_snippet(doc, span: Tuple[int, int], session: Session = None) -> str:
+    """Fragment treści (HTML) wokół wystąpienia encji, encja w <mark>."""
+    from app.text_extraction import get_document_text_content
+
+    content = get_document_text_content(doc, session, parse=False) or ""
+    start, end = span
+    if end > len(content):
+        return ""
+    before = _WHITESPACE_RE.sub(" ", content[max(0, start - ENTITY_SNIPPET_CONTEXT):start]).lstrip()
+    after = _WHITESPACE_RE.sub(" ", content[end:end + ENTITY_SNIPPET_CONTEXT]).rstrip()
+    return (("… " if start > ENTITY_SNIPPET_CONTEXT else "") + html.escape(before) + "<mark>"
+            + html.escape(content[start:end]) + "</mark>" + html.escape(after)
+            + (" …" if end + ENTITY_SNIPPET_CONTEXT < len(content) else ""))
+
+
+# ==================== PRZEBUDOWA ====================
+
+def rebuild_entities() -> int:
+    """Wyodrębnia encje wszystkich dokumentów z treścią. Zwraca liczbę zapisanych encji."""
+    from app.duplicates import file_page_texts
+    from app.db import FILES_DIR
+    from app.text_extraction import get_document_text_content
+
+    with Session(engine) as session:
+        doc_ids = list(session.exec(select(Document.id).order_by(Document.id)))
+
+    total = 0
+    for doc_id in doc_ids:
+        with Session(engine) as session:
+            doc = session.get(Document, doc_id)
+            if doc is None:
+                continue
+            try:
+                content = get_document_text_content(doc, session) or ""
+                file_pages = None
+                if doc.mime_type == "application/pdf" and has_entities(doc):
+                    file_pages = file_page_texts(FILES_DIR / doc.stored_filename, doc.mime_type)
+                total += index_document_entities(session, doc, content, file_pages)
+                session.commit()
+            except Exception as e:
+                logger.warning(f"⚠️ [ENTITIES] Błąd wyodrębniania encji dokumentu {doc_id}: {e}")
+    return total
+
+
+def main(argv=None) -> int:
+    from app.db import init_db
+
+    parser = argparse.ArgumentParser(description="Indeks encji (PESEL, daty, sygnatury akt, osoby)")
+    parser.add_argument("--rebuild", action="store_true", help="wyodrębnij encje wszystkich dokumentów")
+    parser.add_argument("--find", metavar="WARTOŚĆ", help="dokumenty z encją (PESEL, sygnatura, data)")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.rebuild:
+        print(f"✅ Zapisano {rebuild_entities()} encji")
+    if args.find:
+        parsed = parse_entity_query(args.find)
+        if parsed is None:
+            print(f"❌ Nie rozpoznano encji: {args.find}")
+            return 1
+        with Session(engine) as session:
+            found = find_entity_documents(session, *parsed)
+        print(f"{ENTITY_TYPES[parsed[0]]} {parsed[1]}: dokumenty {sorted(found)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# app/ingest.py
+"""
+Przetwarzanie dokumentów po przyjęciu (ingest) w puli procesów CPU.
+
+Zaraz po zapisaniu uploadu dokument trafia do puli, która:
+- wyodrębnia tekst pliku do magazynu tekstów (app/text_store.py),
+- ustala liczbę stron, język tekstu i jakość warstwy tekstowej PDF,
+- indeksuje treść w indeksie pełnotekstowym (app/search_index.py),
+- liczy skrót pliku i sygnatury MinHash do wykrywania duplikatów (app/duplicates.py),
+- wyodrębnia encje treści: PESEL, daty, sygnatury akt, osoby (app/entities.py).
+
+W puli wykonywana jest też analiza wstępna uploadu (liczba stron dla kolejki OCR).
+Żądania HTTP nie parsują plików PDF ani Word - najwyżej czekają na wynik puli.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlmodel import Session, select
+
+from app.db import engine, FILES_DIR
+from app.models import Document
+
+logger = logging.getLogger("ingest")
+
+# Liczba procesów puli - jeden rdzeń zostaje dla serwera HTTP
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+
+# Ile dokumentów przekazywać do procesu w jednym zadaniu przy nadrabianiu zaległości
+INGEST_BATCH_SIZE = 25
+
+# Średnia liczba znaków na stronę, od której warstwa tekstowa PDF ma pełną jakość
+TEXT_LAYER_FULL_CHARS_PER_PAGE = 500
+
+# Jakość, od której PDF uznajemy za mający użyteczną warstwę tekstową
+TEXT_LAYER_MIN_QUALITY = 0.3
+
+# Najczęstsze słowa funkcyjne - do rozpoznania języka tekstu
+_STOPWORDS = {
+    "pl": {"i", "w", "na", "z", "się", "nie", "do", "jest", "że", "to", "o", "jak", "po", "przez",
+           "oraz", "od", "dla", "lub", "przy", "był", "była", "został", "także", "które", "który"},
+    "en": {"the", "and", "of", "to", "in", "is", "that", "for", "with", "was", "as", "on", "by",
+           "this", "are", "be", "from", "or", "which", "it"},
+    "de": {"der", "die", "und", "das", "ist", "nicht", "mit", "den", "von", "zu", "sich", "des",
+           "auf", "für", "ein", "eine", "dem", "im", "wurde", "auch"},
+}
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+_TOKEN_RE = re.compile(r"\S+")
+_LANGUAGE_SAMPLE_CHARS = 20000
+
+
+# ==================== ANALIZA TEKSTU ====================
+
+def detect_language(text: str) -> Optional[str]:
+    """Język tekstu (pl/en/de) na podstawie słów funkcyjnych; None, gdy nie da się ustalić."""
+    words = _WORD_RE.findall(text[:_LANGUAGE_SAMPLE_CHARS].lower())
+    if len(words) < 20:
+        return None
+
+    scores = {lang: sum(1 for word in words if word in stopwords) for lang, stopwords in _STOPWORDS.items()}
+    language, score = max(scores.items(), key=lambda item: item[1])
+    return language if score >= 0.05 * len(words) else None
+
+
+def text_layer_quality(text: str, page_count: Optional[int]) -> float:
+    """
+    Jakość warstwy tekstowej PDF w skali 0-1: udział tokenów będących słowami
+    (odrzuca "krzaki" ze źle zakodowanych fontów) przemnożony przez gęstość
+    tekstu na stronę (skan z pojedynczym nagłówkiem ma jakość bliską zeru).
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return 0.0
+
+    word_like = sum(1 for token in tokens if len(_WORD_RE.findall(token)) == 1 and len(token) >= 2)
+    chars_per_page = len(text) / max(page_count or 1, 1)
+    density = min(1.0, chars_per_page / TEXT_LAYER_FULL_CHARS_PER_PAGE)
+    return round(word_like / len(tokens) * density, 3)
+
+
+def _docx_page_count(file_path: Path) -> Optional[int]:
+    """Liczba stron zapisana przez edytor w docProps/app.xml (.docx)."""
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            app_xml = archive.read("docProps/app.xml").decode("utf-8", errors="ignore")
+    except (KeyError, OSError, zipfile.BadZipFile):
+        return None
+    match = re.search(r"<Pages>(\d+)</Pages>", app_xml)
+    return int(match.group(1)) if match else None
+
+
+# ==================== ZADANIE PROCESU ====================
+
+def ingest_document(doc_id: int) -> bool:
+    """
+    Przetwarza jeden dokument (w procesie puli): tekst do magazynu, metadane
+    tekstu do bazy, treść do indeksu. Zwraca False, gdy dokumentu nie ma.
+    """
+    from app.duplicates import file_page_texts, update_document_fingerprint
+    from app.entities import index_document_entities
+    from app.ocr_estimator import analyze_file
+    from app.search_index import index_document
+    from app.text_extraction import get_document_text_content, get_file_text
+
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        if doc is None:
+            return False
+
+        file_path = FILES_DIR / doc.stored_filename
+        file_text = get_file_text(doc)
+        content = get_document_text_content(doc, session) or ""
+
+        if doc.page_count is None and file_path.exists():
+            if doc.mime_type and "word" in doc.mime_type:
+                doc.page_count = _docx_page_count(file_path)
+            else:
+                doc.page_count = analyze_file(file_path, doc.mime_type)["page_count"]
+
+        doc.text_language = detect_language(content)
+        if doc.mime_type == "application/pdf":
+            doc.text_quality = text_layer_quality(file_text, doc.page_count)
+            if doc.has_text_layer is None:
+                doc.has_text_layer = doc.text_quality >= TEXT_LAYER_MIN_QUALITY
+        doc.text_extracted_at = datetime.utcnow()
+
+        # Teksty stron PDF z warstwą tekstową - strony encji i sygnatur duplikatów
+        file_pages = None
+        if doc.mime_type == "application/pdf" and file_text.strip():
+            file_pages = file_page_texts(file_path, doc.mime_type)
+
+        try:
+            update_document_fingerprint(session, doc, file_pages)
+        except Exception as e:
+            logger.warning(f"⚠️ [INGEST] Błąd sygnatury duplikatów dokumentu {doc_id}: {e}")
+        try:
+            index_document_entities(session, doc, content, file_pages)
+        except Exception as e:
+            logger.warning(f"⚠️ [INGEST] Błąd wyodrębniania encji dokumentu {doc_id}: {e}")
+
+        session.add(doc)
+        session.commit()
+
+    index_document(doc_id)
+    return True
+
+
+def ingest_documents(doc_ids: List[int]) -> int:
+    """Przetwarza listę dokumentów (w procesie puli). Zwraca liczbę przetworzonych."""
+    done = 0
+    for doc_id in doc_ids:
+        try:
+            done += ingest_document(doc_id)
+        except Exception as e:
+            logger.warning(f"⚠️ [INGEST] Błąd przetwarzania dokumentu {doc_id}: {e}")
+    return done
+
+
+# ==================== PULA PROCESÓW ====================
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_in_flight: Set[int] = set()  # Dokumenty zlecone, jeszcze nieprzetworzone
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=INGEST_MAX_WORKERS)
+            logger.info(f"✅ [INGEST] Utworzono pulę przetwarzania dokumentów ({INGEST_MAX_WORKERS} procesów)")
+        return _executor
+
+
+def _discard_broken_executor(executor: ProcessPoolExecutor):
+    """Porzuca uszkodzoną pulę (np. proces zabity przez OOM) - kolejne zadania dostaną nową."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _on_ingest_done(future, executor: ProcessPoolExecutor, doc_ids: List[int]):
+    with _executor_lock:
+        _in_flight.difference_update(doc_ids)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        logger.error(f"❌ [INGEST] Pula przetwarzania uszkodzona (dokumenty {doc_ids}) - zostanie odtworzona")
+        _discard_broken_executor(executor)
+    elif error is not None:
+        logger.error(f"❌ [INGEST] Błąd przetwarzania dokumentów {doc_ids}: {error}")
+    else:
+        # Tekst wyodrębniony - osadzenia dla wyszukiwania semantycznego (app/semantic_index.py)
+        from app.semantic_index import schedule_embedding
+        schedule_embedding(doc_ids)
+
+
+def schedule_ingest(doc_ids: Iterable[int]):
+    """Zleca przetworzenie dokumentów (tekst, metadane, indeks) w puli procesów."""
+    with _executor_lock:
+        doc_ids = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id not in _in_flight]
+        _in_flight.update(doc_ids)
+    if not doc_ids:
+        return
+
+    executor = _get_executor()
+    try:
+        future = executor.submit(ingest_documents, doc_ids)
+    except (BrokenProcessPool, RuntimeError):
+        _discard_broken_executor(executor)
+        executor = _get_executor()
+        future = executor.submit(ingest_documents, doc_ids)
+    future.add_done_callback(lambda f: _on_ingest_done(f, executor, doc_ids))
+
+
+def schedule_pending_ingest() -> int:
+    """
+    Zleca przetworzenie dokumentów, których tekstu jeszcze nie wyodrębniono
+    (start aplikacji - dokumenty sprzed wprowadzenia puli lub przerwane zadania).
+    """
+    with Session(engine) as session:
+        pending = list(session.exec(
+            select(Document.id)
+            .where(Document.text_extracted_at == None, Document.archived_at == None)  # noqa: E711
+            .order_by(Document.id.desc())
+        ))
+
+    for start in range(0, len(pending), INGEST_BATCH_SIZE):
+        schedule_ingest(pending[start:start + INGEST_BATCH_SIZE])
+
+    if pending:
+        logger.info(f"📥 [INGEST] Zlecono przetworzenie {len(pending)} dokumentów")
+    return len(pending)
+
+
+async def run_in_ingest_pool(func, *args):
+    """Wykonuje funkcję w puli procesów bez blokowania pętli zdarzeń."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), func, *args)
+
+
+async def analyze_file_in_pool(file_path: Path, mime_type: Optional[str]) -> Dict:
+    """Analiza wstępna pliku (app/ocr_estimator.analyze_file) w puli procesów."""
+    from app.ocr_estimator import analyze_file
+
+    return await run_in_ingest_pool(analyze_file, file_path, mime_type)
+
+
+def shutdown_ingest_pool():
+    """Zamyka pulę, porzucając niewykonane zadania (dokończy je schedule_pending_ingest)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,354 @@
+# app/listing.py
+"""
+Stronicowanie list dokumentów i opinii.
+
+- projekcja: listy pobierają tylko kolumny renderowane przez szablony (LIST_COLUMNS),
+  bez długich pól tekstowych (comments, postęp OCR itp.),
+- stronicowanie kluczem (keyset): kolejna strona zaczyna się za ostatnim wierszem
+  poprzedniej strony - kursor to wartość klucza sortowania i id, bez OFFSET,
+  więc koszt strony nie rośnie wraz z archiwum,
+- typy dokumentów do filtra z SELECT DISTINCT po indeksie (doc_type, upload_time),
+- dokumenty w archiwum (app/archive.py) tylko na żądanie - archive_condition.
+
+Wyniki wyszukiwania są sortowane według trafności w Pythonie - pobierane są wtedy
+tylko kolumny potrzebne do dopasowania (SEARCH_COLUMNS), a pełne wiersze
+wyłącznie dla wyświetlanej strony.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import func, literal, tuple_
+from sqlmodel import Session, select
+
+from app.models import Document
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Kolumny renderowane przez listy (opinions.html, documents_list.html, eksport CSV)
+LIST_COLUMNS = (
+    Document.id,
+    Document.sygnatura,
+    Document.doc_type,
+    Document.original_filename,
+    Document.stored_filename,
+    Document.step,
+    Document.ocr_status,
+    Document.mime_type,
+    Document.is_main,
+    Document.note,
+    Document.upload_time,
+    Document.last_modified,
+    Document.archived_at,
+)
+
+# Kolumny potrzebne do dopasowania wyszukiwania (metadane + odczyt treści bez FTS5, indeks archiwum)
+SEARCH_COLUMNS = (
+    Document.id,
+    Document.sygnatura,
+    Document.doc_type,
+    Document.original_filename,
+    Document.stored_filename,
+    Document.mime_type,
+    Document.archived_at,
+)
+
+
+class SortOption(NamedTuple):
+    label: str
+    column: object
+    descending: bool
+    value_type: type          # Typ wartości sortowania w kursorze strony
+
+
+SORT_OPTIONS: Dict[str, SortOption] = {
+    "newest": SortOption("Najnowsze", Document.upload_time, True, datetime),
+    "oldest": SortOption("Najstarsze", Document.upload_time, False, datetime),
+    "modified": SortOption("Ostatnio zmienione",
+                           func.coalesce(Document.last_modified, Document.upload_time), True, datetime),
+    "name": SortOption("Nazwa pliku", Document.original_filename, False, str),
+    "sygnatura": SortOption("Dotyczy", func.coalesce(Document.sygnatura, ""), False, str),
+}
+DEFAULT_SORT = "newest"
+
+
+def archive_condition(include_archive: bool = False) -> list:
+    """Warunek pomijający dokumenty przeniesione do archiwum (chyba że wyszukiwanie obejmuje archiwum)."""
+    return [] if include_archive else [Document.archived_at == None]  # noqa: E711
+
+
+@dataclass
+class ListPage:
+    """Strona listy: wiersze (projekcja LIST_COLUMNS) i kursor następnej strony."""
+    rows: list
+    next_cursor: Optional[str] = None
+    total_count: int = 0
+
+
+def resolve_sort(sort: Optional[str]) -> str:
+    return sort if sort in SORT_OPTIONS else DEFAULT_SORT
+
+
+def clamp_page_size(page_size: Optional[int]) -> int:
+    if not page_size or page_size < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+# ==================== KURSOR ====================
+
+def encode_cursor(values: Sequence) -> str:
+    """Kursor strony - nieprzezroczysty dla klienta (base64 z JSON)."""
+    payload = [{"dt": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], value_type: Optional[type] = None) -> Optional[list]:
+    """
+    Odczytuje kursor; nieprawidłowy kursor oznacza pierwszą stronę.
+
+    value_type - typ wartości sortowania: kursor listy [wartość, id] (list_page);
+    bez typu kursor wyników wyszukiwania [id] (ranked_page).
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(payload, list) or len(payload) != (1 if value_type is None else 2):
+            return None
+
+        *values, doc_id = payload
+        if not isinstance(doc_id, int) or isinstance(doc_id, bool):
+            return None
+        if value_type is None:
+            return [doc_id]
+
+        value, = values
+        if value_type is datetime:
+            if not isinstance(value, dict) or set(value) != {"dt"} or not isinstance(value["dt"], str):
+                return None
+            value = datetime.fromisoformat(value["dt"])
+        elif value is not None and not isinstance(value, value_type):
+            return None
+        return [value, doc_id]
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+# ==================== ZAPYTANIA ====================
+
+def list_page(session: Session, conditions: list, sort: str = DEFAULT_SORT,
+              cursor: Optional[str] = None, page_size: Optional[int] = DEFAULT_PAGE_SIZE) -> ListPage:
+    """
+    Strona listy dokumentów spełniających warunki, posortowana według `sort`.
+    page_size=None zwraca wszystkie wiersze (eksport).
+    """
+    option = SORT_OPTIONS[resolve_sort(sort)]
+    sort_value = option.column.label("sort_value")
+
+    total_count = session.exec(select(func.count(Document.id)).where(*conditions)).one()
+
+    query = select(*LIST_COLUMNS, sort_value).where(*conditions)
+    if option.descending:
+        query = query.order_by(option.column.desc(), Document.id.desc())
+    else:
+        query = query.order_by(option.column, Document.id)
+
+    position = decode_cursor(cursor, option.value_type)
+    if position:
+        key = tuple_(option.column, Document.id)
+        after = tuple_(literal(position[0], option.column.type), literal(position[1]))
+        query = query.where(key < after if option.descending else key > after)
+
+    if page_size is None:
+        return ListPage(rows=session.exec(query).all(), total_count=total_count)
+
+    page_size = clamp_page_size(page_size)
+    rows = session.exec(query.limit(page_size + 1)).all()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([rows[-1].sort_value, rows[-1].id])
+
+    return ListPage(rows=rows, next_cursor=next_cursor, total_count=total_count)
+
+
+def search_candidates(session: Session, conditions: list, sort: str = DEFAULT_SORT) -> list:
+    """Wszystkie dokumenty spełniające warunki - tylko kolumny SEARCH_COLUMNS, w kolejności `sort`."""
+    option = SORT_OPTIONS[resolve_sort(sort)]
+    query = select(*SEARCH_COLUMNS).where(*conditions)
+    if option.descending:
+        query = query.order_by(option.column.desc(), Document.id.desc())
+    else:
+        query = query.order_by(option.column, Document.id)
+    return session.exec(query).all()
+
+
+def ranked_page(session: Session, ranked_ids: List[int], cursor: Optional[str] = None,
+                page_size: Optional[int] = DEFAULT_PAGE_SIZE) -> ListPage:
+    """
+    Strona wyników wyszukiwania uporządkowanych w Pythonie (trafność).
+    Kursor wskazuje ostatni dokument poprzedniej strony; pełne wiersze
+    pobierane są tylko dla bieżącej strony.
+    """
+    start = 0
+    position = decode_cursor(cursor)
+    if position and position[0] in ranked_ids:
+        start = ranked_ids.index(position[0]) + 1
+
+    if page_size is None:
+        page_ids = ranked_ids[start:]
+    else:
+        page_ids = ranked_ids[start:start + clamp_page_size(page_size)]
+
+    rows_by_id = {}
+    if page_ids:
+        rows_by_id = {row.id: row for row in session.exec(select(*LIST_COLUMNS).where(Document.id.in_(page_ids)))}
+    rows = [rows_by_id[doc_id] for doc_id in page_ids if doc_id in rows_by_id]
+
+    next_cursor = None
+    if page_ids and start + len(page_ids) < len(ranked_ids):
+        next_cursor = encode_cursor([page_ids[-1]])
+
+    return ListPage(rows=rows, next_cursor=next_cursor, total_count=len(ranked_ids))
+
+
+def rank_search(session: Session, conditions: list, search_term: str, search_content: bool = False,
+                fuzzy_search: bool = False, sort: str = DEFAULT_SORT, semantic_search: bool = False):
+    """
+    Dopasowanie i uporządkowanie wszystkich wyników wyszukiwania (bez stronicowania).
+    semantic_search - treść wyszukiwana hybrydowo: indeks pełnotekstowy + osadzenia
+    (app/semantic_index.py). Wpisany PESEL, sygnatura akt lub data wyszukiwane są
+    w treści także po wartości znormalizowanej w indeksie encji (app/entities.py).
+
+    Returns:
+        CachedSearch: uporządkowane dokumenty, rodzaje dopasowań, trafienia w treści i encjach
+    """
+    from app.entities import find_entity_documents, parse_entity_query
+    from app.search import is_fuzzy_match
+    from app.search_cache import CachedSearch
+    from app.search_index import NO_HIT_SORT_KEY, find_content_matches
+    from app.semantic_index import hybrid_content_matches
+
+    candidates = search_candidates(session, conditions, sort)
+
+    # Treść z indeksu pełnotekstowego (app/search_index.py) i indeksu osadzeń
+    if semantic_search:
+        content_hits = hybrid_content_matches(search_term, candidates, fuzzy_search, session)
+    elif search_content:
+        content_hits = find_content_matches(search_term, candidates, fuzzy_search, session)
+    else:
+        content_hits = {}
+
+    # Encja zapisana inaczej niż w treści (np. "12.03.2020" / "12 marca 2020 r.")
+    entity_hits = {}
+    entity_query = parse_entity_query(search_term) if search_content or semantic_search else None
+    if entity_query:
+        entity_hits = find_entity_documents(session, *entity_query, doc_ids=[doc.id for doc in candidates])
+
+    search_matches = {}
+    matched_ids = []
+    for doc in candidates:
+        matches = []
+
+        # Wyszukiwanie w metadanych
+        searchable_text = ' '.join(filter(None, [
+            doc.original_filename or '',
+            doc.sygnatura or '',
+            doc.doc_type or ''
+        ]))
+
+        if search_term.lower() in searchable_text.lower():
+            matches.append('metadata')
+        elif fuzzy_search and is_fuzzy_match(search_term, searchable_text):
+            matches.append('fuzzy_metadata')
+
+        # Wyszukiwanie w treści
+        hit = content_hits.get(doc.id)
+        if hit:
+            if hit.semantic:
+                matches.append('semantic_content')
+            else:
+                matches.append('fuzzy_content' if hit.fuzzy else 'content')
+        if doc.id in entity_hits:
+            matches.append('entity')
+
+        if matches:
+            search_matches[doc.id] = matches
+            matched_ids.append(doc.id)
+
+    # Trafienia encji, następnie w treści według trafności, pozostałe w kolejności sortowania
+    matched_ids.sort(key=lambda doc_id: (0 if doc_id in entity_hits else 1,
+                                         content_hits[doc_id].sort_key if doc_id in content_hits
+                                         else NO_HIT_SORT_KEY))
+
+    return CachedSearch(matched_ids, search_matches, content_hits, entity_hits)
+
+
+def search_page(session: Session, conditions: list, search_term: str, search_content: bool = False,
+                fuzzy_search: bool = False, sort: str = DEFAULT_SORT, cursor: Optional[str] = None,
+                page_size: Optional[int] = DEFAULT_PAGE_SIZE,
+                semantic_search: bool = False) -> Tuple[ListPage, Dict[int, List[str]], Dict[int, str]]:
+    """
+    Wyszukiwanie w metadanych (i treści) dokumentów spełniających warunki - strona wyników.
+
+    Uporządkowane wyniki (rank_search) pochodzą z pamięci podręcznej (app/search_cache.py),
+    jeśli to samo wyszukiwanie wykonano przy bieżącej wersji treści - kolejne strony,
+    powtórzone wyszukiwania i eksport CSV pobierają wtedy tylko wiersze.
+
+    Returns:
+        tuple: (strona wyników, rodzaje dopasowań dokumentów, fragmenty treści z trafieniami)
+    """
+    from app.entities import entity_snippet
+    from app.search_cache import get_content_version, normalize_search_term, search_cache, search_cache_key
+    from app.search_index import fill_snippets
+    from app.semantic_index import semantic_snippet
+
+    search_term = normalize_search_term(search_term)
+    key = search_cache_key(search_term, conditions, resolve_sort(sort), search_content=search_content,
+                           fuzzy_search=fuzzy_search, semantic_search=semantic_search)
+    version = get_content_version(session)
+    ranked = search_cache.get(key, version)
+    if ranked is None:
+        ranked = search_cache.put(key, version, rank_search(
+            session, conditions, search_term, search_content, fuzzy_search, sort, semantic_search
+        ))
+
+    content_hits, entity_hits = ranked.content_hits, ranked.entity_hits
+    page = ranked_page(session, ranked.matched_ids, cursor, page_size)
+
+    # Fragmenty trafień z pozycji w indeksie tylko dla wyświetlanej strony
+    search_snippets = {}
+    fill_snippets(content_hits[row.id] for row in page.rows if row.id in content_hits)
+    for row in page.rows:
+        hit = content_hits.get(row.id)
+        if hit and hit.semantic and hit.span and not hit.snippet:
+            # Fragment trafienia semantycznego tylko dla wyświetlanej strony
+            hit.snippet = semantic_snippet(row, hit.span, session)
+        if hit and hit.snippet:
+            search_snippets[row.id] = hit.snippet
+        elif row.id in entity_hits:
+            first = entity_hits[row.id][0]
+            search_snippets[row.id] = entity_snippet(row, (first.start_offset, first.end_offset), session)
+
+    return page, ranked.search_matches, search_snippets
+
+
+def list_doc_types(session: Session) -> List[str]:
+    """Typy dokumentów do filtra - SELECT DISTINCT po indeksie zamiast odczytu całej tabeli."""
+    query = select(Document.doc_type).where(Document.doc_type != None).distinct().order_by(Document.doc_type)  # noqa: E711
+    return [doc_type for doc_type in session.exec(query) if doc_type]
+
+
+def pagination_links(request, next_cursor: Optional[str], cursor: Optional[str]) -> Dict[str, Optional[str]]:
+    """Adresy następnej i pierwszej strony listy (z zachowaniem filtrów w zapytaniu)."""
+    return {
+        "next_page_url": str(request.url.include_query_params(cursor=next_cursor)) if next_cursor else None,
+        "first_page_url": str(request.url.remove_query_params("cursor")) if cursor else None,
+    }
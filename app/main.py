@@ -101,6 +101,22 @@ async def startup():
     # Ensure database tables are created
     init_db()
 
+    # Dokumenty bez wyodrębnionego tekstu - pula przetwarzania (tekst, metadane, indeks)
+    from app.ingest import schedule_pending_ingest
+    schedule_pending_ingest()
+
+    # Dokumenty spoza indeksu pełnotekstowego - indeksowanie w tle
+    from app.search_index import schedule_index_missing
+    schedule_index_missing()
+
+    # Dokumenty spoza indeksu osadzeń (wyszukiwanie semantyczne) - osadzanie w tle
+    from app.semantic_index import schedule_missing_embeddings
+    schedule_missing_embeddings()
+
+    # Indeks podpowiedzi wyszukiwania (typeahead) - ładowanie w tle
+    from app.suggest import schedule_suggest_index_load
+    schedule_suggest_index_load()
+
     # Uruchomienie nowego systemu workerów zadań w tle
     from app.background_tasks import start_background_workers
     asyncio.create_task(start_background_workers())
@@ -116,6 +132,18 @@ async def shutdown():
     from app.background_tasks import cleanup_background_workers
     await cleanup_background_workers()
 
+    from app.search_index import shutdown_index_worker
+    shutdown_index_worker()
+
+    from app.ingest import shutdown_ingest_pool
+    shutdown_ingest_pool()
+
+    from app.text_scan import shutdown_scan_pool
+    shutdown_scan_pool()
+
+    from app.semantic_index import shutdown_embedding_worker
+    shutdown_embedding_worker()
+
     print("🛑 [MAIN] Aplikacja zamknięta, workery zatrzymane")
 
 
@@ -200,6 +228,14 @@ def debug_multiprocessing():
         return {"error": str(e)}
 
 
+@app.get("/debug/ocr-workers", name="debug_ocr_workers")
+def debug_ocr_workers():
+    """Debug endpoint - stan puli procesów OCR i supervisora"""
+    from app.background_tasks import get_ocr_pool_status
+
+    return get_ocr_pool_status()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,269 @@
+# app/migrations.py
+"""
+Wersjonowane migracje schematu bazy danych.
+
+Każda migracja ma numer wersji i jest wykonywana dokładnie raz - zastosowane
+wersje zapisywane są w tabeli schema_version. Migracje są idempotentne -
+przerwaną migrację można bezpiecznie powtórzyć, a bazy, w których część zmian
+wprowadzono wcześniej (ad hoc lub przez SQLModel.metadata.create_all), nie
+wymagają specjalnej obsługi.
+
+Nowa migracja: dopisz funkcję przyjmującą połączenie i dodaj ją na końcu MIGRATIONS
+z kolejnym numerem wersji. Zastosowanych migracji nie wolno zmieniać.
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import text
+
+logger = logging.getLogger("migrations")
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+# ==================== MIGRACJE ====================
+
+def _add_document_columns(connection: Connection):
+    """Kolumny dodane do dokumentu po pierwszym wydaniu (wcześniej ad hoc w init_db)."""
+    columns = {
+        "content_type": "VARCHAR DEFAULT 'document'",
+        "mime_type": "VARCHAR",
+        "ocr_confidence": "FLOAT",
+        "note": "VARCHAR",
+        "page_count": "INTEGER",
+        "has_text_layer": "BOOLEAN",
+        "page_pixels": "INTEGER",
+    }
+
+    existing_columns = {col["name"] for col in inspect(connection).get_columns("document")}
+    for name, ddl in columns.items():
+        if name not in existing_columns:
+            logger.info(f"Dodawanie kolumny '{name}'...")
+            connection.execute(text(f"ALTER TABLE document ADD COLUMN {name} {ddl}"))
+
+
+# Indeksy ścieżek dostępu używanych przez listy i widoki szczegółów:
+# - dokumenty opinii (parent_id) sortowane po dacie,
+# - wynik OCR dokumentu (ocr_parent_id + doc_type = 'OCR TXT'), najnowszy pierwszy,
+# - lista opinii (is_main + step) sortowana po dacie - indeks częściowy, bo opinie
+#   to niewielka część tabeli, a sam is_main nie jest dla planera selektywny,
+# - lista wszystkich dokumentów sortowana po dacie.
+DOCUMENT_INDEXES = {
+    "ix_document_parent_upload": "document (parent_id, upload_time)",
+    "ix_document_ocr_parent_type": "document (ocr_parent_id, doc_type, upload_time)",
+    "ix_document_main_step": "document (step, upload_time) WHERE is_main = 1",
+    "ix_document_upload_time": "document (upload_time)",
+}
+
+
+def _create_document_indexes(connection: Connection):
+    for name, target in DOCUMENT_INDEXES.items():
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {target}"))
+    # Statystyki dla planera zapytań
+    connection.execute(text("ANALYZE document"))
+
+
+def _create_document_fts(connection: Connection):
+    """Indeks pełnotekstowy treści (app/search_index.py) - wypełniany w tle po starcie."""
+    from app.search_index import create_fts_table
+
+    create_fts_table(connection)
+
+
+def _create_document_fts_vocab(connection: Connection):
+    """Słownik indeksu pełnotekstowego dla wyszukiwania rozmytego."""
+    from app.search_index import create_fts_vocab_table
+
+    create_fts_vocab_table(connection)
+
+
+def _add_document_text_columns(connection: Connection):
+    """Metadane tekstu wyodrębnianego po przyjęciu dokumentu (app/ingest.py)."""
+    columns = {
+        "text_language": "VARCHAR",
+        "text_quality": "FLOAT",
+        "text_extracted_at": "DATETIME",
+    }
+
+    existing_columns = {col["name"] for col in inspect(connection).get_columns("document")}
+    for name, ddl in columns.items():
+        if name not in existing_columns:
+            logger.info(f"Dodawanie kolumny '{name}'...")
+            connection.execute(text(f"ALTER TABLE document ADD COLUMN {name} {ddl}"))
+
+
+# Indeksy list stronicowanych (app/listing.py): filtr typu dokumentu sortowany
+# po dacie, a zarazem SELECT DISTINCT doc_type. Filtr statusu listy dokumentów
+# przechodzi indeks ix_document_upload_time do wypełnienia strony.
+LIST_INDEXES = {
+    "ix_document_doc_type_upload": "document (doc_type, upload_time)",
+}
+
+
+def _create_list_indexes(connection: Connection):
+    for name, target in LIST_INDEXES.items():
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {target}"))
+    connection.execute(text("ANALYZE document"))
+
+
+def _create_opinion_stats(connection: Connection):
+    """Agregaty dokumentów opinii utrzymywane wyzwalaczami (app/opinion_stats.py)."""
+    from app.opinion_stats import create_stats_schema, rebuild_stats
+
+    create_stats_schema(connection)
+    rebuild_stats(connection)
+
+
+def _add_document_sha256(connection: Connection):
+    """Skrót pliku dokumentu do wykrywania duplikatów (app/duplicates.py)."""
+    existing_columns = {col["name"] for col in inspect(connection).get_columns("document")}
+    if "file_sha256" not in existing_columns:
+        logger.info("Dodawanie kolumny 'file_sha256'...")
+        connection.execute(text("ALTER TABLE document ADD COLUMN file_sha256 VARCHAR"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_document_file_sha256 ON document (file_sha256)"))
+
+
+def _create_entity_index(connection: Connection):
+    """Wyszukiwanie encji po typie i wartości (app/entities.py) - wypełniane przez app/ingest.py."""
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_document_entity_lookup ON document_entity (entity_type, value, doc_id)"
+    ))
+
+
+def _create_document_change_log(connection: Connection):
+    """Dziennik zmian dokumentów dla indeksu podpowiedzi w pamięci (app/suggest.py)."""
+    from app.suggest import create_suggest_schema
+
+    create_suggest_schema(connection)
+
+
+def _create_document_fts_instances(connection: Connection):
+    """Pozycje tokenów indeksu pełnotekstowego - frazy, NEAR i fragmenty wyników (app/search_index.py)."""
+    from app.search_index import create_fts_instance_table
+
+    create_fts_instance_table(connection)
+
+
+def _create_content_version(connection: Connection):
+    """Liczniki wersji treści dla pamięci podręcznej wyników wyszukiwania (app/search_cache.py)."""
+    from app.search_cache import create_version_schema
+
+    create_version_schema(connection)
+
+
+def _create_document_archive(connection: Connection):
+    """Archiwum opinii k4: znacznik dokumentów, indeks treści archiwum, podpowiedzi bez archiwum (app/archive.py)."""
+    from app.search_index import create_archive_fts_table
+    from app.suggest import create_suggest_schema
+
+    existing_columns = {col["name"] for col in inspect(connection).get_columns("document")}
+    if "archived_at" not in existing_columns:
+        logger.info("Dodawanie kolumny 'archived_at'...")
+        connection.execute(text("ALTER TABLE document ADD COLUMN archived_at DATETIME"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_document_archived_at ON document (archived_at)"))
+    create_archive_fts_table(connection)
+
+    # Wyzwalacz dziennika zmian obejmuje teraz kolumnę archived_at
+    connection.execute(text("DROP TRIGGER IF EXISTS document_change_update"))
+    create_suggest_schema(connection)
+
+
+def _create_file_blobs(connection: Connection):
+    """Magazyn plików adresowany treścią - liczniki dokumentów wskazujących plik (app/blobs.py)."""
+    from app.blobs import create_blob_schema
+
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_document_stored_filename ON document (stored_filename)"))
+    create_blob_schema(connection)
+
+
+def _global_content_version(connection: Connection):
+    """Wyzwalacze wersji treści podnoszą tylko licznik globalny - jedyny odczytywany (app/search_cache.py)."""
+    from app.search_cache import GLOBAL_SCOPE, create_version_schema
+
+    create_version_schema(connection, replace=True)
+    connection.execute(text("DELETE FROM content_version WHERE scope != :scope"), {"scope": GLOBAL_SCOPE})
+
+
+def _search_columns_content_version(connection: Connection):
+    """Wyzwalacz zmiany dokumentu ograniczony do kolumn wyszukiwania (bez postępu OCR) - app/search_cache.py."""
+    from app.search_cache import create_version_schema
+
+    create_version_schema(connection, replace=True)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "document_columns", _add_document_columns),
+    Migration(2, "document_indexes", _create_document_indexes),
+    Migration(3, "document_fts", _create_document_fts),
+    Migration(4, "document_fts_vocab", _create_document_fts_vocab),
+    Migration(5, "document_text_columns", _add_document_text_columns),
+    Migration(6, "list_indexes", _create_list_indexes),
+    Migration(7, "opinion_stats", _create_opinion_stats),
+    Migration(8, "document_sha256", _add_document_sha256),
+    Migration(9, "entity_index", _create_entity_index),
+    Migration(10, "document_change_log", _create_document_change_log),
+    Migration(11, "document_fts_instances", _create_document_fts_instances),
+    Migration(12, "content_version", _create_content_version),
+    Migration(13, "document_archive", _create_document_archive),
+    Migration(14, "file_blobs", _create_file_blobs),
+    Migration(15, "global_content_version", _global_content_version),
+    Migration(16, "search_columns_content_version", _search_columns_content_version),
+]
+
+
+# ==================== WYKONANIE ====================
+
+def _ensure_version_table(connection: Connection):
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at VARCHAR NOT NULL
+        )
+    """))
+
+
+def get_schema_version(engine: Engine) -> int:
+    """Najwyższa zastosowana wersja schematu (0 dla nowej bazy)."""
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+        return connection.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """
+    Wykonuje brakujące migracje w kolejności wersji.
+
+    Returns:
+        list: numery zastosowanych teraz wersji
+    """
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+        applied_versions = set(connection.execute(text("SELECT version FROM schema_version")).scalars())
+
+    applied_now = []
+    for migration in MIGRATIONS:
+        if migration.version in applied_versions:
+            continue
+
+        logger.info(f"Migracja {migration.version}: {migration.name}...")
+        with engine.begin() as connection:
+            migration.apply(connection)
+            connection.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {"version": migration.version, "name": migration.name,
+                 "applied_at": datetime.utcnow().isoformat()}
+            )
+        applied_now.append(migration.version)
+
+    if applied_now:
+        logger.info(f"Zastosowano migracje: {applied_now}")
+    return applied_now
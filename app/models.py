@@ -7,7 +7,7 @@ class Document(SQLModel, table=True):
     sygnatura: str | None = None        # zmiana, teraz przechowuje to Imię i Nazwisko osoby, której dotyczy
     doc_type: str | None = None
     original_filename: str
-    stored_filename: str
+    stored_filename: str = Field(index=True)   # Plik w FILES_DIR (wspólny dla identycznych plików - app/blobs.py)
     step: str
     ocr_status: str = "none"            # none/pending/running/done/fail
     ocr_parent_id: int | None = None    # Relacja do dokumentu źródłowego OCR
@@ -34,3 +34,194 @@ class Document(SQLModel, table=True):
     ocr_progress_info: str | None = None  # Dodatkowe informacje o postępie
     ocr_total_pages: int | None = None  # Całkowita liczba stron
     ocr_current_page: int | None = None  # Aktualna przetwarzana strona
+
+    # Analiza wstępna pliku przed OCR (app/ocr_estimator.py)
+    page_count: int | None = None       # Liczba stron (obraz = 1)
+    has_text_layer: bool | None = None  # Czy PDF ma już warstwę tekstową
+    page_pixels: int | None = None      # Średnia liczba pikseli strony po renderowaniu do OCR
+
+    # Wyodrębnienie tekstu po przyjęciu dokumentu (app/ingest.py)
+    text_language: str | None = None    # Język tekstu (pl/en/de)
+    text_quality: float | None = None   # Jakość warstwy tekstowej PDF (0-1)
+    text_extracted_at: datetime | None = None  # Kiedy tekst trafił do magazynu tekstów
+
+    # Wykrywanie duplikatów (app/duplicates.py)
+    file_sha256: str | None = Field(default=None, index=True)  # SHA-256 pliku w chwili przyjęcia
+
+    # Archiwum opinii w kroku k4 (app/archive.py)
+    archived_at: datetime | None = Field(default=None, index=True)  # Pliki w archiwum, treść w indeksie archiwum
+
+
+class OcrTiming(SQLModel, table=True):
+    """Zmierzony czas zadania OCR - dane dla modelu czasu strony i ETA kolejki."""
+    id: int | None = Field(default=None, primary_key=True)
+    doc_count: int = 1                  # Liczba dokumentów w zadaniu (batch > 1)
+    pages: int                          # Łączna liczba stron
+    page_pixels: int | None = None      # Średnia liczba pikseli strony
+    seconds: float                      # Czas ścienny zadania
+    finished_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class OcrJob(SQLModel, table=True):
+    """
+    Jedna próba OCR dokumentu - stan wykonania i postęp.
+
+    Postęp w trakcie przetwarzania zapisywany jest wyłącznie tutaj, dzięki czemu
+    wiersz document zmienia się tylko przy przejściach stanu (start, zakończenie,
+    błąd, anulowanie). Każde ponowienie tworzy nowy wiersz - historia prób.
+    """
+    id: int | None = Field(default=None, primary_key=True)
+    doc_id: int = Field(index=True)     # Dokument źródłowy OCR
+    attempt: int = 1                    # Numer próby dla dokumentu
+    status: str = "running"             # running/done/fail/cancelled
+    progress: float | None = None       # Postęp od 0.0 do 1.0
+    progress_info: str | None = None    # Opis bieżącego kroku
+    current_page: int | None = None     # Aktualna przetwarzana strona
+    total_pages: int | None = None      # Całkowita liczba stron
+    error: str | None = None            # Przyczyna błędu / przerwania próby
+    worker_pid: int | None = None       # PID procesu OCR
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+
+
+class OpinionStats(SQLModel, table=True):
+    """
+    Zagregowane dane dokumentów opinii (dzieci po parent_id).
+
+    Utrzymywane przez wyzwalacze SQLite na tabeli document (app/opinion_stats.py)
+    w tej samej transakcji co zmiana dokumentu - niezależnie od tego, czy zmianę
+    wykonuje ORM, czy proces OCR przez surowe zapytania.
+    """
+    __tablename__ = "opinion_stats"
+
+    opinion_id: int = Field(primary_key=True)
+    doc_count: int = 0                  # Liczba dokumentów opinii
+    ocr_none: int = 0                   # Dokumenty wg statusu OCR
+    ocr_pending: int = 0
+    ocr_running: int = 0
+    ocr_done: int = 0
+    ocr_fail: int = 0
+    pdf_count: int = 0                  # Pliki PDF
+    image_count: int = 0                # Obrazy
+    total_pages: int = 0                # Suma stron dokumentów (page_count)
+    last_activity: datetime | None = None  # Najnowsze dodanie/modyfikacja dokumentu
+
+
+class OpinionTypeCount(SQLModel, table=True):
+    """Liczba dokumentów opinii danego typu (doc_type, brak typu = "Inne")."""
+    __tablename__ = "opinion_type_count"
+
+    opinion_id: int = Field(primary_key=True)
+    doc_type: str = Field(primary_key=True)
+    doc_count: int = 0
+
+
+class EmbeddingDocument(SQLModel, table=True):
+    """Stan osadzeń (embeddingów) treści dokumentu w indeksie wektorowym (app/semantic_index.py)."""
+    __tablename__ = "embedding_document"
+
+    doc_id: int = Field(primary_key=True)
+    content_hash: str                   # Skrót osadzonej treści - zmiana treści = ponowne osadzenie
+    model: str                          # Model osadzeń (z llama-server)
+    chunk_count: int = 0
+    embedded_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class EmbeddingChunk(SQLModel, table=True):
+    """Fragment treści dokumentu - id to numer wiersza wektora w pliku indeksu."""
+    __tablename__ = "embedding_chunk"
+
+    id: int = Field(primary_key=True)
+    doc_id: int = Field(index=True)
+    start_offset: int                   # Pozycje fragmentu w treści dokumentu (get_document_text_content)
+    end_offset: int
+
+
+class SearchTokenOffsets(SQLModel, table=True):
+    """
+    Zakresy znaków kolejnych tokenów treści w indeksie pełnotekstowym (app/search_index.py)
+    - pozycja tokenu z indeksu FTS5 -> miejsce w oryginalnej treści.
+    """
+    __tablename__ = "search_token_offsets"
+
+    doc_id: int = Field(primary_key=True)
+    token_count: int                    # Liczba tokenów treści (jak w indeksie FTS5)
+    offsets: bytes | None = None        # Pary (początek, koniec) uint32; None - podział niezgodny z FTS5
+
+
+class DocumentMinhash(SQLModel, table=True):
+    """
+    Sygnatura MinHash tekstu dokumentu (page = 0) lub jego strony (page >= 1)
+    - do wykrywania prawie identycznych dokumentów (app/duplicates.py).
+    """
+    __tablename__ = "document_minhash"
+
+    doc_id: int = Field(primary_key=True)
+    page: int = Field(primary_key=True)
+    signature: bytes                    # MINHASH_PERMUTATIONS wartości uint32
+    shingle_count: int                  # Liczba różnych n-gramów słów tekstu
+    source: str = "file"                # file/ocr - tekst pliku lub wynik OCR
+
+
+class MinhashBand(SQLModel, table=True):
+    """Kubełek LSH pasma sygnatury - dokumenty w tym samym kubełku są kandydatami na duplikaty."""
+    __tablename__ = "minhash_band"
+
+    bucket: int = Field(primary_key=True)   # Skrót (numer pasma, wartości pasma)
+    doc_id: int = Field(primary_key=True, index=True)
+    page: int = Field(primary_key=True)
+
+
+class DocumentEntity(SQLModel, table=True):
+    """
+    Wystąpienie encji (PESEL, data, sygnatura akt, osoba) w treści dokumentu (app/entities.py).
+    Wyszukiwanie po indeksie (entity_type, value, doc_id) - migracja entity_index.
+    """
+    __tablename__ = "document_entity"
+
+    id: int | None = Field(default=None, primary_key=True)
+    doc_id: int = Field(index=True)
+    entity_type: str                    # pesel/date/case/person
+    value: str                          # Wartość znormalizowana
+    page: int | None = None             # Strona dokumentu (gdy da się ustalić)
+    start_offset: int                   # Pozycje w treści dokumentu (get_document_text_content)
+    end_offset: int
+
+
+class DocumentChange(SQLModel, table=True):
+    """
+    Dziennik zmian dokumentów dla indeksów w pamięci (app/suggest.py).
+    Wypełniany wyzwalaczami SQLite - także przy zapisach procesu OCR przez surowe zapytania.
+    """
+    __tablename__ = "document_change"
+    __table_args__ = {"sqlite_autoincrement": True}  # Numery nie są używane ponownie po czyszczeniu
+
+    seq: int | None = Field(default=None, primary_key=True)
+    doc_id: int
+
+
+class FileBlob(SQLModel, table=True):
+    """
+    Plik w magazynie adresowanym treścią (app/blobs.py) - wspólny dla dokumentów
+    z identyczną zawartością. Licznik dokumentów utrzymują wyzwalacze SQLite.
+    """
+    __tablename__ = "file_blob"
+
+    stored_filename: str = Field(primary_key=True)  # blobs/<2 znaki>/<sha256><rozszerzenie>
+    sha256: str = Field(index=True)     # Skrót zawartości w chwili przyjęcia
+    size: int                           # Rozmiar w bajtach
+    ref_count: int = 0                  # Dokumenty wskazujące plik (stored_filename)
+    ocr_doc_id: int | None = None       # Dokument OCR TXT z wynikiem OCR pliku
+    ocr_config: str | None = None       # Konfiguracja modelu OCR tego wyniku
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ContentVersion(SQLModel, table=True):
+    """
+    Globalny licznik wersji treści (scope = 0) dla pamięci podręcznej wyników
+    wyszukiwania (app/search_cache.py) - podnoszony wyzwalaczami.
+    """
+    __tablename__ = "content_version"
+
+    scope: int = Field(primary_key=True)
+    version: int = 0
@@ -0,0 +1,360 @@
+# app/ocr_estimator.py
+"""
+Szacowanie czasu OCR i kontrola przyjmowania zadań do kolejki.
+
+- analiza wstępna pliku (liczba stron, warstwa tekstowa, rozmiar strony w pikselach),
+- model czasu strony dopasowany do zmierzonych czasów zadań (OcrTiming),
+- ETA dokumentu liczona dla całej kolejki i wszystkich procesów OCR,
+- backpressure: odrzucenie lub odłożenie uploadu, gdy kolejka jest przepełniona.
+"""
+
+import heapq
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlmodel import Session, select
+
+from app.db import engine, FILES_DIR
+from app.models import Document, OcrTiming
+from app.ocr_jobs import get_open_ocr_jobs
+from tasks.ocr.config import (
+    OCR_DEFAULT_SECONDS_PER_PAGE,
+    OCR_TIMING_SAMPLES,
+    OCR_MAX_BACKLOG_SECONDS,
+    OCR_BACKPRESSURE_MODE,
+    logger,
+)
+
+# pikepdf jest opcjonalny - bez niego liczba stron z PyPDF2, bez wykrywania rozmiaru
+try:
+    import pikepdf
+
+    HAS_PIKEPDF = True
+except ImportError:
+    HAS_PIKEPDF = False
+
+try:
+    from PIL import Image
+
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
+
+# Rozdzielczość renderowania stron PDF w pipeline OCR (pdf2image, dpi=200)
+OCR_RENDER_DPI = 200
+
+# Informacja o postępie dla dokumentów odłożonych przez backpressure
+OCR_DEFERRED_INFO = "Odłożony - kolejka OCR przepełniona"
+
+# Jak długo model czasu jest trzymany w pamięci przed ponownym dopasowaniem
+_MODEL_TTL_SECONDS = 60
+
+
+# ==================== ANALIZA WSTĘPNA ====================
+
+def analyze_file(file_path: Path, mime_type: Optional[str]) -> Dict:
+    """
+    Tania analiza pliku przed OCR - bez renderowania stron.
+
+    Returns:
+        dict: {"page_count", "has_text_layer", "page_pixels"} (wartości mogą być None)
+    """
+    result = {"page_count": None, "has_text_layer": None, "page_pixels": None}
+
+    try:
+        if mime_type and mime_type.startswith("image/"):
+            result["page_count"] = 1
+            result["has_text_layer"] = False
+            if HAS_PIL:
+                with Image.open(file_path) as img:
+                    result["page_pixels"] = img.width * img.height
+
+        elif mime_type == "application/pdf":
+            if HAS_PIKEPDF:
+                result.update(_analyze_pdf_pikepdf(file_path))
+            else:
+                import PyPDF2
+
+                with open(file_path, "rb") as pdf_file:
+                    result["page_count"] = len(PyPDF2.PdfReader(pdf_file).pages)
+
+    except Exception as e:
+        logger.warning(f"Błąd analizy wstępnej pliku {file_path}: {str(e)}")
+
+    return result
+
+
+def _analyze_pdf_pikepdf(file_path: Path) -> Dict:
+    """Liczba stron, obecność fontów (warstwa tekstowa) i rozmiar stron PDF."""
+    with pikepdf.open(file_path) as pdf:
+        pages = pdf.pages
+        has_text = False
+        total_pixels = 0
+
+        for page in pages:
+            resources = page.obj.get("/Resources")
+            if not has_text and resources is not None and "/Font" in resources:
+                has_text = True
+
+            x0, y0, x1, y1 = [float(v) for v in page.mediabox]
+            scale = OCR_RENDER_DPI / 72.0
+            total_pixels += int(abs(x1 - x0) * scale * abs(y1 - y0) * scale)
+
+        page_count = len(pages)
+        return {
+            "page_count": page_count,
+            "has_text_layer": has_text,
+            "page_pixels": total_pixels // page_count if page_count else None,
+        }
+
+
+def apply_preflight(doc: Document, file_path: Optional[Path] = None, info: Optional[Dict] = None) -> Document:
+    """
+    Uzupełnia pola analizy wstępnej dokumentu (bez zapisu do bazy).
+    `info` - gotowy wynik analyze_file (np. z puli app/ingest.py).
+    """
+    if info is None:
+        info = analyze_file(file_path or FILES_DIR / doc.stored_filename, doc.mime_type)
+    doc.page_count = info["page_count"]
+    doc.has_text_layer = info["has_text_layer"]
+    doc.page_pixels = info["page_pixels"]
+    return doc
+
+
+# ==================== MODEL CZASU STRONY ====================
+
+@dataclass
+class PageTimeModel:
+    """Czas strony = intercept + slope * megapiksele (regresja liniowa na pomiarach)."""
+    intercept: float = OCR_DEFAULT_SECONDS_PER_PAGE
+    slope: float = 0.0
+    samples: int = 0
+    mean_megapixels: float = 0.0        # używane, gdy rozmiar strony nie jest znany
+
+    def predict_page(self, page_pixels: Optional[int] = None) -> float:
+        megapixels = page_pixels / 1_000_000 if page_pixels else self.mean_megapixels
+        return max(self.intercept + self.slope * megapixels, 1.0)
+
+
+def fit_page_time_model(timings: List[OcrTiming]) -> PageTimeModel:
+    """Dopasowuje model czasu strony do pomiarów (ważonych liczbą stron)."""
+    points = [
+        (t.page_pixels / 1_000_000 if t.page_pixels else None, t.seconds / t.pages, t.pages)
+        for t in timings if t.pages and t.seconds > 0
+    ]
+    if not points:
+        return PageTimeModel()
+
+    total_weight = sum(w for _, _, w in points)
+    mean_seconds = sum(s * w for _, s, w in points) / total_weight
+
+    sized = [(x, s, w) for x, s, w in points if x is not None]
+    if len(sized) < 5:
+        return PageTimeModel(intercept=mean_seconds, samples=len(points))
+
+    sized_weight = sum(w for _, _, w in sized)
+    mean_x = sum(x * w for x, _, w in sized) / sized_weight
+    mean_y = sum(s * w for _, s, w in sized) / sized_weight
+    var_x = sum(w * (x - mean_x) ** 2 for x, _, w in sized)
+
+    if var_x < 1e-9:
+        return PageTimeModel(intercept=mean_seconds, samples=len(points), mean_megapixels=mean_x)
+
+    slope = sum(w * (x - mean_x) * (s - mean_y) for x, s, w in sized) / var_x
+    slope = max(slope, 0.0)  # większa strona nie może być szybsza
+    return PageTimeModel(
+        intercept=mean_y - slope * mean_x,
+        slope=slope,
+        samples=len(points),
+        mean_megapixels=mean_x,
+    )
+
+
+_model_cache = {"model": None, "loaded_at": 0.0}
+
+
+def get_page_time_model() -> PageTimeModel:
+    """Zwraca model czasu strony dopasowany do ostatnich pomiarów (z krótkim cache)."""
+    now = time.monotonic()
+    if _model_cache["model"] is not None and now - _model_cache["loaded_at"] < _MODEL_TTL_SECONDS:
+        return _model_cache["model"]
+
+    with Session(engine) as session:
+        timings = session.exec(
+            select(OcrTiming).order_by(OcrTiming.id.desc()).limit(OCR_TIMING_SAMPLES)
+        ).all()
+
+    model = fit_page_time_model(timings)
+    _model_cache.update(model=model, loaded_at=now)
+    return model
+
+
+def record_ocr_timing(doc_ids: List[int], seconds: float):
+    """Zapisuje czas zakończonego zadania OCR (proces główny)."""
+    try:
+        with Session(engine) as session:
+            docs = [d for d in (session.get(Document, doc_id) for doc_id in doc_ids) if d]
+            pages = sum(_document_pages(d) for d in docs)
+            if not docs or not pages:
+                return
+
+            sized = [(d.page_pixels, _document_pages(d)) for d in docs if d.page_pixels]
+            page_pixels = None
+            if sized:
+                page_pixels = int(sum(px * n for px, n in sized) / sum(n for _, n in sized))
+
+            session.add(OcrTiming(doc_count=len(docs), pages=pages, page_pixels=page_pixels, seconds=seconds))
+            session.commit()
+
+        # Nowy pomiar - wymuś ponowne dopasowanie modelu
+        _model_cache["model"] = None
+    except Exception as e:
+        logger.error(f"Błąd zapisu czasu OCR dla dokumentów {doc_ids}: {str(e)}")
+
+
+# ==================== ETA KOLEJKI ====================
+
+def _document_pages(doc: Document) -> int:
+    return doc.page_count or doc.ocr_total_pages or 1
+
+
+def estimate_document_seconds(doc: Document, model: PageTimeModel) -> float:
+    """Szacowany czas OCR całego dokumentu."""
+    return _document_pages(doc) * model.predict_page(doc.page_pixels)
+
+
+def _remaining_seconds(doc: Document, model: PageTimeModel, progress: Optional[float]) -> float:
+    """Szacowany czas pozostały dla dokumentu w trakcie przetwarzania."""
+    total = estimate_document_seconds(doc, model)
+    return total * (1.0 - min(max(progress or 0.0, 0.0), 1.0))
+
+
+def _simulate_queue(session: Session, model: PageTimeModel) -> Dict[int, Dict]:
+    """
+    Symuluje obsługę kolejki przez pulę procesów OCR.
+
+    Returns:
+        dict: doc_id -> {"eta_seconds", "queue_position"} (position 0 = w trakcie)
+    """
+    from app.background_tasks import get_ocr_queue_snapshot, get_ocr_max_workers
+
+    snapshot = get_ocr_queue_snapshot()
+    workers = get_ocr_max_workers()
+
+    result = {}
+    # Czas, w którym każdy proces się zwolni (batch dokumentów zajmuje jeden proces)
+    free_at = []
+    jobs = get_open_ocr_jobs(session, [doc_id for batch in snapshot["running"] for doc_id in batch])
+    for batch in snapshot["running"]:
+        remaining = 0.0
+        for doc_id in batch:
+            doc = session.get(Document, doc_id)
+            if doc:
+                remaining += _remaining_seconds(doc, model, jobs[doc_id].progress if doc_id in jobs else None)
+        for doc_id in batch:
+            result[doc_id] = {"eta_seconds": remaining, "queue_position": 0}
+        free_at.append(remaining)
+
+    free_at += [0.0] * max(workers - len(free_at), 0)
+    heapq.heapify(free_at)
+
+    for position, doc_id in enumerate(snapshot["queued"], 1):
+        doc = session.get(Document, doc_id)
+        duration = estimate_document_seconds(doc, model) if doc else 0.0
+        start = heapq.heappop(free_at)
+        heapq.heappush(free_at, start + duration)
+        result[doc_id] = {"eta_seconds": start + duration, "queue_position": position}
+
+    return result
+
+
+def get_document_eta(doc_id: int) -> Dict:
+    """ETA dokumentu w kolejce OCR (None, gdy dokument nie czeka ani nie jest przetwarzany)."""
+    model = get_page_time_model()
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        entry = _simulate_queue(session, model).get(doc_id)
+
+        return {
+            "eta_seconds": round(entry["eta_seconds"]) if entry else None,
+            "queue_position": entry["queue_position"] if entry else None,
+            "deferred": bool(doc and doc.ocr_status == "pending" and doc.ocr_progress_info == OCR_DEFERRED_INFO),
+            "estimated_seconds_per_page": round(model.predict_page(doc.page_pixels if doc else None), 1),
+        }
+
+
+def get_projected_backlog_seconds() -> float:
+    """Czas potrzebny na opróżnienie kolejki przy obecnej liczbie procesów."""
+    model = get_page_time_model()
+    with Session(engine) as session:
+        etas = _simulate_queue(session, model)
+    return max((e["eta_seconds"] for e in etas.values()), default=0.0)
+
+
+# ==================== BACKPRESSURE ====================
+
+def check_ocr_admission(new_seconds: float) -> str:
+    """
+    Sprawdza, czy nowe zadania OCR zmieszczą się w limicie zaległości kolejki.
+
+    Returns:
+        str: "admit", "defer" lub "reject"
+    """
+    if not OCR_MAX_BACKLOG_SECONDS:
+        return "admit"
+
+    from app.background_tasks import get_ocr_max_workers
+
+    projected = get_projected_backlog_seconds() + new_seconds / get_ocr_max_workers()
+    if projected <= OCR_MAX_BACKLOG_SECONDS:
+        return "admit"
+
+    logger.warning(f"Kolejka OCR przepełniona: przewidywane {projected:.0f}s > limit {OCR_MAX_BACKLOG_SECONDS}s")
+    return "reject" if OCR_BACKPRESSURE_MODE == "reject" else "defer"
+
+
+def estimate_new_documents_seconds(docs: List[Document]) -> float:
+    """Szacowany łączny czas OCR dla dokumentów jeszcze nie zakolejkowanych."""
+    model = get_page_time_model()
+    return sum(estimate_document_seconds(doc, model) for doc in docs)
+
+
+def collect_deferred_documents() -> List[int]:
+    """
+    Wybiera odłożone dokumenty, które mieszczą się już w limicie kolejki.
+    Status dokumentów zmienia się na zwykłe oczekiwanie w kolejce.
+    """
+    model = get_page_time_model()
+    admitted = []
+
+    with Session(engine) as session:
+        deferred = session.exec(
+            select(Document).where(
+                Document.ocr_status == "pending",
+                Document.ocr_progress_info == OCR_DEFERRED_INFO
+            ).order_by(Document.id)
+        ).all()
+        if not deferred:
+            return []
+
+        from app.background_tasks import get_ocr_max_workers
+
+        backlog = get_projected_backlog_seconds()
+        workers = get_ocr_max_workers()
+
+        for doc in deferred:
+            added = estimate_document_seconds(doc, model) / workers
+            # Przy pustej kolejce przyjmij przynajmniej jeden dokument - inaczej
+            # dokument większy niż cały limit nigdy by nie ruszył
+            if OCR_MAX_BACKLOG_SECONDS and backlog + added > OCR_MAX_BACKLOG_SECONDS and (admitted or backlog > 0):
+                break
+            backlog += added
+            doc.ocr_progress_info = "Oczekuje w kolejce"
+            session.add(doc)
+            admitted.append(doc.id)
+
+        session.commit()
+
+    return admitted
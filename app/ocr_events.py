@@ -0,0 +1,143 @@
+# app/ocr_events.py
+"""
+Szyna zdarzeń postępu OCR w pamięci procesu głównego.
+
+Procesy OCR wysyłają zdarzenia przez kolejkę multiprocessing.Manager
+(tasks/ocr/pipeline.py: emit_ocr_event), wątek pompujący przekazuje je do
+kolejki task_queues["notifications"], a notification_worker rozsyła je do
+subskrybentów - strumieni SSE dokumentów i opinii (app/routes/ocr.py).
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from typing import Dict, Iterable, Optional, Set
+
+logger = logging.getLogger("ocr_events")
+
+# Statusy OCR, po których strumień dokumentu może zostać zamknięty
+FINAL_OCR_STATUSES = {"done", "fail", "none"}
+
+# Odstęp między komunikatami podtrzymującymi połączenie SSE (sekundy)
+SSE_HEARTBEAT_SECONDS = 15
+
+# Maksymalna liczba niewysłanych zdarzeń na subskrybenta (najstarsze są odrzucane)
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class OcrEventBus:
+    """Rozsyła zdarzenia OCR do subskrybentów zainteresowanych danymi dokumentami."""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Zapamiętuje pętlę zdarzeń procesu głównego (dla emit z innych wątków)."""
+        self._loop = loop
+
+    def subscribe(self, doc_ids: Iterable[int]) -> asyncio.Queue:
+        """Rejestruje subskrybenta zdarzeń wskazanych dokumentów."""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        queue.doc_ids = set(doc_ids)
+        for doc_id in queue.doc_ids:
+            self._subscribers.setdefault(doc_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        for doc_id in getattr(queue, "doc_ids", ()):
+            subscribers = self._subscribers.get(doc_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[doc_id]
+
+    def publish(self, event: dict):
+        """Przekazuje zdarzenie subskrybentom dokumentu (wywoływane w pętli zdarzeń)."""
+        for queue in list(self._subscribers.get(event.get("doc_id"), ())):
+            if queue.full():
+                # Wolny klient - odrzuć najstarsze zdarzenie zamiast blokować szynę
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+    def emit(self, event: dict):
+        """
+        Dodaje zdarzenie do kolejki powiadomień - bezpieczne z dowolnego wątku
+        procesu głównego (endpointy synchroniczne, wątek pompujący).
+        """
+        from app.background_tasks import task_queues
+
+        if self._loop is None or self._loop.is_closed():
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self._loop:
+            task_queues["notifications"].put_nowait(event)
+        else:
+            self._loop.call_soon_threadsafe(task_queues["notifications"].put_nowait, event)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len({id(q) for queues in self._subscribers.values() for q in queues})
+
+
+# Singleton szyny zdarzeń
+ocr_event_bus = OcrEventBus()
+
+
+def notify_ocr_state(doc_id: int, **fields):
+    """Publikuje zmianę stanu OCR dokumentu wykonaną w procesie głównym."""
+    ocr_event_bus.emit({"type": "progress", "doc_id": doc_id, **fields})
+
+
+def start_worker_event_pump(worker_queue, stop_event: threading.Event) -> threading.Thread:
+    """
+    Uruchamia wątek przenoszący zdarzenia z kolejki procesów OCR
+    (multiprocessing.Manager().Queue) na szynę zdarzeń.
+    """
+    import queue as queue_module
+
+    def pump():
+        while not stop_event.is_set():
+            try:
+                event = worker_queue.get(timeout=1.0)
+            except queue_module.Empty:
+                continue
+            except (EOFError, OSError, BrokenPipeError):
+                # Manager zamknięty przy wyłączaniu aplikacji
+                break
+            except Exception as e:
+                logger.error(f"❌ Błąd odczytu zdarzenia OCR: {e}")
+                continue
+
+            if event.get("type") == "file_replaced":
+                # OCR zapisał PDF z warstwą tekstową jako nowy plik - poprzedni usuwany,
+                # jeśli nie wskazuje go inny dokument (app/blobs.py)
+                from app.blobs import release_file
+                release_file(event.get("stored_filename"))
+                continue
+
+            ocr_event_bus.emit(event)
+
+            if event.get("status") == "done" and event.get("doc_id") is not None:
+                # Treść dokumentu obejmuje teraz wynik OCR - sygnatury duplikatów
+                # z tekstu OCR i ponowne osadzenie (po przetworzeniu w app/ingest.py)
+                from app.ingest import schedule_ingest
+                schedule_ingest([event["doc_id"]])
+
+    thread = threading.Thread(target=pump, name="ocr-event-pump", daemon=True)
+    thread.start()
+    return thread
+
+
+def format_sse(event_type: str, data: dict) -> str:
+    """Formatuje zdarzenie w formacie text/event-stream."""
+    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
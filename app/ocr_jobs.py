@@ -0,0 +1,79 @@
+# app/ocr_jobs.py
+"""
+Odczyt i zamykanie prób OCR (tabela ocrjob) w procesie głównym.
+
+Proces OCR zapisuje postęp w wierszu bieżącej próby (tasks/ocr/pipeline.py),
+a wiersz document zmienia tylko przy przejściach stanu. Widoki postępu łączą
+oba źródła: dla dokumentu w trakcie OCR postęp pochodzi z otwartej próby,
+w pozostałych stanach - z kolumn dokumentu.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlmodel import Session, select
+
+from app.models import Document, OcrJob
+
+
+def get_open_ocr_job(session: Session, doc_id: int) -> Optional[OcrJob]:
+    """Zwraca bieżącą (niezakończoną) próbę OCR dokumentu."""
+    return session.exec(
+        select(OcrJob)
+        .where(OcrJob.doc_id == doc_id, OcrJob.status == "running")
+        .order_by(OcrJob.id.desc())
+    ).first()
+
+
+def get_open_ocr_jobs(session: Session, doc_ids: Iterable[int]) -> Dict[int, OcrJob]:
+    """Zwraca bieżące próby OCR wielu dokumentów jednym zapytaniem: {doc_id: OcrJob}."""
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return {}
+
+    jobs = session.exec(
+        select(OcrJob)
+        .where(OcrJob.doc_id.in_(doc_ids), OcrJob.status == "running")
+        .order_by(OcrJob.id)
+    ).all()
+    # Przy kilku otwartych próbach wygrywa najnowsza
+    return {job.doc_id: job for job in jobs}
+
+
+def list_ocr_jobs(session: Session, doc_id: int) -> List[OcrJob]:
+    """Historia prób OCR dokumentu (od najnowszej)."""
+    return session.exec(
+        select(OcrJob).where(OcrJob.doc_id == doc_id).order_by(OcrJob.id.desc())
+    ).all()
+
+
+def close_open_ocr_job(session: Session, doc_id: int, status: str, error: str = None) -> Optional[OcrJob]:
+    """
+    Zamyka bieżącą próbę OCR dokumentu (np. po przekroczeniu limitu czasu,
+    restarcie puli lub anulowaniu). Zmiany zatwierdza wywołujący.
+    """
+    job = get_open_ocr_job(session, doc_id)
+    if job:
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        session.add(job)
+    return job
+
+
+def ocr_progress_view(doc: Document, job: Optional[OcrJob] = None) -> dict:
+    """Postęp OCR dokumentu do wyświetlenia: z otwartej próby lub z kolumn dokumentu."""
+    if job is not None and doc.ocr_status == "running":
+        return {
+            "progress": job.progress or 0.0,
+            "info": job.progress_info or "",
+            "current_page": job.current_page or 0,
+            "total_pages": job.total_pages or doc.page_count or 0,
+        }
+
+    return {
+        "progress": doc.ocr_progress or 0.0,
+        "info": doc.ocr_progress_info or "",
+        "current_page": doc.ocr_current_page or 0,
+        "total_pages": doc.ocr_total_pages or doc.page_count or 0,
+    }
@@ -0,0 +1,215 @@
+# app/opinion_stats.py
+"""
+Zmaterializowane agregaty dokumentów opinii (tabele opinion_stats i opinion_type_count).
+
+Liczniki (dokumenty wg typu i statusu OCR, PDF/obrazy, suma stron, ostatnia
+aktywność) utrzymują wyzwalacze SQLite na tabeli document - aktualizacja
+następuje w tej samej transakcji co zmiana dokumentu, także gdy zapisuje
+proces OCR przez surowe zapytania. Lista i szczegóły opinii czytają agregaty
+jednym zapytaniem zamiast przeglądać dokumenty.
+
+Przebudowa od zera (np. po ręcznych zmianach w bazie):
+    python -m app.opinion_stats            # przebudowa
+    python -m app.opinion_stats --check    # tylko porównanie z bieżącymi danymi
+"""
+
+import argparse
+import sys
+from typing import Dict, Iterable
+
+from sqlmodel import Session, select
+
+from app.models import OpinionStats, OpinionTypeCount
+
+# Typ dokumentu bez doc_type (jak grupowanie w szczegółach opinii)
+OTHER_DOC_TYPE = "Inne"
+
+STATS_TABLES = [OpinionStats.__table__, OpinionTypeCount.__table__]
+
+# Wkład jednego dokumentu w liczniki opinii: kolumna -> wyrażenie dla wiersza {row}
+_COUNTERS = {
+    "doc_count": "1",
+    "ocr_none": "({row}.ocr_status IS 'none')",
+    "ocr_pending": "({row}.ocr_status IS 'pending')",
+    "ocr_running": "({row}.ocr_status IS 'running')",
+    "ocr_done": "({row}.ocr_status IS 'done')",
+    "ocr_fail": "({row}.ocr_status IS 'fail')",
+    "pdf_count": "({row}.mime_type IS 'application/pdf')",
+    "image_count": "COALESCE({row}.mime_type LIKE 'image/%', 0)",
+    "total_pages": "COALESCE({row}.page_count, 0)",
+}
+# Daty zapisywane są ze spacją (ORM) lub z "T" (proces OCR) - ujednolicenie dla porównań
+_ACTIVITY = "replace(COALESCE({row}.last_modified, {row}.upload_time), 'T', ' ')"
+_DOC_TYPE = f"COALESCE({{row}}.doc_type, '{OTHER_DOC_TYPE}')"
+
+# Kolumny dokumentu wpływające na agregaty
+_TRACKED_COLUMNS = "parent_id, ocr_status, doc_type, mime_type, page_count, last_modified"
+
+
+def _add_document_sql(row: str) -> str:
+    """Dolicza dokument `row` (NEW/OLD) do agregatów jego opinii."""
+    columns = ", ".join(_COUNTERS)
+    values = ", ".join(expr.format(row=row) for expr in _COUNTERS.values())
+    updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in _COUNTERS)
+    return f"""
+        INSERT INTO opinion_stats (opinion_id, {columns}, last_activity)
+        SELECT {row}.parent_id, {values}, {_ACTIVITY.format(row=row)}
+        WHERE {row}.parent_id IS NOT NULL
+        ON CONFLICT(opinion_id) DO UPDATE SET {updates},
+            last_activity = CASE WHEN excluded.last_activity > COALESCE(last_activity, '')
+                                 THEN excluded.last_activity ELSE last_activity END;
+        INSERT INTO opinion_type_count (opinion_id, doc_type, doc_count)
+        SELECT {row}.parent_id, {_DOC_TYPE.format(row=row)}, 1
+        WHERE {row}.parent_id IS NOT NULL
+        ON CONFLICT(opinion_id, doc_type) DO UPDATE SET doc_count = doc_count + 1;
+    """
+
+
+def _remove_document_sql(row: str) -> str:
+    """Odejmuje dokument `row` od agregatów jego opinii (ostatnia aktywność bez zmian)."""
+    updates = ", ".join(f"{column} = {column} - {expr.format(row=row)}" for column, expr in _COUNTERS.items())
+    return f"""
+        UPDATE opinion_stats SET {updates} WHERE opinion_id = {row}.parent_id;
+        UPDATE opinion_type_count SET doc_count = doc_count - 1
+        WHERE opinion_id = {row}.parent_id AND doc_type = {_DOC_TYPE.format(row=row)};
+        DELETE FROM opinion_type_count WHERE opinion_id = {row}.parent_id AND doc_count <= 0;
+    """
+
+
+TRIGGERS = {
+    "document_stats_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS document_stats_insert AFTER INSERT ON document
+        BEGIN {_add_document_sql("NEW")} END
+    """,
+    "document_stats_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS document_stats_delete AFTER DELETE ON document
+        BEGIN {_remove_document_sql("OLD")}
+            DELETE FROM opinion_stats WHERE opinion_id = OLD.id;
+            DELETE FROM opinion_type_count WHERE opinion_id = OLD.id;
+        END
+    """,
+    "document_stats_update": f"""
+        CREATE TRIGGER IF NOT EXISTS document_stats_update AFTER UPDATE OF {_TRACKED_COLUMNS} ON document
+        BEGIN {_remove_document_sql("OLD")} {_add_document_sql("NEW")} END
+    """,
+}
+
+
+# ==================== SCHEMAT I PRZEBUDOWA ====================
+
+def create_stats_schema(connection):
+    """Tabele agregatów i wyzwalacze (migracja schematu)."""
+    for table in STATS_TABLES:
+        table.create(connection, checkfirst=True)
+    for ddl in TRIGGERS.values():
+        connection.exec_driver_sql(ddl)
+
+
+def _aggregate_sql() -> str:
+    sums = ", ".join(f"SUM({expr.format(row='document')}) AS {column}" for column, expr in _COUNTERS.items())
+    return f"""
+        SELECT parent_id AS opinion_id, {sums}, MAX({_ACTIVITY.format(row='document')}) AS last_activity
+        FROM document WHERE parent_id IS NOT NULL GROUP BY parent_id
+    """
+
+
+def _type_counts_sql() -> str:
+    doc_type = _DOC_TYPE.format(row="document")
+    return f"""
+        SELECT parent_id AS opinion_id, {doc_type} AS doc_type, COUNT(*) AS doc_count
+        FROM document WHERE parent_id IS NOT NULL GROUP BY parent_id, {doc_type}
+    """
+
+
+def rebuild_stats(connection) -> int:
+    """Przelicza agregaty od zera z tabeli document. Zwraca liczbę opinii z dokumentami."""
+    connection.exec_driver_sql("DELETE FROM opinion_type_count")
+    connection.exec_driver_sql("DELETE FROM opinion_stats")
+    connection.exec_driver_sql(
+        f"INSERT INTO opinion_stats (opinion_id, {', '.join(_COUNTERS)}, last_activity) {_aggregate_sql()}"
+    )
+    connection.exec_driver_sql(
+        f"INSERT INTO opinion_type_count (opinion_id, doc_type, doc_count) {_type_counts_sql()}"
+    )
+    return connection.exec_driver_sql("SELECT COUNT(*) FROM opinion_stats").scalar()
+
+
+def _symmetric_difference_sql(expected: str, stored: str) -> str:
+    """Klucze (pierwsza kolumna) wierszy obecnych tylko w jednym z dwóch zapytań."""
+    return f"""
+        SELECT * FROM (SELECT * FROM ({expected}) EXCEPT SELECT * FROM ({stored}))
+        UNION ALL
+        SELECT * FROM (SELECT * FROM ({stored}) EXCEPT SELECT * FROM ({expected}))
+    """
+
+
+def find_stale_stats(connection) -> list:
+    """
+    Opinie, których zapisane liczniki różnią się od przeliczonych z dokumentów.
+    Ostatnia aktywność nie jest porównywana - usunięcie dokumentu jej nie cofa.
+    """
+    counters = ", ".join(_COUNTERS)
+    expected = f"SELECT opinion_id, {counters} FROM ({_aggregate_sql()})"
+    stored = f"SELECT opinion_id, {counters} FROM opinion_stats WHERE doc_count > 0"
+    stored_types = "SELECT opinion_id, doc_type, doc_count FROM opinion_type_count"
+
+    differences = connection.exec_driver_sql(f"""
+        SELECT opinion_id FROM ({_symmetric_difference_sql(expected, stored)})
+        UNION
+        SELECT opinion_id FROM ({_symmetric_difference_sql(_type_counts_sql(), stored_types)})
+    """)
+    return sorted(row[0] for row in differences)
+
+
+# ==================== ODCZYT ====================
+
+def get_opinion_stats(session: Session, opinion_id: int) -> OpinionStats:
+    """Agregaty opinii (puste dla opinii bez dokumentów)."""
+    return session.get(OpinionStats, opinion_id) or OpinionStats(opinion_id=opinion_id)
+
+
+def get_opinion_stats_map(session: Session, opinion_ids: Iterable[int]) -> Dict[int, OpinionStats]:
+    """Agregaty wielu opinii jednym zapytaniem (lista opinii)."""
+    opinion_ids = list(opinion_ids)
+    found = {}
+    if opinion_ids:
+        found = {stats.opinion_id: stats for stats in session.exec(
+            select(OpinionStats).where(OpinionStats.opinion_id.in_(opinion_ids))
+        )}
+    return {opinion_id: found.get(opinion_id) or OpinionStats(opinion_id=opinion_id) for opinion_id in opinion_ids}
+
+
+def get_type_counts(session: Session, opinion_id: int) -> Dict[str, int]:
+    """Liczba dokumentów opinii według typu."""
+    rows = session.exec(
+        select(OpinionTypeCount.doc_type, OpinionTypeCount.doc_count)
+        .where(OpinionTypeCount.opinion_id == opinion_id)
+        .order_by(OpinionTypeCount.doc_type)
+    )
+    return {doc_type: doc_count for doc_type, doc_count in rows}
+
+
+def main(argv=None) -> int:
+    from app.db import engine, init_db
+
+    parser = argparse.ArgumentParser(description="Agregaty dokumentów opinii")
+    parser.add_argument("--check", action="store_true", help="tylko sprawdź zgodność z tabelą document")
+    args = parser.parse_args(argv)
+
+    init_db()
+    with engine.begin() as connection:
+        if args.check:
+            stale = find_stale_stats(connection)
+            if stale:
+                print(f"❌ Niezgodne agregaty opinii: {stale}")
+                return 1
+            print("✅ Agregaty opinii zgodne z dokumentami")
+            return 0
+
+        count = rebuild_stats(connection)
+    print(f"✅ Przebudowano agregaty {count} opinii")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
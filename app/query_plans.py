@@ -0,0 +1,147 @@
+# app/query_plans.py
+"""
+Sprawdzenie planów zapytań głównych widoków (lista opinii, szczegóły opinii,
+lista dokumentów, wynik OCR dokumentu).
+
+Domyślnie buduje tymczasową bazę z zadaną liczbą dokumentów (100 000),
+stosuje migracje i wypisuje EXPLAIN QUERY PLAN każdego zapytania. Kończy się
+kodem 1, gdy któreś zapytanie przegląda całą tabelę document bez indeksu.
+
+Użycie:
+    python -m app.query_plans                 # tymczasowa baza, 100 000 wierszy
+    python -m app.query_plans --rows 20000
+    python -m app.query_plans --db data.db    # istniejąca baza (tylko odczyt planów)
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+from sqlalchemy import create_engine, tuple_
+from sqlalchemy.engine import Engine
+from sqlmodel import SQLModel, select
+
+from app.listing import LIST_COLUMNS
+from app.migrations import run_migrations
+from app.models import Document
+
+STEPS = ["k1", "k2", "k3", "k4"]
+DOC_TYPES = ["Akta", "Dokumentacja medyczna", "Opinia", "Wywiad", "OCR TXT"]
+
+
+def main_queries() -> Dict[str, object]:
+    """Zapytania gorących ścieżek - w tej samej postaci co w widokach."""
+    return {
+        "lista opinii (is_main + step, sortowanie po dacie)":
+            select(Document).where(Document.is_main == True, Document.step.in_(["k1", "k2", "k3"]))
+            .order_by(Document.upload_time.desc()),
+        "szczegóły opinii (dokumenty po parent_id)":
+            select(Document).where(Document.parent_id == 42).order_by(Document.upload_time.desc()),
+        "wynik OCR dokumentu (ocr_parent_id + doc_type)":
+            select(Document).where(Document.ocr_parent_id == 4242, Document.doc_type == "OCR TXT")
+            .order_by(Document.upload_time.desc()),
+        "archiwalne wersje (parent_id + doc_type)":
+            select(Document).where(Document.parent_id == 42, Document.doc_type == "Archiwalna wersja")
+            .order_by(Document.upload_time.desc()),
+        "lista dokumentów (sortowanie po dacie)":
+            select(Document).order_by(Document.upload_time.desc()).limit(50),
+        "lista dokumentów - kolejna strona (kursor)":
+            select(*LIST_COLUMNS)
+            .where(tuple_(Document.upload_time, Document.id) < tuple_(datetime(2020, 2, 1), 40000))
+            .order_by(Document.upload_time.desc(), Document.id.desc()).limit(51),
+        "lista dokumentów (filtr typu)":
+            select(*LIST_COLUMNS).where(Document.doc_type == "Opinia")
+            .order_by(Document.upload_time.desc(), Document.id.desc()).limit(51),
+        "lista dokumentów (filtr statusu)":
+            select(*LIST_COLUMNS).where(Document.step.in_(["k2", "k3"]))
+            .order_by(Document.upload_time.desc(), Document.id.desc()).limit(51),
+        "typy dokumentów (DISTINCT)":
+            select(Document.doc_type).where(Document.doc_type != None).distinct().order_by(Document.doc_type),
+    }
+
+
+def populate(engine: Engine, rows: int, opinion_size: int = 50):
+    """Wypełnia bazę opiniami z dokumentami i wynikami OCR (łącznie `rows` wierszy)."""
+    rng = random.Random(0)
+    start = datetime(2020, 1, 1)
+    records = []
+    opinion_id = None
+
+    for doc_id in range(1, rows + 1):
+        upload_time = (start + timedelta(minutes=doc_id)).isoformat(sep=" ")
+        if doc_id % opinion_size == 1:
+            opinion_id = doc_id
+            records.append((doc_id, f"Osoba {doc_id}", "Opinia", True, None, None, rng.choice(STEPS), upload_time))
+        else:
+            doc_type = rng.choice(DOC_TYPES)
+            ocr_parent_id = doc_id - 1 if doc_type == "OCR TXT" else None
+            records.append((doc_id, None, doc_type, False, opinion_id, ocr_parent_id, "k1", upload_time))
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO document (id, sygnatura, doc_type, is_main, parent_id, ocr_parent_id, step, upload_time, "
+            "original_filename, stored_filename, ocr_status, content_type) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'plik.pdf', 'plik.pdf', 'none', 'document')",
+            records
+        )
+
+
+def explain(engine: Engine, statement) -> List[str]:
+    """Zwraca wiersze EXPLAIN QUERY PLAN dla zapytania SQLAlchemy."""
+    sql = str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as connection:
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def is_full_scan(plan: List[str]) -> bool:
+    """Pełny przegląd tabeli document (SCAN bez indeksu)."""
+    return any(line.startswith("SCAN") and "document" in line and "INDEX" not in line for line in plan)
+
+
+def check_query_plans(engine: Engine) -> bool:
+    """Wypisuje plany zapytań. Zwraca False, gdy któreś wykonuje pełny przegląd tabeli."""
+    all_indexed = True
+    for name, statement in main_queries().items():
+        plan = explain(engine, statement)
+        full_scan = is_full_scan(plan)
+        all_indexed &= not full_scan
+
+        print(f"{'❌' if full_scan else '✅'} {name}")
+        for line in plan:
+            print(f"     {line}")
+    return all_indexed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Plany zapytań głównych widoków")
+    parser.add_argument("--rows", type=int, default=100_000, help="liczba dokumentów w bazie testowej")
+    parser.add_argument("--db", type=Path, help="sprawdź istniejącą bazę zamiast tymczasowej")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        engine = create_engine(f"sqlite:///{args.db}")
+        print(f"🔍 Plany zapytań dla {args.db}")
+        return 0 if check_query_plans(engine) else 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{Path(tmp_dir) / 'plans.db'}")
+        SQLModel.metadata.create_all(engine)
+        run_migrations(engine)
+
+        print(f"📥 Generowanie {args.rows} dokumentów...")
+        populate(engine, args.rows)
+        with engine.begin() as connection:
+            connection.exec_driver_sql("ANALYZE")
+
+        print(f"🔍 Plany zapytań ({args.rows} wierszy)")
+        ok = check_query_plans(engine)
+        engine.dispose()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
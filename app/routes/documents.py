@@ -6,13 +6,18 @@ REFAKTORYZACJA: Logika biznesowa przeniesiona do tasks/document_manager.py
 
 from fastapi import APIRouter, Request, Form, HTTPException
 from fastapi.responses import RedirectResponse, FileResponse, StreamingResponse
-from sqlmodel import Session
+from sqlmodel import Session, select
 from datetime import datetime
+import time
 
 from app.navigation import build_document_navigation, PageActionsBuilder
 from app.db import engine, BASE_DIR
+from app.duplicates import get_document_duplicates
+from app.entities import ENTITY_TYPES, find_entity_documents, get_document_entities, parse_entity_query
 from app.models import Document
+from app.ocr_jobs import get_open_ocr_job, ocr_progress_view
 from app.document_utils import STEP_ICON
+from app.listing import DEFAULT_PAGE_SIZE, SORT_OPTIONS, pagination_links, resolve_sort
 from app.text_extraction import HAS_DOCX
 from app.llm_service import llm_service, get_default_instruction, combine_note_with_summary
 
@@ -268,8 +273,13 @@ def list_documents(request: Request,
                    search: str | None = None,
                    search_content: bool = False,
                    fuzzy_search: bool = False,
-                   doc_type_filter: str | None = None):
-    """Lista wszystkich dokumentów z filtrowaniem i wyszukiwaniem - REFACTORED."""
+                   semantic_search: bool = False,
+                   include_archive: bool = False,
+                   doc_type_filter: str | None = None,
+                   sort: str | None = None,
+                   cursor: str | None = None,
+                   page_size: int = DEFAULT_PAGE_SIZE):
+    """Lista wszystkich dokumentów z filtrowaniem, wyszukiwaniem i stronicowaniem - REFACTORED."""
 
     # Deleguj całą logikę do managera
     result = document_manager.get_document_list(
@@ -277,7 +287,12 @@ def list_documents(request: Request,
         search=search,
         search_content=search_content,
         fuzzy_search=fuzzy_search,
-        doc_type_filter=doc_type_filter
+        semantic_search=semantic_search,
+        include_archive=include_archive,
+        doc_type_filter=doc_type_filter,
+        sort=sort,
+        cursor=cursor,
+        page_size=page_size
     )
 
     # Przygotuj dane filtrów
@@ -289,7 +304,10 @@ def list_documents(request: Request,
         'search': search or '',
         'search_content': search_content,
         'fuzzy_search': fuzzy_search,
-        'doc_type_filter': doc_type_filter or ''
+        'semantic_search': semantic_search,
+        'include_archive': include_archive,
+        'doc_type_filter': doc_type_filter or '',
+        'sort': resolve_sort(sort)
     }
 
     # Zbuduj akcje strony
@@ -308,7 +326,10 @@ def list_documents(request: Request,
         "current_filters": current_filters,
         "total_count": result.total_count,
         "search_matches": result.search_matches,
+        "search_snippets": result.search_snippets,
         "unique_doc_types": result.unique_doc_types,
+        "sort_options": SORT_OPTIONS,
+        **pagination_links(request, result.next_cursor, cursor),
         "has_docx": HAS_DOCX,
         "current_year": datetime.now().year,
         "page_type": "documents_list",
@@ -340,11 +361,24 @@ def document_detail(request: Request, doc_id: int):
              ("k3", "k3 – Word z wyciągiem wysłany"),
              ("k4", "k4 – Archiwum")]
 
+    # Postęp OCR w trakcie przetwarzania pochodzi z bieżącej próby (tabela ocrjob)
+    ocr_job = None
+    with Session(engine) as session:
+        if result.document.ocr_status == "running":
+            ocr_job = get_open_ocr_job(session, doc_id)
+        # Te same akta w innych opiniach (app/duplicates.py)
+        duplicates = get_document_duplicates(session, result.document)
+        # PESEL, sygnatury akt, daty i osoby z treści (app/entities.py)
+        entities = get_document_entities(session, doc_id)
+
     # Kontekst odpowiedzi
     context = {
         "request": request,
         "doc": result.document,
+        "ocr_progress": ocr_progress_view(result.document, ocr_job),
         "ocr_txt": result.ocr_txt_document,
+        "duplicates": duplicates,
+        "entities": entities,
         "steps": steps,
         "title": navigation['page_title'],
         "current_year": datetime.now().year,
@@ -384,6 +418,16 @@ def document_download(doc_id: int):
     # Deleguj całą logikę do managera
     result = document_manager.get_document_for_download(doc_id)
 
+    if result.archived:
+        from urllib.parse import quote
+        from app.archive import iter_archived
+
+        return StreamingResponse(
+            iter_archived(result.file_path),
+            media_type=result.mime_type,
+            headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(result.original_filename)}"}
+        )
+
     return FileResponse(
         result.file_path,
         filename=result.original_filename,
@@ -420,7 +464,10 @@ def documents_export_csv(request: Request,
                          search: str | None = None,
                          search_content: bool = False,
                          fuzzy_search: bool = False,
-                         doc_type_filter: str | None = None):
+                         semantic_search: bool = False,
+                         include_archive: bool = False,
+                         doc_type_filter: str | None = None,
+                         sort: str | None = None):
     """Eksport listy dokumentów do CSV."""
     import csv
     import io
@@ -432,7 +479,11 @@ def documents_export_csv(request: Request,
         search=search,
         search_content=search_content,
         fuzzy_search=fuzzy_search,
-        doc_type_filter=doc_type_filter
+        semantic_search=semantic_search,
+        include_archive=include_archive,
+        doc_type_filter=doc_type_filter,
+        sort=sort,
+        page_size=None  # Eksport obejmuje wszystkie strony
     )
 
     # Utwórz CSV
@@ -497,6 +548,141 @@ def documents_export_csv(request: Request,
     )
 
 
+@router.get("/api/documents/scan", name="documents_scan")
+async def documents_scan(request: Request,
+                         q: str,
+                         mode: str = "phrase",
+                         case_sensitive: bool = False,
+                         k1: bool | None = None,
+                         k2: bool | None = None,
+                         k3: bool | None = None,
+                         k4: bool | None = None,
+                         doc_type_filter: str | None = None,
+                         client: str | None = None):
+    """
+    Strumień SSE skanu treści dokumentów frazą lub wyrażeniem regularnym (app/text_scan.py).
+    Filtry jak w liście dokumentów. Nowy skan z tym samym `client` anuluje poprzedni.
+    Zdarzenia: "start", "match" (trafienie z pozycją w tekście), "progress", "end".
+    """
+    from app.ocr_events import format_sse
+    from app.text_scan import compile_scan_pattern, scan_units, start_scan
+
+    try:
+        pattern = compile_scan_pattern(q, mode, case_sensitive)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    conditions = document_manager.document_list_conditions(k1, k2, k3, k4, doc_type_filter)
+    with Session(engine) as session:
+        units, documents = scan_units(session, conditions)
+
+    scan = start_scan(pattern, units, documents, client=client)
+
+    async def event_stream():
+        async for event_type, data in scan.events():
+            if event_type == "progress" and await request.is_disconnected():
+                scan.cancel()
+            yield format_sse(event_type, data)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.post("/api/documents/scan/{scan_id}/cancel", name="documents_scan_cancel")
+def documents_scan_cancel(scan_id: str):
+    """Anuluje trwający skan treści."""
+    from app.text_scan import cancel_scan
+
+    return {"success": cancel_scan(scan_id)}
+
+
+@router.get("/api/document/{doc_id}/duplicates", name="document_duplicates")
+def document_duplicates(doc_id: int):
+    """Duplikaty dokumentu: identyczne pliki i dokumenty/strony o podobnym tekście."""
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        if not doc:
+            raise HTTPException(status_code=404, detail="Nie ma takiego dokumentu")
+        duplicates = get_document_duplicates(session, doc)
+
+    return {"doc_id": doc_id, "sha256": doc.file_sha256, "duplicates": duplicates}
+
+
+@router.get("/api/document/{doc_id}/entities", name="document_entities")
+def document_entities(doc_id: int):
+    """Encje dokumentu (PESEL, sygnatury akt, daty, osoby) z liczbą innych dokumentów, w których występują."""
+    with Session(engine) as session:
+        if not session.get(Document, doc_id):
+            raise HTTPException(status_code=404, detail="Nie ma takiego dokumentu")
+        return {"doc_id": doc_id, "entities": get_document_entities(session, doc_id)}
+
+
+@router.get("/api/entities", name="entity_lookup")
+def entity_lookup(value: str, type: str | None = None, exclude_doc_id: int | None = None):
+    """
+    Dokumenty zawierające encję - wartość w dowolnym zapisie (np. "12 marca 2020 r."),
+    typ rozpoznawany automatycznie (osoba tylko przy type=person).
+    """
+    if type is not None and type not in ENTITY_TYPES:
+        raise HTTPException(status_code=400, detail=f"Nieznany typ encji: {type}")
+    parsed = parse_entity_query(value, type)
+    if parsed is None:
+        raise HTTPException(status_code=400, detail="Nie rozpoznano PESEL, sygnatury akt ani daty")
+    entity_type, normalized = parsed
+
+    with Session(engine) as session:
+        found = find_entity_documents(session, entity_type, normalized)
+        found.pop(exclude_doc_id, None)
+        docs = {doc.id: doc for doc in session.exec(select(Document).where(Document.id.in_(list(found))))} if found else {}
+
+        documents = [
+            {
+                "doc_id": doc_id,
+                "original_filename": docs[doc_id].original_filename,
+                "doc_type": docs[doc_id].doc_type,
+                "parent_id": docs[doc_id].parent_id,
+                "occurrences": [{"page": e.page, "start": e.start_offset, "end": e.end_offset} for e in occurrences],
+            }
+            for doc_id, occurrences in found.items() if doc_id in docs
+        ]
+
+    return {"type": entity_type, "value": normalized, "documents": documents}
+
+
+def _suggestion_url(request: Request, suggestion) -> str:
+    """Dokąd prowadzi podpowiedź: opinia/dokument, gdy jednoznaczna, w przeciwnym razie wyszukiwanie."""
+    if suggestion.field == "sygnatura":
+        if suggestion.opinion_id is not None:
+            return str(request.url_for("opinion_detail", doc_id=suggestion.opinion_id))
+        return str(request.url_for("list_opinions").include_query_params(search=suggestion.value))
+    if suggestion.field == "original_filename" and suggestion.doc_id is not None:
+        return str(request.url_for("document_detail", doc_id=suggestion.doc_id))
+    if suggestion.field == "doc_type":
+        return str(request.url_for("list_documents").include_query_params(doc_type_filter=suggestion.value))
+    return str(request.url_for("list_documents").include_query_params(search=suggestion.value))
+
+
+@router.get("/api/suggest", name="search_suggest")
+def search_suggest(request: Request, q: str = "", limit: int = 10, client: str | None = None):
+    """
+    Podpowiedzi wyszukiwania (typeahead) dla prefiksu: "Dotyczy", nazwy plików, typy dokumentów.
+    Nowe zapytanie z tym samym `client` unieważnia poprzednie, jeszcze nieobsłużone.
+    """
+    from app.suggest import suggest_index
+
+    started = time.perf_counter()
+    suggestions = suggest_index.suggest(q, limit, client=client)
+    if suggestions is None:
+        return {"query": q, "superseded": True, "suggestions": []}
+
+    return {
+        "query": q,
+        "superseded": False,
+        "suggestions": [{**s.to_dict(), "url": _suggestion_url(request, s)} for s in suggestions],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
 @router.get("/api/document/{doc_id}/ocr-text", name="get_ocr_text")
 def get_ocr_text(doc_id: int):
     """Pobiera aktualny tekst OCR dla dokumentu - REFACTORED."""
@@ -7,15 +7,32 @@ import asyncio
 import tempfile
 import os
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
 from datetime import datetime
 
+from app.archive import ensure_restored
 from app.db import engine, FILES_DIR, BASE_DIR
 from app.models import Document
+from app.opinion_stats import get_opinion_stats, get_type_counts
+from app.ocr_jobs import close_open_ocr_job, get_open_ocr_job, get_open_ocr_jobs, list_ocr_jobs, ocr_progress_view
 from app.navigation import build_advanced_viewer_navigation
-from app.background_tasks import enqueue_ocr_task
+from app.background_tasks import enqueue_ocr_task, cancel_ocr_task
+from app.ocr_events import (
+    FINAL_OCR_STATUSES,
+    SSE_HEARTBEAT_SECONDS,
+    format_sse,
+    notify_ocr_state,
+    ocr_event_bus,
+)
+from app.ocr_estimator import (
+    OCR_DEFERRED_INFO,
+    apply_preflight,
+    check_ocr_admission,
+    estimate_new_documents_seconds,
+    get_document_eta,
+)
 
 router = APIRouter()
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
@@ -28,20 +45,107 @@ async def document_run_ocr(request: Request, doc_id: int):
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie ma takiego dokumentu")
+        await asyncio.to_thread(ensure_restored, doc)
+
+        if doc.page_count is None:
+            from app.ingest import analyze_file_in_pool
+            apply_preflight(doc, info=await analyze_file_in_pool(FILES_DIR / doc.stored_filename, doc.mime_type))
+
+        admission = check_ocr_admission(estimate_new_documents_seconds([doc]))
+        if admission == "reject":
+            raise HTTPException(status_code=503, detail="Kolejka OCR jest przepełniona - spróbuj ponownie później")
+
         doc.ocr_status = "pending"
         doc.ocr_progress = 0.0
-        doc.ocr_progress_info = "Oczekuje w kolejce"
+        doc.ocr_progress_info = OCR_DEFERRED_INFO if admission == "defer" else "Oczekuje w kolejce"
         session.add(doc)
         session.commit()
 
-    # Dodaj do kolejki OCR
-    asyncio.create_task(enqueue_ocr_task(doc_id))
+        notify_ocr_state(doc_id, status=doc.ocr_status, info=doc.ocr_progress_info, progress=0.0)
+
+    # Dodaj do kolejki OCR (odłożone dokumenty przyjmie supervisor kolejki)
+    if admission == "admit":
+        asyncio.create_task(enqueue_ocr_task(doc_id))
 
     # Dodaj parametr do URL przekierowania, aby pokazać powiadomienie
     redirect_url = request.url_for("document_detail", doc_id=doc_id)
     return RedirectResponse(f"{redirect_url}?ocr_restarted=true", status_code=303)
 
 
+@router.post("/api/document/{doc_id}/ocr-cancel", name="document_ocr_cancel")
+def document_ocr_cancel(doc_id: int):
+    """Anuluje oczekujące lub uruchomione zadanie OCR dokumentu."""
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        if not doc:
+            raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+
+        job_state = cancel_ocr_task(doc_id)
+
+        if job_state == "running":
+            # Proces sam przywróci status po przerwaniu na granicy strony/tokenu
+            doc.ocr_progress_info = "Anulowanie OCR..."
+        elif doc.ocr_status in ["pending", "running"]:
+            # Zadanie w kolejce (lub osierocone) - od razu cofnij status
+            close_open_ocr_job(session, doc_id, "cancelled", "OCR anulowany")
+            doc.ocr_status = "none"
+            doc.ocr_progress = None
+            doc.ocr_progress_info = "OCR anulowany"
+            doc.ocr_current_page = None
+            doc.ocr_total_pages = None
+        else:
+            return {"success": False, "cancelled": "not_found", "status": doc.ocr_status,
+                    "message": "Brak aktywnego zadania OCR dla tego dokumentu"}
+
+        session.add(doc)
+        session.commit()
+
+        notify_ocr_state(doc_id, status=doc.ocr_status, info=doc.ocr_progress_info)
+
+        return {"success": True, "cancelled": job_state, "status": doc.ocr_status,
+                "message": "Anulowano zadanie OCR"}
+
+
+@router.post("/api/opinion/{opinion_id}/ocr-cancel", name="opinion_ocr_cancel")
+def opinion_ocr_cancel(opinion_id: int):
+    """Anuluje wszystkie aktywne zadania OCR dokumentów opinii."""
+    with Session(engine) as session:
+        opinion = session.get(Document, opinion_id)
+        if not opinion or not opinion.is_main:
+            raise HTTPException(status_code=404, detail="Nie znaleziono opinii")
+
+        active_docs = session.exec(
+            select(Document).where(
+                Document.parent_id == opinion_id,
+                Document.ocr_status.in_(["pending", "running"])
+            )
+        ).all()
+
+        cancelled = {"running": 0, "queued": 0}
+        for doc in active_docs:
+            job_state = cancel_ocr_task(doc.id)
+            if job_state == "running":
+                cancelled["running"] += 1
+                doc.ocr_progress_info = "Anulowanie OCR..."
+            else:
+                cancelled["queued"] += 1
+                close_open_ocr_job(session, doc.id, "cancelled", "OCR anulowany")
+                doc.ocr_status = "none"
+                doc.ocr_progress = None
+                doc.ocr_progress_info = "OCR anulowany"
+                doc.ocr_current_page = None
+                doc.ocr_total_pages = None
+            session.add(doc)
+
+        session.commit()
+
+        for doc in active_docs:
+            notify_ocr_state(doc.id, status=doc.ocr_status, info=doc.ocr_progress_info)
+
+        return {"success": True, "cancelled_running": cancelled["running"],
+                "cancelled_queued": cancelled["queued"]}
+
+
 @router.get("/api/document/{doc_id}/ocr-progress", name="document_ocr_progress")
 def document_ocr_progress(doc_id: int):
     """Zwraca informacje o postępie OCR w formacie JSON."""
@@ -51,16 +155,13 @@ def document_ocr_progress(doc_id: int):
             raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
 
         # Przygotuj dane o postępie
-        progress_data = {
-            "status": doc.ocr_status,
-            "progress": doc.ocr_progress or 0.0,
-            "info": doc.ocr_progress_info or "",
-            "current_page": doc.ocr_current_page or 0,
-            "total_pages": doc.ocr_total_pages or 0,
-            "confidence": doc.ocr_confidence
-        }
+        progress_data = _document_progress_data(doc, get_open_ocr_job(session, doc_id))
+
+    # Szacowany czas do końca OCR z uwzględnieniem całej kolejki
+    if progress_data["status"] in ["pending", "running"]:
+        progress_data.update(get_document_eta(doc_id))
 
-        return progress_data
+    return progress_data
 
 
 @router.get("/document/{doc_id}/ocr-status", name="document_ocr_status")
@@ -71,15 +172,26 @@ async def get_ocr_status(doc_id: int):
         if not doc:
             raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
 
-        # ✅ Używaj istniejących pól z modelu
+        progress = ocr_progress_view(doc, get_open_ocr_job(session, doc_id))
         return {
             "ocr_done": doc.ocr_status == "done",
             "ocr_status": doc.ocr_status,
-            "ocr_progress": doc.ocr_progress or 0.0,
-            "ocr_info": doc.ocr_progress_info or ""
+            "ocr_progress": progress["progress"],
+            "ocr_info": progress["info"]
         }
 
 
+@router.get("/api/document/{doc_id}/ocr-jobs", name="document_ocr_jobs")
+def document_ocr_jobs(doc_id: int):
+    """Historia prób OCR dokumentu (od najnowszej)."""
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        if not doc:
+            raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+
+        return {"doc_id": doc_id, "status": doc.ocr_status, "jobs": list_ocr_jobs(session, doc_id)}
+
+
 @router.get("/api/opinion/{opinion_id}/ocr-status", name="opinion_ocr_status")
 async def get_opinion_ocr_status(opinion_id: int):
     """Sprawdza status OCR wszystkich dokumentów w opinii."""
@@ -89,50 +201,197 @@ async def get_opinion_ocr_status(opinion_id: int):
         if not opinion or not opinion.is_main:
             raise HTTPException(status_code=404, detail="Nie znaleziono opinii")
 
-        # Pobierz wszystkie dokumenty powiązane z opinią
-        related_docs = session.exec(
+        # Liczniki z agregatów opinii (app/opinion_stats.py) - bez wyników OCR (zawsze "done")
+        stats = get_opinion_stats(session, opinion_id)
+        ocr_results = get_type_counts(session, opinion_id).get("OCR TXT", 0)
+
+        # Postęp odczytywany tylko dla dokumentów z aktywnym OCR
+        active_docs = session.exec(
             select(Document).where(
                 Document.parent_id == opinion_id,
-                Document.doc_type != "OCR TXT"  # Ignoruj wyniki OCR
+                Document.ocr_status.in_(["pending", "running"]),
+                Document.doc_type.is_distinct_from("OCR TXT")  # Ignoruj wyniki OCR
             )
         ).all()
 
-        if not related_docs:
-            # Brak dokumentów - OCR "zakończony"
-            return {
-                "ocr_done": True,
-                "total_docs": 0,
-                "completed_docs": 0,
-                "pending_docs": 0,
-                "progress_overall": 1.0
-            }
-
-        # Policz statusy
-        total_docs = len(related_docs)
-        completed_docs = sum(1 for doc in related_docs if doc.ocr_status == "done")
-        pending_docs = sum(1 for doc in related_docs if doc.ocr_status in ["pending", "running"])
-        failed_docs = sum(1 for doc in related_docs if doc.ocr_status == "fail")
-
-        # Oblicz ogólny postęp
-        overall_progress = 0.0
-        for doc in related_docs:
-            if doc.ocr_status == "done":
-                overall_progress += 1.0
-            elif doc.ocr_status in ["pending", "running"]:
-                overall_progress += (doc.ocr_progress or 0.0)
-            # fail i none = 0.0
-
-        overall_progress = overall_progress / total_docs if total_docs > 0 else 0.0
+        return _summarize_opinion_counts(
+            total_docs=stats.doc_count - ocr_results,
+            completed_docs=stats.ocr_done - ocr_results,
+            failed_docs=stats.ocr_fail,
+            active_states=list(_documents_progress_data(session, active_docs).values())
+        )
+
+
+def _document_progress_data(doc: Document, job=None) -> dict:
+    """Stan OCR dokumentu w formacie /api/document/{id}/ocr-progress."""
+    return {
+        "status": doc.ocr_status,
+        **ocr_progress_view(doc, job),
+        "confidence": doc.ocr_confidence
+    }
+
 
+def _documents_progress_data(session: Session, docs) -> dict:
+    """Stany OCR wielu dokumentów - bieżące próby pobierane jednym zapytaniem."""
+    jobs = get_open_ocr_jobs(session, [doc.id for doc in docs if doc.ocr_status == "running"])
+    return {doc.id: _document_progress_data(doc, jobs.get(doc.id)) for doc in docs}
+
+
+def _merge_ocr_event(state: dict, event: dict) -> dict:
+    """Nakłada pola zdarzenia postępu na stan dokumentu."""
+    for key in ("status", "info", "progress", "current_page", "total_pages", "confidence"):
+        if key in event:
+            state[key] = event[key]
+    state["progress"] = state.get("progress") or 0.0
+    state["current_page"] = state.get("current_page") or 0
+    state["total_pages"] = state.get("total_pages") or 0
+    return state
+
+
+def _summarize_opinion_ocr(doc_states: dict) -> dict:
+    """Podsumowanie OCR dokumentów opinii w formacie /api/opinion/{id}/ocr-status."""
+    states = list(doc_states.values())
+    return _summarize_opinion_counts(
+        total_docs=len(states),
+        completed_docs=sum(1 for state in states if state["status"] == "done"),
+        failed_docs=sum(1 for state in states if state["status"] == "fail"),
+        active_states=[state for state in states if state["status"] in ["pending", "running"]]
+    )
+
+
+def _summarize_opinion_counts(total_docs: int, completed_docs: int, failed_docs: int,
+                              active_states: list) -> dict:
+    """
+    Podsumowanie OCR opinii z liczników dokumentów i stanów dokumentów
+    z aktywnym OCR (pending/running).
+    """
+    if total_docs <= 0:
+        # Brak dokumentów - OCR "zakończony"
         return {
-            "ocr_done": pending_docs == 0 and completed_docs > 0,  # Wszystkie zakończone (nie pending)
-            "total_docs": total_docs,
-            "completed_docs": completed_docs,
-            "pending_docs": pending_docs,
-            "failed_docs": failed_docs,
-            "progress_overall": overall_progress
+            "ocr_done": True,
+            "total_docs": 0,
+            "completed_docs": 0,
+            "pending_docs": 0,
+            "progress_overall": 1.0
         }
 
+    pending_docs = len(active_states)
+
+    # Oblicz ogólny postęp: done = 1.0, aktywne według postępu, fail i none = 0.0
+    overall_progress = completed_docs + sum(state["progress"] or 0.0 for state in active_states)
+    overall_progress = overall_progress / total_docs
+
+    return {
+        "ocr_done": pending_docs == 0 and completed_docs > 0,  # Wszystkie zakończone (nie pending)
+        "total_docs": total_docs,
+        "completed_docs": completed_docs,
+        "pending_docs": pending_docs,
+        "failed_docs": failed_docs,
+        "progress_overall": overall_progress
+    }
+
+
+# ==================== STRUMIENIE SSE ====================
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@router.get("/api/document/{doc_id}/ocr-events", name="document_ocr_events")
+async def document_ocr_events(request: Request, doc_id: int):
+    """
+    Strumień SSE postępu OCR dokumentu - zastępuje odpytywanie /ocr-progress.
+    Zdarzenia: "progress" (pełny stan jak w /ocr-progress), "page" (zakończona strona).
+    Strumień kończy się po osiągnięciu statusu końcowego.
+    """
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        if not doc:
+            raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+        state = _document_progress_data(doc, get_open_ocr_job(session, doc_id))
+
+    async def event_stream():
+        queue = ocr_event_bus.subscribe([doc_id])
+        try:
+            if state["status"] in ["pending", "running"]:
+                state.update(await asyncio.to_thread(get_document_eta, doc_id))
+            yield format_sse("progress", state)
+
+            while state["status"] not in FINAL_OCR_STATUSES:
+                if await request.is_disconnected():
+                    break
+
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Podtrzymanie połączenia - przy okazji odśwież ETA kolejki
+                    state.update(await asyncio.to_thread(get_document_eta, doc_id))
+                    yield format_sse("progress", state)
+                    continue
+
+                if event.get("type") == "page":
+                    yield format_sse("page", event)
+                else:
+                    yield format_sse("progress", _merge_ocr_event(state, event))
+            else:
+                # Status końcowy - klient zamyka EventSource zamiast łączyć się ponownie
+                yield format_sse("end", state)
+        finally:
+            ocr_event_bus.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+@router.get("/api/opinion/{opinion_id}/ocr-events", name="opinion_ocr_events")
+async def opinion_ocr_events(request: Request, opinion_id: int):
+    """
+    Strumień SSE postępu OCR wszystkich dokumentów opinii - zastępuje odpytywanie
+    /api/opinion/{id}/ocr-status. Zdarzenie "progress" zawiera podsumowanie jak
+    w /ocr-status oraz stan zmienionego dokumentu ("document").
+    """
+    with Session(engine) as session:
+        opinion = session.get(Document, opinion_id)
+        if not opinion or not opinion.is_main:
+            raise HTTPException(status_code=404, detail="Nie znaleziono opinii")
+
+        related_docs = session.exec(
+            select(Document).where(
+                Document.parent_id == opinion_id,
+                Document.doc_type != "OCR TXT"  # Ignoruj wyniki OCR
+            )
+        ).all()
+        doc_states = _documents_progress_data(session, related_docs)
+
+    async def event_stream():
+        queue = ocr_event_bus.subscribe(doc_states.keys())
+        try:
+            summary = _summarize_opinion_ocr(doc_states)
+            yield format_sse("progress", summary)
+
+            while summary["pending_docs"]:
+                if await request.is_disconnected():
+                    break
+
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+
+                doc_id = event.get("doc_id")
+                if event.get("type") == "page":
+                    yield format_sse("page", event)
+                    continue
+
+                _merge_ocr_event(doc_states[doc_id], event)
+                summary = _summarize_opinion_ocr(doc_states)
+                yield format_sse("progress", {**summary, "document": {"doc_id": doc_id, **doc_states[doc_id]}})
+            else:
+                yield format_sse("end", summary)
+        finally:
+            ocr_event_bus.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
 
 @router.post("/api/document/{doc_id}/ocr-selection", name="document_ocr_selection")
 async def document_ocr_selection(request: Request, doc_id: int):
@@ -159,6 +418,7 @@ async def document_ocr_selection(request: Request, doc_id: int):
             doc = session.get(Document, doc_id)
             if not doc:
                 return {"error": "Nie znaleziono dokumentu"}
+            await asyncio.to_thread(ensure_restored, doc)
 
             # Sprawdź, czy to jest PDF lub obraz
             if not doc.mime_type or (doc.mime_type != 'application/pdf' and not doc.mime_type.startswith('image/')):
@@ -171,15 +431,16 @@ async def document_ocr_selection(request: Request, doc_id: int):
 
             # Obsługa PDF
             if doc.mime_type == 'application/pdf':
-                # Pobierz liczbę stron z PDF
+                # Pobierz liczbę stron z PDF (ustaloną przy przyjęciu dokumentu, jeśli jest)
                 try:
-                    with open(file_path, 'rb') as pdf_file:
-                        pdf_reader = PyPDF2.PdfReader(pdf_file)
-                        total_pages = len(pdf_reader.pages)
-
-                        # Sprawdź, czy żądana strona istnieje
-                        if page <= 0 or page > total_pages:
-                            return {"error": f"Strona {page} nie istnieje. Dokument ma {total_pages} stron."}
+                    total_pages = doc.page_count
+                    if total_pages is None:
+                        with open(file_path, 'rb') as pdf_file:
+                            total_pages = len(PyPDF2.PdfReader(pdf_file).pages)
+
+                    # Sprawdź, czy żądana strona istnieje
+                    if page <= 0 or page > total_pages:
+                        return {"error": f"Strona {page} nie istnieje. Dokument ma {total_pages} stron."}
                 except Exception as e:
                     logger.error(f"Błąd odczytu dokumentu PDF: {str(e)}", exc_info=True)
                     return {"error": f"Nie można odczytać dokumentu PDF: {str(e)}"}
@@ -331,6 +592,7 @@ def document_pdf_viewer(request: Request, doc_id: int):
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+        ensure_restored(doc)
 
         # Sprawdź czy dokument to PDF
         if not doc.mime_type or doc.mime_type != 'application/pdf':
@@ -357,6 +619,7 @@ def document_image_viewer(request: Request, doc_id: int):
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+        ensure_restored(doc)
 
         # Sprawdź czy dokument to obraz
         if not doc.mime_type or not doc.mime_type.startswith('image/'):
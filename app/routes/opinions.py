@@ -8,11 +8,14 @@ from fastapi.responses import RedirectResponse
 from sqlmodel import Session, select
 from datetime import datetime
 
+from app.archive import ArchiveError, archive_opinion, restore_if_active, restore_opinion
 from app.db import engine, BASE_DIR
 from app.models import Document
-from app.search import is_fuzzy_match, normalize_text_for_search
 from app.document_utils import STEP_ICON
-from app.text_extraction import get_document_text_content, HAS_DOCX
+from app.text_extraction import HAS_DOCX
+from app.listing import (DEFAULT_PAGE_SIZE, SORT_OPTIONS, archive_condition, list_page, pagination_links, resolve_sort,
+                         search_page)
+from app.opinion_stats import OTHER_DOC_TYPE, get_opinion_stats, get_opinion_stats_map, get_type_counts
 
 # Moduł nawigacji
 from app.navigation import build_opinion_navigation, PageActionsBuilder
@@ -28,12 +31,17 @@ def list_opinions(request: Request,
                   k4: bool | None = None,
                   search: str | None = None,
                   search_content: bool = False,
-                  fuzzy_search: bool = False):
-    """Lista opinii z filtrowaniem i wyszukiwaniem."""
+                  fuzzy_search: bool = False,
+                  semantic_search: bool = False,
+                  include_archive: bool = False,
+                  sort: str | None = None,
+                  cursor: str | None = None,
+                  page_size: int = DEFAULT_PAGE_SIZE):
+    """Lista opinii z filtrowaniem, wyszukiwaniem i stronicowaniem."""
 
     with Session(engine) as session:
-        # Pobierz wszystkie główne dokumenty (opinie)
-        query = select(Document).where(Document.is_main == True)
+        # Główne dokumenty (opinie) - archiwum (app/archive.py) tylko na żądanie
+        conditions = [Document.is_main == True, *archive_condition(include_archive)]
 
         # Sprawdź czy to pierwsza wizyta czy użytkownik faktycznie filtruje
         query_params = request.query_params
@@ -63,49 +71,24 @@ def list_opinions(request: Request,
 
         # Jeśli wybrano jakieś filtry, zastosuj je
         if status_filters:
-            query = query.where(Document.step.in_(status_filters))
+            conditions.append(Document.step.in_(status_filters))
         else:
             # Jeśli żaden filtr nie jest aktywny, pokaż pustą listę
             # (użytkownik świadomie odznaczył wszystko)
-            query = query.where(Document.id == -1)  # Brak wyników
+            conditions.append(Document.id == -1)  # Brak wyników
 
-        opinions = session.exec(query.order_by(Document.upload_time.desc())).all()
-
-        # Wyszukiwanie (kod bez zmian - zachowujemy istniejącą logikę)
+        # Wyszukiwanie (dopasowanie jak dotąd, stronicowanie wyników według trafności)
         search_matches = {}
+        search_snippets = {}
         if search and search.strip():
-            search_term = search.strip()
-            filtered_opinions = []
-
-            for opinion in opinions:
-                matches = []
-
-                # Wyszukiwanie w metadanych
-                searchable_text = ' '.join(filter(None, [
-                    opinion.original_filename or '',
-                    opinion.sygnatura or '',
-                    opinion.doc_type or ''
-                ]))
-
-                if search_term.lower() in searchable_text.lower():
-                    matches.append('metadata')
-                elif fuzzy_search and is_fuzzy_match(search_term, searchable_text):
-                    matches.append('fuzzy_metadata')
-
-                # Wyszukiwanie w treści
-                if search_content:
-                    content_text = get_document_text_content(opinion)
-                    if content_text:
-                        if search_term.lower() in content_text.lower():
-                            matches.append('content')
-                        elif fuzzy_search and is_fuzzy_match(search_term, content_text):
-                            matches.append('fuzzy_content')
-
-                if matches:
-                    search_matches[opinion.id] = matches
-                    filtered_opinions.append(opinion)
-
-            opinions = filtered_opinions
+            page, search_matches, search_snippets = search_page(
+                session, conditions, search.strip(), search_content, fuzzy_search,
+                sort=sort, cursor=cursor, page_size=page_size, semantic_search=semantic_search
+            )
+        else:
+            page = list_page(session, conditions, sort=sort, cursor=cursor, page_size=page_size)
+        opinions = page.rows
+        opinion_stats = get_opinion_stats_map(session, [opinion.id for opinion in opinions])
 
         # Przygotuj dane filtrów do wyświetlenia
         current_filters = {
@@ -115,7 +98,10 @@ def list_opinions(request: Request,
             'k4': k4,
             'search': search or '',
             'search_content': search_content,
-            'fuzzy_search': fuzzy_search
+            'fuzzy_search': fuzzy_search,
+            'semantic_search': semantic_search,
+            'include_archive': include_archive,
+            'sort': resolve_sort(sort)
         }
 
         # Zbuduj akcje strony
@@ -135,12 +121,16 @@ def list_opinions(request: Request,
         context = {
             "request": request,
             "opinions": opinions,
+            "opinion_stats": opinion_stats,
             "icons": STEP_ICON,
             "title": "Lista opinii",
             "current_filters": current_filters,
-            "total_count": len(opinions),
+            "total_count": page.total_count,
+            "sort_options": SORT_OPTIONS,
+            **pagination_links(request, page.next_cursor, cursor),
             "has_docx": HAS_DOCX,
             "search_matches": search_matches,
+            "search_snippets": search_snippets,
             "current_year": datetime.now().year,
             "page_type": "opinions_list",  # NOWE: Dodany page_type
             # Elementy nawigacji
@@ -172,30 +162,13 @@ def opinion_detail(request: Request, doc_id: int):
             .order_by(Document.upload_time.desc())
         ).all()
 
+        # Liczniki dokumentów z agregatów opinii (app/opinion_stats.py)
+        stats = get_opinion_stats(session, doc_id)
+
         # Grupuj dokumenty powiązane według doc_type
         grouped_docs = {}
-
-        # Przygotuj statystyki OCR
-        total_docs = 0
-        pending_docs = 0
-        running_docs = 0
-        done_docs = 0
-        failed_docs = 0
-
         for doc in related_docs:
-            # Zliczanie dokumentów według statusu OCR
-            total_docs += 1
-            if doc.ocr_status == 'pending':
-                pending_docs += 1
-            elif doc.ocr_status == 'running':
-                running_docs += 1
-            elif doc.ocr_status == 'done':
-                done_docs += 1
-            elif doc.ocr_status == 'fail':
-                failed_docs += 1
-
-            # Grupowanie według typu dokumentu
-            doc_type = doc.doc_type or "Inne"
+            doc_type = doc.doc_type or OTHER_DOC_TYPE
             if doc_type not in grouped_docs:
                 grouped_docs[doc_type] = []
             grouped_docs[doc_type].append(doc)
@@ -225,12 +198,14 @@ def opinion_detail(request: Request, doc_id: int):
                 "k4": "k4 – Archiwum"
             },
             "title": navigation['page_title'],
-            "total_docs": total_docs,
-            "pending_docs": pending_docs,
-            "running_docs": running_docs,
-            "done_docs": done_docs,
-            "failed_docs": failed_docs,
-            "has_active_ocr": pending_docs > 0 or running_docs > 0,
+            "opinion_stats": stats,
+            "type_counts": get_type_counts(session, doc_id),
+            "total_docs": stats.doc_count,
+            "pending_docs": stats.ocr_pending,
+            "running_docs": stats.ocr_running,
+            "done_docs": stats.ocr_done,
+            "failed_docs": stats.ocr_fail,
+            "has_active_ocr": stats.ocr_pending > 0 or stats.ocr_running > 0,
             "current_year": datetime.now().year,
             "page_type": "opinion_detail",  # NOWE: Dodany page_type
             # Elementy nawigacji
@@ -251,6 +226,13 @@ def opinion_update(request: Request, doc_id: int,
         if not opinion or not opinion.is_main:
             raise HTTPException(status_code=404, detail="Nie znaleziono opinii")
 
+        # Powrót do aktywnego kroku przywraca opinię z archiwum
+        try:
+            restore_if_active(doc_id, step)
+        except ArchiveError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        session.refresh(opinion)
+
         # Aktualizuj pola
         opinion.step = step
         opinion.sygnatura = sygnatura or None
@@ -264,6 +246,28 @@ def opinion_update(request: Request, doc_id: int,
     return RedirectResponse(request.url_for("opinion_detail", doc_id=doc_id), status_code=303)
 
 
+@router.post("/opinion/{doc_id}/archive", name="opinion_archive")
+def opinion_archive(request: Request, doc_id: int):
+    """Przeniesienie opinii k4 do archiwum (pliki skompresowane, osobny indeks treści)."""
+    try:
+        archive_opinion(doc_id)
+    except ArchiveError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return RedirectResponse(request.url_for("opinion_detail", doc_id=doc_id), status_code=303)
+
+
+@router.post("/opinion/{doc_id}/restore", name="opinion_restore")
+def opinion_restore(request: Request, doc_id: int):
+    """Przywrócenie opinii z archiwum bez zmiany kroku."""
+    try:
+        restore_opinion(doc_id)
+    except ArchiveError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return RedirectResponse(request.url_for("opinion_detail", doc_id=doc_id), status_code=303)
+
+
 @router.post("/opinion/{doc_id}/update-note", name="opinion_update_note")
 def opinion_update_note(request: Request, doc_id: int, note: str = Form("")):
     """Aktualizacja notatki do opinii."""
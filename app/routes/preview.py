@@ -9,6 +9,7 @@ from fastapi.templating import Jinja2Templates
 from sqlmodel import Session
 from datetime import datetime
 
+from app.archive import ensure_restored
 from app.db import engine, FILES_DIR, BASE_DIR
 from app.models import Document
 from app.document_utils import detect_mime_type
@@ -18,11 +19,15 @@ from app.navigation import (
     build_preview_navigation,
     build_document_context_info
 )
-from app.text_extraction import extract_text_from_word, HAS_DOCX
+from app.ingest import schedule_ingest
+from app.text_extraction import get_file_text, HAS_DOCX
 
 router = APIRouter()
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
 
+# Tekst PDF/Word, którego pula przetwarzania (app/ingest.py) jeszcze nie wyodrębniła
+TEXT_PENDING_MESSAGE = "Trwa wyodrębnianie tekstu dokumentu - odśwież stronę za chwilę"
+
 
 @router.get("/document/{doc_id}/preview", name="document_preview")
 def document_preview(request: Request, doc_id: int, embedded: bool = Query(False)):  # ← DODANE: embedded parameter
@@ -31,6 +36,7 @@ def document_preview(request: Request, doc_id: int, embedded: bool = Query(False
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie ma takiego dokumentu")
+        ensure_restored(doc)
 
     file_path = FILES_DIR / doc.stored_filename
 
@@ -57,8 +63,11 @@ def document_preview(request: Request, doc_id: int, embedded: bool = Query(False
     if embedded and mime_type and 'word' in mime_type:
         # Zwróć wyekstraktowany tekst z Word zamiast surowego pliku
         try:
-            extracted_text = extract_text_from_word(file_path)
-            if not extracted_text:
+            extracted_text = get_file_text(doc, parse=False)
+            if extracted_text is None:
+                schedule_ingest([doc.id])
+                extracted_text = TEXT_PENDING_MESSAGE
+            elif not extracted_text:
                 extracted_text = "Dokument Word jest pusty lub nie zawiera tekstu"
             return HTMLResponse(
                 content=f"<pre style='white-space: pre-wrap; font-family: system-ui; padding: 1rem;'>{extracted_text}</pre>")
@@ -94,6 +103,7 @@ def document_text_preview(request: Request, doc_id: int):
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie ma takiego dokumentu")
+        ensure_restored(doc)
 
         # Zbuduj nawigację dla podglądu tekstowego
         navigation = build_preview_navigation(request, doc, session, 'text')
@@ -104,20 +114,14 @@ def document_text_preview(request: Request, doc_id: int):
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Plik nie istnieje")
 
-    # Odczytaj zawartość pliku
+    # Odczytaj zawartość pliku (magazyn tekstów - plik dekodowany raz na wersję)
     content = None
-    encodings = ['utf-8', 'latin-1', 'cp1250']
     error_message = None
 
-    for encoding in encodings:
-        try:
-            content = file_path.read_text(encoding=encoding)
-            break
-        except UnicodeDecodeError:
-            continue
-
-    if content is None:
-        error_message = "Nie można odczytać pliku - nieobsługiwane kodowanie znaków"
+    try:
+        content = get_file_text(doc, parse=False)
+    except Exception as e:
+        error_message = f"Nie można odczytać pliku: {str(e)}"
 
     context = {
         "request": request,
@@ -139,6 +143,7 @@ def document_word_preview(request: Request, doc_id: int):
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+        ensure_restored(doc)
 
         # Zbuduj nawigację dla podglądu Word
         navigation = build_preview_navigation(request, doc, session, 'word')
@@ -178,8 +183,11 @@ def document_word_preview(request: Request, doc_id: int):
                 error_message = "Serwer nie ma zainstalowanej biblioteki do odczytu dokumentów Word"
             else:
                 try:
-                    content = extract_text_from_word(file_path)
-                    if not content or not content.strip():
+                    content = get_file_text(doc, parse=False)
+                    if content is None:
+                        schedule_ingest([doc.id])
+                        error_message = TEXT_PENDING_MESSAGE
+                    elif not content.strip():
                         error_message = "Dokument Word jest pusty lub nie zawiera tekstu"
                 except Exception as e:
                     error_message = f"Nie udało się odczytać dokumentu Word: {str(e)}"
@@ -204,6 +212,7 @@ def document_pdf_preview(request: Request, doc_id: int):
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+        ensure_restored(doc)
 
         # Sprawdź czy dokument to PDF
         if not doc.mime_type or doc.mime_type != 'application/pdf':
@@ -230,6 +239,7 @@ def document_image_preview(request: Request, doc_id: int):
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+        ensure_restored(doc)
 
         # Sprawdź czy dokument to obraz
         if not doc.mime_type or not doc.mime_type.startswith('image/'):
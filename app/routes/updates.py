@@ -9,13 +9,17 @@ from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
 from datetime import datetime
 from pathlib import Path
+import asyncio
 import shutil
 import uuid
 
+from app.archive import ensure_restored
+from app.blobs import is_blob, release_file, store_file, unpin
 from app.navigation import BreadcrumbBuilder
 from app.db import engine, FILES_DIR, BASE_DIR
 from app.models import Document
-from app.document_utils import detect_mime_type
+from app.ingest import schedule_ingest
+from app.uploads import receive_upload
 
 router = APIRouter()
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
@@ -92,6 +96,7 @@ async def document_update(request: Request, doc_id: int, updated_file: UploadFil
         doc = session.get(Document, doc_id)
         if not doc:
             raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+        await asyncio.to_thread(ensure_restored, doc)
 
         # Sprawdź uprawnienia
         is_empty_opinion = doc.is_main and doc.stored_filename.endswith('.empty')
@@ -112,22 +117,28 @@ async def document_update(request: Request, doc_id: int, updated_file: UploadFil
             )
 
         # Zachowaj stary plik i utwórz rekord historyczny jeśli trzeba
+        historical_doc = None
         if keep_history and not is_empty_opinion:
             old_file_path = FILES_DIR / doc.stored_filename
             if old_file_path.exists():
-                # Utwórz kopię historyczną pliku
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                history_name = f"{doc.id}_backup_{timestamp}{Path(doc.stored_filename).suffix}"
-                history_path = FILES_DIR / "history" / history_name
-                history_path.parent.mkdir(exist_ok=True)
-                shutil.copy2(old_file_path, history_path)
+                if is_blob(doc.stored_filename):
+                    # Plik z magazynu jest niezmienny - wersja historyczna wskazuje ten sam plik
+                    history_stored = doc.stored_filename
+                else:
+                    # Utwórz kopię historyczną pliku
+                    history_name = f"{doc.id}_backup_{timestamp}{Path(doc.stored_filename).suffix}"
+                    history_path = FILES_DIR / "history" / history_name
+                    history_path.parent.mkdir(exist_ok=True)
+                    shutil.copy2(old_file_path, history_path)
+                    history_stored = f"history/{history_name}"  # Ścieżka względna
 
                 # Utwórz rekord w bazie danych dla wersji historycznej
                 historical_doc = Document(
                     sygnatura=doc.sygnatura,
                     doc_type="Archiwalna wersja",
                     original_filename=f"{doc.original_filename} (wersja z {timestamp})",
-                    stored_filename=f"history/{history_name}",  # Ścieżka względna
+                    stored_filename=history_stored,
                     step=doc.step,
                     ocr_status="none",  # Historia nie wymaga OCR
                     parent_id=doc_id,  # Powiązanie z głównym dokumentem
@@ -140,30 +151,16 @@ async def document_update(request: Request, doc_id: int, updated_file: UploadFil
                 )
                 session.add(historical_doc)
 
-        # Generuj nową nazwę pliku
-        unique_name = f"{uuid.uuid4().hex}{suffix}"
-        dest = FILES_DIR / unique_name
-
-        # Zapisz nowy plik
-        with dest.open("wb") as buffer:
-            shutil.copyfileobj(updated_file.file, buffer)
-
-        # Wykryj MIME type
-        actual_mime_type = detect_mime_type(dest)
-
-        # Usuń stary plik (jeśli nie jest kopią historyczną)
-        if not is_empty_opinion:
-            old_file_path = FILES_DIR / doc.stored_filename
-            if old_file_path.exists():
-                try:
-                    old_file_path.unlink()
-                except Exception as e:
-                    print(f"Błąd podczas usuwania starego pliku: {e}")
+        # Zapisz nowy plik strumieniowo w magazynie plików (MIME type z pierwszego bloku)
+        dest = FILES_DIR / f"{uuid.uuid4().hex}{suffix}"
+        upload = await receive_upload(updated_file, dest)
+        stored = await asyncio.to_thread(store_file, dest, upload.sha256, upload.size)
+        old_stored_filename = doc.stored_filename
 
         # Aktualizuj rekord w bazie
         doc.original_filename = updated_file.filename
-        doc.stored_filename = unique_name
-        doc.mime_type = actual_mime_type
+        doc.stored_filename = stored.stored_filename
+        doc.mime_type = upload.mime_type
         doc.last_modified = datetime.now()
         # doc.last_modified_by = current_user  # Gdy będzie system użytkowników
 
@@ -179,7 +176,19 @@ async def document_update(request: Request, doc_id: int, updated_file: UploadFil
             doc.note = existing_note + new_comment
 
         session.add(doc)
-        session.commit()
+        try:
+            session.commit()
+        finally:
+            unpin([stored.stored_filename])
+
+        # Usuń stary plik, jeśli nie wskazuje go już inny dokument (np. kopia historyczna)
+        try:
+            release_file(old_stored_filename)
+        except Exception as e:
+            print(f"Błąd podczas usuwania starego pliku: {e}")
+
+        # Tekst nowej wersji (i kopii historycznej) - wyodrębnienie i indeks w tle
+        schedule_ingest([doc_id] + ([historical_doc.id] if historical_doc else []))
 
         # Przekieruj do odpowiedniego widoku
         if doc.is_main:
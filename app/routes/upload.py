@@ -4,6 +4,8 @@ Endpointy związane z uploadowaniem dokumentów i tworzeniem opinii.
 REFAKTORYZACJA: Logika biznesowa przeniesiona do tasks/upload_manager.py
 """
 
+import asyncio
+
 from fastapi import APIRouter, Request, UploadFile, File, Form, HTTPException
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
@@ -15,6 +17,18 @@ from app.db import engine, BASE_DIR
 from app.models import Document
 from app.document_utils import ALLOWED_EXTENSIONS
 from app.navigation import build_form_navigation, BreadcrumbBuilder
+from app.uploads import (
+    UPLOAD_MAX_FILE_SIZE,
+    UPLOAD_MAX_PART_SIZE,
+    UPLOAD_PART_SIZE,
+    UploadSessionError,
+    append_chunk,
+    create_session,
+    get_session,
+    http_error,
+    remove_session,
+    session_lock,
+)
 
 # Import managera z tasks
 from tasks.upload_manager import upload_manager
@@ -117,11 +131,12 @@ def quick_ocr_form(request: Request):
 
 
 @router.post("/quick_ocr", name="quick_ocr")
-async def quick_ocr(request: Request, files: list[UploadFile] = File(...)):
+async def quick_ocr(request: Request, files: list[UploadFile] = File(...),
+                    reuse_ocr: bool = Form(False)):
     """Szybki OCR - dodawanie dokumentów bez wiązania z opinią - REFACTORED."""
 
     # Deleguj całą logikę do managera
-    result = await upload_manager.create_quick_ocr_documents(files)
+    result = await upload_manager.create_quick_ocr_documents(files, reuse_ocr=reuse_ocr)
 
     if result.success:
         return RedirectResponse(result.redirect_url, status_code=303)
@@ -159,6 +174,7 @@ def upload_to_opinion_form(request: Request, doc_id: int):
         "request": request,
         "opinion": opinion,
         "allowed_types": allowed_types,
+        "max_upload_mb": UPLOAD_MAX_FILE_SIZE // 1024 ** 2,
         "current_year": datetime.now().year,
         "page_type": "upload_form",
         **navigation
@@ -171,7 +187,8 @@ def upload_to_opinion_form(request: Request, doc_id: int):
 async def upload_to_opinion(request: Request, doc_id: int,
                             doc_type: str = Form(...),
                             files: list[UploadFile] = File(...),
-                            run_ocr: bool = Form(False)):
+                            run_ocr: bool = Form(False),
+                            reuse_ocr: bool = Form(False)):
     """Dodawanie dokumentów do opinii - REFACTORED."""
 
     # Deleguj całą logikę do managera
@@ -179,10 +196,115 @@ async def upload_to_opinion(request: Request, doc_id: int,
         opinion_id=doc_id,
         files=files,
         doc_type=doc_type,
-        run_ocr=run_ocr
+        run_ocr=run_ocr,
+        reuse_ocr=reuse_ocr
     )
 
     if result.success:
         return RedirectResponse(result.redirect_url, status_code=303)
     else:
-        raise HTTPException(status_code=400, detail=result.error_message)
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=result.error_message)
+
+
+# ==================== ENDPOINTY UPLOADU WZNAWIALNEGO ====================
+# Duże skany wysyłane częściami (static/js/components/chunked-upload.js):
+# POST sesja -> PUT części z ?offset= -> POST finalize. Po zerwaniu połączenia
+# klient pobiera przesunięcie (GET) i wysyła dalej od niego.
+
+@router.post("/api/opinion/{doc_id}/uploads", name="chunked_upload_init")
+def chunked_upload_init(doc_id: int,
+                        filename: str = Form(...),
+                        size: int = Form(...),
+                        doc_type: str = Form(...),
+                        run_ocr: bool = Form(False),
+                        reuse_ocr: bool = Form(False),
+                        sha256: str | None = Form(None)):
+    """Otwarcie sesji uploadu wznawialnego pliku do opinii."""
+    with Session(engine) as session:
+        opinion = session.get(Document, doc_id)
+        if not opinion or not opinion.is_main:
+            raise HTTPException(status_code=404, detail="Nie znaleziono opinii")
+
+    try:
+        upload = create_session(doc_id, filename, size, doc_type, run_ocr, reuse_ocr, sha256 or None)
+    except UploadSessionError as e:
+        raise http_error(e)
+
+    return {
+        "upload_id": upload.upload_id,
+        "offset": 0,
+        "size": upload.size,
+        "chunk_size": UPLOAD_PART_SIZE,
+        "max_chunk_size": UPLOAD_MAX_PART_SIZE,
+    }
+
+
+@router.get("/api/uploads/{upload_id}", name="chunked_upload_status")
+def chunked_upload_status(upload_id: str):
+    """Stan sesji - przesunięcie, od którego klient wysyła dalej."""
+    try:
+        upload = get_session(upload_id)
+    except UploadSessionError as e:
+        raise http_error(e)
+
+    return {
+        "upload_id": upload.upload_id,
+        "opinion_id": upload.opinion_id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.offset,
+        "chunk_size": UPLOAD_PART_SIZE,
+        "max_chunk_size": UPLOAD_MAX_PART_SIZE,
+    }
+
+
+@router.put("/api/uploads/{upload_id}", name="chunked_upload_chunk")
+async def chunked_upload_chunk(request: Request, upload_id: str, offset: int):
+    """
+    Część pliku w treści żądania, zapisywana strumieniowo od przesunięcia offset.
+    Opcjonalny nagłówek X-Chunk-SHA256 - suma kontrolna części.
+    """
+    try:
+        upload = get_session(upload_id)
+        new_offset = await append_chunk(
+            upload, offset, request.stream(), request.headers.get("X-Chunk-SHA256")
+        )
+    except UploadSessionError as e:
+        raise http_error(e)
+
+    return {"upload_id": upload_id, "offset": new_offset, "size": upload.size}
+
+
+@router.post("/api/uploads/{upload_id}/finalize", name="chunked_upload_finalize")
+async def chunked_upload_finalize(upload_id: str):
+    """Zakończenie uploadu - kontrola skrótu pliku i dodanie dokumentu do opinii."""
+    try:
+        result = await upload_manager.finalize_chunked_upload(upload_id)
+    except UploadSessionError as e:
+        raise http_error(e)
+
+    if not result.success:
+        raise HTTPException(status_code=400, detail=result.error_message)
+
+    return {
+        "success": True,
+        "doc_ids": result.uploaded_doc_ids,
+        "redirect_url": result.redirect_url,
+        "ocr_count": result.ocr_count,
+        "duplicate_count": result.duplicate_count,
+        "ocr_reused_count": result.ocr_reused_count,
+    }
+
+
+@router.delete("/api/uploads/{upload_id}", name="chunked_upload_cancel")
+async def chunked_upload_cancel(upload_id: str):
+    """Anulowanie uploadu - usunięcie przesłanych części."""
+    try:
+        get_session(upload_id)
+        async with session_lock(upload_id):
+            upload = get_session(upload_id)
+            await asyncio.to_thread(remove_session, upload)
+    except UploadSessionError as e:
+        raise http_error(e)
+
+    return {"success": True, "message": "Upload anulowany"}
@@ -112,35 +112,29 @@ def is_fuzzy_match(search_term, text, threshold=0.7):
 
 def highlight_search_results(text, search_term, max_length=200):
     """
-    Znajduje i podkreśla znalezione fragmenty w tekście.
-    Zwraca skrócony tekst z podkreślonymi dopasowaniami.
+    Zwraca fragment tekstu (ok. max_length znaków) wokół pierwszego wystąpienia
+    szukanej frazy. Pozycja pochodzi z zakresów tokenów tekstu, więc jest dokładna
+    także dla tekstu z polskimi znakami. Dokumenty z indeksu treści mają fragmenty
+    budowane z pozycji w indeksie (app/search_index.py:fill_snippets).
     """
+    from app.search_index import find_phrase_span
+
     if not search_term or not text:
         return text[:max_length] + "..." if len(text) > max_length else text
-    
-    # Znajdź pozycję najbardziej pasującego fragmentu
-    norm_search = normalize_text_for_search(search_term)
-    norm_text = normalize_text_for_search(text)
-    
-    # Proste podkreślenie dla dokładnych dopasowań
-    if norm_search in norm_text:
-        # Znajdź pozycję w oryginalnym tekście
-        start_pos = norm_text.find(norm_search)
-        if start_pos != -1:
-            # Oblicz pozycję w oryginalnym tekście (przybliżenie)
-            original_pos = int(start_pos * len(text) / len(norm_text))
-            
-            # Wybierz fragment wokół znalezionego tekstu
-            context_start = max(0, original_pos - max_length // 2)
-            context_end = min(len(text), original_pos + max_length // 2)
-            
-            result = text[context_start:context_end]
-            if context_start > 0:
-                result = "..." + result
-            if context_end < len(text):
-                result = result + "..."
-            
-            return result
-    
-    # Jeśli nie ma dokładnego dopasowania, zwróć początek tekstu
-    return text[:max_length] + "..." if len(text) > max_length else text
+
+    span = find_phrase_span(text, search_term)
+    if span is None:
+        return text[:max_length] + "..." if len(text) > max_length else text
+
+    # Fragment wokół znalezionego wystąpienia
+    start, end = span
+    context_start = max(0, start - max(0, max_length - (end - start)) // 2)
+    context_end = min(len(text), max(end, context_start + max_length))
+
+    result = text[context_start:context_end]
+    if context_start > 0:
+        result = "..." + result
+    if context_end < len(text):
+        result = result + "..."
+
+    return result
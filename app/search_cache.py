@@ -0,0 +1,166 @@
+# app/search_cache.py
+"""
+Pamięć podręczna wyników wyszukiwania list dokumentów i opinii.
+
+Te same wyszukiwania (nazwisko, sygnatura akt) powtarzane są wielokrotnie
+w ciągu dnia przez różne osoby, a eksport CSV zaraz po wyszukiwaniu
+powtarza całe dopasowanie. Wynik (uporządkowane identyfikatory, rodzaje
+dopasowań, trafienia w treści i encjach) zapamiętywany jest pod kluczem
+z znormalizowanego zapytania, filtrów i sortowania - strony wyników
+i eksport pobierają z niego tylko wiersze.
+
+Ważność wpisu wyznacza globalny licznik wersji treści (tabela content_version,
+wiersz scope = 0). Licznik podnoszą wyzwalacze SQLite przy dodaniu i usunięciu
+dokumentu, zmianie kolumn wyszukiwania/filtrów (także przez proces OCR; zapis
+postępu OCR i analizy tekstu jej nie unieważnia) oraz przy zapisie indeksów
+treści (pełnotekstowego i osadzeń), które aktualizowane są w tle po zmianie.
+Wpis z inną wersją niż bieżąca jest pomijany i liczony od nowa.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional
+
+from sqlalchemy import and_, text
+
+from app.models import ContentVersion
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "64"))               # Liczba zapamiętanych wyszukiwań
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "600"))  # Np. powrót serwera osadzeń
+
+GLOBAL_SCOPE = 0
+
+# Operator bliskości jest rozpoznawany tylko wielkimi literami (app/search_index.py)
+_NEAR_RE = re.compile(r"NEAR(?:/\d+)?")
+
+# Kolumny dokumentu, od których zależy wynik wyszukiwania (app/listing.py, tasks/document_manager.py)
+SEARCH_TRIGGER_COLUMNS = (
+    "sygnatura", "doc_type", "original_filename", "stored_filename", "mime_type", "step",
+    "is_main", "parent_id", "archived_at", "upload_time", "last_modified",
+)
+
+_BUMP_SQL = f"""
+    INSERT INTO content_version (scope, version) VALUES ({GLOBAL_SCOPE}, 1)
+    ON CONFLICT(scope) DO UPDATE SET version = version + 1;
+"""
+
+
+def _triggers() -> Dict[str, str]:
+    # Dokumenty oraz indeksy treści aktualizowane w tle (app/search_index.py, app/semantic_index.py)
+    events = {}
+    for table in ("document", "search_token_offsets", "embedding_document"):
+        for operation in ("insert", "update", "delete"):
+            events[f"content_version_{table}_{operation}"] = f"AFTER {operation.upper()} ON {table}"
+
+    # Zmiana dokumentu tylko w kolumnach filtrów, sortowania i dopasowania - bez postępu OCR i analizy tekstu
+    events["content_version_document_update"] = f"AFTER UPDATE OF {', '.join(SEARCH_TRIGGER_COLUMNS)} ON document"
+    return {
+        name: f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {_BUMP_SQL} END"
+        for name, event in events.items()
+    }
+
+
+TRIGGERS = _triggers()
+
+
+def create_version_schema(connection, replace: bool = False):
+    """Tabela licznika wersji i wyzwalacze (migracja schematu); replace - odtworzenie wyzwalaczy."""
+    ContentVersion.__table__.create(connection, checkfirst=True)
+    for name, ddl in TRIGGERS.items():
+        if replace:
+            connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+        connection.exec_driver_sql(ddl)
+
+
+def get_content_version(session) -> int:
+    """Bieżąca globalna wersja treści."""
+    return session.execute(
+        text("SELECT version FROM content_version WHERE scope = :scope"), {"scope": GLOBAL_SCOPE}
+    ).scalar() or 0
+
+
+# ==================== KLUCZ ====================
+
+def normalize_search_term(term: str) -> str:
+    """
+    Zapytanie w postaci kanonicznej: pojedyncze spacje, małe litery (dopasowanie
+    metadanych, treści i encji nie zależy od wielkości liter) - poza operatorem NEAR.
+    """
+    return " ".join(word if _NEAR_RE.fullmatch(word) else word.lower() for word in (term or "").split())
+
+
+def search_cache_key(search_term: str, conditions: list, sort: Optional[str], **options) -> tuple:
+    """Klucz wpisu: zapytanie, filtry (SQL z wartościami), sortowanie i opcje wyszukiwania."""
+    where = str(and_(*conditions).compile(compile_kwargs={"literal_binds": True})) if conditions else ""
+    return (normalize_search_term(search_term), where, sort or "", tuple(sorted(options.items())))
+
+
+# ==================== PAMIĘĆ PODRĘCZNA ====================
+
+@dataclass
+class CachedSearch:
+    """Wynik wyszukiwania niezależny od strony - wiersze pobierane przy każdym użyciu."""
+    matched_ids: List[int]                      # Dokumenty w kolejności wyników
+    search_matches: Dict[int, List[str]]        # Rodzaje dopasowań dokumentów
+    content_hits: Dict[int, object] = field(default_factory=dict)   # Trafienia w treści (ContentHit)
+    entity_hits: Dict[int, list] = field(default_factory=dict)      # Trafienia w indeksie encji
+
+
+@dataclass
+class _Entry:
+    value: CachedSearch
+    version: int
+    stored_at: float
+
+
+class SearchCache:
+    """Ostatnio używane wyniki wyszukiwań (LRU) ważne dla wersji treści z chwili obliczenia."""
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, ttl_seconds: int = SEARCH_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[CachedSearch]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version or time.monotonic() - entry.stored_at > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key: Hashable, version: int, value: CachedSearch) -> CachedSearch:
+        """
+        Zapamiętuje wynik. `version` musi być odczytana przed obliczeniem wyniku -
+        zmiana w trakcie obliczania unieważnia wpis przy następnym odczycie.
+        """
+        if self.max_entries <= 0:
+            return value
+        with self._lock:
+            self._entries[key] = _Entry(value, version, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+search_cache = SearchCache()
@@ -0,0 +1,1057 @@
+# app/search_index.py
+"""
+Indeks pełnotekstowy treści dokumentów (SQLite FTS5).
+
+Treść dokumentu (tekst pliku + wyniki OCR, jak w get_document_text_content)
+trafia do tabeli document_fts (rowid = id dokumentu). Tokenizer unicode61
+z remove_diacritics zwija znaki diakrytyczne, a litery bez dekompozycji
+Unicode (ł/Ł) są zwijane przed indeksowaniem - "Łódź", "lodz" i "LODZ"
+dają te same tokeny. Zwijanie zachowuje długość tekstu, więc pozycje
+fragmentów z indeksu odpowiadają pozycjom w oryginalnej treści (kolumna raw).
+
+Indeks FTS5 jest pozycyjny: zapytanie może zawierać frazy w cudzysłowie
+("biegły sądowy") i operator bliskości (opinia NEAR/5 biegły). Pozycje
+trafień odczytywane są z indeksu (fts5vocab instance), a tabela
+search_token_offsets zamienia numer tokenu na zakres znaków oryginalnej
+treści - fragment wyniku i zakresy podświetleń powstają bez ponownego
+czytania i normalizacji całego dokumentu.
+
+Indeks jest aktualizowany po zakończeniu OCR, po edycji tekstu OCR, po
+aktualizacji pliku opinii i po przesłaniu nowych dokumentów. Przy starcie
+aplikacji w tle indeksowane są dokumenty, których jeszcze nie ma w indeksie.
+
+Treść dokumentów przeniesionych do archiwum (app/archive.py) trafia do osobnej
+tabeli archive_fts o tym samym układzie - nie obciąża indeksu, słownika ani
+pozycji tokenów bieżących dokumentów i jest przeszukiwana tylko na żądanie
+(fragmenty wyników z funkcji snippet() FTS5).
+"""
+
+import html
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlmodel import Session
+
+from app.db import engine, raw_connection
+from app.models import Document
+
+logger = logging.getLogger("search_index")
+
+FTS_TABLE = "document_fts"
+FTS_VOCAB_TABLE = "document_fts_vocab"
+FTS_INSTANCE_TABLE = "document_fts_instance"
+ARCHIVE_FTS_TABLE = "archive_fts"       # Treść dokumentów w archiwum (app/archive.py)
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+# Liczba tokenów we fragmencie wyniku
+SNIPPET_TOKENS = 24
+
+# Domyślna odległość NEAR (w tokenach) - jak w FTS5
+DEFAULT_NEAR_DISTANCE = 10
+
+# Maksymalna liczba wystąpień słów zapytania w indeksie, dla której fragmenty
+# budowane są z pozycji (częstsze słowa - fragmenty funkcji snippet() FTS5)
+MAX_INSTANCE_ROWS = 200_000
+
+# Token jak w tokenizerze unicode61: litery, cyfry, znaki prywatne i łączące (akcenty)
+_TOKEN_RE = re.compile(r"(?:[^\W_]|[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f\ue000-\uf8ff])+")
+
+# Części zapytania: fraza w cudzysłowie, operator NEAR/n, słowo
+_QUERY_PART_RE = re.compile(r'"([^"]*)"?|(?<!\S)NEAR(?:/(\d+))?(?!\S)|[^\s"]+')
+
+# Znaki bez dekompozycji Unicode, których remove_diacritics nie zwija
+_INDEX_FOLD = str.maketrans({"ł": "l", "Ł": "L"})
+
+# Znaczniki trafień we fragmentach zwracanych przez FTS5
+_HIT_START, _HIT_END, _ELLIPSIS = "\x02", "\x03", "…"
+
+
+def _check_fts5() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute(f"CREATE VIRTUAL TABLE t USING fts5(body, tokenize='{FTS_TOKENIZER}')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+HAS_FTS5 = _check_fts5()
+
+
+@dataclass
+class ContentHit:
+    """Trafienie w treści dokumentu."""
+    doc_id: int
+    rank: float             # bm25 - im mniejszy, tym lepsze dopasowanie
+    snippet: str = ""       # Fragment HTML z trafieniami w <mark>
+    fuzzy: bool = False     # Dopasowanie rozmyte (za dokładnymi w kolejności wyników)
+    semantic: bool = False  # Tylko dopasowanie semantyczne (app/semantic_index.py)
+    span: Optional[tuple] = None  # Pozycje najlepszego fragmentu treści (trafienie semantyczne)
+    query: Optional["ContentQuery"] = None  # Zapytanie trafienia - fragment budowany na żądanie (fill_snippets)
+    highlights: Optional[List[Tuple[int, int]]] = None  # Zakresy trafień we fragmencie (pozycje w treści)
+    archived: bool = False  # Trafienie w indeksie archiwum (ARCHIVE_FTS_TABLE)
+
+    @property
+    def sort_key(self):
+        return (1 if self.fuzzy else 0, self.rank)
+
+
+# Klucz sortowania dokumentów bez trafienia w treści (po wszystkich trafieniach)
+NO_HIT_SORT_KEY = (2, 0.0)
+
+
+def fold_for_index(text: str) -> str:
+    """Zwija znaki, których tokenizer nie zwija sam (zachowuje długość tekstu)."""
+    return text.translate(_INDEX_FOLD) if text else ""
+
+
+def token_spans(text: str) -> List[Tuple[int, int]]:
+    """Zakresy znaków kolejnych tokenów tekstu - podział jak w tokenizerze indeksu."""
+    return [match.span() for match in _TOKEN_RE.finditer(text or "")]
+
+
+def normalize_token(token: str) -> str:
+    """Token w postaci zapisanej w indeksie (małe litery, bez znaków diakrytycznych)."""
+    decomposed = unicodedata.normalize("NFKD", fold_for_index(token).lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def find_phrase_span(text: str, term: str) -> Optional[Tuple[int, int]]:
+    """
+    Zakres znaków pierwszego wystąpienia frazy w tekście spoza indeksu
+    (ostatnie słowo jako prefiks, jak w wyszukiwaniu w treści).
+    """
+    words = [normalize_token(token) for token in _TOKEN_RE.findall(term or "")]
+    if not words or not text:
+        return None
+    spans = token_spans(text)
+    tokens = [normalize_token(text[start:end]) for start, end in spans]
+    last = len(words) - 1
+    for position in range(len(tokens) - last):
+        if (tokens[position + last].startswith(words[last])
+                and tokens[position:position + last] == words[:last]):
+            return spans[position][0], spans[position + last][1]
+    return None
+
+
+@dataclass
+class QueryPhrase:
+    """Fraza zapytania - kolejne tokeny, ostatni opcjonalnie jako prefiks."""
+    tokens: List[str]
+    prefix: bool = False
+
+    def fts(self) -> str:
+        return '"' + " ".join(self.tokens) + '"' + ("*" if self.prefix else "")
+
+
+@dataclass
+class QueryGroup:
+    """Fraza albo grupa fraz NEAR (near = maksymalna liczba tokenów między frazami)."""
+    phrases: List[QueryPhrase]
+    near: Optional[int] = None
+
+    def fts(self) -> str:
+        if self.near is None:
+            return self.phrases[0].fts()
+        return f"NEAR({' '.join(phrase.fts() for phrase in self.phrases)}, {self.near})"
+
+
+@dataclass
+class ContentQuery:
+    """Zapytanie do indeksu treści: grupy łączone AND (lub OR - wyszukiwanie rozmyte)."""
+    groups: List[QueryGroup]
+    any_group: bool = False
+
+    @property
+    def match(self) -> str:
+        """Zapytanie FTS5 (MATCH)."""
+        return (" OR " if self.any_group else " ").join(group.fts() for group in self.groups)
+
+    @property
+    def phrases(self) -> List[QueryPhrase]:
+        return [phrase for group in self.groups for phrase in group.phrases]
+
+
+def parse_content_query(term: str) -> Optional[ContentQuery]:
+    """
+    Zamienia wpisany tekst na zapytanie do indeksu treści:
+    - kolejne słowa to fraza z ostatnim słowem jako prefiks (odpowiednik
+      dotychczasowego wyszukiwania podciągu),
+    - "fraza w cudzysłowie" - dokładnie te słowa w tej kolejności,
+    - a NEAR/n b - frazy a i b rozdzielone co najwyżej n słowami (NEAR = NEAR/10).
+    Kilka fraz bez NEAR musi wystąpić w dokumencie jednocześnie.
+    """
+    parts: List[object] = []    # QueryPhrase albo odległość NEAR (int)
+    words: List[str] = []
+
+    def flush_words():
+        if words:
+            parts.append(QueryPhrase(list(words), prefix=True))
+            words.clear()
+
+    for match in _QUERY_PART_RE.finditer(fold_for_index(term or "")):
+        quoted, near = match.group(1), match.group(2)
+        if quoted is not None:
+            flush_words()
+            tokens = _TOKEN_RE.findall(quoted)
+            if tokens:
+                parts.append(QueryPhrase(tokens))
+        elif near is not None or match.group(0) == "NEAR":
+            flush_words()
+            parts.append(int(near) if near is not None else DEFAULT_NEAR_DISTANCE)
+        else:
+            words.extend(_TOKEN_RE.findall(match.group(0)))
+    flush_words()
+
+    groups: List[QueryGroup] = []
+    pending_near = None
+    for part in parts:
+        if isinstance(part, int):
+            pending_near = part if groups else None
+            continue
+        if pending_near is not None:
+            group = groups[-1]
+            group.phrases.append(part)
+            group.near = max(group.near or 0, pending_near)
+            pending_near = None
+        else:
+            groups.append(QueryGroup([part]))
+
+    return ContentQuery(groups) if groups else None
+
+
+def create_fts_table(connection):
+    """Tworzy tabelę FTS5 (wywoływane z migracji)."""
+    if not HAS_FTS5:
+        logger.warning("SQLite bez FTS5 - wyszukiwanie w treści bez indeksu")
+        return
+    connection.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        f"USING fts5(body, raw UNINDEXED, tokenize='{FTS_TOKENIZER}')"
+    )
+
+
+def create_archive_fts_table(connection):
+    """Tworzy tabelę FTS5 treści dokumentów w archiwum (wywoływane z migracji)."""
+    if not HAS_FTS5:
+        return
+    connection.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {ARCHIVE_FTS_TABLE} "
+        f"USING fts5(body, raw UNINDEXED, tokenize='{FTS_TOKENIZER}')"
+    )
+
+
+def create_fts_instance_table(connection):
+    """Tworzy widok wystąpień tokenów indeksu FTS5 (term, dokument, pozycja)."""
+    if not HAS_FTS5:
+        return
+    connection.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_INSTANCE_TABLE} USING fts5vocab({FTS_TABLE}, instance)"
+    )
+
+
+def create_fts_vocab_table(connection):
+    """Tworzy widok słownika indeksu FTS5 (fts5vocab) dla wyszukiwania rozmytego."""
+    if not HAS_FTS5:
+        return
+    connection.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_VOCAB_TABLE} USING fts5vocab({FTS_TABLE}, row)"
+    )
+
+
+# ==================== AKTUALIZACJA INDEKSU ====================
+
+def _document_text(doc: Document, session: Session) -> str:
+    from app.text_extraction import get_document_text_content
+
+    if doc.stored_filename.endswith(".empty"):
+        return ""
+    return get_document_text_content(doc, session) or ""
+
+
+def index_document(doc_id: int, text: Optional[str] = None):
+    """Indeksuje (lub usuwa z indeksu) treść dokumentu."""
+    if not HAS_FTS5:
+        return
+
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        if doc is None:
+            remove_documents([doc_id])
+            return
+        if doc.archived_at is not None:
+            # Treść dokumentu w archiwum wraca do indeksu razem z opinią (app/archive.py)
+            return
+        if text is None:
+            text = _document_text(doc, session)
+
+    with raw_connection() as conn:
+        conn.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = ?", (doc_id,))
+        conn.execute(f"INSERT INTO {FTS_TABLE} (rowid, body, raw) VALUES (?, ?, ?)",
+                     (doc_id, fold_for_index(text), text))
+        _store_token_offsets(conn, doc_id, text)
+
+
+def _fts_token_count(conn, doc_id: int) -> Optional[int]:
+    """Liczba tokenów treści według indeksu FTS5 (pierwszy varint tabeli docsize)."""
+    row = conn.execute(f"SELECT sz FROM {FTS_TABLE}_docsize WHERE id = ?", (doc_id,)).fetchone()
+    if row is None or not row[0]:
+        return None
+    value = 0
+    for position, byte in enumerate(row[0][:9]):
+        if position == 8:
+            return (value << 8) | byte
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value
+    return value
+
+
+def _store_token_offsets(conn, doc_id: int, text: str):
+    """
+    Zapisuje zakresy znaków tokenów treści. Gdy podział na tokeny nie zgadza się
+    z indeksem FTS5 (znaki spoza obsługiwanych klas), zakresy nie są zapisywane
+    - fragmenty wyników dokumentu budowane są wtedy funkcją snippet() FTS5.
+    """
+    spans = token_spans(text)
+    offsets = None
+    if len(spans) == (_fts_token_count(conn, doc_id) or 0):
+        offsets = array("I", [position for span in spans for position in span]).tobytes()
+    else:
+        logger.debug(f"Dokument {doc_id}: podział na tokeny niezgodny z indeksem FTS5")
+    conn.execute("INSERT OR REPLACE INTO search_token_offsets (doc_id, token_count, offsets) VALUES (?, ?, ?)",
+                 (doc_id, len(spans), offsets))
+
+
+def remove_documents(doc_ids: Iterable[int]):
+    """Usuwa dokumenty z indeksu."""
+    if not HAS_FTS5:
+        return
+    doc_ids = [(doc_id,) for doc_id in doc_ids]
+    with raw_connection() as conn:
+        conn.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = ?", doc_ids)
+        conn.executemany(f"DELETE FROM {ARCHIVE_FTS_TABLE} WHERE rowid = ?", doc_ids)
+        conn.executemany("DELETE FROM search_token_offsets WHERE doc_id = ?", doc_ids)
+
+
+def index_missing_offsets() -> int:
+    """Zakresy tokenów dla dokumentów zindeksowanych przed ich wprowadzeniem (z treści w indeksie)."""
+    with raw_connection() as conn:
+        missing = [row[0] for row in conn.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE rowid NOT IN (SELECT doc_id FROM search_token_offsets)"
+        )]
+        for doc_id in missing:
+            row = conn.execute(f"SELECT raw FROM {FTS_TABLE} WHERE rowid = ?", (doc_id,)).fetchone()
+            _store_token_offsets(conn, doc_id, row[0] or "")
+
+    if missing:
+        logger.info(f"🔎 Zapisano pozycje tokenów {len(missing)} dokumentów")
+    return len(missing)
+
+
+def index_missing_documents() -> int:
+    """Indeksuje dokumenty, których nie ma jeszcze w indeksie. Zwraca ich liczbę."""
+    if not HAS_FTS5:
+        return 0
+
+    with raw_connection() as conn:
+        missing = [row[0] for row in conn.execute(
+            f"SELECT id FROM document WHERE id NOT IN (SELECT rowid FROM {FTS_TABLE}) "
+            f"AND archived_at IS NULL ORDER BY id"
+        )]
+
+    for doc_id in missing:
+        try:
+            index_document(doc_id)
+        except Exception as e:
+            logger.warning(f"Nie można zindeksować dokumentu {doc_id}: {e}")
+
+    if missing:
+        logger.info(f"🔎 Zindeksowano treść {len(missing)} dokumentów")
+    index_missing_offsets()
+    return len(missing)
+
+
+# Aktualizacje indeksu wykonywane poza żądaniem HTTP (ekstrakcja tekstu bywa wolna)
+_index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-index")
+_index_lock = threading.Lock()
+
+
+def _reindex(doc_ids: List[int]):
+    with _index_lock:
+        for doc_id in doc_ids:
+            try:
+                index_document(doc_id)
+            except Exception as e:
+                logger.warning(f"Nie można zindeksować dokumentu {doc_id}: {e}")
+
+
+def schedule_reindex(doc_ids: Iterable[int]):
+    """Zleca ponowne zindeksowanie dokumentów w tle."""
+    if HAS_FTS5:
+        _index_executor.submit(_reindex, list(doc_ids))
+
+
+def schedule_index_missing():
+    """Zleca w tle zindeksowanie dokumentów spoza indeksu (start aplikacji)."""
+    if HAS_FTS5:
+        _index_executor.submit(index_missing_documents)
+
+
+def shutdown_index_worker():
+    """Porzuca niewykonane zlecenia indeksowania (zamykanie aplikacji)."""
+    _index_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ==================== ARCHIWUM ====================
+
+def _chunks(doc_ids: List[int], size: int = 500):
+    for start in range(0, len(doc_ids), size):
+        chunk = doc_ids[start:start + size]
+        yield chunk, ",".join("?" * len(chunk))
+
+
+def move_to_archive_index(conn, doc_ids: List[int]):
+    """
+    Przenosi treść dokumentów z indeksu do indeksu archiwum (bez pozycji tokenów).
+    Wykonywane w transakcji wywołującego - razem z oznaczeniem dokumentów (app/archive.py).
+    """
+    if not HAS_FTS5:
+        return
+    for chunk, placeholders in _chunks(doc_ids):
+        conn.execute(f"DELETE FROM {ARCHIVE_FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+        conn.execute(f"INSERT INTO {ARCHIVE_FTS_TABLE} (rowid, body, raw) "
+                     f"SELECT rowid, body, raw FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+        conn.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+        conn.execute(f"DELETE FROM search_token_offsets WHERE doc_id IN ({placeholders})", chunk)
+
+
+def restore_from_archive_index(conn, doc_ids: List[int]):
+    """Przywraca treść dokumentów z indeksu archiwum do indeksu (z pozycjami tokenów), bez ekstrakcji tekstu."""
+    if not HAS_FTS5:
+        return
+    for chunk, placeholders in _chunks(doc_ids):
+        conn.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+        conn.execute(f"INSERT INTO {FTS_TABLE} (rowid, body, raw) "
+                     f"SELECT rowid, body, raw FROM {ARCHIVE_FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+        rows = conn.execute(f"SELECT rowid, raw FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk).fetchall()
+        for doc_id, raw in rows:
+            _store_token_offsets(conn, doc_id, raw or "")
+        conn.execute(f"DELETE FROM {ARCHIVE_FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+
+
+def archived_text(doc_id: int) -> Optional[str]:
+    """Treść dokumentu z indeksu archiwum (jak get_document_text_content przed archiwizacją)."""
+    if not HAS_FTS5:
+        return None
+    with raw_connection() as conn:
+        row = conn.execute(f"SELECT raw FROM {ARCHIVE_FTS_TABLE} WHERE rowid = ?", (doc_id,)).fetchone()
+    return row[0] if row else None
+
+
+def search_archive(term: str, doc_ids: Iterable[int]) -> Dict[int, ContentHit]:
+    """
+    Wyszukuje w treści dokumentów archiwum (ta sama składnia co search_content,
+    bez wyszukiwania rozmytego). Fragmenty buduje fill_snippets.
+    """
+    query = parse_content_query(term)
+    if not HAS_FTS5 or not query:
+        return {}
+    return _run_match(query, doc_ids, with_snippets=False, table=ARCHIVE_FTS_TABLE)
+
+
+# ==================== WYSZUKIWANIE ====================
+
+def _render_snippet(conn, doc_id: int, snippet: str, table: str = FTS_TABLE) -> str:
+    """
+    Przenosi fragment z indeksu (tekst po zwinięciu) na oryginalną treść
+    i zwraca HTML z trafieniami w <mark>.
+    """
+    prefix = snippet.startswith(_ELLIPSIS)
+    suffix = snippet.endswith(_ELLIPSIS)
+    snippet = snippet[len(_ELLIPSIS) if prefix else 0:len(snippet) - len(_ELLIPSIS) if suffix else None]
+
+    plain = snippet.replace(_HIT_START, "").replace(_HIT_END, "")
+    row = conn.execute(
+        f"SELECT substr(raw, instr(body, ?), ?) FROM {table} WHERE rowid = ?",
+        (plain, len(plain), doc_id)
+    ).fetchone()
+    original = row[0] if row and row[0] and len(row[0]) == len(plain) else plain
+
+    parts, position = [], 0
+    for chunk in re.split(f"([{_HIT_START}{_HIT_END}])", snippet):
+        if chunk == _HIT_START:
+            parts.append("<mark>")
+        elif chunk == _HIT_END:
+            parts.append("</mark>")
+        else:
+            parts.append(html.escape(original[position:position + len(chunk)]))
+            position += len(chunk)
+
+    return ("… " if prefix else "") + "".join(parts) + (" …" if suffix else "")
+
+
+def _fts_snippet(conn, match_query: str, doc_id: int, table: str = FTS_TABLE) -> str:
+    """Fragment z funkcji snippet() FTS5 - dokumenty bez zakresów tokenów, bardzo częste słowa i archiwum."""
+    row = conn.execute(
+        f"SELECT snippet({table}, 0, char(2), char(3), '{_ELLIPSIS}', {SNIPPET_TOKENS}) "
+        f"FROM {table} WHERE {table} MATCH ? AND rowid = ?",
+        (match_query, doc_id)
+    ).fetchone()
+    return _render_snippet(conn, doc_id, row[0], table) if row and row[0] else ""
+
+
+# ---------- Pozycje trafień z indeksu ----------
+
+def _prefix_upper_bound(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _phrase_keys(phrase: QueryPhrase) -> List[Tuple[str, bool]]:
+    """Tokeny frazy w postaci z indeksu: (token, czy prefiks)."""
+    last = len(phrase.tokens) - 1
+    return [(normalize_token(token), phrase.prefix and i == last) for i, token in enumerate(phrase.tokens)]
+
+
+def _term_condition(token: str, prefix: bool) -> Tuple[str, tuple]:
+    if prefix:
+        return "term >= ? AND term < ?", (token, _prefix_upper_bound(token))
+    return "term = ?", (token,)
+
+
+def _instance_count(conn, keys: Iterable[Tuple[str, bool]]) -> int:
+    """Łączna liczba wystąpień tokenów w indeksie (słownik fts5vocab row)."""
+    total = 0
+    for token, prefix in keys:
+        condition, params = _term_condition(token, prefix)
+        total += conn.execute(f"SELECT COALESCE(SUM(cnt), 0) FROM {FTS_VOCAB_TABLE} WHERE {condition}",
+                              params).fetchone()[0]
+    return total
+
+
+def _token_positions(conn, keys: Iterable[Tuple[str, bool]],
+                     doc_ids: Set[int]) -> Dict[int, Dict[Tuple[str, bool], Set[int]]]:
+    """
+    Pozycje tokenów zapytania w dokumentach: doc_id -> {(token, prefiks): pozycje}.
+    Wiersze wystąpień zawężane są do doc_ids w SQL - zapytanie zwraca tylko
+    wystąpienia w dokumentach strony wyników, nie w całym korpusie.
+    """
+    positions: Dict[int, Dict[Tuple[str, bool], Set[int]]] = defaultdict(lambda: defaultdict(set))
+    if not doc_ids:
+        return positions
+
+    restriction, restriction_params = _match_restriction(conn, FTS_TABLE, doc_ids, column="doc")
+    try:
+        for key in keys:
+            condition, params = _term_condition(*key)
+            for doc_id, offset in conn.execute(
+                    f"SELECT doc, offset FROM {FTS_INSTANCE_TABLE} "
+                    f"WHERE {condition} AND col = 'body'{restriction}", (*params, *restriction_params)):
+                positions[doc_id][key].add(offset)
+    finally:
+        _clear_match_restriction(conn, restriction)
+    return positions
+
+
+def _phrase_spans(phrase: QueryPhrase, positions: Dict[Tuple[str, bool], Set[int]]) -> List[Tuple[int, int]]:
+    """Wystąpienia frazy jako zakresy tokenów [początek, koniec)."""
+    keys = _phrase_keys(phrase)
+    first = positions.get(keys[0], ())
+    rest = [positions.get(key, set()) for key in keys[1:]]
+    return sorted(
+        (start, start + len(keys)) for start in first
+        if all(start + i + 1 in later for i, later in enumerate(rest))
+    )
+
+
+def _near_spans(group: QueryGroup, phrase_spans: List[List[Tuple[int, int]]]) -> List[Tuple[int, int]]:
+    """
+    Skupiska grupy NEAR: najkrótsze okna zawierające wystąpienie każdej frazy,
+    w których między końcem pierwszego a początkiem ostatniego wystąpienia jest
+    co najwyżej group.near tokenów (warunek FTS5).
+    """
+    instances = sorted((start, end, index) for index, spans in enumerate(phrase_spans) for start, end in spans)
+    needed = len(phrase_spans)
+    clumps = []
+    for left, (start, end, _) in enumerate(instances):
+        seen, last_start, clump_end = set(), start, end
+        for other_start, other_end, index in instances[left:]:
+            if other_start - end > group.near:
+                break
+            seen.add(index)
+            last_start, clump_end = other_start, max(clump_end, other_end)
+            if len(seen) == needed:
+                break
+        if len(seen) == needed and last_start - end <= group.near:
+            clumps.append((start, clump_end))
+    return clumps
+
+
+def _match_spans(query: ContentQuery,
+                 positions: Dict[Tuple[str, bool], Set[int]]) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """
+    Trafienia zapytania w dokumencie.
+
+    Returns:
+        tuple: (zakresy tokenów do podświetlenia, zakresy dopasowań grup - kandydaci na środek fragmentu)
+    """
+    highlights, anchors = [], []
+    for group in query.groups:
+        spans = [_phrase_spans(phrase, positions) for phrase in group.phrases]
+        if group.near is None:
+            anchors.extend(spans[0])
+            highlights.extend(spans[0])
+            continue
+        clumps = _near_spans(group, spans)
+        anchors.extend(clumps)
+        highlights.extend(span for phrase_spans in spans for span in phrase_spans
+                          if any(start <= span[0] and span[1] <= end for start, end in clumps))
+    return sorted(set(highlights)), sorted(anchors)
+
+
+def _snippet_window(anchor: Tuple[int, int], token_count: int) -> Tuple[int, int]:
+    """Zakres tokenów fragmentu: trafienie w pierwszej trzeciej części fragmentu."""
+    length = max(SNIPPET_TOKENS, anchor[1] - anchor[0])
+    start = max(0, min(anchor[0] - (length - (anchor[1] - anchor[0])) // 3, token_count - length))
+    return start, min(token_count, start + length)
+
+
+def _render_offsets_snippet(conn, doc_id: int, token_count: int, window: Tuple[int, int],
+                            highlights: List[Tuple[int, int]]) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    Fragment HTML z zakresów tokenów - odczyt tylko zakresów tokenów okna
+    i odpowiadającego im tekstu oryginalnej treści.
+
+    Returns:
+        tuple: (HTML z trafieniami w <mark>, zakresy znaków trafień w treści)
+    """
+    first, last = window
+    item_size = array("I").itemsize * 2
+    row = conn.execute(
+        "SELECT substr(offsets, ?, ?) FROM search_token_offsets WHERE doc_id = ?",
+        (first * item_size + 1, (last - first) * item_size, doc_id)
+    ).fetchone()
+    offsets = array("I")
+    offsets.frombytes(row[0])
+    text_start, text_end = offsets[0], offsets[-1]
+
+    fragment = conn.execute(f"SELECT substr(raw, ?, ?) FROM {FTS_TABLE} WHERE rowid = ?",
+                            (text_start + 1, text_end - text_start, doc_id)).fetchone()[0] or ""
+
+    ranges = []
+    for start, end in highlights:
+        start, end = max(start, first), min(end, last)
+        if start < end:
+            ranges.append((offsets[2 * (start - first)], offsets[2 * (end - first) - 1]))
+
+    parts, position = [], text_start
+    for start, end in ranges:
+        if start < position:
+            continue
+        parts.append(html.escape(fragment[position - text_start:start - text_start]))
+        parts.append("<mark>" + html.escape(fragment[start - text_start:end - text_start]) + "</mark>")
+        position = end
+    parts.append(html.escape(fragment[position - text_start:]))
+
+    snippet = ("… " if first > 0 else "") + "".join(parts) + (" …" if last < token_count else "")
+    return snippet, ranges
+
+
+def fill_snippets(hits: Iterable[ContentHit]):
+    """
+    Buduje fragmenty treści (ContentHit.snippet) i zakresy trafień (ContentHit.highlights)
+    z pozycji w indeksie - wywoływane tylko dla wyświetlanych wyników.
+    """
+    by_query: Dict[int, List[ContentHit]] = defaultdict(list)
+    for hit in hits:
+        if hit.query is not None and not hit.snippet:
+            by_query[id(hit.query)].append(hit)
+    if not HAS_FTS5 or not by_query:
+        return
+
+    with raw_connection() as conn:
+        for query_hits in by_query.values():
+            query = query_hits[0].query
+            keys = {key for phrase in query.phrases for key in _phrase_keys(phrase)}
+            doc_ids = {hit.doc_id for hit in query_hits}
+            token_counts = dict(conn.execute(
+                f"SELECT doc_id, token_count FROM search_token_offsets "
+                f"WHERE offsets IS NOT NULL AND doc_id IN ({','.join('?' * len(doc_ids))})",
+                tuple(doc_ids)
+            ).fetchall())
+
+            positions = {}
+            if token_counts and _instance_count(conn, keys) <= MAX_INSTANCE_ROWS:
+                positions = _token_positions(conn, keys, set(token_counts))
+
+            for hit in query_hits:
+                if hit.archived:
+                    hit.snippet = _fts_snippet(conn, query.match, hit.doc_id, ARCHIVE_FTS_TABLE)
+                    continue
+                highlights, anchors = _match_spans(query, positions.get(hit.doc_id, {}))
+                if not anchors:
+                    hit.snippet = _fts_snippet(conn, query.match, hit.doc_id)
+                    continue
+                token_count = token_counts[hit.doc_id]
+                hit.snippet, hit.highlights = _render_offsets_snippet(
+                    conn, hit.doc_id, token_count, _snippet_window(anchors[0], token_count), highlights
+                )
+
+
+def search_content(term: str, doc_ids: Optional[Iterable[int]] = None,
+                   with_snippets: bool = True) -> Dict[int, ContentHit]:
+    """
+    Wyszukuje dokumenty zawierające frazę w treści (składnia: parse_content_query).
+
+    Args:
+        term: wpisany tekst
+        doc_ids: opcjonalne zawężenie do dokumentów (np. po filtrach listy)
+        with_snippets: czy od razu budować fragmenty z trafieniami (w przeciwnym
+            razie fill_snippets dla wyświetlanych wyników)
+
+    Returns:
+        dict: doc_id -> ContentHit (kolejność wg trafności)
+    """
+    query = parse_content_query(term)
+    if not HAS_FTS5 or not query:
+        return {}
+    return _run_match(query, doc_ids, with_snippets)
+
+
+# Zawężenie zapytania do dokumentów (filtry listy) - lista parametrów, większe zbiory w tabeli tymczasowej
+MATCH_IN_LIMIT = 500
+_MATCH_TEMP_TABLE = "temp.match_doc_ids"
+
+
+def _match_restriction(conn, table: str, allowed: Optional[Set[int]], column: str = "rowid") -> Tuple[str, list]:
+    """
+    Warunek SQL ograniczający zapytanie do dokumentów allowed (kolumna column
+    z id dokumentu) - przy wąskich filtrach (jedna opinia, typ, krok) FTS5 nie
+    ocenia trafień z całego korpusu. Zbiór nie mniejszy od korpusu nie jest zawężany.
+    Warunek z tabelą tymczasową zwalnia _clear_match_restriction.
+    """
+    if allowed is None:
+        return "", []
+    corpus = conn.execute(f"SELECT count(*) FROM {table}_docsize").fetchone()[0]
+    if len(allowed) >= corpus:
+        return "", []
+    if len(allowed) <= MATCH_IN_LIMIT:
+        return f" AND {column} IN ({', '.join('?' * len(allowed))})", sorted(allowed)
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS match_doc_ids (doc_id INTEGER PRIMARY KEY)")
+    conn.execute(f"DELETE FROM {_MATCH_TEMP_TABLE}")
+    conn.executemany(f"INSERT INTO {_MATCH_TEMP_TABLE} (doc_id) VALUES (?)", ((doc_id,) for doc_id in allowed))
+    return f" AND {column} IN (SELECT doc_id FROM {_MATCH_TEMP_TABLE})", []
+
+
+def _clear_match_restriction(conn, restriction: str):
+    if _MATCH_TEMP_TABLE in restriction:
+        conn.execute(f"DELETE FROM {_MATCH_TEMP_TABLE}")
+
+
+def _run_match(query: ContentQuery, doc_ids: Optional[Iterable[int]] = None, with_snippets: bool = True,
+               fuzzy: bool = False, table: str = FTS_TABLE) -> Dict[int, ContentHit]:
+    """Wykonuje zapytanie FTS5 i zwraca trafienia (doc_id -> ContentHit) według bm25."""
+    allowed = set(doc_ids) if doc_ids is not None else None
+    if allowed is not None and not allowed:
+        return {}
+
+    hits: Dict[int, ContentHit] = {}
+    with raw_connection() as conn:
+        restriction, params = _match_restriction(conn, table, allowed)
+        rows = conn.execute(
+            f"SELECT rowid, bm25({table}) FROM {table} "
+            f"WHERE {table} MATCH ?{restriction} ORDER BY bm25({table})",
+            (query.match, *params)
+        ).fetchall()
+        _clear_match_restriction(conn, restriction)
+
+    archived = table == ARCHIVE_FTS_TABLE
+    for doc_id, rank in rows:
+        if allowed is not None and doc_id not in allowed:
+            continue
+        hits[doc_id] = ContentHit(doc_id, rank, fuzzy=fuzzy, query=query, archived=archived)
+
+    if with_snippets:
+        fill_snippets(hits.values())
+    return hits
+
+
+# ==================== WYSZUKIWANIE ROZMYTE ====================
+
+# Próg podobieństwa słów - jak w app/search.py:is_fuzzy_match
+FUZZY_THRESHOLD = 0.7
+
+# Maksymalna liczba wariantów jednego słowa w zapytaniu FTS5
+FUZZY_MAX_VARIANTS = 50
+
+# Czas życia zbudowanego słownika (sekundy) - nowe słowa z indeksu pojawiają się po tym czasie
+FUZZY_VOCABULARY_TTL_SECONDS = 60
+
+# Liczba kandydatów frazy rozmytej sprawdzanych na treści (is_fuzzy_match) - przy większej
+# liczbie sąsiedztwo wariantów słów sprawdzane jest z pozycji tokenów w indeksie
+FUZZY_TEXT_CHECK_MAX_DOCS = 50
+
+# Próg podobieństwa pojedynczego słowa frazy przy sprawdzaniu sąsiedztwa w indeksie - niższy
+# niż FUZZY_THRESHOLD, bo is_fuzzy_match porównuje całe okno słów (jedno słowo może odbiegać
+# bardziej); okno wariantów jest potem sprawdzane progiem FUZZY_THRESHOLD
+FUZZY_PHRASE_WORD_THRESHOLD = 0.5
+
+
+def _trigrams(term: str) -> Set[str]:
+    padded = f"^{term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyVocabulary:
+    """
+    Słownik znormalizowanych słów z indeksu FTS5 z indeksem trigramów.
+
+    Rozwinięcie słowa zapytania: kandydaci o co najmniej jednym wspólnym trigramie
+    i długości dopuszczalnej przy progu podobieństwa, potwierdzani tym samym
+    kryterium co is_fuzzy_match (SequenceMatcher.ratio na tekście znormalizowanym).
+    """
+
+    def __init__(self, terms: List[str]):
+        self.terms = terms
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        for term_id, term in enumerate(terms):
+            for trigram in _trigrams(term):
+                self.postings[trigram].append(term_id)
+        self.built_at = time.monotonic()
+
+    def expand(self, word: str, threshold: float = FUZZY_THRESHOLD) -> List[str]:
+        """Słowa słownika podobne do `word` (najbardziej podobne pierwsze)."""
+        # Granice długości: warunek is_fuzzy_match i maksimum, przy którym ratio może osiągnąć próg
+        min_length = len(word) * threshold
+        max_length = len(word) * (2 / threshold - 1)
+
+        candidates = set()
+        for trigram in _trigrams(word):
+            candidates.update(self.postings.get(trigram, ()))
+
+        scored = []
+        for term_id in candidates:
+            term = self.terms[term_id]
+            if not min_length <= len(term) <= max_length:
+                continue
+            ratio = SequenceMatcher(None, word, term).ratio()
+            if ratio >= threshold:
+                scored.append((ratio, term))
+
+        scored.sort(reverse=True)
+        return [term for _, term in scored[:FUZZY_MAX_VARIANTS]]
+
+
+_vocabulary: Optional[FuzzyVocabulary] = None
+_vocabulary_lock = threading.Lock()
+_vocabulary_rebuilding = False
+
+
+def _build_vocabulary() -> FuzzyVocabulary:
+    with raw_connection() as conn:
+        terms = [row[0] for row in conn.execute(f"SELECT term FROM {FTS_VOCAB_TABLE}")]
+    return FuzzyVocabulary(terms)
+
+
+def _rebuild_vocabulary():
+    """Przebudowa słownika w tle - gotowy słownik zastępuje poprzedni jednym przypisaniem."""
+    global _vocabulary, _vocabulary_rebuilding
+    try:
+        _vocabulary = _build_vocabulary()
+    except Exception as e:
+        logger.warning(f"Nie można przebudować słownika wyszukiwania rozmytego: {e}")
+    finally:
+        _vocabulary_rebuilding = False
+
+
+def get_fuzzy_vocabulary() -> FuzzyVocabulary:
+    """
+    Słownik słów indeksu. Po FUZZY_VOCABULARY_TTL_SECONDS przebudowywany jest
+    w osobnym wątku - do czasu podmiany zapytania używają poprzedniego słownika.
+    Tylko pierwsze zapytanie (brak słownika) czeka na jego zbudowanie.
+    """
+    global _vocabulary, _vocabulary_rebuilding
+
+    vocabulary = _vocabulary
+    if vocabulary is None:
+        with _vocabulary_lock:
+            if _vocabulary is None:
+                _vocabulary = _build_vocabulary()
+            return _vocabulary
+
+    if time.monotonic() - vocabulary.built_at > FUZZY_VOCABULARY_TTL_SECONDS:
+        with _vocabulary_lock:
+            if not _vocabulary_rebuilding:
+                _vocabulary_rebuilding = True
+                threading.Thread(target=_rebuild_vocabulary, name="fuzzy-vocabulary", daemon=True).start()
+    return vocabulary
+
+
+def fuzzy_word_variants(words: List[str], threshold: float = FUZZY_THRESHOLD) -> List[List[str]]:
+    """Warianty kolejnych słów zapytania ze słownika indeksu (samo słowo na końcu)."""
+    vocabulary = get_fuzzy_vocabulary()
+    word_variants = []
+    for word in words:
+        variants = vocabulary.expand(word, threshold) if len(word) > 2 else []
+        word_variants.append(variants + ([word] if word not in variants else []))
+    return word_variants
+
+
+def build_fuzzy_query(words: List[str], word_variants: Optional[List[List[str]]] = None) -> Optional[ContentQuery]:
+    """
+    Zapytanie dla wyszukiwania rozmytego: każde słowo zastępowane
+    alternatywą podobnych słów ze słownika.
+    """
+    if not words:
+        return None
+
+    variants = []
+    for variant in (variant for group in (word_variants or fuzzy_word_variants(words)) for variant in group):
+        if variant not in variants:
+            variants.append(variant)
+    phrases = [QueryPhrase(tokens) for tokens in (_TOKEN_RE.findall(variant) for variant in variants) if tokens]
+    return ContentQuery([QueryGroup([phrase]) for phrase in phrases], any_group=True) if phrases else None
+
+
+def _fuzzy_phrase_matches(phrase: str, word_variants: List[List[str]], doc_ids: Set[int]) -> Set[int]:
+    """
+    Dokumenty, w których warianty kolejnych słów frazy stoją obok siebie, a okno
+    tych słów spełnia kryterium fragmentu z is_fuzzy_match (SequenceMatcher.ratio
+    wobec całej frazy). Pozycje z indeksu - tylko warianty słów i dokumenty doc_ids.
+    Przy bardzo częstych wariantach (ponad MAX_INSTANCE_ROWS wystąpień) wystarcza
+    wariant każdego słowa w dokumencie (zapytanie FTS5, bez sąsiedztwa).
+    """
+    variant_sets = [set(variants) for variants in word_variants]
+    keys = {(variant, False) for variants in variant_sets for variant in variants}
+
+    with raw_connection() as conn:
+        if _instance_count(conn, keys) > MAX_INSTANCE_ROWS:
+            match = " AND ".join(
+                "(" + " OR ".join(QueryPhrase([variant]).fts() for variant in variants) + ")"
+                for variants in word_variants
+            )
+            restriction, params = _match_restriction(conn, FTS_TABLE, doc_ids)
+            try:
+                return {row[0] for row in conn.execute(
+                    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?{restriction}", (match, *params)
+                )}
+            finally:
+                _clear_match_restriction(conn, restriction)
+
+        positions = _token_positions(conn, keys, doc_ids)
+
+    matched = set()
+    for doc_id, key_positions in positions.items():
+        term_at = {offset: term for (term, _), offsets in key_positions.items() for offset in offsets}
+        for start, term in term_at.items():
+            if term not in variant_sets[0]:
+                continue
+            window = [term_at.get(start + i) for i in range(len(variant_sets))]
+            if (all(word in variants for word, variants in zip(window, variant_sets))
+                    and SequenceMatcher(None, phrase, " ".join(window)).ratio() >= FUZZY_THRESHOLD):
+                matched.add(doc_id)
+                break
+    return matched
+
+
+def _indexed_texts(doc_ids: List[int]) -> Dict[int, str]:
+    """Zindeksowana treść dokumentów (bez ponownej ekstrakcji z plików)."""
+    texts = {}
+    with raw_connection() as conn:
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            texts.update(conn.execute(
+                f"SELECT rowid, raw FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk
+            ).fetchall())
+    return texts
+
+
+def search_fuzzy(term: str, doc_ids: Optional[Iterable[int]] = None,
+                 with_snippets: bool = True) -> Dict[int, ContentHit]:
+    """
+    Wyszukiwanie rozmyte w treści przez słownik indeksu.
+
+    Dla jednego słowa wynik wynika wprost z listy wariantów. Fraza jest w
+    is_fuzzy_match porównywana z oknami kolejnych słów: dokumenty zawierające
+    warianty któregokolwiek słowa frazy są sprawdzane sąsiedztwem wariantów
+    z pozycji w indeksie (_fuzzy_phrase_matches), a treść czytana jest tylko
+    przy niewielu kandydatach (FUZZY_TEXT_CHECK_MAX_DOCS). Kryterium z indeksu
+    jest węższe niż is_fuzzy_match: każde słowo okna musi być wariantem słowa
+    frazy (próg FUZZY_PHRASE_WORD_THRESHOLD), a nie dowolnym słowem treści.
+    """
+    from app.search import is_fuzzy_match, normalize_text_for_search
+
+    words = normalize_text_for_search(term).split()
+    if not HAS_FTS5 or not words:
+        return {}
+    word_variants = fuzzy_word_variants(words)
+    query = build_fuzzy_query(words, word_variants)
+    if not query:
+        return {}
+
+    hits = _run_match(query, doc_ids, with_snippets, fuzzy=True)
+    if len(words) < 2 or not hits:
+        return hits
+
+    single_tokens = all(_TOKEN_RE.findall(word) == [word] for word in words)
+    if len(hits) <= FUZZY_TEXT_CHECK_MAX_DOCS or not single_tokens:
+        texts = _indexed_texts(list(hits))
+        return {doc_id: hit for doc_id, hit in hits.items() if is_fuzzy_match(term, texts.get(doc_id) or "")}
+
+    matched = _fuzzy_phrase_matches(" ".join(words), fuzzy_word_variants(words, FUZZY_PHRASE_WORD_THRESHOLD), set(hits))
+    return {doc_id: hit for doc_id, hit in hits.items() if doc_id in matched}
+
+
+def find_content_matches(term: str, docs: List[Document], fuzzy: bool = False,
+                         session: Session = None) -> Dict[int, ContentHit]:
+    """
+    Dopasowania treści dla listy dokumentów (listy opinii i dokumentów).
+
+    Zwraca trafienia indeksu, a przy wyszukiwaniu rozmytym także dokumenty
+    dopasowane rozmyto (ContentHit.fuzzy, za trafieniami dokładnymi). Dokumenty
+    archiwum (na liście tylko na żądanie) przeszukiwane są w indeksie archiwum.
+    Fragmenty treści buduje fill_snippets dla wyświetlanej strony wyników. Bez FTS5
+    przeszukiwany jest tekst z magazynu tekstów (dokumenty jeszcze nieprzetworzone
+    przez app/ingest.py są pomijane).
+    """
+    from app.search import is_fuzzy_match
+
+    doc_ids = [doc.id for doc in docs]
+
+    if not HAS_FTS5:
+        from app.text_extraction import get_document_text_content
+
+        hits = {}
+        for doc in docs:
+            content_text = get_document_text_content(doc, session, parse=False)
+            if not content_text:
+                continue
+            if term.lower() in content_text.lower():
+                hits[doc.id] = ContentHit(doc.id, 0.0)
+            elif fuzzy and is_fuzzy_match(term, content_text):
+                hits[doc.id] = ContentHit(doc.id, float("inf"), fuzzy=True)
+        return hits
+
+    hits = search_content(term, doc_ids, with_snippets=False)
+
+    if fuzzy:
+        for doc_id, hit in search_fuzzy(term, doc_ids, with_snippets=False).items():
+            hits.setdefault(doc_id, hit)
+
+    archived_ids = [doc.id for doc in docs if getattr(doc, "archived_at", None) is not None]
+    if archived_ids:
+        for doc_id, hit in search_archive(term, archived_ids).items():
+            hits.setdefault(doc_id, hit)
+
+    return hits
@@ -0,0 +1,536 @@
+# app/semantic_index.py
+"""
+Wyszukiwanie semantyczne - indeks wektorowy osadzeń (embeddingów) treści dokumentów.
+
+Treść dokumentu (jak w indeksie pełnotekstowym: tekst pliku + wyniki OCR) dzielona
+jest na zachodzące na siebie fragmenty, które lokalny llama-server (endpoint
+/embedding, ten sam serwer co app/llm_service.py) zamienia na wektory. Wektory
+(znormalizowane, float16) są dopisywane do jednego pliku FILES_DIR/vectors/chunks.f16
+odczytywanego przez np.memmap, a fragmenty (dokument, pozycje w treści) trafiają
+do tabeli embedding_chunk - id fragmentu to numer wiersza w pliku.
+
+Wyszukiwanie liczy podobieństwo kosinusowe zapytania do wszystkich fragmentów
+(brute force, blokami) i zwraca najlepszy fragment każdego dokumentu. Tryb
+hybrydowy łączy ranking indeksu pełnotekstowego z semantycznym (Reciprocal Rank Fusion).
+
+Osadzanie wykonuje jeden wątek procesu głównego (jedyny zapisujący plik wektorów)
+- po przetworzeniu dokumentu przez app/ingest.py, po zakończeniu OCR i przy starcie
+dla dokumentów jeszcze nieosadzonych. Gdy serwer osadzeń jest niedostępny,
+wyszukiwanie semantyczne zwraca pusty wynik, a hybrydowe - wynik pełnotekstowy.
+
+Przebudowa pliku wektorów bez usuniętych fragmentów (przy zatrzymanej aplikacji):
+    python -m app.semantic_index --compact
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from sqlmodel import Session, delete
+
+from app.db import engine, raw_connection, FILES_DIR
+from app.llm_service import LLM_SERVER_URL
+from app.models import Document, EmbeddingChunk, EmbeddingDocument
+
+logger = logging.getLogger("semantic_index")
+
+# Serwer osadzeń (domyślnie serwer LLM) i nazwa modelu zapisywana przy wektorach
+EMBEDDING_SERVER_URL = os.getenv("EMBEDDING_SERVER_URL", LLM_SERVER_URL)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "llama-server")
+EMBEDDING_TIMEOUT = 60
+EMBEDDING_BATCH_SIZE = 16
+
+# Podział treści na fragmenty (znaki) - zakładka zachowuje kontekst na granicach
+CHUNK_CHARS = 1000
+CHUNK_OVERLAP = 200
+
+VECTOR_DIR = FILES_DIR / "vectors"
+VECTOR_DIR.mkdir(parents=True, exist_ok=True)
+VECTOR_FILE = VECTOR_DIR / "chunks.f16"
+VECTOR_META_FILE = VECTOR_DIR / "meta.json"
+
+# Liczba wierszy liczonych naraz przy wyszukiwaniu (ogranicza pamięć float32)
+SEARCH_BLOCK_ROWS = 65536
+
+# Minimalne podobieństwo kosinusowe trafienia i maksymalna liczba dokumentów w wyniku
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.35"))
+SEMANTIC_MAX_RESULTS = 200
+
+# Stała Reciprocal Rank Fusion w trybie hybrydowym
+RRF_K = 60
+
+# Długość fragmentu treści pokazywanego przy trafieniu semantycznym
+SEMANTIC_SNIPPET_CHARS = 240
+
+
+class EmbeddingError(Exception):
+    """Serwer osadzeń niedostępny lub zwrócił nieoczekiwaną odpowiedź."""
+
+
+@dataclass
+class SemanticHit:
+    """Najlepiej dopasowany fragment dokumentu."""
+    doc_id: int
+    score: float            # Podobieństwo kosinusowe (im większe, tym lepiej)
+    start: int              # Pozycje fragmentu w treści dokumentu
+    end: int
+
+
+# ==================== FRAGMENTY TREŚCI ====================
+
+def chunk_text(text: str) -> List[Tuple[int, int]]:
+    """
+    Dzieli tekst na fragmenty ok. CHUNK_CHARS znaków, kończone w miarę możliwości
+    na granicy akapitu, zdania lub słowa. Zwraca pozycje (start, end) w tekście.
+    """
+    spans = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + CHUNK_CHARS, length)
+        if end < length:
+            window = text[start + CHUNK_CHARS // 2:end]
+            for separator in ("\n\n", ". ", "\n", " "):
+                cut = window.rfind(separator)
+                if cut >= 0:
+                    end = start + CHUNK_CHARS // 2 + cut + len(separator)
+                    break
+
+        if text[start:end].strip():
+            spans.append((start, end))
+        if end >= length:
+            break
+
+        # Następny fragment zaczyna się od początku słowa w obrębie zakładki
+        next_start = max(end - CHUNK_OVERLAP, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space >= 0 else next_start
+    return spans
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# ==================== KLIENT OSADZEŃ ====================
+
+def _as_vector(value) -> np.ndarray:
+    vector = np.asarray(value, dtype=np.float32)
+    if vector.ndim == 2:
+        # Serwer bez poolingu zwraca wektory tokenów - uśrednij
+        vector = vector.mean(axis=0)
+    return vector
+
+
+def _parse_embeddings(data) -> List[np.ndarray]:
+    """Wektory z odpowiedzi llama-server (różne wersje formatu /embedding)."""
+    if isinstance(data, dict):
+        if "embedding" in data:
+            return [_as_vector(data["embedding"])]
+        items = data.get("results") or data.get("data") or []
+    else:
+        items = data
+    items = sorted(items, key=lambda item: item.get("index", 0))
+    return [_as_vector(item["embedding"]) for item in items]
+
+
+class EmbeddingClient:
+    """Klient endpointu /embedding lokalnego llama-server."""
+
+    def __init__(self, server_url: str = EMBEDDING_SERVER_URL, timeout: int = EMBEDDING_TIMEOUT):
+        self.server_url = server_url.rstrip('/')
+        self.timeout = timeout
+
+    def _request(self, client: httpx.Client, content) -> List[np.ndarray]:
+        response = client.post(f"{self.server_url}/embedding", json={"content": content},
+                               headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+        return _parse_embeddings(response.json())
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Znormalizowane wektory tekstów (float32, wiersz na tekst).
+
+        Raises:
+            EmbeddingError: serwer niedostępny lub odpowiedź bez wektorów
+        """
+        vectors = []
+        try:
+            with httpx.Client(timeout=self.timeout) as client:
+                for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+                    batch = texts[start:start + EMBEDDING_BATCH_SIZE]
+                    result = self._request(client, batch)
+                    if len(result) != len(batch):
+                        # Starsze wersje serwera przyjmują tylko pojedynczy tekst
+                        result = [vector for text in batch for vector in self._request(client, text)[:1]]
+                    vectors.extend(result)
+        except (httpx.HTTPError, ValueError, KeyError, TypeError) as e:
+            raise EmbeddingError(f"Błąd serwera osadzeń ({self.server_url}): {e}") from e
+
+        if len(vectors) != len(texts) or len({vector.shape for vector in vectors}) > 1:
+            raise EmbeddingError("Serwer osadzeń zwrócił niespójne wektory")
+
+        matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+
+# ==================== PLIK WEKTORÓW ====================
+
+class VectorStore:
+    """Wektory fragmentów w jednym pliku float16 (wiersz = id fragmentu), czytane przez memmap."""
+
+    def __init__(self, path=VECTOR_FILE, meta_path=VECTOR_META_FILE):
+        self.path = path
+        self.meta_path = meta_path
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._matrix_rows = -1
+
+    def meta(self) -> Optional[dict]:
+        try:
+            return json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def dim(self) -> Optional[int]:
+        meta = self.meta()
+        return meta["dim"] if meta else None
+
+    def rows(self) -> int:
+        dim = self.dim
+        if not dim or not self.path.exists():
+            return 0
+        return self.path.stat().st_size // (dim * 2)
+
+    def append(self, vectors: np.ndarray, model: str) -> int:
+        """Dopisuje wektory na końcu pliku. Zwraca numer pierwszego dopisanego wiersza."""
+        with self._lock:
+            meta = self.meta()
+            if meta is None:
+                meta = {"dim": int(vectors.shape[1]), "model": model}
+                self.meta_path.write_text(json.dumps(meta), encoding="utf-8")
+            elif meta["dim"] != vectors.shape[1] or meta["model"] != model:
+                raise EmbeddingError(
+                    f"Model osadzeń zmienił się ({meta['model']}/{meta['dim']} → {model}/{vectors.shape[1]}) "
+                    f"- przebuduj indeks: python -m app.semantic_index --reset"
+                )
+
+            first_row = self.rows()
+            with open(self.path, "ab") as f:
+                # Wyrównanie po przerwanym zapisie - niepełny wiersz jest pomijany
+                f.truncate(first_row * meta["dim"] * 2)
+                f.write(vectors.astype(np.float16).tobytes())
+            return first_row
+
+    def matrix(self) -> Optional[np.ndarray]:
+        """Wektory wszystkich wierszy (memmap otwierany ponownie po dopisaniu wierszy)."""
+        rows = self.rows()
+        if rows == 0:
+            return None
+        with self._lock:
+            if self._matrix is None or self._matrix_rows != rows:
+                self._matrix = np.memmap(self.path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+                self._matrix_rows = rows
+            return self._matrix
+
+    def replace(self, vectors: np.ndarray, meta: dict):
+        """Zastępuje cały plik (kompaktowanie)."""
+        with self._lock:
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            os.replace(tmp_path, self.path)
+            self.meta_path.write_text(json.dumps(meta), encoding="utf-8")
+            self._matrix = None
+            self._matrix_rows = -1
+
+    def reset(self):
+        with self._lock:
+            self.path.unlink(missing_ok=True)
+            self.meta_path.unlink(missing_ok=True)
+            self._matrix = None
+            self._matrix_rows = -1
+
+
+embedding_client = EmbeddingClient()
+vector_store = VectorStore()
+
+
+# ==================== OSADZANIE DOKUMENTÓW ====================
+
+def _embeddable(doc: Document) -> bool:
+    """Wyniki OCR są osadzane jako część treści dokumentu źródłowego."""
+    return not (doc.doc_type == "OCR TXT" and doc.ocr_parent_id is not None)
+
+
+def embed_document(doc_id: int) -> bool:
+    """
+    Osadza treść dokumentu, jeśli zmieniła się od ostatniego osadzenia.
+    Zwraca False, gdy tekstu dokumentu jeszcze nie wyodrębniono (app/ingest.py).
+
+    Raises:
+        EmbeddingError: serwer osadzeń niedostępny
+    """
+    from app.text_extraction import get_document_text_content
+
+    with Session(engine) as session:
+        doc = session.get(Document, doc_id)
+        if doc is None or not _embeddable(doc):
+            remove_embeddings([doc_id])
+            return True
+
+        content = "" if doc.stored_filename.endswith(".empty") else get_document_text_content(doc, session, parse=False)
+        if content is None:
+            return False
+
+        digest = content_hash(content)
+        state = session.get(EmbeddingDocument, doc_id)
+        if state is not None and state.content_hash == digest and state.model == EMBEDDING_MODEL:
+            return True
+
+    spans = chunk_text(content)
+    first_row = None
+    if spans:
+        vectors = embedding_client.embed([content[start:end] for start, end in spans])
+        first_row = vector_store.append(vectors, EMBEDDING_MODEL)
+
+    with Session(engine) as session:
+        session.exec(delete(EmbeddingChunk).where(EmbeddingChunk.doc_id == doc_id))
+        for offset, (start, end) in enumerate(spans):
+            session.add(EmbeddingChunk(id=first_row + offset, doc_id=doc_id, start_offset=start, end_offset=end))
+
+        state = session.get(EmbeddingDocument, doc_id) or EmbeddingDocument(doc_id=doc_id, content_hash=digest,
+                                                                             model=EMBEDDING_MODEL)
+        state.content_hash = digest
+        state.model = EMBEDDING_MODEL
+        state.chunk_count = len(spans)
+        state.embedded_at = datetime.utcnow()
+        session.add(state)
+        session.commit()
+    return True
+
+
+def remove_embeddings(doc_ids: Iterable[int]):
+    """Usuwa fragmenty dokumentów z indeksu (wiersze pliku zwolni kompaktowanie)."""
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return
+    with Session(engine) as session:
+        session.exec(delete(EmbeddingChunk).where(EmbeddingChunk.doc_id.in_(doc_ids)))
+        session.exec(delete(EmbeddingDocument).where(EmbeddingDocument.doc_id.in_(doc_ids)))
+        session.commit()
+
+
+def _embed_documents(doc_ids: List[int]):
+    for doc_id in doc_ids:
+        try:
+            embed_document(doc_id)
+        except EmbeddingError as e:
+            # Serwer niedostępny - pozostałe dokumenty osadzi kolejne zlecenie lub start aplikacji
+            logger.warning(f"⚠️ Osadzanie wstrzymane: {e}")
+            return
+        except Exception as e:
+            logger.warning(f"Nie można osadzić dokumentu {doc_id}: {e}")
+
+
+def missing_embeddings() -> List[int]:
+    """Dokumenty z wyodrębnionym tekstem (spoza archiwum), których treści jeszcze nie osadzono."""
+    with raw_connection() as conn:
+        return [row[0] for row in conn.execute("""
+            SELECT id FROM document
+            WHERE text_extracted_at IS NOT NULL
+              AND NOT (doc_type IS 'OCR TXT' AND ocr_parent_id IS NOT NULL)
+              AND archived_at IS NULL
+              AND id NOT IN (SELECT doc_id FROM embedding_document)
+            ORDER BY id DESC
+        """)]
+
+
+# Osadzanie w jednym wątku - jedyny zapisujący plik wektorów
+_embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-index")
+
+
+def schedule_embedding(doc_ids: Iterable[int]):
+    """Zleca (ponowne) osadzenie treści dokumentów w tle."""
+    _embed_executor.submit(_embed_documents, list(doc_ids))
+
+
+def schedule_missing_embeddings():
+    """Zleca w tle osadzenie dokumentów spoza indeksu (start aplikacji)."""
+    _embed_executor.submit(lambda: _embed_documents(missing_embeddings()))
+
+
+def shutdown_embedding_worker():
+    """Porzuca niewykonane zlecenia osadzania (zamykanie aplikacji)."""
+    _embed_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ==================== WYSZUKIWANIE ====================
+
+def semantic_search(query: str, doc_ids: Optional[Iterable[int]] = None,
+                    limit: int = SEMANTIC_MAX_RESULTS) -> Dict[int, SemanticHit]:
+    """
+    Dokumenty najbardziej podobne znaczeniowo do zapytania (najlepszy fragment
+    każdego dokumentu), od najbardziej podobnego. Pusty wynik, gdy indeks jest
+    pusty lub serwer osadzeń niedostępny.
+    """
+    matrix = vector_store.matrix()
+    if matrix is None or not (query or "").strip():
+        return {}
+
+    try:
+        query_vector = embedding_client.embed([query.strip()])[0]
+    except EmbeddingError as e:
+        logger.warning(f"⚠️ Wyszukiwanie semantyczne niedostępne: {e}")
+        return {}
+    if query_vector.shape[0] != matrix.shape[1]:
+        logger.warning("⚠️ Wymiar wektora zapytania niezgodny z indeksem - przebuduj indeks osadzeń")
+        return {}
+
+    allowed = set(doc_ids) if doc_ids is not None else None
+    with raw_connection() as conn:
+        chunks = [row for row in conn.execute(
+            "SELECT id, doc_id, start_offset, end_offset FROM embedding_chunk WHERE id < ? ORDER BY id",
+            (matrix.shape[0],)
+        ) if allowed is None or row[1] in allowed]
+    if not chunks:
+        return {}
+
+    rows = np.fromiter((chunk[0] for chunk in chunks), dtype=np.int64, count=len(chunks))
+    scores = np.empty(len(rows), dtype=np.float32)
+    for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+        block = rows[start:start + SEARCH_BLOCK_ROWS]
+        scores[start:start + len(block)] = np.asarray(matrix[block], dtype=np.float32) @ query_vector
+
+    hits: Dict[int, SemanticHit] = {}
+    for index in np.argsort(-scores):
+        score = float(scores[index])
+        if score < SEMANTIC_MIN_SCORE or len(hits) >= limit:
+            break
+        _, doc_id, start, end = chunks[index]
+        if doc_id not in hits:
+            hits[doc_id] = SemanticHit(doc_id, score, start, end)
+    return hits
+
+
+def semantic_snippet(doc, hit_span: Tuple[int, int], session: Session = None) -> str:
+    """Fragment treści (HTML) z najlepiej dopasowanego fragmentu dokumentu."""
+    from app.text_extraction import get_document_text_content
+
+    content = get_document_text_content(doc, session, parse=False) or ""
+    start, end = hit_span
+    fragment = " ".join(content[start:min(end, start + SEMANTIC_SNIPPET_CHARS)].split())
+    if not fragment:
+        return ""
+    return ("… " if start > 0 else "") + html.escape(fragment) + (" …" if end < len(content) else "")
+
+
+def hybrid_content_matches(term: str, docs: list, fuzzy: bool = False, session: Session = None) -> dict:
+    """
+    Dopasowania treści w trybie hybrydowym: ranking indeksu pełnotekstowego
+    i semantyczny połączone metodą Reciprocal Rank Fusion.
+
+    Returns:
+        dict: doc_id -> ContentHit (ContentHit.semantic - tylko dopasowanie semantyczne)
+    """
+    from app.search_index import ContentHit, find_content_matches
+
+    keyword_hits = find_content_matches(term, docs, fuzzy, session)
+    semantic_hits = semantic_search(term, [doc.id for doc in docs])
+
+    fused: Dict[int, float] = {}
+    keyword_ranking = sorted(keyword_hits.values(), key=lambda hit: hit.sort_key)
+    for position, hit in enumerate(keyword_ranking):
+        fused[hit.doc_id] = fused.get(hit.doc_id, 0.0) + 1.0 / (RRF_K + position + 1)
+    for position, hit in enumerate(semantic_hits.values()):
+        fused[hit.doc_id] = fused.get(hit.doc_id, 0.0) + 1.0 / (RRF_K + position + 1)
+
+    hits = {}
+    for doc_id, score in sorted(fused.items(), key=lambda item: -item[1]):
+        keyword_hit = keyword_hits.get(doc_id)
+        if keyword_hit is not None:
+            hits[doc_id] = ContentHit(doc_id, -score, keyword_hit.snippet, fuzzy=keyword_hit.fuzzy,
+                                      query=keyword_hit.query, archived=keyword_hit.archived)
+        else:
+            semantic_hit = semantic_hits[doc_id]
+            hits[doc_id] = ContentHit(doc_id, -score, semantic=True, span=(semantic_hit.start, semantic_hit.end))
+    return hits
+
+
+# ==================== KOMPAKTOWANIE ====================
+
+def compact_vectors() -> int:
+    """Przepisuje plik wektorów bez wierszy usuniętych fragmentów. Zwraca liczbę wierszy."""
+    matrix = vector_store.matrix()
+    meta = vector_store.meta()
+    if matrix is None or meta is None:
+        return 0
+
+    with raw_connection() as conn:
+        chunk_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM embedding_chunk WHERE id < ? ORDER BY id", (matrix.shape[0],)
+        )]
+        vectors = np.asarray(matrix[np.asarray(chunk_ids, dtype=np.int64)]) if chunk_ids else \
+            np.zeros((0, meta["dim"]), dtype=np.float16)
+        vector_store.replace(vectors, meta)
+
+        # Fragmenty bez wektora (przerwany zapis) - dokument zostanie osadzony ponownie
+        conn.execute("""
+            DELETE FROM embedding_document WHERE doc_id IN (
+                SELECT doc_id FROM embedding_chunk WHERE id >= ?)
+        """, (matrix.shape[0],))
+        conn.execute("DELETE FROM embedding_chunk WHERE id >= ?", (matrix.shape[0],))
+        conn.execute("CREATE TEMP TABLE chunk_renumber (old_id INTEGER PRIMARY KEY, new_id INTEGER)")
+        conn.executemany("INSERT INTO chunk_renumber VALUES (?, ?)",
+                         [(old_id, new_id) for new_id, old_id in enumerate(chunk_ids)])
+        # Przez wartości ujemne - nowe numery nie kolidują ze starymi w trakcie aktualizacji
+        conn.execute("""
+            UPDATE embedding_chunk
+            SET id = -1 - (SELECT new_id FROM chunk_renumber WHERE old_id = embedding_chunk.id)
+        """)
+        conn.execute("UPDATE embedding_chunk SET id = -1 - id")
+        conn.commit()
+    return len(chunk_ids)
+
+
+def main(argv=None) -> int:
+    from app.db import init_db
+
+    parser = argparse.ArgumentParser(description="Indeks osadzeń treści dokumentów")
+    parser.add_argument("--compact", action="store_true", help="usuń z pliku wektory usuniętych fragmentów")
+    parser.add_argument("--reset", action="store_true", help="usuń indeks (np. po zmianie modelu)")
+    parser.add_argument("--embed-missing", action="store_true", help="osadź dokumenty spoza indeksu")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.reset:
+        with raw_connection() as conn:
+            conn.execute("DELETE FROM embedding_chunk")
+            conn.execute("DELETE FROM embedding_document")
+            conn.commit()
+        vector_store.reset()
+        print("✅ Indeks osadzeń usunięty")
+    if args.compact:
+        print(f"✅ Plik wektorów przepisany: {compact_vectors()} fragmentów")
+    if args.embed_missing:
+        missing = missing_embeddings()
+        _embed_documents(missing)
+        print(f"✅ Osadzono dokumenty: {len(missing) - len(missing_embeddings())} z {len(missing)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+# app/suggest.py
+"""
+Podpowiedzi wyszukiwania (typeahead) - indeks prefiksów w pamięci.
+
+Indeks obejmuje "Dotyczy" (sygnatura), oryginalne nazwy plików i typy
+dokumentów spoza archiwum (app/archive.py). Wartości są sprowadzane do małych liter bez znaków
+diakrytycznych, a klucze indeksu to końcówki wartości od początku każdego
+słowa - "kow" podpowiada zarówno "Kowalski Jan", jak i "Jan Kowalski".
+Klucze trzymane są w posortowanej liście, więc zapytanie to wyszukiwanie
+binarne i odczyt kolejnych kluczy z tym samym prefiksem.
+
+Synchronizacja jest przyrostowa: wyzwalacze SQLite dopisują identyfikatory
+zmienionych dokumentów do dziennika document_change (również przy zapisach
+procesu OCR), a każde zapytanie najpierw stosuje nowe wpisy dziennika.
+
+Nowe zapytanie tego samego klienta (parametr `client`) unieważnia
+poprzednie, które jeszcze czeka na indeks - dostaje pustą odpowiedź
+z flagą superseded.
+
+Sprawdzenie z linii poleceń:
+    python -m app.suggest kowal          # podpowiedzi dla prefiksu
+    python -m app.suggest --stats        # rozmiar indeksu
+"""
+
+import argparse
+import bisect
+import heapq
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.models import DocumentChange
+from app.search import remove_polish_diacritics
+
+logger = logging.getLogger(__name__)
+
+# Pola dokumentu w podpowiedziach (kolejność = pierwszeństwo przy równej ocenie)
+SUGGEST_FIELDS = ("sygnatura", "original_filename", "doc_type")
+_FIELD_ORDER = {field: order for order, field in enumerate(SUGGEST_FIELDS)}
+FIELD_LABELS = {"sygnatura": "Dotyczy", "original_filename": "Plik", "doc_type": "Typ dokumentu"}
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+MAX_KEY_LENGTH = 64             # Długość klucza (końcówki wartości) w indeksie
+MAX_WORD_STARTS = 12            # Klucze jednej wartości - długie nazwy plików
+MAX_SCAN_KEYS = 2000            # Klucze przeglądane dla jednego prefiksu
+SUPERSEDED_CHECK_EVERY = 250    # Co ile kluczy sprawdzać, czy zapytanie jest nadal aktualne
+SYNC_RELOAD_DOCUMENTS = 2000    # Przy większej liczbie zmian - pełne załadowanie zamiast przyrostowego
+CHANGE_LOG_MAX_ROWS = int(os.getenv("SUGGEST_CHANGE_LOG_MAX_ROWS", "10000"))  # Czyszczenie dziennika
+
+_SEPARATOR_RE = re.compile(r"[\W_]+")
+
+_CHANGE_COLUMNS = ("sygnatura, original_filename, doc_type, stored_filename, is_main, parent_id, ocr_parent_id, "
+                   "archived_at")
+
+TRIGGERS = {
+    "document_change_insert": """
+        CREATE TRIGGER IF NOT EXISTS document_change_insert AFTER INSERT ON document
+        BEGIN INSERT INTO document_change (doc_id) VALUES (NEW.id); END
+    """,
+    "document_change_delete": """
+        CREATE TRIGGER IF NOT EXISTS document_change_delete AFTER DELETE ON document
+        BEGIN INSERT INTO document_change (doc_id) VALUES (OLD.id); END
+    """,
+    "document_change_update": f"""
+        CREATE TRIGGER IF NOT EXISTS document_change_update AFTER UPDATE OF {_CHANGE_COLUMNS} ON document
+        BEGIN INSERT INTO document_change (doc_id) VALUES (NEW.id); END
+    """,
+}
+
+_DOCUMENT_SQL = f"SELECT id, {_CHANGE_COLUMNS} FROM document"
+
+
+def create_suggest_schema(connection):
+    """Dziennik zmian i wyzwalacze (migracja schematu)."""
+    DocumentChange.__table__.create(connection, checkfirst=True)
+    for ddl in TRIGGERS.values():
+        connection.exec_driver_sql(ddl)
+
+
+# ==================== NORMALIZACJA ====================
+
+def fold(value: str) -> str:
+    """Małe litery bez znaków diakrytycznych, separatory (spacje, _, -, .) jako pojedyncza spacja."""
+    value = remove_polish_diacritics(value.lower())
+    value = "".join(ch for ch in unicodedata.normalize("NFKD", value) if not unicodedata.combining(ch))
+    return _SEPARATOR_RE.sub(" ", value).strip()
+
+
+def index_keys(value: str) -> List[Tuple[str, int]]:
+    """Klucze indeksu wartości: (końcówka od początku słowa, numer słowa)."""
+    folded = fold(value)
+    if not folded:
+        return []
+    starts = [0] + [match.end() for match in re.finditer(" ", folded)]
+    return [(folded[start:start + MAX_KEY_LENGTH], word) for word, start in enumerate(starts[:MAX_WORD_STARTS])]
+
+
+def _document_terms(row) -> Tuple[Tuple[str, str], ...]:
+    """Wartości (pole, wartość) dokumentu w podpowiedziach - bez wyników OCR, pustych opinii i archiwum."""
+    (doc_id, sygnatura, original_filename, doc_type, stored_filename, is_main, parent_id, ocr_parent_id,
+     archived_at) = row
+    if ocr_parent_id is not None or doc_type == "OCR TXT" or archived_at is not None:
+        return ()
+    terms = []
+    if sygnatura and sygnatura.strip():
+        terms.append(("sygnatura", sygnatura.strip()))
+    if original_filename and not (stored_filename or "").endswith(".empty"):
+        terms.append(("original_filename", original_filename))
+    if doc_type:
+        terms.append(("doc_type", doc_type))
+    return tuple(terms)
+
+
+# ==================== INDEKS ====================
+
+@dataclass
+class Suggestion:
+    field: str
+    value: str
+    doc_count: int
+    doc_id: Optional[int]       # Gdy wartość ma dokładnie jeden dokument
+    opinion_id: Optional[int]   # Gdy wszystkie dokumenty należą do jednej opinii
+    at_start: bool              # Prefiks pasuje do początku wartości (nie dalszego słowa)
+
+    def to_dict(self) -> dict:
+        return {
+            "field": self.field,
+            "label": FIELD_LABELS[self.field],
+            "value": self.value,
+            "doc_count": self.doc_count,
+            "doc_id": self.doc_id,
+            "opinion_id": self.opinion_id,
+        }
+
+
+class SuggestIndex:
+    """Posortowane klucze prefiksów z przyrostową synchronizacją z dziennika document_change."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: List[Tuple[str, int, str, str]] = []   # (klucz, numer słowa, pole, wartość)
+        self._postings: Dict[Tuple[str, str], Set[int]] = {}
+        self._doc_terms: Dict[int, Tuple[Tuple[str, str], ...]] = {}
+        self._doc_opinion: Dict[int, Optional[int]] = {}
+        self._last_seq: Optional[int] = None    # None = indeks niezaładowany
+        self._pruned_seq = 0                    # Dziennik wyczyszczony do tego numeru
+        self._requests_lock = threading.Lock()  # Osobna blokada - nowe zapytanie nie czeka na trwające
+        self._client_requests: Dict[str, int] = {}
+        self._request_counter = 0
+
+    # ---------- Zapytania klientów ----------
+
+    def _register_request(self, client: Optional[str]) -> int:
+        """Numer zapytania; zapamiętany jako najnowsze zapytanie klienta."""
+        with self._requests_lock:
+            self._request_counter += 1
+            if client:
+                self._client_requests[client] = self._request_counter
+            return self._request_counter
+
+    def _superseded(self, client: Optional[str], request_id: int) -> bool:
+        return bool(client) and self._client_requests.get(client, request_id) != request_id
+
+    # ---------- Zmiany ----------
+
+    def _add_term(self, term: Tuple[str, str], doc_id: int):
+        doc_ids = self._postings.get(term)
+        if doc_ids is None:
+            doc_ids = self._postings[term] = set()
+            field, value = term
+            for key, word in index_keys(value):
+                bisect.insort(self._keys, (key, word, field, value))
+        doc_ids.add(doc_id)
+
+    def _remove_term(self, term: Tuple[str, str], doc_id: int):
+        doc_ids = self._postings.get(term)
+        if doc_ids is None:
+            return
+        doc_ids.discard(doc_id)
+        if not doc_ids:
+            del self._postings[term]
+            field, value = term
+            for key, word in index_keys(value):
+                entry = (key, word, field, value)
+                position = bisect.bisect_left(self._keys, entry)
+                if position < len(self._keys) and self._keys[position] == entry:
+                    del self._keys[position]
+
+    def _apply_document(self, doc_id: int, row):
+        """Ustawia wkład dokumentu w indeks na stan wiersza `row` (None = dokument usunięty)."""
+        old_terms = self._doc_terms.pop(doc_id, ())
+        self._doc_opinion.pop(doc_id, None)
+        new_terms = _document_terms(row) if row is not None else ()
+        for term in old_terms:
+            if term not in new_terms:
+                self._remove_term(term, doc_id)
+        for term in new_terms:
+            self._add_term(term, doc_id)
+        if new_terms:
+            self._doc_terms[doc_id] = new_terms
+            is_main, parent_id = row[5], row[6]
+            self._doc_opinion[doc_id] = doc_id if is_main else parent_id
+
+    def _load(self, connection):
+        """Pełne załadowanie indeksu z tabeli document."""
+        started = time.perf_counter()
+        # Numer dziennika odczytany przed dokumentami - zmiany w trakcie ładowania zostaną zastosowane ponownie
+        last_seq = connection.exec_driver_sql(
+            "SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'document_change'"
+        ).scalar()
+
+        postings: Dict[Tuple[str, str], Set[int]] = {}
+        self._doc_terms, self._doc_opinion = {}, {}
+        for row in connection.exec_driver_sql(_DOCUMENT_SQL):
+            terms = _document_terms(row)
+            if not terms:
+                continue
+            doc_id = row[0]
+            self._doc_terms[doc_id] = terms
+            self._doc_opinion[doc_id] = doc_id if row[5] else row[6]
+            for term in terms:
+                postings.setdefault(term, set()).add(doc_id)
+
+        self._postings = postings
+        self._keys = sorted(
+            (key, word, field, value) for field, value in postings for key, word in index_keys(value)
+        )
+        self._last_seq = last_seq
+        logger.info(f"🔤 [SUGGEST] Indeks podpowiedzi: {len(postings)} wartości, {len(self._keys)} kluczy "
+                    f"({time.perf_counter() - started:.2f}s)")
+
+    def _sync(self, connection):
+        """Stosuje wpisy dziennika zmian nowsze niż ostatnio zastosowany."""
+        if self._last_seq is None:
+            self._load(connection)
+            return
+
+        changes = connection.exec_driver_sql(
+            "SELECT seq, doc_id FROM document_change WHERE seq > ? ORDER BY seq", (self._last_seq,)
+        ).all()
+        if not changes:
+            return
+        if changes[0][0] != self._last_seq + 1:
+            # Dziennik wyczyszczony przez inny proces - część zmian nieznana
+            logger.info("🔤 [SUGGEST] Luka w dzienniku zmian - ponowne załadowanie indeksu")
+            self._load(connection)
+            return
+
+        doc_ids = sorted({doc_id for _, doc_id in changes})
+        if len(doc_ids) > SYNC_RELOAD_DOCUMENTS:
+            self._load(connection)
+            return
+        placeholders = ", ".join("?" * len(doc_ids))
+        rows = {row[0]: row for row in connection.exec_driver_sql(
+            f"{_DOCUMENT_SQL} WHERE id IN ({placeholders})", tuple(doc_ids)
+        )}
+        for doc_id in doc_ids:
+            self._apply_document(doc_id, rows.get(doc_id))
+        self._last_seq = changes[-1][0]
+
+        if self._last_seq - self._pruned_seq >= CHANGE_LOG_MAX_ROWS:
+            connection.exec_driver_sql("DELETE FROM document_change WHERE seq <= ?", (self._last_seq,))
+            connection.commit()
+            self._pruned_seq = self._last_seq
+
+    def ensure_loaded(self):
+        """Ładuje indeks, jeśli jeszcze nie jest w pamięci (rozgrzewanie przy starcie aplikacji)."""
+        from app.db import engine
+
+        with self._lock:
+            if self._last_seq is None:
+                with engine.connect() as connection:
+                    self._load(connection)
+
+    # ---------- Wyszukiwanie ----------
+
+    def _lookup(self, prefix: str, limit: int, client: Optional[str], request_id: int) -> Optional[List[Suggestion]]:
+        matches: Dict[Tuple[str, str], bool] = {}
+        position = bisect.bisect_left(self._keys, (prefix,))
+        for scanned, (key, word, field, value) in enumerate(self._keys[position:position + MAX_SCAN_KEYS]):
+            if not key.startswith(prefix):
+                break
+            if scanned % SUPERSEDED_CHECK_EVERY == 0 and self._superseded(client, request_id):
+                return None
+            term = (field, value)
+            matches[term] = matches.get(term, False) or word == 0
+
+        ranked = heapq.nsmallest(limit, matches.items(), key=lambda item: (
+            not item[1], -len(self._postings[item[0]]), _FIELD_ORDER[item[0][0]], len(item[0][1]), item[0][1]
+        ))
+        return [self._suggestion(field, value, at_start) for (field, value), at_start in ranked]
+
+    def _suggestion(self, field: str, value: str, at_start: bool) -> Suggestion:
+        doc_ids = self._postings[(field, value)]
+        opinion_id = None
+        for doc_id in doc_ids:
+            doc_opinion = self._doc_opinion.get(doc_id)
+            if doc_opinion is None or (opinion_id is not None and doc_opinion != opinion_id):
+                opinion_id = None
+                break
+            opinion_id = doc_opinion
+        return Suggestion(
+            field=field,
+            value=value,
+            doc_count=len(doc_ids),
+            doc_id=next(iter(doc_ids)) if len(doc_ids) == 1 else None,
+            opinion_id=opinion_id,
+            at_start=at_start,
+        )
+
+    def suggest(self, prefix: str, limit: int = DEFAULT_SUGGESTIONS,
+                client: Optional[str] = None) -> Optional[List[Suggestion]]:
+        """
+        Podpowiedzi dla prefiksu. Zwraca None, gdy w międzyczasie przyszło
+        nowsze zapytanie tego samego klienta (zapytanie unieważnione).
+        """
+        from app.db import engine
+
+        request_id = self._register_request(client)
+        folded = fold(prefix)
+        if not folded:
+            return []
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+
+        with self._lock:
+            if self._superseded(client, request_id):
+                return None
+            with engine.connect() as connection:
+                self._sync(connection)
+            return self._lookup(folded, limit, client, request_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self._last_seq is not None,
+                "values": len(self._postings),
+                "keys": len(self._keys),
+                "documents": len(self._doc_terms),
+                "last_seq": self._last_seq,
+            }
+
+    def reset(self):
+        """Wymusza ponowne załadowanie przy następnym zapytaniu."""
+        with self._lock:
+            self._last_seq = None
+
+
+suggest_index = SuggestIndex()
+
+
+def schedule_suggest_index_load():
+    """Ładuje indeks podpowiedzi w tle, aby pierwsze zapytanie nie czekało na przebudowę."""
+    def load():
+        try:
+            suggest_index.ensure_loaded()
+        except Exception as e:
+            logger.warning(f"⚠️ [SUGGEST] Nie udało się załadować indeksu podpowiedzi: {e}")
+
+    threading.Thread(target=load, name="suggest-index-load", daemon=True).start()
+
+
+def main(argv=None) -> int:
+    from app.db import init_db
+
+    parser = argparse.ArgumentParser(description="Podpowiedzi wyszukiwania")
+    parser.add_argument("prefix", nargs="?", help="prefiks do podpowiedzi")
+    parser.add_argument("--limit", type=int, default=DEFAULT_SUGGESTIONS)
+    parser.add_argument("--stats", action="store_true", help="rozmiar indeksu")
+    args = parser.parse_args(argv)
+
+    init_db()
+    suggest_index.ensure_loaded()
+    if args.stats or not args.prefix:
+        print(suggest_index.stats())
+    if args.prefix:
+        started = time.perf_counter()
+        suggestions = suggest_index.suggest(args.prefix, args.limit)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for suggestion in suggestions:
+            print(f"{FIELD_LABELS[suggestion.field]:15} {suggestion.value}  ({suggestion.doc_count})")
+        print(f"{len(suggestions)} podpowiedzi w {elapsed_ms:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
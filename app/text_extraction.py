@@ -3,15 +3,20 @@
 Moduł ekstraktowania tekstu z różnych typów dokumentów.
 """
 
+import logging
+import re
+import shutil
+import subprocess
+
 import PyPDF2
 from sqlmodel import Session, select
 from pathlib import Path
 
+from app import text_store
 from app.db import FILES_DIR, engine
 from app.models import Document
-from tasks.ocr.config import logger
-import subprocess
-import shutil
+
+logger = logging.getLogger("text_extraction")
 
 # Próba importu biblioteki python-docx
 try:
@@ -27,22 +32,20 @@ try:
 except ImportError:
     HAS_DOCX2TXT = False
 
-# Cache dla wyekstraktowanych tekstów
-extracted_text_cache = {}
+# Prefiks tekstu zwracanego przez extract_text_from_word, gdy odczyt się nie powiódł
+WORD_READ_ERROR_PREFIX = "[BŁĄD ODCZYTU]"
+
+# Nagłówki stron w wyniku OCR (tasks/ocr/pipeline.py) i początek wyników OCR w treści dokumentu
+OCR_PAGE_HEADER_RE = re.compile(r"^=== Strona (\d+) ===$", re.MULTILINE)
+OCR_RESULTS_MARKER = "=== OCR RESULTS ==="
 
 
 def clear_text_cache(doc_id=None):
-    """Czyści cache tekstów dla dokumentu lub całkowicie."""
-    global extracted_text_cache
+    """Usuwa zapisane teksty dokumentu (app/text_store.py) lub wszystkich dokumentów."""
+    text_store.invalidate(doc_id)
     if doc_id is None:
-        # Wyczyść cały cache
-        extracted_text_cache.clear()
         print(f"🧹 [TEXT_EXTRACTION] Wyczyszczono cały cache tekstów")
     else:
-        # Wyczyść cache dla konkretnego dokumentu
-        keys_to_remove = [k for k in extracted_text_cache.keys() if k.startswith(f"{doc_id}_")]
-        for key in keys_to_remove:
-            del extracted_text_cache[key]
         print(f"🧹 [TEXT_EXTRACTION] Wyczyszczono cache dla dokumentu {doc_id}")
 
 
@@ -140,7 +143,7 @@ def extract_text_from_word(file_path):
         error_msg += f"Brakujące narzędzia: {', '.join(missing_tools)}"
 
     logger.warning(f"❌ {error_msg}: {file_path}")
-    return f"[BŁĄD ODCZYTU] {error_msg}\n\nAby odczytać ten plik, zainstaluj: sudo apt-get install antiword"
+    return f"{WORD_READ_ERROR_PREFIX} {error_msg}\n\nAby odczytać ten plik, zainstaluj: sudo apt-get install antiword"
 
 def get_ocr_text_for_document(doc_id, session):
     """Pobiera tekst OCR dla danego dokumentu - NAJNOWSZY dokument OCR."""
@@ -159,23 +162,12 @@ def get_ocr_text_for_document(doc_id, session):
         # Debug log
         print(f"🔍 [TEXT_EXTRACTION] Pobrano OCR dokument ID={ocr_txt.id}, upload_time={ocr_txt.upload_time}")
 
-        # Odczytaj tekst z pliku OCR
-        ocr_file_path = FILES_DIR / ocr_txt.stored_filename
-        if not ocr_file_path.exists():
-            print(f"❌ [TEXT_EXTRACTION] Plik OCR nie istnieje: {ocr_file_path}")
+        # Odczytaj tekst wyniku OCR (magazyn tekstów)
+        if not (FILES_DIR / ocr_txt.stored_filename).exists():
+            print(f"❌ [TEXT_EXTRACTION] Plik OCR nie istnieje: {ocr_txt.stored_filename}")
             return ""
 
-        encodings = ['utf-8', 'latin-1', 'cp1250']
-        for encoding in encodings:
-            try:
-                text = ocr_file_path.read_text(encoding=encoding)
-                print(f"✅ [TEXT_EXTRACTION] Odczytano OCR text ({len(text)} znaków) z encoding={encoding}")
-                return text
-            except UnicodeDecodeError:
-                continue
-
-        print(f"❌ [TEXT_EXTRACTION] Nie można odczytać pliku OCR z żadnym kodowaniem")
-        return ""
+        return get_file_text(ocr_txt)
 
     except Exception as e:
         print(f"❌ [TEXT_EXTRACTION] Błąd podczas odczytu OCR dla dokumentu {doc_id}: {str(e)}")
@@ -183,42 +175,77 @@ def get_ocr_text_for_document(doc_id, session):
         return ""
 
 
-def get_document_text_content(document, session=None):
+def _extract_file_text(document):
+    """Wyciąga tekst z pliku dokumentu (bez wyników OCR). None = błąd odczytu."""
+    file_path = FILES_DIR / document.stored_filename
+
+    if document.mime_type == 'application/pdf':
+        return extract_text_from_pdf(file_path)
+    if document.mime_type and 'word' in document.mime_type:
+        text = extract_text_from_word(file_path)
+        # Błąd odczytu zapisujemy jako pusty tekst - nie trafia do indeksu ani podglądu
+        return "" if text.startswith(WORD_READ_ERROR_PREFIX) else text
+    try:
+        return text_store.decode_text_bytes(file_path.read_bytes())
+    except OSError as e:
+        logger.warning(f"Nie można odczytać pliku tekstowego {file_path}: {str(e)}")
+        return None
+
+
+def has_extractable_text(document):
+    """Czy z pliku dokumentu da się wyciągnąć tekst (PDF, Word, plik tekstowy, wynik OCR)."""
+    mime_type = document.mime_type or ""
+    return (
+        needs_parsing(document)
+        or mime_type == 'text/plain'
+        or document.doc_type == "OCR TXT"
+        or (document.original_filename or "").lower().endswith('.txt')
+    )
+
+
+def needs_parsing(document):
+    """Czy tekst wymaga parsowania pliku (PDF, Word) - wykonywanego w tle, nie w żądaniu HTTP."""
+    mime_type = document.mime_type or ""
+    return mime_type == 'application/pdf' or 'word' in mime_type
+
+
+def get_file_text(document, parse=True):
     """
-    Zwraca tekstową zawartość dokumentu.
-    Dla dokumentów z OCR sprawdza zarówno oryginalny plik jak i wyniki OCR.
+    Zwraca tekst pliku dokumentu (bez wyników OCR).
+
+    Tekst wyciągany jest raz na wersję dokumentu i zapisywany w magazynie
+    tekstów (app/text_store.py) - kolejne odczyty nie parsują pliku źródłowego.
+
+    Args:
+        parse: False w żądaniach HTTP - tekst PDF/Word, którego nie ma jeszcze
+            w magazynie, daje None zamiast parsowania pliku (zrobi to app/ingest.py)
     """
-    cache_key = f"{document.id}_{document.stored_filename}_{document.last_modified or document.upload_time}"
+    if document.stored_filename.endswith('.empty') or not has_extractable_text(document):
+        return ""
+    if not (FILES_DIR / document.stored_filename).exists():
+        return ""
 
-    # Sprawdź cache
-    if cache_key in extracted_text_cache:
-        return extracted_text_cache[cache_key]
+    extract = None
+    if parse or not needs_parsing(document):
+        extract = lambda: _extract_file_text(document)
+    return text_store.get_text(document, extract)
 
-    file_path = FILES_DIR / document.stored_filename
-    text_content = ""
 
-    # Sprawdź czy plik istnieje
-    if not file_path.exists():
-        extracted_text_cache[cache_key] = ""
-        return ""
+def get_document_text_content(document, session=None, parse=True):
+    """
+    Zwraca tekstową zawartość dokumentu.
+    Dla dokumentów z OCR sprawdza zarówno oryginalny plik jak i wyniki OCR.
+    Przy parse=False zwraca None, gdy tekst pliku nie został jeszcze wyodrębniony.
+    Treść dokumentu w archiwum (app/archive.py) pochodzi z indeksu archiwum.
+    """
+    if getattr(document, "archived_at", None) is not None:
+        from app.search_index import archived_text
+        return archived_text(document.id) or ""
 
-    # Wyciągnij tekst z oryginalnego pliku
-    if document.mime_type == 'application/pdf':
-        text_content = extract_text_from_pdf(file_path)
-    elif document.mime_type and 'word' in document.mime_type:
-        text_content = extract_text_from_word(file_path)
-    elif document.mime_type == 'text/plain' or document.doc_type == "OCR TXT":
-        # Dla plików tekstowych i wyników OCR
-        try:
-            encodings = ['utf-8', 'latin-1', 'cp1250']
-            for encoding in encodings:
-                try:
-                    text_content = file_path.read_text(encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-        except Exception as e:
-            logger.warning(f"Nie można odczytać pliku tekstowego {file_path}: {str(e)}")
+    # Tekst oryginalnego pliku
+    text_content = get_file_text(document, parse=parse)
+    if text_content is None:
+        return None
 
     # WAŻNE: Jeśli to dokument PDF/obrazek, sprawdź też czy ma wyniki OCR
     if document.mime_type in ['application/pdf'] or (document.mime_type and document.mime_type.startswith('image/')):
@@ -231,11 +258,7 @@ def get_document_text_content(document, session=None):
 
         # Dodaj wyniki OCR do tekstu (jeśli istnieją i nie są puste)
         if ocr_results and ocr_results.strip():
-            text_content = f"{text_content}\n\n=== OCR RESULTS ===\n{ocr_results}".strip()
-
-    # Zapisz w cache (max 2000 znaków aby nie zużywać za dużo pamięci)
-    cached_text = text_content[:2000] if text_content else ""
-    extracted_text_cache[cache_key] = cached_text
+            text_content = f"{text_content}\n\n{OCR_RESULTS_MARKER}\n{ocr_results}".strip()
 
     return text_content
 
@@ -257,23 +280,15 @@ def get_text_preview(doc_id, max_length=None):
             return "Nie znaleziono dokumentu"
 
         try:
-            text_path = FILES_DIR / doc.stored_filename
-            if not text_path.exists():
+            if doc.archived_at is not None:
+                # Dokument w archiwum - treść z indeksu archiwum (app/archive.py)
+                text = get_document_text_content(doc, session)
+            elif not (FILES_DIR / doc.stored_filename).exists():
                 return "Plik tekstowy nie istnieje"
-
-            # Próba odczytu z różnymi kodowaniami
-            encodings = ['utf-8', 'latin-1', 'cp1250']
-            for encoding in encodings:
-                try:
-                    # Odczytaj pełny tekst dokumentu
-                    text = text_path.read_text(encoding=encoding)
-                    if max_length and len(text) > max_length:
-                        return text[:max_length] + "...\n[Skrócone - pobierz pełny tekst, aby zobaczyć więcej]"
-                    return text
-                except UnicodeDecodeError:
-                    continue
-
-            # Jeśli żadne kodowanie nie zadziałało
-            return "Nie można odczytać tekstu - nieobsługiwane kodowanie znaków"
+            else:
+                text = get_file_text(doc)
+            if max_length and len(text) > max_length:
+                return text[:max_length] + "...\n[Skrócone - pobierz pełny tekst, aby zobaczyć więcej]"
+            return text
         except Exception as e:
-            return f"Błąd podczas odczytu tekstu: {str(e)}"
\ No newline at end of file
+            return f"Błąd podczas odczytu tekstu: {str(e)}"
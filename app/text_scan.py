@@ -0,0 +1,446 @@
+# app/text_scan.py
+"""
+Skanowanie treści dokumentów frazą lub wyrażeniem regularnym.
+
+Uzupełnia indeks pełnotekstowy (app/search_index.py) o zapytania, których nie da
+się wyrazić słowami FTS: frazy z interpunkcją, wzorce PESEL i sygnatur, wyrażenia
+obejmujące kilka linii. Skan:
+
+- zawęża dokumenty w SQL filtrami listy dokumentów (status kN, typ dokumentu),
+- dzieli teksty na shardy przetwarzane równolegle w puli procesów,
+- czyta wyłącznie zapisane teksty (app/text_store.py) - bez parsowania PDF/Word,
+- przesyła trafienia na bieżąco, z pozycjami znaków w zapisanym tekście (NFC),
+- może zostać przerwany (rozłączenie klienta, nowe zapytanie tego samego klienta,
+  jawne anulowanie) - niewykonane shardy są porzucane, a trwające przerywają
+  dopasowywanie także w środku tekstu,
+- ogranicza koszt wyrażenia: długość wzorca, długość przeszukiwanego tekstu
+  i czas dopasowywania jednego tekstu (wyrażenia z katastrofalnym nawracaniem).
+"""
+
+import asyncio
+import logging
+import os
+import re
+import signal
+import threading
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from app.db import FILES_DIR
+from app.models import Document
+
+logger = logging.getLogger("text_scan")
+
+# Liczba procesów puli skanowania
+SCAN_MAX_WORKERS = int(os.getenv("SCAN_MAX_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+
+# Liczba tekstów w jednym shardzie (zadaniu procesu)
+SCAN_SHARD_SIZE = int(os.getenv("SCAN_SHARD_SIZE", "100"))
+
+# Limity trafień - cały skan i pojedynczy tekst
+SCAN_MAX_MATCHES = 1000
+SCAN_MAX_MATCHES_PER_TEXT = 50
+
+# Kontekst trafienia (znaki przed i po) oraz maksymalna długość zwracanego dopasowania
+SCAN_CONTEXT_CHARS = 60
+SCAN_MATCH_MAX_CHARS = 200
+
+# Limity kosztu zapytania: długość wzorca, długość przeszukiwanego tekstu (dalsza część
+# jest pomijana) i czas dopasowywania jednego tekstu w procesie puli
+SCAN_MAX_PATTERN_CHARS = int(os.getenv("SCAN_MAX_PATTERN_CHARS", "500"))
+SCAN_MAX_TEXT_CHARS = int(os.getenv("SCAN_MAX_TEXT_CHARS", "5000000"))
+SCAN_TEXT_TIME_BUDGET = float(os.getenv("SCAN_TEXT_TIME_BUDGET", "2.0"))
+
+# Co ile sekund proces puli sprawdza budżet czasu i znacznik anulowania w trakcie dopasowania
+SCAN_WATCHDOG_INTERVAL = 0.2
+
+# Znaczniki anulowania widoczne dla procesów puli
+SCAN_CANCEL_DIR = FILES_DIR / "scan"
+SCAN_CANCEL_DIR.mkdir(parents=True, exist_ok=True)
+
+SCAN_MODES = ("phrase", "regex")
+
+
+class ScanUnit(NamedTuple):
+    """
+    Tekst do przeszukania. Pola id/stored_filename/mime_type/doc_type/original_filename
+    opisują dokument, którego tekst jest czytany (plik lub wynik OCR), doc_id - dokument,
+    któremu przypisywane są trafienia.
+    """
+    doc_id: int
+    source: str  # "file" | "ocr"
+    id: int
+    stored_filename: str
+    mime_type: Optional[str]
+    doc_type: Optional[str]
+    original_filename: Optional[str]
+
+
+# ==================== ZAPYTANIE ====================
+
+def compile_scan_pattern(query: str, mode: str = "phrase", case_sensitive: bool = False) -> "re.Pattern":
+    """
+    Kompiluje zapytanie skanu. Fraza dopasowuje słowa rozdzielone dowolnymi
+    białymi znakami (także końcem linii); regex jest używany bez zmian.
+
+    Raises:
+        ValueError: nieznany tryb, puste lub zbyt długie zapytanie, błędne wyrażenie regularne
+    """
+    if mode not in SCAN_MODES:
+        raise ValueError(f"Nieznany tryb skanowania: {mode}")
+
+    query = unicodedata.normalize("NFC", query or "").strip()
+    if not query:
+        raise ValueError("Puste zapytanie")
+    if len(query) > SCAN_MAX_PATTERN_CHARS:
+        raise ValueError(f"Zapytanie dłuższe niż {SCAN_MAX_PATTERN_CHARS} znaków")
+
+    flags = re.MULTILINE | (0 if case_sensitive else re.IGNORECASE)
+    if mode == "phrase":
+        return re.compile(r"\s+".join(re.escape(word) for word in query.split()), flags)
+
+    try:
+        return re.compile(query, flags)
+    except re.error as e:
+        raise ValueError(f"Nieprawidłowe wyrażenie regularne: {e}") from e
+
+
+def scan_units(session: Session, conditions: list) -> Tuple[List[ScanUnit], Dict[int, dict]]:
+    """
+    Teksty dokumentów spełniających warunki listy: tekst pliku każdego dokumentu
+    i najnowszy wynik OCR (przypisany dokumentowi źródłowemu).
+
+    Returns:
+        tuple: (teksty do przeszukania, metadane dokumentów wyników)
+    """
+    rows = session.exec(
+        select(Document.id, Document.stored_filename, Document.mime_type, Document.doc_type,
+               Document.original_filename, Document.sygnatura, Document.ocr_parent_id)
+        .where(*conditions)
+        .order_by(Document.id)
+    ).all()
+    documents = {row.id: {"original_filename": row.original_filename, "sygnatura": row.sygnatura}
+                 for row in rows}
+
+    # Najnowsze wyniki OCR dokumentów - jednym zapytaniem
+    candidate_ids = select(Document.id).where(*conditions)
+    ocr_results = {}
+    for row in session.exec(
+        select(Document.ocr_parent_id, Document.id, Document.stored_filename, Document.mime_type,
+               Document.doc_type, Document.original_filename)
+        .where(Document.doc_type == "OCR TXT", Document.ocr_parent_id.in_(candidate_ids))
+        .order_by(Document.upload_time.desc())
+    ):
+        ocr_results.setdefault(row.ocr_parent_id, row)
+
+    units = []
+    for row in rows:
+        # Wynik OCR dokumentu z listy jest już przeszukiwany jako tekst OCR tego dokumentu
+        if row.doc_type == "OCR TXT" and row.ocr_parent_id in documents:
+            continue
+        if not row.stored_filename.endswith(".empty"):
+            units.append(ScanUnit(row.id, "file", row.id, row.stored_filename, row.mime_type,
+                                  row.doc_type, row.original_filename))
+        ocr = ocr_results.get(row.id)
+        if ocr is not None:
+            units.append(ScanUnit(row.id, "ocr", ocr.id, ocr.stored_filename, ocr.mime_type,
+                                  ocr.doc_type, ocr.original_filename))
+
+    return units, documents
+
+
+# ==================== ZADANIE PROCESU ====================
+
+class _ScanInterrupted(Exception):
+    """Przerwanie dopasowywania tekstu: "timeout" (budżet czasu) lub "cancelled"."""
+
+
+class _MatchWatchdog:
+    """
+    Budzik procesu puli (SIGALRM co SCAN_WATCHDOG_INTERVAL). Gdy dopasowywanie tekstu
+    jest uzbrojone (arm), przerywa je po przekroczeniu budżetu czasu lub po anulowaniu
+    skanu - moduł re obsługuje sygnały w trakcie dopasowania, więc przerwane zostaje
+    także pojedyncze wywołanie z katastrofalnym nawracaniem.
+    Bez setitimer (Windows) działa tylko sprawdzanie znacznika między tekstami.
+    """
+
+    def __init__(self, cancel_marker: str):
+        self.cancel_marker = cancel_marker
+        self.deadline: Optional[float] = None
+        self.enabled = hasattr(signal, "setitimer")
+        self._previous_handler = None
+
+    def __enter__(self):
+        if self.enabled:
+            self._previous_handler = signal.signal(signal.SIGALRM, self._on_alarm)
+            signal.setitimer(signal.ITIMER_REAL, SCAN_WATCHDOG_INTERVAL, SCAN_WATCHDOG_INTERVAL)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._previous_handler)
+
+    def arm(self):
+        self.deadline = time.monotonic() + SCAN_TEXT_TIME_BUDGET
+
+    def disarm(self):
+        self.deadline = None
+
+    def _on_alarm(self, signum, frame):
+        if self.deadline is None:
+            return
+        if time.monotonic() > self.deadline:
+            reason = "timeout"
+        elif os.path.exists(self.cancel_marker):
+            reason = "cancelled"
+        else:
+            return
+        # Jedno przerwanie na uzbrojenie - handler nie rzuca ponownie w obsłudze wyjątku
+        self.deadline = None
+        raise _ScanInterrupted(reason)
+
+
+def scan_shard(pattern: "re.Pattern", units: List[ScanUnit], cancel_marker: str, max_matches: int) -> dict:
+    """
+    Przeszukuje shard tekstów (w procesie puli). Przerywa, gdy pojawi się znacznik
+    anulowania lub po zebraniu max_matches trafień. Tekst dopasowywany dłużej niż
+    SCAN_TEXT_TIME_BUDGET jest porzucany (trafienia znalezione wcześniej zostają),
+    z tekstu dłuższego niż SCAN_MAX_TEXT_CHARS przeszukiwany jest tylko początek.
+
+    Returns:
+        dict: trafienia, liczba przeszukanych tekstów, dokumenty bez wyodrębnionego
+        tekstu, teksty przerwane po czasie i teksty przeszukane częściowo
+    """
+    from app.text_extraction import get_file_text
+
+    matches = []
+    scanned = 0
+    pending = []
+    timed_out = []
+    clipped = []
+    with _MatchWatchdog(cancel_marker) as watchdog:
+        for unit in units:
+            if os.path.exists(cancel_marker) or len(matches) >= max_matches:
+                break
+
+            text = get_file_text(unit, parse=False)
+            if text is None:
+                pending.append(unit.id)
+                continue
+            scanned += 1
+            if len(text) > SCAN_MAX_TEXT_CHARS:
+                clipped.append(unit.id)
+
+            found = 0
+            try:
+                watchdog.arm()
+                for match in pattern.finditer(text, 0, SCAN_MAX_TEXT_CHARS):
+                    start, end = match.span()
+                    if start == end:
+                        continue
+                    matches.append({
+                        "doc_id": unit.doc_id,
+                        "source": unit.source,
+                        "start": start,
+                        "end": end,
+                        "match": text[start:min(end, start + SCAN_MATCH_MAX_CHARS)],
+                        "before": text[max(0, start - SCAN_CONTEXT_CHARS):start],
+                        "after": text[end:end + SCAN_CONTEXT_CHARS],
+                    })
+                    found += 1
+                    if found >= SCAN_MAX_MATCHES_PER_TEXT or len(matches) >= max_matches:
+                        break
+                watchdog.disarm()
+            except _ScanInterrupted as e:
+                if str(e) == "cancelled":
+                    break
+                logger.warning(f"⏱️ [SCAN] Przekroczono {SCAN_TEXT_TIME_BUDGET}s dopasowywania tekstu {unit.id}")
+                timed_out.append(unit.id)
+
+    return {"matches": matches, "scanned": scanned, "pending": pending,
+            "timed_out": timed_out, "clipped": clipped}
+
+
+# ==================== PULA PROCESÓW ====================
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=SCAN_MAX_WORKERS)
+            logger.info(f"✅ [SCAN] Utworzono pulę skanowania tekstów ({SCAN_MAX_WORKERS} procesów)")
+        return _executor
+
+
+def _discard_broken_executor(executor: ProcessPoolExecutor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_scan_pool():
+    """Zamyka pulę skanowania, przerywając trwające skany."""
+    global _executor
+    for scan in list(_scans.values()):
+        scan.cancel()
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ==================== SKAN ====================
+
+_scans: Dict[str, "TextScan"] = {}  # Trwające skany według scan_id
+_client_scans: Dict[str, str] = {}  # Bieżący skan klienta (nowe zapytanie anuluje poprzednie)
+_scans_lock = threading.Lock()
+
+
+class TextScan:
+    """Jeden skan: shardy zlecone do puli i zdarzenia z wynikami dla klienta."""
+
+    def __init__(self, pattern: "re.Pattern", units: List[ScanUnit], documents: Dict[int, dict]):
+        self.scan_id = uuid.uuid4().hex
+        self.pattern = pattern
+        self.units = units
+        self.documents = documents
+        self.cancelled = False
+        self._cancel_marker = SCAN_CANCEL_DIR / f"{self.scan_id}.cancel"
+        self._futures = []
+        self._wakeup = None  # Budzi pętlę zdarzeń po anulowaniu
+
+    def cancel(self):
+        """Przerywa skan: porzuca niewykonane shardy, trwające przerywają dopasowywanie."""
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self._cancel_marker.touch(exist_ok=True)
+        for future in self._futures:
+            future.cancel()
+        if self._wakeup is not None:
+            self._wakeup()
+
+    async def events(self) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Zdarzenia skanu: "start", "match" (pojedyncze trafienie), "progress"
+        (po każdym shardzie) i "end" (podsumowanie).
+        """
+        from app.ingest import schedule_ingest
+
+        loop = asyncio.get_running_loop()
+        done_queue: asyncio.Queue = asyncio.Queue()
+        self._wakeup = lambda: loop.call_soon_threadsafe(done_queue.put_nowait, None)
+
+        shards = [self.units[start:start + SCAN_SHARD_SIZE] for start in range(0, len(self.units), SCAN_SHARD_SIZE)]
+        yield "start", {"scan_id": self.scan_id, "total_texts": len(self.units), "total_shards": len(shards)}
+
+        executor = _get_executor()
+        try:
+            for shard in shards:
+                future = executor.submit(scan_shard, self.pattern, shard, str(self._cancel_marker), SCAN_MAX_MATCHES)
+                future.add_done_callback(lambda f: loop.call_soon_threadsafe(done_queue.put_nowait, f))
+                self._futures.append(future)
+        except (BrokenProcessPool, RuntimeError) as e:
+            logger.error(f"❌ [SCAN] Nie można zlecić skanu: {e}")
+            _discard_broken_executor(executor)
+            self.cancel()
+
+        match_count = 0
+        scanned = 0
+        shards_done = 0
+        pending = []
+        timed_out = 0
+        clipped = 0
+        truncated = False
+        try:
+            while shards_done < len(self._futures) and not self.cancelled:
+                future = await done_queue.get()
+                if future is None or future.cancelled():
+                    continue
+                shards_done += 1
+
+                error = future.exception()
+                if error is not None:
+                    logger.error(f"❌ [SCAN] Błąd skanowania sharda: {error}")
+                    if isinstance(error, BrokenProcessPool):
+                        _discard_broken_executor(executor)
+                        self.cancel()
+                    continue
+
+                result = future.result()
+                scanned += result["scanned"]
+                pending.extend(result["pending"])
+                timed_out += len(result["timed_out"])
+                clipped += len(result["clipped"])
+                for match in result["matches"]:
+                    if match_count >= SCAN_MAX_MATCHES:
+                        truncated = True
+                        break
+                    match_count += 1
+                    yield "match", {**match, **self.documents.get(match["doc_id"], {})}
+
+                yield "progress", {"scan_id": self.scan_id, "scanned_texts": scanned, "matches": match_count,
+                                   "shards_done": shards_done, "total_shards": len(shards)}
+                if truncated:
+                    self.cancel()
+        finally:
+            interrupted = self.cancelled
+            self.cancel()
+            self._cancel_marker.unlink(missing_ok=True)
+            _unregister(self)
+
+        # Teksty jeszcze niewyodrębnione - przy następnym skanie będą dostępne
+        if pending:
+            schedule_ingest(pending)
+
+        yield "end", {"scan_id": self.scan_id, "matches": match_count, "scanned_texts": scanned,
+                      "pending_texts": len(pending), "timed_out_texts": timed_out,
+                      "clipped_texts": clipped, "truncated": truncated,
+                      "cancelled": interrupted and not truncated}
+
+
+def start_scan(pattern: "re.Pattern", units: List[ScanUnit], documents: Dict[int, dict],
+               client: Optional[str] = None) -> TextScan:
+    """Rejestruje nowy skan; poprzedni skan tego samego klienta jest anulowany."""
+    scan = TextScan(pattern, units, documents)
+    superseded = None
+    with _scans_lock:
+        _scans[scan.scan_id] = scan
+        if client:
+            superseded = _scans.get(_client_scans.get(client))
+            _client_scans[client] = scan.scan_id
+    if superseded is not None:
+        logger.info(f"🛑 [SCAN] Anulowano skan {superseded.scan_id} - nowe zapytanie klienta")
+        superseded.cancel()
+    return scan
+
+
+def cancel_scan(scan_id: str) -> bool:
+    """Anuluje trwający skan. Zwraca False, gdy skanu nie ma (zakończony lub nieznany)."""
+    with _scans_lock:
+        scan = _scans.get(scan_id)
+    if scan is None:
+        return False
+    scan.cancel()
+    return True
+
+
+def _unregister(scan: TextScan):
+    with _scans_lock:
+        _scans.pop(scan.scan_id, None)
+        for client, scan_id in list(_client_scans.items()):
+            if scan_id == scan.scan_id:
+                del _client_scans[client]
@@ -0,0 +1,193 @@
+# app/text_store.py
+"""
+Magazyn wyekstraktowanego tekstu dokumentów.
+
+Tekst pliku dokumentu (PDF, Word, TXT, wynik OCR) wyciągany jest raz i zapisywany
+obok plików w FILES_DIR/text jako skompresowany plik UTF-8 (gzip), osobno dla
+każdej wersji dokumentu. Wersja wynika z nazwy, rozmiaru i czasu modyfikacji
+zapisanego pliku - podmiana pliku tworzy nową wersję, a stare pliki tekstu są usuwane.
+
+Nad plikami działa ograniczony rozmiarem cache LRU w pamięci procesu. Trafienie
+w pamięci jest ważne tylko, gdy plik tekstu nadal istnieje - unieważnienie
+w procesie OCR (usunięcie pliku) widzą więc także pozostałe procesy.
+
+Wyszukiwanie, podsumowania i podglądy czytają tekst wyłącznie przez ten moduł.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from app.db import FILES_DIR
+
+logger = logging.getLogger("text_store")
+
+TEXT_STORE_DIR = FILES_DIR / "text"
+TEXT_STORE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Limit pamięci cache (liczba znaków łącznie we wszystkich wpisach)
+TEXT_CACHE_MAX_CHARS = int(os.getenv("TEXT_CACHE_MAX_CHARS", "50000000"))
+
+# Zmiana sposobu ekstrakcji - podbij, aby unieważnić wszystkie zapisane teksty
+EXTRACTION_VERSION = "1"
+
+# Kolejność kodowań przy odczycie plików tekstowych - latin-1 na końcu,
+# bo dekoduje każdy ciąg bajtów
+TEXT_ENCODINGS = ("utf-8-sig", "cp1250", "latin-1")
+
+
+def document_text_version(doc) -> str:
+    """
+    Wersja tekstu dokumentu - zmienia się przy podmianie lub modyfikacji pliku
+    (nazwa, rozmiar i czas modyfikacji pliku), ale nie przy zmianie metadanych.
+    """
+    try:
+        stat = (FILES_DIR / doc.stored_filename).stat()
+        file_stamp = f"{stat.st_size}|{stat.st_mtime_ns}"
+    except OSError:
+        file_stamp = "-"
+    stamp = f"{EXTRACTION_VERSION}|{doc.stored_filename}|{file_stamp}"
+    return hashlib.sha1(stamp.encode("utf-8")).hexdigest()[:16]
+
+
+def sidecar_path(doc_id: int, version: str) -> Path:
+    return TEXT_STORE_DIR / f"{doc_id}-{version}.txt.gz"
+
+
+def normalize_text(text: str) -> str:
+    """Ujednolicenie tekstu: NFC, końce linii \\n, bez znaków NUL."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n").replace("\x00", "")
+    return unicodedata.normalize("NFC", text)
+
+
+def decode_text_bytes(data: bytes) -> str:
+    """Dekoduje zawartość pliku tekstowego, próbując kolejnych kodowań."""
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("utf-8", errors="replace")
+
+
+class _TextCache:
+    """Cache LRU tekstów w pamięci, ograniczony łączną liczbą znaków."""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[Tuple[int, str], str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[int, str]) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            return text
+
+    def put(self, key: Tuple[int, str], text: str):
+        if len(text) > self.max_chars:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = text
+            self._size += len(text)
+            while self._size > self.max_chars and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def discard(self, doc_id: Optional[int] = None):
+        with self._lock:
+            if doc_id is None:
+                self._entries.clear()
+                self._size = 0
+                return
+            for key in [k for k in self._entries if k[0] == doc_id]:
+                self._size -= len(self._entries.pop(key))
+
+
+_cache = _TextCache(TEXT_CACHE_MAX_CHARS)
+
+
+def _read_sidecar(path: Path) -> Optional[str]:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, UnicodeDecodeError) as e:
+        logger.warning(f"Uszkodzony plik tekstu {path.name}: {e}")
+        path.unlink(missing_ok=True)
+        return None
+
+
+def _write_sidecar(doc_id: int, version: str, text: str) -> bool:
+    """Zapisuje tekst wersji dokumentu (atomowo) i usuwa teksty starszych wersji."""
+    path = sidecar_path(doc_id, version)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Nie można zapisać tekstu dokumentu {doc_id}: {e}")
+        tmp_path.unlink(missing_ok=True)
+        return False
+
+    for old_path in TEXT_STORE_DIR.glob(f"{doc_id}-*.txt.gz"):
+        if old_path != path:
+            old_path.unlink(missing_ok=True)
+    return True
+
+
+def get_text(doc, extract: Optional[Callable[[], Optional[str]]]) -> Optional[str]:
+    """
+    Zwraca tekst bieżącej wersji dokumentu: z pamięci, z pliku tekstu lub
+    - tylko gdy żadnego nie ma - wyciągając go funkcją `extract`.
+
+    `extract` zwraca None, gdy odczyt się nie powiódł (wynik nie jest wtedy zapisywany).
+    Bez `extract` brak zapisanego tekstu daje None.
+    """
+    version = document_text_version(doc)
+    key = (doc.id, version)
+    path = sidecar_path(doc.id, version)
+
+    text = _cache.get(key)
+    if text is not None and path.exists():
+        return text
+
+    text = _read_sidecar(path)
+    if text is None:
+        if extract is None:
+            return None
+        extracted = extract()
+        if extracted is None:
+            return ""
+        text = normalize_text(extracted)
+        if not _write_sidecar(doc.id, version, text):
+            return text
+
+    _cache.put(key, text)
+    return text
+
+
+def has_text(doc) -> bool:
+    """Czy tekst bieżącej wersji dokumentu jest już zapisany."""
+    return sidecar_path(doc.id, document_text_version(doc)).exists()
+
+
+def invalidate(doc_id: Optional[int] = None):
+    """Usuwa zapisane teksty dokumentu (wszystkich wersji) lub wszystkich dokumentów."""
+    _cache.discard(doc_id)
+    pattern = "*.txt.gz" if doc_id is None else f"{doc_id}-*.txt.gz"
+    for path in TEXT_STORE_DIR.glob(pattern):
+        path.unlink(missing_ok=True)
@@ -0,0 +1,354 @@
+# app/uploads.py
+"""
+Strumieniowy zapis przesyłanych plików na dysk.
+
+Plik z formularza (UploadFile - Starlette buforuje go w pliku tymczasowym)
+kopiowany jest do FILES_DIR blokami UPLOAD_CHUNK_SIZE w wątku puli, więc
+pętla zdarzeń nie czeka na dysk, a w pamięci jest najwyżej jeden blok -
+także przy plikach rzędu setek MB. W trakcie kopiowania liczony jest skrót
+SHA-256 (wykrywanie duplikatów nie czyta pliku ponownie), a MIME type
+rozpoznawany jest z pierwszego bloku.
+
+Bardzo duże skany (setki MB - kilka GB, łącza VPN z zerwaniami) przesyłane
+są uploadem wznawialnym: sesja (create_session) -> kolejne części z
+przesunięciem (append_chunk) -> zakończenie (complete_session). Części
+dopisywane są do pliku w UPLOAD_INCOMING_DIR; przesunięciem sesji jest jego
+rozmiar, więc po zerwaniu połączenia klient pyta o nie i wysyła dalej.
+Niepotwierdzona (przerwana albo z błędną sumą kontrolną) część jest
+obcinana. Przy zakończeniu liczony jest skrót SHA-256 całego pliku
+i porównywany ze skrótem podanym przy otwarciu sesji.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+from app.db import FILES_DIR
+from app.document_utils import check_file_extension, detect_mime_type_from_bytes
+
+# Blok kopiowania; pierwszy blok służy też do rozpoznania MIME type (python-magic czyta domyślnie 1 MiB)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Upload wznawialny - katalog na tym samym systemie plików co FILES_DIR (dowiązanie zamiast kopii)
+UPLOAD_INCOMING_DIR = Path(os.getenv("UPLOAD_INCOMING_DIR", str(FILES_DIR / "incoming")))
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))           # Zalecana część dla klienta
+UPLOAD_MAX_PART_SIZE = int(os.getenv("UPLOAD_MAX_PART_SIZE", str(64 * 1024 * 1024)))  # Największa przyjmowana część
+UPLOAD_MAX_FILE_SIZE = int(os.getenv("UPLOAD_MAX_FILE_SIZE", str(4 * 1024 ** 3)))
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "48"))  # Porzucone sesje są usuwane
+
+
+@dataclass
+class ReceivedFile:
+    """Plik zapisany na dysku."""
+    path: Path
+    size: int
+    sha256: str
+    mime_type: str
+    filename: Optional[str] = None      # Nazwa pliku u klienta
+
+
+def copy_to_disk(source: BinaryIO, dest: Path) -> Tuple[int, str, bytes]:
+    """
+    Kopiuje strumień do pliku blokami, licząc skrót SHA-256 (blokujące - w wątku).
+    Przy błędzie usuwa niepełny plik.
+
+    Returns:
+        (rozmiar, skrót SHA-256, pierwszy blok)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        with open(dest, "wb") as target:
+            for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                if not head:
+                    head = chunk
+                digest.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+    return size, digest.hexdigest(), head
+
+
+async def receive_upload(file: UploadFile, dest: Path) -> ReceivedFile:
+    """Zapisuje przesłany plik pod ścieżką dest bez blokowania pętli zdarzeń."""
+    size, sha256, head = await asyncio.to_thread(copy_to_disk, file.file, dest)
+    return ReceivedFile(
+        path=dest,
+        size=size,
+        sha256=sha256,
+        mime_type=detect_mime_type_from_bytes(head, file.filename),
+        filename=file.filename,
+    )
+
+
+# ==================== UPLOAD WZNAWIALNY ====================
+
+_UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+# Operacje na sesji wykonywane pojedynczo (dwie części naraz z tym samym przesunięciem)
+_session_locks: Dict[str, asyncio.Lock] = {}
+
+
+class UploadSessionError(Exception):
+    """Błąd sesji uploadu wznawialnego; offset - przesunięcie, od którego klient ma wysyłać dalej."""
+
+    def __init__(self, message: str, status_code: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+@dataclass
+class UploadSession:
+    """Sesja uploadu wznawialnego - metadane w <upload_id>.json, dane w <upload_id><rozszerzenie>."""
+    upload_id: str
+    opinion_id: int
+    filename: str
+    size: int                           # Zadeklarowany rozmiar pliku
+    suffix: str
+    doc_type: str
+    run_ocr: bool = False
+    reuse_ocr: bool = False
+    sha256: Optional[str] = None        # Oczekiwany skrót całego pliku (opcjonalny)
+    created_at: str = ""
+
+    @property
+    def path(self) -> Path:
+        return UPLOAD_INCOMING_DIR / f"{self.upload_id}{self.suffix}"
+
+    @property
+    def meta_path(self) -> Path:
+        return UPLOAD_INCOMING_DIR / f"{self.upload_id}.json"
+
+    @property
+    def offset(self) -> int:
+        """Liczba bajtów przyjętych przez serwer."""
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+
+def http_error(error: UploadSessionError) -> HTTPException:
+    """Błąd sesji jako odpowiedź HTTP - przesunięcie w nagłówku Upload-Offset."""
+    headers = {"Upload-Offset": str(error.offset)} if error.offset is not None else None
+    return HTTPException(status_code=error.status_code, detail=str(error), headers=headers)
+
+
+@asynccontextmanager
+async def session_lock(upload_id: str):
+    """Wyłączny dostęp do sesji (w obrębie procesu serwera)."""
+    lock = _session_locks.setdefault(upload_id, asyncio.Lock())
+    async with lock:
+        yield
+
+
+def create_session(opinion_id: int, filename: str, size: int, doc_type: str,
+                   run_ocr: bool = False, reuse_ocr: bool = False,
+                   sha256: Optional[str] = None) -> UploadSession:
+    """Otwiera sesję uploadu wznawialnego (sprawdza rozszerzenie i rozmiar pliku)."""
+    suffix = check_file_extension(filename)
+    if size <= 0:
+        raise UploadSessionError("Pusty plik")
+    if size > UPLOAD_MAX_FILE_SIZE:
+        raise UploadSessionError(
+            f"Plik jest za duży (limit {UPLOAD_MAX_FILE_SIZE // 1024 ** 2} MB)", status_code=413
+        )
+    if sha256 is not None:
+        sha256 = sha256.lower()
+        if not _SHA256.fullmatch(sha256):
+            raise UploadSessionError("Niepoprawny skrót SHA-256")
+
+    UPLOAD_INCOMING_DIR.mkdir(parents=True, exist_ok=True)
+    remove_stale_sessions()
+
+    session = UploadSession(
+        upload_id=uuid.uuid4().hex,
+        opinion_id=opinion_id,
+        filename=Path(filename).name,
+        size=size,
+        suffix=suffix,
+        doc_type=doc_type,
+        run_ocr=run_ocr,
+        reuse_ocr=reuse_ocr,
+        sha256=sha256,
+        created_at=datetime.utcnow().isoformat(timespec="seconds"),
+    )
+    session.path.touch()
+    tmp_path = session.meta_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(asdict(session)), encoding="utf-8")
+    os.replace(tmp_path, session.meta_path)
+    print(f"📦 Upload wznawialny {session.upload_id}: {session.filename} ({size / 1024 ** 2:.1f} MB)")
+    return session
+
+
+def get_session(upload_id: str) -> UploadSession:
+    """Wczytuje sesję; nieznana (zakończona, porzucona) - 404."""
+    if not _UPLOAD_ID.fullmatch(upload_id):
+        raise UploadSessionError("Nie znaleziono sesji uploadu", status_code=404)
+    meta_path = UPLOAD_INCOMING_DIR / f"{upload_id}.json"
+    try:
+        data = json.loads(meta_path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        raise UploadSessionError("Nie znaleziono sesji uploadu", status_code=404)
+    return UploadSession(**data)
+
+
+def _write_part(target: BinaryIO, digest, data: bytes):
+    digest.update(data)
+    target.write(data)
+
+
+def _sync_part(target: BinaryIO):
+    target.flush()
+    os.fsync(target.fileno())
+
+
+def _truncate(path: Path, offset: int):
+    with open(path, "r+b") as target:
+        target.truncate(offset)
+
+
+async def append_chunk(session: UploadSession, offset: int, chunks: AsyncIterator[bytes],
+                       chunk_sha256: Optional[str] = None) -> int:
+    """
+    Dopisuje część pliku ze strumienia (treść żądania) od przesunięcia offset.
+    Strumień zapisywany jest blokami UPLOAD_CHUNK_SIZE w wątku - w pamięci
+    jest najwyżej jeden blok. Przesunięcie inne niż liczba przyjętych bajtów
+    - 409 z bieżącym przesunięciem. Przerwana część albo część z sumą inną niż
+    chunk_sha256 jest obcinana. Zwraca nowe przesunięcie.
+    """
+    async with session_lock(session.upload_id):
+        # Sesja zakończona lub anulowana w czasie oczekiwania na blokadę - nie odtwarzaj pliku danych
+        if not await asyncio.to_thread(session.meta_path.exists):
+            raise UploadSessionError("Nie znaleziono sesji uploadu", status_code=404)
+
+        received = session.offset
+        if offset != received:
+            raise UploadSessionError(
+                f"Niezgodne przesunięcie części ({offset}, serwer ma {received} B)",
+                status_code=409, offset=received,
+            )
+
+        digest = hashlib.sha256()
+        written = 0
+        buffer = bytearray()
+        target = await asyncio.to_thread(open, session.path, "ab")
+        try:
+            async for piece in chunks:
+                written += len(piece)
+                if written > UPLOAD_MAX_PART_SIZE:
+                    raise UploadSessionError("Część jest za duża", status_code=413, offset=received)
+                if received + written > session.size:
+                    raise UploadSessionError("Część przekracza rozmiar pliku", status_code=413, offset=received)
+                buffer += piece
+                if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                    await asyncio.to_thread(_write_part, target, digest, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(_write_part, target, digest, bytes(buffer))
+            if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+                raise UploadSessionError(
+                    "Suma kontrolna części nie zgadza się - wyślij ją ponownie",
+                    status_code=422, offset=received,
+                )
+            await asyncio.to_thread(_sync_part, target)
+        except BaseException:
+            await asyncio.to_thread(target.close)
+            await asyncio.to_thread(_truncate, session.path, received)
+            raise
+        await asyncio.to_thread(target.close)
+        return received + written
+
+
+def _hash_file(path: Path) -> Tuple[str, bytes]:
+    """Skrót SHA-256 pliku i jego pierwszy blok (blokujące - w wątku)."""
+    digest = hashlib.sha256()
+    head = b""
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+            if not head:
+                head = chunk
+            digest.update(chunk)
+    return digest.hexdigest(), head
+
+
+async def complete_session(session: UploadSession) -> ReceivedFile:
+    """
+    Sprawdza kompletność i skrót SHA-256 złożonego pliku (wywoływać w session_lock).
+    Plik niezgodny ze skrótem z otwarcia sesji jest obcinany - do wysłania od nowa.
+    """
+    received = session.offset
+    if received != session.size:
+        raise UploadSessionError(
+            f"Plik nie został przesłany w całości ({received} z {session.size} B)",
+            status_code=409, offset=received,
+        )
+
+    sha256, head = await asyncio.to_thread(_hash_file, session.path)
+    if session.sha256 and sha256 != session.sha256:
+        await asyncio.to_thread(_truncate, session.path, 0)
+        raise UploadSessionError(
+            "Suma kontrolna pliku nie zgadza się - plik trzeba przesłać ponownie",
+            status_code=422, offset=0,
+        )
+
+    return ReceivedFile(
+        path=session.path,
+        size=received,
+        sha256=sha256,
+        mime_type=detect_mime_type_from_bytes(head, session.filename),
+        filename=session.filename,
+    )
+
+
+def remove_session(session: UploadSession):
+    """Usuwa dane i metadane sesji (po zakończeniu albo anulowaniu)."""
+    session.path.unlink(missing_ok=True)
+    session.meta_path.unlink(missing_ok=True)
+    _session_locks.pop(session.upload_id, None)
+
+
+def remove_stale_sessions() -> int:
+    """
+    Usuwa sesje bez aktywności dłużej niż UPLOAD_SESSION_TTL_HOURS - także
+    pliki danych bez metadanych (np. przerwane otwarcie sesji).
+    """
+    cutoff = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+    removed = 0
+    sessions: Dict[str, List[Path]] = {}
+    for path in UPLOAD_INCOMING_DIR.glob("*.*"):
+        if _UPLOAD_ID.fullmatch(path.stem):
+            sessions.setdefault(path.stem, []).append(path)
+
+    for upload_id, paths in sessions.items():
+        if upload_id in _session_locks and _session_locks[upload_id].locked():
+            continue
+        try:
+            last_activity = max(path.stat().st_mtime for path in paths)
+        except FileNotFoundError:
+            continue
+        if last_activity >= cutoff:
+            continue
+        for path in paths:
+            path.unlink(missing_ok=True)
+        _session_locks.pop(upload_id, None)
+        removed += 1
+    if removed:
+        print(f"🧹 Usunięto {removed} porzuconych sesji uploadu")
+    return removed
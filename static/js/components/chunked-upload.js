@@ -0,0 +1,228 @@
+/**
+ * Upload wznawialny dużych plików częściami (/api/opinion/{id}/uploads)
+ * Po zerwaniu połączenia wysyłanie jest ponawiane od przesunięcia potwierdzonego
+ * przez serwer - także po odświeżeniu strony i ponownym wybraniu tego samego
+ * pliku (identyfikator sesji w localStorage)
+ */
+
+class ChunkedUpload {
+  constructor(file, options = {}) {
+    this.file = file;
+
+    // Konfiguracja
+    this.config = {
+      opinionId: null,
+      docType: '',
+      runOcr: false,
+      reuseOcr: false,
+      verifyChunks: true,       // Suma SHA-256 każdej części (X-Chunk-SHA256)
+      maxRetries: 30,
+      retryDelay: 2000,         // Opóźnienie kolejnych prób rośnie do maxRetryDelay
+      maxRetryDelay: 30000,
+      onProgress: () => {},
+      onRetry: () => {},
+      ...options
+    };
+
+    // Stan
+    this.uploadId = null;
+    this.offset = 0;
+    this.chunkSize = 8 * 1024 * 1024;
+    this.cancelled = false;
+    this.finalizing = false;
+  }
+
+  /**
+   * Klucz sesji w localStorage - ten sam plik wybrany ponownie wznawia upload
+   */
+  get storageKey() {
+    const { name, size, lastModified } = this.file;
+    return `chunked-upload:${this.config.opinionId}:${name}:${size}:${lastModified}`;
+  }
+
+  /**
+   * Wysyła plik i kończy upload - zwraca odpowiedź serwera (doc_ids, redirect_url)
+   */
+  async start() {
+    await this.withRetry(() => this.openSession());
+    this.config.onProgress(this.offset, this.file.size);
+
+    while (this.offset < this.file.size) {
+      if (this.cancelled) {
+        throw new Error('Upload anulowany');
+      }
+      this.offset = await this.withRetry(() => this.sendChunk(this.offset));
+      this.config.onProgress(this.offset, this.file.size);
+    }
+
+    const result = await this.withRetry(() => this.finalize());
+    localStorage.removeItem(this.storageKey);
+    return result;
+  }
+
+  /**
+   * Przerywa upload i usuwa przesłane części na serwerze
+   */
+  async cancel() {
+    this.cancelled = true;
+    localStorage.removeItem(this.storageKey);
+    if (this.uploadId) {
+      await fetch(`/api/uploads/${this.uploadId}`, { method: 'DELETE' }).catch(() => {});
+    }
+  }
+
+  /**
+   * Wznowienie zapisanej sesji albo otwarcie nowej
+   */
+  async openSession() {
+    const savedId = localStorage.getItem(this.storageKey);
+    if (savedId) {
+      const response = await fetch(`/api/uploads/${savedId}`);
+      if (response.ok) {
+        const data = await response.json();
+        this.uploadId = savedId;
+        this.offset = data.offset;
+        this.chunkSize = data.chunk_size;
+        console.log(`🔁 Wznawiam upload ${this.file.name} od ${data.offset} B`);
+        return;
+      }
+      if (response.status >= 500) {
+        throw await this.responseError(response);
+      }
+      localStorage.removeItem(this.storageKey);
+    }
+
+    const formData = new FormData();
+    formData.append('filename', this.file.name);
+    formData.append('size', this.file.size);
+    formData.append('doc_type', this.config.docType);
+    formData.append('run_ocr', this.config.runOcr);
+    formData.append('reuse_ocr', this.config.reuseOcr);
+
+    const response = await fetch(`/api/opinion/${this.config.opinionId}/uploads`, {
+      method: 'POST',
+      body: formData
+    });
+    if (!response.ok) {
+      throw await this.responseError(response);
+    }
+
+    const data = await response.json();
+    this.uploadId = data.upload_id;
+    this.offset = data.offset;
+    this.chunkSize = data.chunk_size;
+    localStorage.setItem(this.storageKey, this.uploadId);
+  }
+
+  /**
+   * Wysyła część od przesunięcia start - zwraca przesunięcie potwierdzone przez serwer
+   */
+  async sendChunk(start) {
+    const chunk = this.file.slice(start, Math.min(start + this.chunkSize, this.file.size));
+    const headers = { 'Content-Type': 'application/octet-stream' };
+
+    if (this.config.verifyChunks && window.crypto && window.crypto.subtle) {
+      const digest = await window.crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+      headers['X-Chunk-SHA256'] = Array.from(new Uint8Array(digest))
+        .map(byte => byte.toString(16).padStart(2, '0'))
+        .join('');
+    }
+
+    const response = await fetch(`/api/uploads/${this.uploadId}?offset=${start}`, {
+      method: 'PUT',
+      headers,
+      body: chunk
+    });
+
+    // Serwer ma inne przesunięcie (np. poprzednia próba dotarła mimo błędu) - dalej od niego
+    if (response.status === 409 && response.headers.has('Upload-Offset')) {
+      return parseInt(response.headers.get('Upload-Offset'), 10);
+    }
+    if (!response.ok) {
+      const error = await this.responseError(response);
+      // Część uszkodzona po drodze (suma kontrolna) - serwer ją odrzucił, wysyłamy ponownie
+      error.retryable = error.retryable || response.status === 422;
+      throw error;
+    }
+
+    const data = await response.json();
+    return data.offset;
+  }
+
+  /**
+   * Zakończenie - serwer sprawdza plik i dodaje dokument do opinii
+   */
+  async finalize() {
+    const retried = this.finalizing;
+    this.finalizing = true;
+
+    const response = await fetch(`/api/uploads/${this.uploadId}/finalize`, { method: 'POST' });
+    // Poprzednia próba zakończyła upload, ale odpowiedź nie dotarła
+    if (response.status === 404 && retried) {
+      return { success: true, doc_ids: [], redirect_url: `/opinion/${this.config.opinionId}` };
+    }
+    if (!response.ok) {
+      throw await this.responseError(response);
+    }
+    return response.json();
+  }
+
+  /**
+   * Błąd odpowiedzi - ponawiane są błędy serwera (poza pełną kolejką OCR - 503)
+   */
+  async responseError(response) {
+    let message = `HTTP ${response.status}`;
+    try {
+      const data = await response.json();
+      message = data.detail || message;
+    } catch (e) {
+      // Odpowiedź bez JSON (np. brama VPN)
+    }
+    const error = new Error(message);
+    error.status = response.status;
+    error.retryable = response.status >= 500 && response.status !== 503;
+    return error;
+  }
+
+  /**
+   * Ponawia operację po błędzie sieci z rosnącym opóźnieniem
+   */
+  async withRetry(operation) {
+    for (let attempt = 1; ; attempt++) {
+      try {
+        return await operation();
+      } catch (error) {
+        // Błąd sieci (fetch) nie ma statusu HTTP
+        const retryable = error.status === undefined || error.retryable;
+        if (this.cancelled || !retryable || attempt >= this.config.maxRetries) {
+          throw error;
+        }
+
+        const delay = Math.min(this.config.retryDelay * attempt, this.config.maxRetryDelay);
+        console.warn(`⚠️ Upload ${this.file.name}: ${error.message} - próba ${attempt + 1} za ${delay} ms`);
+        this.config.onRetry(attempt, error);
+        await new Promise(resolve => setTimeout(resolve, delay));
+
+        // Po zerwaniu połączenia przesunięcie ustala serwer
+        if (this.uploadId && error.status === undefined) {
+          await this.refreshOffset();
+        }
+      }
+    }
+  }
+
+  async refreshOffset() {
+    try {
+      const response = await fetch(`/api/uploads/${this.uploadId}`);
+      if (response.ok) {
+        const data = await response.json();
+        this.offset = data.offset;
+      }
+    } catch (e) {
+      // Serwer nadal niedostępny - kolejna próba
+    }
+  }
+}
+
+// Export globalny
+window.ChunkedUpload = ChunkedUpload;
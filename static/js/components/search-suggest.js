@@ -0,0 +1,174 @@
+/**
+ * Podpowiedzi wyszukiwania (typeahead) dla pól z atrybutem data-suggest
+ * Korzysta z /api/suggest - nowe zapytanie przerywa poprzednie (AbortController
+ * po stronie przeglądarki, parametr client po stronie serwera)
+ */
+
+class SearchSuggest {
+  constructor(input, options = {}) {
+    this.input = input;
+
+    // Konfiguracja
+    this.config = {
+      url: options.url || '/api/suggest',
+      limit: options.limit || 8,
+      debounce: options.debounce || 60,
+      minLength: options.minLength || 1,
+      ...options
+    };
+
+    // Stan
+    this.state = {
+      controller: null,
+      timer: null,
+      suggestions: [],
+      active: -1
+    };
+
+    this.clientId = `suggest-${Math.random().toString(36).slice(2, 10)}`;
+    this.menu = null;
+
+    this.init();
+  }
+
+  /**
+   * Inicjalizacja - lista podpowiedzi pod polem wyszukiwania
+   */
+  init() {
+    this.menu = document.createElement('div');
+    this.menu.className = 'dropdown-menu search-suggest-menu';
+    this.menu.style.width = '100%';
+    this.menu.style.top = '100%';
+    this.menu.style.left = '0';
+
+    const container = this.input.closest('.input-group') || this.input.parentElement;
+    container.style.position = 'relative';
+    container.appendChild(this.menu);
+
+    this.input.setAttribute('autocomplete', 'off');
+    this.input.addEventListener('input', () => this.schedule());
+    this.input.addEventListener('keydown', (e) => this.handleKeydown(e));
+    this.input.addEventListener('blur', () => setTimeout(() => this.hide(), 150));
+    this.menu.addEventListener('mousedown', (e) => e.preventDefault());
+  }
+
+  schedule() {
+    clearTimeout(this.state.timer);
+    this.state.timer = setTimeout(() => this.fetchSuggestions(), this.config.debounce);
+  }
+
+  /**
+   * Pobranie podpowiedzi - poprzednie zapytanie jest przerywane
+   */
+  async fetchSuggestions() {
+    const query = this.input.value.trim();
+    if (this.state.controller) {
+      this.state.controller.abort();
+    }
+    if (query.length < this.config.minLength) {
+      this.hide();
+      return;
+    }
+
+    const controller = new AbortController();
+    this.state.controller = controller;
+    const params = new URLSearchParams({ q: query, limit: this.config.limit, client: this.clientId });
+
+    try {
+      const response = await fetch(`${this.config.url}?${params}`, { signal: controller.signal });
+      if (!response.ok) {
+        return;
+      }
+      const data = await response.json();
+      if (data.superseded || controller !== this.state.controller) {
+        return;
+      }
+      this.render(data.suggestions);
+    } catch (error) {
+      if (error.name !== 'AbortError') {
+        console.error('Błąd pobierania podpowiedzi:', error);
+      }
+    }
+  }
+
+  render(suggestions) {
+    this.state.suggestions = suggestions;
+    this.state.active = -1;
+    this.menu.innerHTML = '';
+
+    if (!suggestions.length) {
+      this.hide();
+      return;
+    }
+
+    suggestions.forEach((suggestion, index) => {
+      const item = document.createElement('a');
+      item.className = 'dropdown-item d-flex justify-content-between align-items-center';
+      item.href = suggestion.url;
+
+      const value = document.createElement('span');
+      value.className = 'text-truncate';
+      value.textContent = suggestion.value;
+
+      const meta = document.createElement('small');
+      meta.className = 'text-muted ms-2 text-nowrap';
+      meta.textContent = suggestion.doc_count > 1
+        ? `${suggestion.label} · ${suggestion.doc_count}`
+        : suggestion.label;
+
+      item.appendChild(value);
+      item.appendChild(meta);
+      item.addEventListener('mouseenter', () => this.setActive(index));
+      this.menu.appendChild(item);
+    });
+
+    this.menu.classList.add('show');
+  }
+
+  setActive(index) {
+    const items = this.menu.querySelectorAll('.dropdown-item');
+    items.forEach((item, i) => item.classList.toggle('active', i === index));
+    this.state.active = index;
+  }
+
+  /**
+   * Nawigacja klawiaturą: strzałki, Enter (przejście do podpowiedzi), Escape
+   */
+  handleKeydown(e) {
+    if (!this.menu.classList.contains('show')) {
+      return;
+    }
+    const count = this.state.suggestions.length;
+
+    if (e.key === 'ArrowDown') {
+      e.preventDefault();
+      this.setActive((this.state.active + 1) % count);
+    } else if (e.key === 'ArrowUp') {
+      e.preventDefault();
+      this.setActive((this.state.active - 1 + count) % count);
+    } else if (e.key === 'Enter' && this.state.active >= 0) {
+      e.preventDefault();
+      e.stopImmediatePropagation();
+      window.location.href = this.state.suggestions[this.state.active].url;
+    } else if (e.key === 'Escape') {
+      this.hide();
+    }
+  }
+
+  hide() {
+    this.menu.classList.remove('show');
+    this.state.active = -1;
+  }
+
+  /**
+   * Podłączenie do wszystkich pól z atrybutem data-suggest
+   */
+  static attachAll(root = document) {
+    return Array.from(root.querySelectorAll('input[data-suggest]')).map((input) => new SearchSuggest(input));
+  }
+}
+
+// Export globalny
+window.SearchSuggest = SearchSuggest;
+
+document.addEventListener('DOMContentLoaded', () => SearchSuggest.attachAll());
@@ -131,6 +131,20 @@ async post(url, data = {}, options = {}) {
     return this.post(`/document/${docId}/run-ocr`);
   }
 
+  /**
+   * Anuluj zadanie OCR dla dokumentu (w kolejce lub w trakcie)
+   */
+  async cancelOcr(docId) {
+    return this.post(`/api/document/${docId}/ocr-cancel`);
+  }
+
+  /**
+   * Anuluj wszystkie zadania OCR w opinii
+   */
+  async cancelOpinionOcr(opinionId) {
+    return this.post(`/api/opinion/${opinionId}/ocr-cancel`);
+  }
+
   // === DOCUMENT API CALLS ===
 
   /**
@@ -247,6 +261,49 @@ async post(url, data = {}, options = {}) {
    * Monitoruj postęp OCR z automatycznym polling
    */
   startOcrProgressMonitoring(docId, callback, interval = 2000) {
+    // Preferuj strumień SSE - serwer sam wysyła zmiany postępu
+    if (window.EventSource) {
+      return this.subscribeOcrEvents(`/api/document/${docId}/ocr-events`, callback,
+        () => this.pollOcrProgress(docId, callback, interval));
+    }
+    return this.pollOcrProgress(docId, callback, interval);
+  }
+
+  /**
+   * Subskrybuj strumień SSE zdarzeń OCR (zdarzenia "progress", "page", "end").
+   * Gdy połączenie nie powiedzie się przed pierwszym zdarzeniem, wywoływany jest fallback.
+   */
+  subscribeOcrEvents(url, onProgress, fallback = null, onPage = null) {
+    const source = new EventSource(this.baseUrl + url);
+    let received = false;
+
+    source.addEventListener('progress', (event) => {
+      received = true;
+      onProgress(JSON.parse(event.data));
+    });
+
+    if (onPage) {
+      source.addEventListener('page', (event) => onPage(JSON.parse(event.data)));
+    }
+
+    // Status końcowy - zamknij, aby przeglądarka nie łączyła się ponownie
+    source.addEventListener('end', () => source.close());
+
+    source.onerror = () => {
+      if (!received) {
+        source.close();
+        if (fallback) fallback();
+      }
+      // Po odebraniu danych EventSource sam wznawia połączenie
+    };
+
+    return source;
+  }
+
+  /**
+   * Monitorowanie postępu OCR przez odpytywanie (gdy SSE jest niedostępne)
+   */
+  pollOcrProgress(docId, callback, interval = 2000) {
     const monitor = async () => {
       try {
         const data = await this.getOcrProgress(docId);
@@ -50,6 +50,13 @@ class DocumentDetailManager {
       return;
     }
 
+    // Przycisk anulowania OCR
+    const cancelOcrBtn = e.target.closest('.cancel-ocr-btn');
+    if (cancelOcrBtn) {
+      this.handleCancelOcr(e, cancelOcrBtn);
+      return;
+    }
+
     // Przycisk odświeżania tekstu OCR
     const refreshOcrBtn = e.target.closest('.refresh-ocr-btn');
     if (refreshOcrBtn) {
@@ -112,6 +119,43 @@ class DocumentDetailManager {
     }
   }
   
+  /**
+   * Obsługa anulowania OCR (zadanie w kolejce lub w trakcie)
+   */
+  async handleCancelOcr(e, button) {
+    e.preventDefault();
+
+    const docId = button.getAttribute('data-doc-id') || this.docId;
+    const originalHtml = button.innerHTML;
+
+    try {
+      button.disabled = true;
+      button.innerHTML = '<i class="bi bi-hourglass-split"></i> Anulowanie...';
+
+      const result = await window.apiClient.cancelOcr(docId);
+
+      if (window.alertManager) {
+        if (result.success) {
+          window.alertManager.success(result.message || 'Anulowano zadanie OCR', { duration: 5000 });
+        } else {
+          window.alertManager.warning(result.message || 'Brak aktywnego zadania OCR');
+        }
+      }
+
+      setTimeout(() => location.reload(), 2000);
+
+    } catch (error) {
+      console.error('Błąd anulowania OCR:', error);
+
+      if (window.alertManager) {
+        window.alertManager.error('Nie udało się anulować OCR: ' + error.message);
+      }
+
+      button.disabled = false;
+      button.innerHTML = originalHtml;
+    }
+  }
+
   /**
    * Obsługa odświeżania tekstu OCR
    */
@@ -227,9 +271,23 @@ class DocumentDetailManager {
         if (data.current_page && data.total_pages) {
           infoText += ` (Strona ${data.current_page}/${data.total_pages})`;
         }
+        if (data.eta_seconds) {
+          infoText += ` – pozostało ${this.formatEta(data.eta_seconds)}`;
+        }
         progressInfo.textContent = infoText;
       }
 
+    } else if (data.status === 'pending') {
+      const queueEta = document.getElementById('ocrQueueEta');
+      if (queueEta) {
+        if (data.deferred) {
+          queueEta.textContent = data.info || 'Odłożony - kolejka OCR przepełniona';
+        } else if (data.queue_position) {
+          queueEta.textContent = `Pozycja w kolejce: ${data.queue_position}` +
+            (data.eta_seconds ? `, szacowany koniec za ${this.formatEta(data.eta_seconds)}` : '');
+        }
+      }
+
     } else if (data.status === 'done' || data.status === 'fail') {
       // OCR zakończony
       this.state.ocrProgressMonitoring = false;
@@ -247,6 +305,17 @@ class DocumentDetailManager {
     }
   }
 
+  /**
+   * Formatuje szacowany czas (sekundy) do postaci "ok. X min"
+   */
+  formatEta(seconds) {
+    if (seconds < 60) return 'mniej niż minutę';
+    const minutes = Math.round(seconds / 60);
+    if (minutes < 60) return `ok. ${minutes} min`;
+    const hours = Math.floor(minutes / 60);
+    return `ok. ${hours} h ${minutes % 60} min`;
+  }
+
   /**
    * Konfiguracja obsługi formularzy
    */
@@ -1,6 +1,65 @@
 // ZAMIEŃ CAŁY PLIK upload-detail.js NA:
 
 export function startOcrPolling(opinionId) {
+  // Preferuj strumień SSE - postęp wysyłany przez serwer bez odpytywania
+  if (window.EventSource) {
+    return startOcrEventStream(opinionId);
+  }
+  return startOcrIntervalPolling(opinionId);
+}
+
+function handleOcrFinished(opinionId, data) {
+  console.log('✅ OCR zakończony - przekierowuję do opinii');
+
+  if (window.alertManager) {
+    window.alertManager.success(`OCR zakończony! Przetworzono ${data.completed_docs}/${data.total_docs} dokumentów.`);
+  }
+
+  // Krótkie opóźnienie przed przekierowaniem
+  setTimeout(() => {
+    window.location.href = `/opinion/${opinionId}`;
+  }, 1000);
+}
+
+function startOcrEventStream(opinionId) {
+  console.log(`🔄 Subskrypcja SSE postępu OCR dla opinii ${opinionId}`);
+
+  const source = new EventSource(`/api/opinion/${opinionId}/ocr-events`);
+  let received = false;
+
+  source.addEventListener('progress', (event) => {
+    received = true;
+    const data = JSON.parse(event.data);
+
+    if (data.ocr_done) {
+      source.close();
+      handleOcrFinished(opinionId, data);
+    } else {
+      updateProgressDisplay(data);
+    }
+  });
+
+  source.addEventListener('end', (event) => {
+    source.close();
+    const data = JSON.parse(event.data);
+    if (!data.ocr_done) {
+      // Brak aktywnych zadań, ale nic nie zakończyło się sukcesem - wróć do opinii
+      window.location.href = `/opinion/${opinionId}`;
+    }
+  });
+
+  source.onerror = () => {
+    if (!received) {
+      console.warn('⚠️ SSE niedostępne - przełączam na odpytywanie');
+      source.close();
+      startOcrIntervalPolling(opinionId);
+    }
+  };
+
+  return source;
+}
+
+function startOcrIntervalPolling(opinionId) {
   const checkInterval = 2000; // co 2 sekundy - szybsze sprawdzanie
   const maxAttempts = 300; // max ~10 minut
   let attempts = 0;
@@ -45,16 +104,7 @@ export function startOcrPolling(opinionId) {
       // ✅ Sprawdź czy OCR zakończony
       if (data.ocr_done) {
         clearInterval(interval);
-        console.log('✅ OCR zakończony - przekierowuję do opinii');
-        
-        if (window.alertManager) {
-          window.alertManager.success(`OCR zakończony! Przetworzono ${data.completed_docs}/${data.total_docs} dokumentów.`);
-        }
-        
-        // Krótkie opóźnienie przed przekierowaniem
-        setTimeout(() => {
-          window.location.href = `/opinion/${opinionId}`;
-        }, 1000);
+        handleOcrFinished(opinionId, data);
       } else {
         // ✅ Opcjonalnie: aktualizuj progress bar jeśli istnieje
         updateProgressDisplay(data);
@@ -13,10 +13,17 @@ from pathlib import Path
 from fastapi import HTTPException
 from sqlmodel import Session, select
 
+from app.archive import ArchiveError, archived_path, ensure_restored, restore_if_active
+from app.blobs import release_file
 from app.db import engine, FILES_DIR
+from app.duplicates import remove_fingerprints
+from app.entities import remove_entities
 from app.models import Document
-from app.search import is_fuzzy_match
-from app.text_extraction import get_document_text_content, get_ocr_text_for_document
+from app.listing import DEFAULT_PAGE_SIZE, archive_condition, list_doc_types, list_page, search_page
+from app.ingest import schedule_ingest
+from app.search_index import remove_documents
+from app.semantic_index import remove_embeddings
+from app.text_extraction import clear_text_cache, get_ocr_text_for_document
 from app.document_utils import detect_mime_type
 from app.llm_service import llm_service, combine_note_with_summary
 
@@ -28,6 +35,8 @@ class DocumentListResult:
     search_matches: Dict[int, List[str]]
     total_count: int
     unique_doc_types: List[str]
+    search_snippets: Dict[int, str] = None
+    next_cursor: Optional[str] = None
 
 
 @dataclass
@@ -46,6 +55,7 @@ class DocumentDownloadResult:
     file_path: Path
     original_filename: str
     mime_type: str
+    archived: bool = False      # file_path to skompresowany plik w archiwum (app/archive.py)
 
 
 @dataclass
@@ -71,6 +81,38 @@ class DocumentSummaryResult:
 class DocumentManager:
     """Manager dla wszystkich operacji na dokumentach."""
 
+    @staticmethod
+    def document_list_conditions(
+            k1: Optional[bool] = None,
+            k2: Optional[bool] = None,
+            k3: Optional[bool] = None,
+            k4: Optional[bool] = None,
+            doc_type_filter: Optional[str] = None,
+            include_archive: bool = False
+    ) -> list:
+        """Warunki filtrów listy dokumentów (status kN, typ dokumentu, archiwum)."""
+        conditions = archive_condition(include_archive)
+
+        # Zastosuj filtry statusów
+        status_filters = []
+        if k1 is not None and k1:
+            status_filters.append("k1")
+        if k2 is not None and k2:
+            status_filters.append("k2")
+        if k3 is not None and k3:
+            status_filters.append("k3")
+        if k4 is not None and k4:
+            status_filters.append("k4")
+
+        if status_filters:
+            conditions.append(Document.step.in_(status_filters))
+
+        # Filtr typu dokumentu
+        if doc_type_filter:
+            conditions.append(Document.doc_type == doc_type_filter)
+
+        return conditions
+
     @staticmethod
     def get_document_list(
             k1: Optional[bool] = None,
@@ -80,81 +122,41 @@ class DocumentManager:
             search: Optional[str] = None,
             search_content: bool = False,
             fuzzy_search: bool = False,
-            doc_type_filter: Optional[str] = None
+            doc_type_filter: Optional[str] = None,
+            sort: Optional[str] = None,
+            cursor: Optional[str] = None,
+            page_size: Optional[int] = DEFAULT_PAGE_SIZE,
+            semantic_search: bool = False,
+            include_archive: bool = False
     ) -> DocumentListResult:
         """
-        Pobiera listę dokumentów z filtrowaniem i wyszukiwaniem.
+        Pobiera stronę listy dokumentów z filtrowaniem i wyszukiwaniem.
         Logika z routes/documents.py -> list_documents()
+
+        Wiersze to projekcja kolumn listy (app/listing.py), nie pełne obiekty Document.
+        page_size=None zwraca wszystkie pasujące dokumenty (eksport CSV).
         """
         with Session(engine) as session:
-            # Pobierz wszystkie dokumenty
-            query = select(Document)
-
-            # Zastosuj filtry statusów
-            status_filters = []
-            if k1 is not None and k1:
-                status_filters.append("k1")
-            if k2 is not None and k2:
-                status_filters.append("k2")
-            if k3 is not None and k3:
-                status_filters.append("k3")
-            if k4 is not None and k4:
-                status_filters.append("k4")
-
-            if status_filters:
-                query = query.where(Document.step.in_(status_filters))
-
-            # Filtr typu dokumentu
-            if doc_type_filter:
-                query = query.where(Document.doc_type == doc_type_filter)
-
-            docs = session.exec(query.order_by(Document.upload_time.desc())).all()
+            conditions = DocumentManager.document_list_conditions(k1, k2, k3, k4, doc_type_filter, include_archive)
 
             # Wyszukiwanie
             search_matches = {}
+            search_snippets = {}
             if search and search.strip():
-                search_term = search.strip()
-                filtered_docs = []
-
-                for doc in docs:
-                    matches = []
-
-                    # Wyszukiwanie w metadanych
-                    searchable_text = ' '.join(filter(None, [
-                        doc.original_filename or '',
-                        doc.sygnatura or '',
-                        doc.doc_type or ''
-                    ]))
-
-                    if search_term.lower() in searchable_text.lower():
-                        matches.append('metadata')
-                    elif fuzzy_search and is_fuzzy_match(search_term, searchable_text):
-                        matches.append('fuzzy_metadata')
-
-                    # Wyszukiwanie w treści
-                    if search_content:
-                        content_text = get_document_text_content(doc, session)
-                        if content_text:
-                            if search_term.lower() in content_text.lower():
-                                matches.append('content')
-                            elif fuzzy_search and is_fuzzy_match(search_term, content_text):
-                                matches.append('fuzzy_content')
-
-                    if matches:
-                        search_matches[doc.id] = matches
-                        filtered_docs.append(doc)
-
-                docs = filtered_docs
-
-            # Pobierz unikalne typy dokumentów
-            unique_doc_types = list(set(filter(None, [doc.doc_type for doc in session.exec(select(Document)).all()])))
-            unique_doc_types.sort()
+                page, search_matches, search_snippets = search_page(
+                    session, conditions, search.strip(), search_content, fuzzy_search,
+                    sort=sort, cursor=cursor, page_size=page_size, semantic_search=semantic_search
+                )
+            else:
+                page = list_page(session, conditions, sort=sort, cursor=cursor, page_size=page_size)
 
             return DocumentListResult(
-                documents=docs,
+                documents=page.rows,
                 search_matches=search_matches,
-                total_count=len(docs),
-                unique_doc_types=unique_doc_types
+                total_count=page.total_count,
+                unique_doc_types=list_doc_types(session),
+                search_snippets=search_snippets,
+                next_cursor=page.next_cursor
             )
 
     @staticmethod
@@ -223,6 +225,18 @@ class DocumentManager:
             if not doc:
                 raise HTTPException(status_code=404, detail="Nie ma takiego dokumentu")
 
+            # Dokument w archiwum - plik dekompresowany w locie, bez przywracania opinii
+            if doc.archived_at is not None:
+                file_path = archived_path(doc.stored_filename)
+                if file_path is None:
+                    raise HTTPException(status_code=404, detail="Nie znaleziono pliku w archiwum")
+                return DocumentDownloadResult(
+                    file_path=file_path,
+                    original_filename=doc.original_filename,
+                    mime_type=doc.mime_type or "application/octet-stream",
+                    archived=True
+                )
+
             # Obsługa plików historycznych
             if doc.stored_filename.startswith('history/'):
                 # Plik historyczny - używaj bezpośrednio ścieżki z stored_filename
@@ -289,6 +303,12 @@ class DocumentManager:
             was_opinion = doc.is_main
             parent_id = doc.parent_id
 
+            # Zatrzymaj OCR usuwanego dokumentu (i dokumentów opinii), żeby proces
+            # nie pracował dalej nad plikiem, który za chwilę zniknie
+            DocumentManager._cancel_ocr_for_deleted(session, doc)
+            removed_ids = []
+            stored_filenames = [doc.stored_filename]
+
             # Sprawdź czy to opinia (dokument główny)
             if doc.is_main:
                 # Pobierz wszystkie powiązane dokumenty
@@ -296,36 +316,35 @@ class DocumentManager:
                     select(Document).where(Document.parent_id == doc_id)
                 ).all()
 
-                # Usuń pliki powiązanych dokumentów
-                for related_doc in related_docs:
-                    file_path = FILES_DIR / related_doc.stored_filename
-                    try:
-                        if file_path.exists():
-                            file_path.unlink()
-                    except Exception as e:
-                        print(f"Błąd podczas usuwania pliku {related_doc.stored_filename}: {e}")
-
                 # Usuń powiązane dokumenty z bazy danych
                 for related_doc in related_docs:
                     session.delete(related_doc)
+                    removed_ids.append(related_doc.id)
+                    stored_filenames.append(related_doc.stored_filename)
 
                 deleted_count += len(related_docs)
                 delete_message = f"Usunięto opinię i {len(related_docs)} powiązanych dokumentów."
             else:
                 delete_message = "Dokument został usunięty."
 
-            # Usuń plik głównego dokumentu
-            file_path = FILES_DIR / doc.stored_filename
-            try:
-                if file_path.exists():
-                    file_path.unlink()
-            except Exception as e:
-                print(f"Błąd podczas usuwania pliku {doc.stored_filename}: {e}")
-
             # Usuń dokument z bazy danych
             session.delete(doc)
             session.commit()
 
+            # Usuń pliki, których nie wskazują już inne dokumenty (wspólne pliki - app/blobs.py)
+            for stored_filename in stored_filenames:
+                try:
+                    release_file(stored_filename)
+                except Exception as e:
+                    print(f"Błąd podczas usuwania pliku {stored_filename}: {e}")
+
+            remove_documents([doc_id, *removed_ids])
+            remove_embeddings([doc_id, *removed_ids])
+            remove_fingerprints([doc_id, *removed_ids])
+            remove_entities([doc_id, *removed_ids])
+            for removed_id in [doc_id, *removed_ids]:
+                clear_text_cache(removed_id)
+
             # Określ URL przekierowania
             if was_opinion:
                 redirect_url = f"/?delete_message={delete_message}"
@@ -342,6 +361,26 @@ class DocumentManager:
                 was_opinion=was_opinion
             )
 
+    @staticmethod
+    def _cancel_ocr_for_deleted(session: Session, doc: Document):
+        """Anuluje zadania OCR usuwanego dokumentu oraz jego dokumentów powiązanych."""
+        from app.background_tasks import cancel_ocr_task
+
+        doc_ids = [doc.id]
+        if doc.is_main:
+            doc_ids += session.exec(
+                select(Document.id).where(
+                    Document.parent_id == doc.id,
+                    Document.ocr_status.in_(["pending", "running"])
+                )
+            ).all()
+
+        for active_id in doc_ids:
+            try:
+                cancel_ocr_task(active_id)
+            except Exception as e:
+                print(f"Błąd podczas anulowania OCR dokumentu {active_id}: {e}")
+
     @staticmethod
     async def summarize_document(
             doc_id: int,
@@ -419,6 +458,13 @@ class DocumentManager:
             if not doc:
                 raise HTTPException(status_code=404, detail="Nie ma takiego dokumentu")
 
+            # Powrót do aktywnego kroku przywraca opinię dokumentu z archiwum
+            try:
+                restore_if_active(doc_id, step)
+            except ArchiveError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            session.refresh(doc)
+
             doc.step = step
             doc.sygnatura = sygnatura or None
             doc.doc_type = doc_type or None
@@ -472,6 +518,7 @@ class DocumentManager:
             source_doc = session.get(Document, doc_id)
             if not source_doc:
                 raise HTTPException(status_code=404, detail="Nie znaleziono dokumentu")
+            ensure_restored(source_doc)
 
             # Sprawdź czy już istnieje dokument OCR TXT dla tego dokumentu
             ocr_txt_query = select(Document).where(
@@ -493,6 +540,10 @@ class DocumentManager:
                     session.add(ocr_txt_doc)
                     session.commit()
 
+                    # Treść źródła obejmuje tekst OCR - oba dokumenty do ponownego przetworzenia
+                    # (encje, sygnatura duplikatów, indeks pełnotekstowy i osadzenia - app/ingest.py)
+                    schedule_ingest([doc_id, ocr_txt_doc.id])
+
                     return {
                         "success": True,
                         "message": "Tekst OCR został zaktualizowany",
@@ -536,6 +587,8 @@ class DocumentManager:
 
                     session.commit()
 
+                    schedule_ingest([doc_id, new_ocr_doc.id])
+
                     return {
                         "success": True,
                         "message": "Utworzono nowy plik z tekstem OCR",
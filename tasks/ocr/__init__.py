@@ -1,6 +1,16 @@
 """
 Moduł OCR do rozpoznawania tekstu w dokumentach.
+
+Pipeline (torch, transformers) ładowany jest dopiero przy pierwszym użyciu
+run_ocr_pipeline - import tasks.ocr.config czy tasks.ocr.scheduler w procesach
+puli ingestu i skanowania nie wczytuje modeli.
 """
-from .pipeline import run_ocr_pipeline
 
 __all__ = ['run_ocr_pipeline']
+
+
+def __getattr__(name):
+    if name == 'run_ocr_pipeline':
+        from .pipeline import run_ocr_pipeline
+        return run_ocr_pipeline
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
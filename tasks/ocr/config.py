@@ -45,6 +45,37 @@ logger = setup_logger()
 # Ustawienia dla timeout'ów
 OCR_TIMEOUT_SECONDS = 600  # 10 minut na stronę
 WATCHDOG_TIMEOUT_SECONDS = 1800  # 30 minut na cały dokument
+# Dodatkowy czas na każdą wykrytą stronę - duże PDF-y nie są ubijane po 30 minutach
+WATCHDOG_SECONDS_PER_PAGE = int(os.getenv("OCR_WATCHDOG_SECONDS_PER_PAGE", "120"))
+WATCHDOG_INTERVAL_SECONDS = int(os.getenv("OCR_WATCHDOG_INTERVAL_SECONDS", "30"))
+
+# Ustawienia puli procesów OCR (supervisor w app/background_tasks.py)
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "2"))
+# Recykling procesu po N zadaniach - ogranicza fragmentację CUDA i wycieki RAM
+WORKER_MAX_JOBS = int(os.getenv("OCR_WORKER_MAX_JOBS", "25"))
+# Recykling puli po przekroczeniu progów pamięci (0 = bez limitu)
+WORKER_MAX_RSS_MB = int(os.getenv("OCR_WORKER_MAX_RSS_MB", "16384"))
+WORKER_MAX_GPU_MB = int(os.getenv("OCR_WORKER_MAX_GPU_MB", "22528"))
+# Ile razy dokument może zostać ponowiony po ubiciu zawieszonego procesu
+OCR_MAX_ATTEMPTS = int(os.getenv("OCR_MAX_ATTEMPTS", "3"))
+
+# Batchowanie stron wielu dokumentów (tasks/ocr/scheduler.py)
+# Liczba stron w jednym wywołaniu generate (1 = bez batchowania)
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "4"))
+# Maksymalna liczba dokumentów łączonych w jedno zadanie procesu OCR
+OCR_BATCH_MAX_DOCS = int(os.getenv("OCR_BATCH_MAX_DOCS", "8"))
+# Dokumenty o tylu stronach lub mniej są łączone z innymi małymi dokumentami
+OCR_BATCH_SMALL_DOC_PAGES = int(os.getenv("OCR_BATCH_SMALL_DOC_PAGES", "3"))
+
+# Model czasu OCR i kontrola przyjmowania zadań (app/ocr_estimator.py)
+# Czas strony przyjmowany, zanim zostaną zebrane pomiary
+OCR_DEFAULT_SECONDS_PER_PAGE = float(os.getenv("OCR_DEFAULT_SECONDS_PER_PAGE", "45"))
+# Liczba ostatnich pomiarów używanych do dopasowania modelu
+OCR_TIMING_SAMPLES = int(os.getenv("OCR_TIMING_SAMPLES", "200"))
+# Maksymalny przewidywany czas zaległości kolejki w sekundach (0 = bez limitu)
+OCR_MAX_BACKLOG_SECONDS = int(os.getenv("OCR_MAX_BACKLOG_SECONDS", "0"))
+# 'reject' → odrzuć upload (HTTP 503), 'defer' → przyjmij, OCR uruchomi się po zwolnieniu kolejki
+OCR_BACKPRESSURE_MODE = os.getenv("OCR_BACKPRESSURE_MODE", "defer").lower()
 
 # Ustawienia dla preprocessingu
 DPI = 300  # Rozdzielczość przy konwersji PDF -> obraz
@@ -10,11 +10,11 @@ import signal
 import time
 from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import pynvml
 
 import torch
-from transformers import AutoModelForVision2Seq, AutoProcessor
+from transformers import AutoModelForVision2Seq, AutoProcessor, StoppingCriteria, StoppingCriteriaList
 
 from .config import (
     DEFAULT_OCR_INSTRUCTION,
@@ -199,13 +199,44 @@ def _timeout_handler(_signum, _frame):
     raise TimeoutError("Timeout podczas generacji tekstu")
 
 
+class CancelStoppingCriteria(StoppingCriteria):
+    """
+    Przerywa generację na granicy tokenu, gdy should_stop() zwróci True.
+    should_stop wywoływane jest po każdym tokenie - musi być tanie (CancelPoller).
+    """
+
+    def __init__(self, should_stop):
+        self.should_stop = should_stop
+
+    def __call__(self, input_ids, scores, **kwargs):
+        stop = bool(self.should_stop())
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+
+class BatchCancelStoppingCriteria(StoppingCriteria):
+    """Jak CancelStoppingCriteria, ale osobno dla każdego wiersza batcha (strony różnych dokumentów)."""
+
+    def __init__(self, row_should_stop: List[Optional[Callable[[], bool]]]):
+        self.row_should_stop = row_should_stop
+
+    def __call__(self, input_ids, scores, **kwargs):
+        stops = [bool(fn()) if fn is not None else False for fn in self.row_should_stop]
+        return torch.tensor(stops, dtype=torch.bool, device=input_ids.device)
+
+
 def process_image_to_text(
         image_path: str | Path,
         instruction: str = DEFAULT_OCR_INSTRUCTION,
         model=None,
         processor=None,
+        should_stop=None,
 ):
-    """Rozpoznaje tekst z obrazu i zwraca go jako string."""
+    """
+    Rozpoznaje tekst z obrazu i zwraca go jako string.
+
+    should_stop: opcjonalna funkcja bez argumentów - gdy zwróci True, generacja
+    kończy się na najbliższym tokenie (anulowanie zadania OCR).
+    """
     print(f"🔍 [OCR_MODELS] process_image_to_text wywołane dla: {image_path}")
 
     try:
@@ -271,10 +302,14 @@ def process_image_to_text(
         signal.alarm(OCR_TIMEOUT_SECONDS)
         try:
             logger.info("Instrukcja: %s", instruction)
+            generate_kwargs = {}
+            if should_stop is not None:
+                generate_kwargs["stopping_criteria"] = StoppingCriteriaList([CancelStoppingCriteria(should_stop)])
             with torch.no_grad():
                 gen_ids = model.generate(
                     **inputs,
-                    max_new_tokens=MAX_NEW_TOKENS
+                    max_new_tokens=MAX_NEW_TOKENS,
+                    **generate_kwargs
                     # eos_token_id=processor.tokenizer.eos_token_id,
                     # pad_token_id=processor.tokenizer.pad_token_id,
                 )
@@ -313,6 +348,139 @@ def process_image_to_text(
         return f"[Błąd OCR: {str(e)}]"
 
 
+# ---------------------------------------------------------------------------
+#  OCR wielu stron w jednym wywołaniu generate (batch)
+# ---------------------------------------------------------------------------
+
+def _build_ocr_messages(image_path: str, instruction: str) -> list:
+    return [
+        {
+            "role": "system",
+            "content": [{"type": "text", "text": "You are OCR system for text recognition."}],
+        },
+        {
+            "role": "user",
+            "content": [
+                {"type": "image", "image": image_path},
+                {"type": "text", "text": instruction},
+            ],
+        },
+    ]
+
+
+def process_images_to_text(
+        image_paths: List[str | Path],
+        instruction: str = DEFAULT_OCR_INSTRUCTION,
+        model=None,
+        processor=None,
+        should_stop: Optional[List[Optional[Callable[[], bool]]]] = None,
+) -> List[str]:
+    """
+    Rozpoznaje tekst z kilku obrazów jednym wywołaniem generate i zwraca listę
+    tekstów w kolejności wejściowej.
+
+    should_stop: opcjonalna lista funkcji (po jednej na obraz) - wiersz, dla którego
+    funkcja zwróci True, kończy generację na najbliższym tokenie.
+
+    Przy błędzie batcha (np. OOM) strony są przetwarzane pojedynczo.
+    """
+    if not image_paths:
+        return []
+
+    image_paths = [str(p) for p in image_paths]
+    if should_stop is None:
+        should_stop = [None] * len(image_paths)
+
+    if len(image_paths) == 1:
+        return [process_image_to_text(image_paths[0], instruction, model, processor, should_stop=should_stop[0])]
+
+    print(f"🔍 [OCR_MODELS] process_images_to_text: batch {len(image_paths)} stron")
+
+    try:
+        from qwen_vl_utils import process_vision_info
+    except ImportError as e:
+        raise Exception(f"Nie można zaimportować qwen_vl_utils: {str(e)}")
+
+    if model is None or processor is None:
+        model, processor = get_ocr_model()
+
+    missing = [p for p in image_paths if not Path(p).exists()]
+    if missing:
+        # Pojedyncze przetwarzanie zwróci komunikat błędu dla brakujących plików
+        return [
+            process_image_to_text(p, instruction, model, processor, should_stop=stop)
+            for p, stop in zip(image_paths, should_stop)
+        ]
+
+    inputs = gen_ids = None
+    try:
+        batch_messages = [_build_ocr_messages(p, instruction) for p in image_paths]
+        text_prompts = [
+            processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+            for messages in batch_messages
+        ]
+        image_inputs, video_inputs = process_vision_info(batch_messages)
+
+        # Generacja w batchu wymaga paddingu z lewej strony
+        processor.tokenizer.padding_side = "left"
+        inputs = processor(
+            text=text_prompts,
+            images=image_inputs,
+            videos=video_inputs,
+            padding=True,
+            return_tensors="pt",
+        ).to(model.device)
+
+        generate_kwargs = {}
+        if any(fn is not None for fn in should_stop):
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList([BatchCancelStoppingCriteria(should_stop)])
+
+        signal.signal(signal.SIGALRM, _timeout_handler)
+        signal.alarm(OCR_TIMEOUT_SECONDS)
+        try:
+            with torch.no_grad():
+                gen_ids = model.generate(
+                    **inputs,
+                    max_new_tokens=MAX_NEW_TOKENS,
+                    **generate_kwargs
+                )
+        except TimeoutError:
+            error_msg = f"Timeout > {OCR_TIMEOUT_SECONDS} s – pominięto batch {len(image_paths)} stron"
+            print(f"⏰ [OCR_MODELS] {error_msg}")
+            logger.error(error_msg)
+            return ["[Timeout OCR]"] * len(image_paths)
+        finally:
+            signal.alarm(0)
+
+        trimmed = [o[len(i):] for i, o in zip(inputs.input_ids, gen_ids)]
+        texts = processor.batch_decode(trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=True)
+
+        print(f"✅ [OCR_MODELS] Batch zakończony: {[len(t) for t in texts]} znaków")
+        return [t.strip() for t in texts]
+
+    except Exception as e:
+        error_msg = f"Błąd OCR batcha ({len(image_paths)} stron), przetwarzam pojedynczo: {str(e)}"
+        print(f"⚠️ [OCR_MODELS] {error_msg}")
+        logger.warning(error_msg)
+
+        del inputs, gen_ids
+        inputs = gen_ids = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+        return [
+            process_image_to_text(p, instruction, model, processor, should_stop=stop)
+            for p, stop in zip(image_paths, should_stop)
+        ]
+
+    finally:
+        del inputs, gen_ids
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
 # ---------------------------------------------------------------------------
 #  Zwalnianie zasobów (legacy helper)
 # ---------------------------------------------------------------------------
@@ -24,17 +24,61 @@ os.environ['TORCH_USE_CUDA_DSA'] = '1'
 
 import uuid
 import tempfile
-import sqlite3
+import time
 from datetime import datetime
 from pathlib import Path
 
-from app.db import FILES_DIR
+from app.db import FILES_DIR, raw_connection
 
 # Importujemy funkcje z innych modułów OCR
 from .models import process_image_to_text
 from .postprocessors import clean_ocr_text, estimate_ocr_confidence
 
 
+# Kolejka zdarzeń postępu do procesu głównego (proxy multiprocessing.Manager().Queue)
+_event_queue = None
+
+
+def set_event_queue(event_queue):
+    """Ustawia kolejkę zdarzeń postępu dla bieżącego procesu OCR."""
+    global _event_queue
+    _event_queue = event_queue
+
+
+def emit_ocr_event(doc_id: int, event_type: str = "progress", **data):
+    """Wysyła zdarzenie postępu OCR do procesu głównego (SSE) - nigdy nie przerywa OCR."""
+    if _event_queue is None:
+        return
+    try:
+        _event_queue.put({"type": event_type, "doc_id": doc_id, **data})
+    except Exception as e:
+        print(f"⚠️ [PROCES] Nie można wysłać zdarzenia OCR: {e}")
+
+
+class OCRCancelledError(Exception):
+    """Sygnalizuje anulowanie zadania OCR przez użytkownika."""
+
+
+def is_cancel_set(cancel_event) -> bool:
+    """
+    Stan zdarzenia anulowania (proxy z multiprocessing.Manager - wywołanie IPC).
+    Menedżer niedostępny (np. zamykanie aplikacji) oznacza brak anulowania.
+    """
+    if cancel_event is None:
+        return False
+    try:
+        return bool(cancel_event.is_set())
+    except Exception as e:
+        print(f"⚠️ [PROCES] Nie można sprawdzić anulowania: {e}")
+        return False
+
+
+def check_cancelled(cancel_event, doc_id: int):
+    """Przerywa przetwarzanie, jeśli zadanie OCR zostało anulowane."""
+    if is_cancel_set(cancel_event):
+        raise OCRCancelledError(f"OCR dokumentu {doc_id} został anulowany")
+
+
 def ensure_cuda_cleanup():
     """Wymuś czyszczenie CUDA przed rozpoczęciem procesu."""
     try:
@@ -49,23 +93,39 @@ def ensure_cuda_cleanup():
         print(f"⚠️ [PROCES] Błąd czyszczenia CUDA: {e}")
 
 
-def process_document_sync(doc_id: int) -> dict:
+def process_document_sync(doc_id: int, cancel_event=None, event_queue=None) -> dict:
     """
     Główna funkcja OCR dla ProcessPoolExecutor.
     Używa tylko SQLite - bez SQLModel Session.
+
+    Args:
+        doc_id: ID dokumentu
+        cancel_event: Opcjonalny Event (proxy z multiprocessing.Manager) - ustawiony
+                      oznacza żądanie anulowania zadania
+        event_queue: Opcjonalna kolejka (proxy z multiprocessing.Manager) na zdarzenia postępu
     """
+    set_event_queue(event_queue)
     try:
         print(f"🔄 [PROCES] Rozpoczynam OCR dla dokumentu {doc_id}")
 
+        # Zadanie mogło zostać anulowane zanim proces je podjął
+        check_cancelled(cancel_event, doc_id)
+
         # Wyczyść CUDA na początku procesu
         ensure_cuda_cleanup()
 
         # Uruchom główne przetwarzanie
-        result_id = process_document_sqlite(doc_id)
+        result_id = process_document_sqlite(doc_id, cancel_event=cancel_event)
 
         print(f"✅ [PROCES] OCR zakończony dla {doc_id}, txt_doc_id: {result_id}")
         return {"success": True, "doc_id": doc_id, "result_id": result_id}
 
+    except OCRCancelledError as e:
+        print(f"🛑 [PROCES] {e}")
+        mark_document_cancelled(doc_id)
+        ensure_cuda_cleanup()
+        return {"success": False, "cancelled": True, "error": str(e), "doc_id": doc_id}
+
     except Exception as e:
         error_msg = str(e)
         print(f"❌ [PROCES] Błąd OCR dla {doc_id}: {error_msg}")
@@ -76,16 +136,16 @@ def process_document_sync(doc_id: int) -> dict:
         return {"success": False, "error": error_msg, "doc_id": doc_id}
 
 
-def process_document_sqlite(doc_id: int) -> int:
+def process_document_sqlite(doc_id: int, cancel_event=None) -> int:
     """
     Główna funkcja przetwarzania OCR używająca tylko SQLite.
 
+    Raises:
+        OCRCancelledError: gdy zadanie zostało anulowane (wyniki nie są zapisywane)
+
     Returns:
         int: ID utworzonego dokumentu TXT lub None w przypadku błędu
     """
-    # Połączenie z bazą
-    db_path = get_db_path()
-
     # Pobierz dane dokumentu
     doc_data = get_document_data(doc_id)
     if not doc_data:
@@ -93,8 +153,8 @@ def process_document_sqlite(doc_id: int) -> int:
 
     stored_filename, original_filename, mime_type, content_type, sygnatura, step = doc_data
 
-    # Oznacz jako running
-    update_document_status(doc_id, "running", "Inicjalizacja procesu OCR", 0.0)
+    # Nowa próba OCR - dokument przechodzi w stan running
+    start_ocr_job(doc_id, "Inicjalizacja procesu OCR")
 
     print(f"🔄 [PROCES] Przetwarzam: {original_filename}")
 
@@ -109,16 +169,21 @@ def process_document_sqlite(doc_id: int) -> int:
     try:
         if is_image:
             # Przetwarzanie pojedynczego obrazu
-            text_all, confidence_score = process_single_image(doc_id, file_path, original_filename)
+            text_all, confidence_score = process_single_image(doc_id, file_path, original_filename,
+                                                              cancel_event=cancel_event)
         else:
             # Przetwarzanie PDF (wielostronicowe)
-            text_all, confidence_score = process_pdf_document(doc_id, file_path, original_filename)
+            text_all, confidence_score = process_pdf_document(doc_id, file_path, original_filename,
+                                                              cancel_event=cancel_event)
+
+            # Ostatnia szansa na anulowanie przed modyfikacją pliku źródłowego
+            check_cancelled(cancel_event, doc_id)
 
             # Osadź tekst w PDF jeśli to PDF
             if mime_type == 'application/pdf':
                 print(f"📎 [PROCES] Osadzanie tekstu w PDF")
                 update_document_status(doc_id, "running", "Osadzanie tekstu w pliku PDF", 0.95)
-                embed_text_in_pdf(file_path)
+                embed_text_in_pdf(file_path, doc_id)
 
         # Zapisz wyniki do plików i bazy
         txt_doc_id = save_ocr_results(doc_id, text_all, confidence_score, original_filename, sygnatura, step)
@@ -129,6 +194,9 @@ def process_document_sqlite(doc_id: int) -> int:
         print(f"✅ [PROCES] OCR zakończony pomyślnie dla {doc_id}")
         return txt_doc_id
 
+    except OCRCancelledError:
+        raise
+
     except Exception as e:
         error_msg = str(e)
         print(f"❌ [PROCES] Błąd przetwarzania OCR: {error_msg}")
@@ -136,7 +204,7 @@ def process_document_sqlite(doc_id: int) -> int:
         raise
 
 
-def process_single_image(doc_id: int, file_path: Path, filename: str):
+def process_single_image(doc_id: int, file_path: Path, filename: str, cancel_event=None):
     """Przetwarzanie pojedynczego obrazu."""
     print(f"🖼️ [PROCES] Obraz: {filename}")
 
@@ -153,9 +221,12 @@ def process_single_image(doc_id: int, file_path: Path, filename: str):
     try:
         # OCR obrazu
         print(f"🔍 [PROCES] Wywołuję process_image_to_text...")
-        page_text = process_image_to_text(str(file_path))
+        page_text = process_image_to_text(str(file_path), should_stop=_stop_callback(cancel_event))
+        check_cancelled(cancel_event, doc_id)
         print(f"🔍 [PROCES] OCR zwrócił: {len(page_text)} znaków")
         print(f"🔍 [PROCES] Pierwsze 100 znaków: {page_text[:100]}")
+    except OCRCancelledError:
+        raise
     except Exception as e:
         print(f"❌ [PROCES] Błąd w process_image_to_text: {str(e)}")
         import traceback
@@ -173,7 +244,7 @@ def process_single_image(doc_id: int, file_path: Path, filename: str):
     return clean_text, confidence
 
 
-def process_pdf_document(doc_id: int, file_path: Path, filename: str):
+def process_pdf_document(doc_id: int, file_path: Path, filename: str, cancel_event=None):
     """Przetwarzanie dokumentu PDF (wielostronicowe)."""
     print(f"📄 [PROCES] PDF: {filename}")
 
@@ -193,6 +264,9 @@ def process_pdf_document(doc_id: int, file_path: Path, filename: str):
     confidence_scores = []
 
     for page_number, img in enumerate(pages, 1):
+        # Granica strony - sprawdź czy zadanie nie zostało anulowane
+        check_cancelled(cancel_event, doc_id)
+
         print(f"🔍 [PROCES] Strona {page_number}/{total_pages}")
 
         # Aktualizuj postęp
@@ -214,16 +288,23 @@ def process_pdf_document(doc_id: int, file_path: Path, filename: str):
             # Wyczyść CUDA przed każdą stroną
             ensure_cuda_cleanup()
 
-            # OCR strony
-            page_text = process_image_to_text(img_path)
+            # OCR strony (generacja przerywana na granicy tokenu po anulowaniu)
+            page_text = process_image_to_text(img_path, should_stop=_stop_callback(cancel_event))
+            check_cancelled(cancel_event, doc_id)
             clean_text = clean_ocr_text(page_text)
             confidence = estimate_ocr_confidence(clean_text)
 
             page_texts.append(clean_text)
             confidence_scores.append(confidence)
 
+            emit_ocr_event(doc_id, "page", page=page_number, total_pages=total_pages,
+                           chars=len(clean_text), confidence=confidence)
+
             print(f"✅ [PROCES] Strona {page_number}: {len(clean_text)} znaków, pewność: {confidence:.2f}")
 
+        except OCRCancelledError:
+            raise
+
         except Exception as e:
             print(f"❌ [PROCES] Błąd OCR strony {page_number}: {str(e)}")
             page_texts.append(f"[Błąd OCR dla strony {page_number}: {str(e)}]")
@@ -238,11 +319,7 @@ def process_pdf_document(doc_id: int, file_path: Path, filename: str):
             ensure_cuda_cleanup()
 
     # Połącz teksty stron
-    text_all = ""
-    for i, page_text in enumerate(page_texts, 1):
-        text_all += f"\n\n=== Strona {i} ===\n\n{page_text}"
-
-    text_all = text_all.strip()
+    text_all = join_page_texts(page_texts)
 
     # Oblicz średnią pewność
     avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.0
@@ -250,6 +327,15 @@ def process_pdf_document(doc_id: int, file_path: Path, filename: str):
     return text_all, avg_confidence
 
 
+def join_page_texts(page_texts) -> str:
+    """Łączy teksty stron z nagłówkami '=== Strona N ==='."""
+    text_all = ""
+    for i, page_text in enumerate(page_texts, 1):
+        text_all += f"\n\n=== Strona {i} ===\n\n{page_text}"
+
+    return text_all.strip()
+
+
 def save_ocr_results(doc_id: int, text_content: str, confidence: float,
                     original_filename: str, sygnatura: str, step: str) -> int:
     """Zapisuje wyniki OCR do pliku i bazy danych."""
@@ -264,8 +350,7 @@ def save_ocr_results(doc_id: int, text_content: str, confidence: float,
     print(f"💾 [PROCES] Zapisano tekst: {txt_filename} ({len(text_content)} znaków)")
 
     # Zapisz do bazy danych
-    db_path = get_db_path()
-    with sqlite3.connect(str(db_path)) as conn:
+    with raw_connection() as conn:
         cursor = conn.cursor()
 
         # ✅ NOWE: Usuń stare dokumenty OCR dla tego dokumentu
@@ -315,6 +400,10 @@ def save_ocr_results(doc_id: int, text_content: str, confidence: float,
         ))
 
         txt_doc_id = cursor.lastrowid
+
+        # Wynik OCR wspólnego pliku - dla kolejnych dokumentów z tą samą zawartością (app/blobs.py)
+        from app.blobs import record_ocr_result
+        record_ocr_result(cursor, doc_id, txt_doc_id)
         conn.commit()
 
         print(f"✅ [PROCES] Utworzono nowy dokument TXT ID: {txt_doc_id}")
@@ -326,27 +415,55 @@ def save_ocr_results(doc_id: int, text_content: str, confidence: float,
         except Exception as e:
             print(f"⚠️ [PROCES] Błąd czyszczenia cache: {e}")
 
-        return txt_doc_id
+    # Indeks pełnotekstowy: nowy wynik OCR, źródło (jego treść obejmuje OCR), usunięte stare wyniki
+    try:
+        from app.search_index import index_document, remove_documents
+        from app.text_store import invalidate
+        remove_documents([old_doc[0] for old_doc in old_ocr_docs])
+        for old_doc in old_ocr_docs:
+            invalidate(old_doc[0])
+        index_document(txt_doc_id, text_content)
+        index_document(doc_id)
+    except Exception as e:
+        print(f"⚠️ [PROCES] Błąd aktualizacji indeksu wyszukiwania: {e}")
+
+    return txt_doc_id
 
 
-def embed_text_in_pdf(pdf_path: Path):
-    """Osadza tekst w PDF używając ocrmypdf."""
+def embed_text_in_pdf(pdf_path: Path, doc_id: int = None):
+    """
+    Osadza tekst w PDF używając ocrmypdf. Plik z magazynu (app/blobs.py) nie jest
+    zmieniany - PDF z warstwą tekstową trafia do magazynu jako nowy plik dokumentu doc_id.
+    """
     try:
         import subprocess
         import shutil
+        from app.blobs import BLOB_PREFIX, replace_document_file
 
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp_out:
+        in_store = doc_id is not None and pdf_path.is_relative_to(FILES_DIR / BLOB_PREFIX)
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False,
+                                         dir=FILES_DIR if in_store else None) as tmp_out:
             tmp_path = tmp_out.name
 
         print(f"📎 [PROCES] Uruchamiam ocrmypdf...")
 
-        result = subprocess.run(
-            ["ocrmypdf", "--skip-text", "--sidecar", "/dev/null", str(pdf_path), tmp_path],
-            check=True, capture_output=True, text=True
-        )
-
-        # Zamień oryginalny plik
-        shutil.move(tmp_path, str(pdf_path))
+        try:
+            result = subprocess.run(
+                ["ocrmypdf", "--skip-text", "--sidecar", "/dev/null", str(pdf_path), tmp_path],
+                check=True, capture_output=True, text=True
+            )
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        if in_store:
+            # Poprzedni plik zwalnia proces główny (zdarzenie file_replaced - app/ocr_events.py)
+            previous = replace_document_file(doc_id, Path(tmp_path))
+            if previous:
+                emit_ocr_event(doc_id, "file_replaced", stored_filename=previous)
+        else:
+            # Zamień oryginalny plik (plik sprzed magazynu należy do jednego dokumentu)
+            shutil.move(tmp_path, str(pdf_path))
 
         print(f"✅ [PROCES] Osadzono tekst w PDF")
         return True
@@ -358,15 +475,115 @@ def embed_text_in_pdf(pdf_path: Path):
 
 # ==================== FUNKCJE POMOCNICZE ====================
 
-def get_db_path() -> Path:
-    """Zwraca ścieżkę do bazy danych."""
-    return Path(__file__).parent.parent.parent / "data.db"
+# Generacja pyta o anulowanie po każdym tokenie - proxy zdarzenia odpytywane najwyżej co tyle sekund
+OCR_CANCEL_POLL_SECONDS = float(os.getenv("OCR_CANCEL_POLL_SECONDS", "0.5"))
+
+
+class CancelPoller:
+    """
+    Sprawdzanie anulowania dla generacji modelu: stan proxy zdarzenia odczytywany
+    najwyżej co OCR_CANCEL_POLL_SECONDS (zamiast IPC na każdy token i wiersz batcha),
+    a raz zauważone anulowanie zapamiętywane.
+    """
+
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+        self.cancelled = False
+        self.checked_at = 0.0
+
+    def __call__(self) -> bool:
+        if self.cancelled:
+            return True
+        now = time.monotonic()
+        if now - self.checked_at >= OCR_CANCEL_POLL_SECONDS:
+            self.checked_at = now
+            self.cancelled = is_cancel_set(self.cancel_event)
+        return self.cancelled
+
+
+def _stop_callback(cancel_event):
+    """Zwraca funkcję sprawdzającą anulowanie dla generacji modelu (lub None)."""
+    if cancel_event is None:
+        return None
+    return CancelPoller(cancel_event)
+
+
+def mark_document_cancelled(doc_id: int):
+    """Przywraca dokument do stanu sprzed OCR po anulowaniu zadania."""
+
+    try:
+        with raw_connection() as conn:
+            conn.execute("""
+                UPDATE document SET
+                    ocr_status = 'none', ocr_progress_info = ?, ocr_progress = NULL,
+                    ocr_current_page = NULL, ocr_total_pages = NULL
+                WHERE id = ?
+            """, ("OCR anulowany", doc_id))
+            _finish_ocr_job(conn, doc_id, "cancelled", "OCR anulowany")
+            conn.commit()
+    except Exception as e:
+        print(f"❌ [PROCES] Błąd oznaczania anulowania: {e}")
+
+    emit_ocr_event(doc_id, status="none", info="OCR anulowany", progress=None,
+                   current_page=None, total_pages=None)
+
+
+# ==================== ZADANIA OCR (tabela ocrjob) ====================
+
+def _open_ocr_job_id(conn, doc_id: int):
+    """Zwraca ID bieżącej (niezakończonej) próby OCR dokumentu."""
+    row = conn.execute(
+        "SELECT id FROM ocrjob WHERE doc_id = ? AND status = 'running' ORDER BY id DESC LIMIT 1",
+        (doc_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _finish_ocr_job(conn, doc_id: int, status: str, error: str = None, progress: float = None):
+    """Zamyka bieżącą próbę OCR dokumentu (jeśli istnieje)."""
+    conn.execute("""
+        UPDATE ocrjob SET status = ?, error = ?, progress = COALESCE(?, progress), finished_at = ?
+        WHERE doc_id = ? AND status = 'running'
+    """, (status, error, progress, datetime.utcnow().isoformat(), doc_id))
+
+
+def start_ocr_job(doc_id: int, info: str, total_pages: int = None) -> None:
+    """
+    Rozpoczyna nową próbę OCR dokumentu.
+
+    Pozostawione otwarte próby (np. po zabiciu procesu) są zamykane jako przerwane.
+    Dokument przechodzi w stan 'running' - jedyny zapis wiersza document na starcie.
+    """
+    now = datetime.utcnow().isoformat()
+
+    try:
+        with raw_connection() as conn:
+            _finish_ocr_job(conn, doc_id, "fail", "Próba przerwana")
+            conn.execute("""
+                INSERT INTO ocrjob (doc_id, attempt, status, progress, progress_info,
+                                    current_page, total_pages, worker_pid, started_at)
+                VALUES (?, (SELECT COUNT(*) + 1 FROM ocrjob WHERE doc_id = ?), 'running', 0.0, ?,
+                        ?, ?, ?, ?)
+            """, (doc_id, doc_id, info, 0 if total_pages else None, total_pages, os.getpid(), now))
+            conn.execute("""
+                UPDATE document SET
+                    ocr_status = 'running', ocr_progress_info = ?, ocr_progress = NULL,
+                    ocr_current_page = NULL, ocr_total_pages = NULL
+                WHERE id = ?
+            """, (info, doc_id))
+            conn.commit()
+    except Exception as e:
+        print(f"❌ [PROCES] Błąd rozpoczynania zadania OCR: {e}")
+
+    event = {"status": "running", "info": info, "progress": 0.0}
+    if total_pages:
+        event.update(current_page=0, total_pages=total_pages)
+    emit_ocr_event(doc_id, **event)
 
 
 def get_document_data(doc_id: int):
     """Pobiera dane dokumentu z bazy."""
-    db_path = get_db_path()
-    with sqlite3.connect(str(db_path)) as conn:
+    with raw_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT stored_filename, original_filename, mime_type, 
@@ -379,52 +596,65 @@ def get_document_data(doc_id: int):
 def update_document_status(doc_id: int, status: str, info: str, progress: float = None,
                           confidence: float = None, current_page: int = None,
                           total_pages: int = None):
-    """Aktualizuje status dokumentu w bazie."""
-    db_path = get_db_path()
+    """
+    Aktualizuje stan OCR dokumentu w bazie.
+
+    Postęp w stanie 'running' trafia tylko do bieżącej próby w tabeli ocrjob.
+    Wiersz document jest zapisywany przy zakończeniu (done/fail) razem
+    z zamknięciem próby.
+    """
+    job_id = None
 
     try:
-        with sqlite3.connect(str(db_path)) as conn:
-            cursor = conn.cursor()
-
-            # Przygotuj zapytanie w zależności od parametrów
-            if progress is not None:
-                if current_page is not None and total_pages is not None:
-                    # Pełny update z postępem i stronami
-                    query = """
-                        UPDATE document SET 
-                            ocr_status = ?, ocr_progress_info = ?, ocr_progress = ?,
-                            ocr_current_page = ?, ocr_total_pages = ?
-                    """
-                    params = [status, info, progress, current_page, total_pages]
-                else:
-                    # Update z postępem ale bez stron
-                    query = """
-                        UPDATE document SET 
-                            ocr_status = ?, ocr_progress_info = ?, ocr_progress = ?
-                    """
-                    params = [status, info, progress]
+        with raw_connection() as conn:
+            if status == "running":
+                fields = {"progress_info": info}
+                if progress is not None:
+                    fields["progress"] = progress
+                    if current_page is not None and total_pages is not None:
+                        fields.update(current_page=current_page, total_pages=total_pages)
+
+                job_id = _open_ocr_job_id(conn, doc_id)
+                if job_id is not None:
+                    assignments = ", ".join(f"{name} = ?" for name in fields)
+                    conn.execute(f"UPDATE ocrjob SET {assignments} WHERE id = ?", [*fields.values(), job_id])
             else:
-                # Podstawowy update bez postępu
-                query = """
-                    UPDATE document SET 
-                        ocr_status = ?, ocr_progress_info = ?
-                """
-                params = [status, info]
-
-            # Dodaj confidence jeśli podane
-            if confidence is not None:
-                query += ", ocr_confidence = ?"
-                params.append(confidence)
-
-            # Dodaj WHERE clause
-            query += " WHERE id = ?"
-            params.append(doc_id)
-
-            cursor.execute(query, params)
+                fields = {"ocr_status": status, "ocr_progress_info": info}
+                if progress is not None:
+                    fields["ocr_progress"] = progress
+                if confidence is not None:
+                    fields["ocr_confidence"] = confidence
+
+                assignments = ", ".join(f"{name} = ?" for name in fields)
+                params = [*fields.values()]
+                if status == "done":
+                    # Liczba stron z zamykanej próby - podgląd dokumentu bez odczytu ocrjob
+                    assignments += """, ocr_current_page = NULL, ocr_total_pages = COALESCE((
+                        SELECT total_pages FROM ocrjob WHERE doc_id = document.id AND status = 'running'
+                        ORDER BY id DESC LIMIT 1), ocr_total_pages)"""
+                conn.execute(f"UPDATE document SET {assignments} WHERE id = ?", [*params, doc_id])
+                _finish_ocr_job(conn, doc_id, status, info if status == "fail" else None, progress)
+
             conn.commit()
 
     except Exception as e:
         print(f"❌ [PROCES] Błąd aktualizacji statusu: {e}")
+        job_id = -1
+
+    if status == "running" and job_id is None:
+        # Wywołanie spoza process_document_sqlite/schedulera - rozpocznij próbę
+        start_ocr_job(doc_id, info, total_pages)
+        return
+
+    # Powiadom subskrybentów SSE - tylko pola faktycznie zmienione powyżej
+    event = {"status": status, "info": info}
+    if progress is not None:
+        event["progress"] = progress
+        if current_page is not None and total_pages is not None:
+            event.update(current_page=current_page, total_pages=total_pages)
+    if confidence is not None:
+        event["confidence"] = confidence
+    emit_ocr_event(doc_id, **event)
 
 
 # ==================== LEGACY COMPATIBILITY ====================
@@ -483,7 +713,13 @@ __all__ = [
     'process_document',
     'process_document_async',
     'update_document_status',
-    'embed_text_in_pdf'
+    'mark_document_cancelled',
+    'start_ocr_job',
+    'emit_ocr_event',
+    'set_event_queue',
+    'embed_text_in_pdf',
+    'join_page_texts',
+    'OCRCancelledError'
 ]
 
 # ==================== POZOSTAŁE FUNKCJE (niezmienione) ====================
@@ -0,0 +1,322 @@
+"""
+Scheduler batchujący strony wielu dokumentów w jednym wywołaniu modelu OCR.
+
+Kolejka małych dokumentów (1-3 strony, typowe dla /quick_ocr) nie wypełnia GPU,
+gdy każdy dokument jest przetwarzany osobno. PageBatchScheduler trzyma kolejkę
+stron ze wszystkich przyjętych dokumentów i składa z nich batche o stałym
+rozmiarze - gdy jeden dokument się kończy, jego miejsce w kolejnym batchu zajmują
+strony następnego. Wynik każdej strony trafia z powrotem do jej dokumentu,
+a dokument jest zapisywany, gdy tylko wszystkie jego strony są gotowe.
+"""
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from app.db import FILES_DIR
+
+from .config import OCR_BATCH_SIZE, logger
+from .models import process_images_to_text
+from .pipeline import (
+    OCRCancelledError,
+    check_cancelled,
+    embed_text_in_pdf,
+    emit_ocr_event,
+    ensure_cuda_cleanup,
+    get_document_data,
+    is_cancel_set,
+    join_page_texts,
+    mark_document_cancelled,
+    save_ocr_results,
+    set_event_queue,
+    start_ocr_job,
+    update_document_status,
+    _stop_callback,
+)
+from .postprocessors import clean_ocr_text, estimate_ocr_confidence
+
+
+def count_document_pages(file_path: Path, mime_type: Optional[str]) -> Optional[int]:
+    """Zwraca liczbę stron dokumentu do OCR (None, gdy nie da się jej ustalić)."""
+    if mime_type and mime_type.startswith("image/"):
+        return 1
+
+    if mime_type == "application/pdf":
+        try:
+            import PyPDF2
+
+            with open(file_path, "rb") as pdf_file:
+                return len(PyPDF2.PdfReader(pdf_file).pages)
+        except Exception as e:
+            logger.warning(f"Nie można odczytać liczby stron {file_path}: {e}")
+
+    return None
+
+
+@dataclass
+class DocumentJob:
+    """Stan jednego dokumentu w schedulerze."""
+    doc_id: int
+    file_path: Path
+    original_filename: str
+    mime_type: Optional[str]
+    sygnatura: Optional[str]
+    step: Optional[str]
+    is_image: bool
+    total_pages: int
+    cancel_event: object = None
+    should_stop: object = None          # CancelPoller - wspólny dla stron dokumentu w batchach
+    next_page: int = 1
+    page_texts: Dict[int, str] = field(default_factory=dict)
+    confidences: Dict[int, float] = field(default_factory=dict)
+
+    @property
+    def pages_left(self) -> int:
+        return self.total_pages - self.next_page + 1
+
+    @property
+    def is_complete(self) -> bool:
+        return len(self.page_texts) == self.total_pages
+
+    def is_cancelled(self) -> bool:
+        return is_cancel_set(self.cancel_event)
+
+
+@dataclass
+class PageTask:
+    """Strona dokumentu przygotowana do OCR."""
+    job: DocumentJob
+    page_number: int
+    image_path: str
+    is_temp: bool
+
+
+class PageBatchScheduler:
+    """
+    Składa batche stron z wielu dokumentów i rozsyła wyniki do dokumentów.
+
+    Dokumenty są obsługiwane w kolejności przyjęcia (FIFO) - batch jest wypełniany
+    stronami najstarszego dokumentu, a wolne miejsca stronami kolejnych.
+    """
+
+    def __init__(self, batch_size: int = OCR_BATCH_SIZE,
+                 process_batch: Callable[..., List[str]] = process_images_to_text):
+        self.batch_size = max(1, batch_size)
+        self.process_batch = process_batch
+        self.jobs: List[DocumentJob] = []
+        self.results: Dict[int, dict] = {}
+
+    # ---------------------------------------------------------------- przyjęcie
+
+    def add_document(self, doc_id: int, cancel_event=None) -> bool:
+        """Przyjmuje dokument do przetwarzania. Zwraca False, gdy nie można go przyjąć."""
+        try:
+            check_cancelled(cancel_event, doc_id)
+
+            doc_data = get_document_data(doc_id)
+            if not doc_data:
+                raise Exception(f"Nie znaleziono dokumentu o ID={doc_id}")
+
+            stored_filename, original_filename, mime_type, content_type, sygnatura, step = doc_data
+
+            file_path = FILES_DIR / stored_filename
+            if not file_path.exists():
+                raise Exception(f"Plik źródłowy nie istnieje: {file_path}")
+
+            is_image = content_type == 'image' or bool(mime_type and mime_type.startswith('image/'))
+            total_pages = 1 if is_image else count_document_pages(file_path, mime_type or "application/pdf")
+            if not total_pages:
+                raise Exception("Nie można ustalić liczby stron dokumentu")
+
+            self.jobs.append(DocumentJob(
+                doc_id=doc_id,
+                file_path=file_path,
+                original_filename=original_filename,
+                mime_type=mime_type,
+                sygnatura=sygnatura,
+                step=step,
+                is_image=is_image,
+                total_pages=total_pages,
+                cancel_event=cancel_event,
+                should_stop=_stop_callback(cancel_event),
+            ))
+
+            start_ocr_job(doc_id, "Oczekiwanie w batchu OCR", total_pages=total_pages)
+            print(f"📥 [SCHEDULER] Przyjęto dokument {doc_id} ({total_pages} stron)")
+            return True
+
+        except OCRCancelledError as e:
+            self._finish_cancelled(doc_id, e)
+        except Exception as e:
+            self._finish_failed(doc_id, e)
+        return False
+
+    # ------------------------------------------------------------------ batche
+
+    def _next_batch(self) -> List[PageTask]:
+        """Pobiera kolejne strony z dokumentów w kolejności przyjęcia."""
+        batch: List[PageTask] = []
+
+        for job in list(self.jobs):
+            try:
+                while job.pages_left > 0 and len(batch) < self.batch_size:
+                    page_number = job.next_page
+                    job.next_page += 1
+                    batch.append(self._prepare_page(job, page_number))
+            except Exception as e:
+                # Błąd renderowania strony - odrzuć cały dokument, pozostałe przetwarzaj dalej
+                self._discard_pages(batch, job)
+                batch = [task for task in batch if task.job is not job]
+                self.jobs.remove(job)
+                self._finish_failed(job.doc_id, e)
+                continue
+            if len(batch) >= self.batch_size:
+                break
+
+        return batch
+
+    @staticmethod
+    def _discard_pages(batch: List[PageTask], job: Optional[DocumentJob] = None):
+        """Usuwa pliki tymczasowe stron (wszystkich lub tylko danego dokumentu)."""
+        for task in batch:
+            if (job is None or task.job is job) and task.is_temp and os.path.exists(task.image_path):
+                os.remove(task.image_path)
+
+    def _prepare_page(self, job: DocumentJob, page_number: int) -> PageTask:
+        """Przygotowuje obraz strony - PDF renderowany jest strona po stronie."""
+        if job.is_image:
+            return PageTask(job, page_number, str(job.file_path), is_temp=False)
+
+        from pdf2image import convert_from_path
+
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp_img:
+            img_path = tmp_img.name
+
+        try:
+            image = convert_from_path(str(job.file_path), dpi=200, first_page=page_number, last_page=page_number)[0]
+            image.save(img_path, "PNG")
+        except Exception:
+            os.remove(img_path)
+            raise
+        return PageTask(job, page_number, img_path, is_temp=True)
+
+    def _drop_cancelled(self):
+        """Usuwa anulowane dokumenty z kolejki stron."""
+        for job in list(self.jobs):
+            if job.is_cancelled():
+                self.jobs.remove(job)
+                self._finish_cancelled(job.doc_id, OCRCancelledError(f"OCR dokumentu {job.doc_id} został anulowany"))
+
+    def run(self) -> Dict[int, dict]:
+        """Przetwarza wszystkie przyjęte dokumenty. Zwraca wyniki per doc_id."""
+        while self.jobs:
+            self._drop_cancelled()
+
+            batch = self._next_batch()
+            if not batch:
+                break
+
+            print(f"🔍 [SCHEDULER] Batch {len(batch)} stron z dokumentów "
+                  f"{sorted({task.job.doc_id for task in batch})}")
+
+            for task in batch:
+                update_document_status(
+                    task.job.doc_id, "running",
+                    f"Przetwarzanie strony {task.page_number}/{task.job.total_pages}",
+                    0.2 + 0.7 * (task.page_number - 1) / task.job.total_pages,
+                    current_page=task.page_number, total_pages=task.job.total_pages
+                )
+
+            try:
+                texts = self.process_batch(
+                    [task.image_path for task in batch],
+                    should_stop=[task.job.should_stop for task in batch],
+                )
+            except Exception as e:
+                texts = [f"[Błąd OCR dla strony {task.page_number}: {str(e)}]" for task in batch]
+            finally:
+                self._discard_pages(batch)
+                ensure_cuda_cleanup()
+
+            for task, page_text in zip(batch, texts):
+                clean_text = clean_ocr_text(page_text)
+                task.job.page_texts[task.page_number] = clean_text
+                task.job.confidences[task.page_number] = estimate_ocr_confidence(clean_text)
+                emit_ocr_event(task.job.doc_id, "page", page=task.page_number, total_pages=task.job.total_pages,
+                               chars=len(clean_text), confidence=task.job.confidences[task.page_number])
+
+            self._drop_cancelled()
+
+            for job in [job for job in self.jobs if job.is_complete]:
+                self.jobs.remove(job)
+                self._finish_document(job)
+
+        return self.results
+
+    # ----------------------------------------------------------------- wyniki
+
+    def _finish_document(self, job: DocumentJob):
+        """Zapisuje wynik dokumentu, którego wszystkie strony są gotowe."""
+        try:
+            pages = [job.page_texts[n] for n in range(1, job.total_pages + 1)]
+            if job.is_image:
+                text_all = pages[0]
+            else:
+                text_all = join_page_texts(pages)
+            confidence = sum(job.confidences.values()) / len(job.confidences)
+
+            if job.mime_type == 'application/pdf':
+                update_document_status(job.doc_id, "running", "Osadzanie tekstu w pliku PDF", 0.95)
+                embed_text_in_pdf(job.file_path, job.doc_id)
+
+            txt_doc_id = save_ocr_results(job.doc_id, text_all, confidence, job.original_filename,
+                                          job.sygnatura, job.step)
+            update_document_status(job.doc_id, "done", "OCR zakończony", 1.0, confidence)
+
+            print(f"✅ [SCHEDULER] OCR zakończony dla {job.doc_id}, txt_doc_id: {txt_doc_id}")
+            self.results[job.doc_id] = {"success": True, "doc_id": job.doc_id, "result_id": txt_doc_id}
+
+        except Exception as e:
+            self._finish_failed(job.doc_id, e)
+
+    def _finish_cancelled(self, doc_id: int, error: Exception):
+        print(f"🛑 [SCHEDULER] {error}")
+        mark_document_cancelled(doc_id)
+        self.results[doc_id] = {"success": False, "cancelled": True, "error": str(error), "doc_id": doc_id}
+
+    def _finish_failed(self, doc_id: int, error: Exception):
+        error_msg = str(error)
+        print(f"❌ [SCHEDULER] Błąd OCR dla {doc_id}: {error_msg}")
+        update_document_status(doc_id, "fail", f"Błąd: {error_msg}", 1.0)
+        self.results[doc_id] = {"success": False, "error": error_msg, "doc_id": doc_id}
+
+
+def process_documents_batch_sync(doc_ids: List[int], cancel_events: Optional[Dict[int, object]] = None,
+                                 event_queue=None) -> dict:
+    """
+    Funkcja dla ProcessPoolExecutor - OCR kilku dokumentów we wspólnych batchach.
+
+    Returns:
+        dict: {"success", "results": {doc_id: wynik jak z process_document_sync}}
+    """
+    cancel_events = cancel_events or {}
+    set_event_queue(event_queue)
+    print(f"🔄 [SCHEDULER] Rozpoczynam batch OCR dla dokumentów {doc_ids}")
+
+    ensure_cuda_cleanup()
+
+    scheduler = PageBatchScheduler()
+    for doc_id in doc_ids:
+        scheduler.add_document(doc_id, cancel_event=cancel_events.get(doc_id))
+
+    try:
+        results = scheduler.run()
+    except Exception as e:
+        # Nieoczekiwany błąd schedulera - dokumenty bez wyniku oznacz jako błąd
+        for job in scheduler.jobs:
+            scheduler._finish_failed(job.doc_id, e)
+        results = scheduler.results
+
+    ensure_cuda_cleanup()
+    return {"success": all(r.get("success") for r in results.values()), "results": results}
@@ -6,19 +6,28 @@ Zawiera całą logikę biznesową przeniesioną z routes/upload.py.
 
 import asyncio
 import uuid
-import shutil
 from pathlib import Path
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime
 
 from fastapi import UploadFile, HTTPException
 from sqlmodel import Session
 
+from app.archive import ensure_restored
+from app.blobs import release_file, store_file, unpin
 from app.db import engine, FILES_DIR
 from app.models import Document
+from app.ingest import analyze_file_in_pool, run_in_ingest_pool, schedule_ingest
+from app.uploads import (
+    ReceivedFile,
+    complete_session,
+    get_session,
+    receive_upload,
+    remove_session,
+    session_lock,
+)
 from app.document_utils import (
-    detect_mime_type,
     check_file_extension,
     get_content_type_from_mime
 )
@@ -33,6 +42,8 @@ class UploadResult:
     error_message: Optional[str] = None
     has_ocr_docs: bool = False
     ocr_count: int = 0
+    duplicate_count: int = 0        # Przesłane pliki mające duplikat w bazie
+    ocr_reused_count: int = 0       # Dokumenty z wynikiem OCR skopiowanym z duplikatu
 
 
 class UploadManager:
@@ -44,46 +55,50 @@ class UploadManager:
         Tworzy nowe opinie z przesłanych plików Word.
         Logika z routes/upload.py -> upload()
         """
-        uploaded_docs = []
+        # Dla opinii akceptujemy tylko pliki Word - sprawdzenie przed zapisem czegokolwiek
+        suffixes = []
+        for file in files:
+            # Sprawdzenie rozszerzenia pliku
+            suffix = check_file_extension(file.filename)
+            if suffix.lower() not in ['.doc', '.docx']:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Opinie muszą być w formacie Word (.doc, .docx). Przesłano: {suffix}"
+                )
+            suffixes.append(suffix)
 
-        with Session(engine) as session:
-            for file in files:
-                # Sprawdzenie rozszerzenia pliku
-                suffix = check_file_extension(file.filename)
-
-                # Dla opinii akceptujemy tylko pliki Word
-                if suffix.lower() not in ['.doc', '.docx']:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Opinie muszą być w formacie Word (.doc, .docx). Przesłano: {suffix}"
-                    )
+        staged = []
+        saved = False
+        try:
+            for file, suffix in zip(files, suffixes):
+                # Zapis strumieniowy (MIME z pierwszego bloku) do magazynu plików
+                staged.append(await UploadManager._store_upload(file, suffix))
 
-                # Generowanie unikalnej nazwy pliku
-                unique_name = f"{uuid.uuid4().hex}{suffix}"
-                dest = FILES_DIR / unique_name
-
-                # Zapisanie pliku
-                with dest.open("wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-
-                # Wykrywanie właściwego MIME typu pliku
-                actual_mime_type = detect_mime_type(dest)
-
-                # Zapisanie do bazy danych jako dokument główny
-                doc = Document(
-                    original_filename=file.filename,
-                    stored_filename=unique_name,
-                    step="k1",  # Nowe opinie zaczynają od k1
-                    ocr_status="none",  # Word nie wymaga OCR
-                    is_main=True,  # Oznacz jako dokument główny
-                    content_type="opinion",
-                    mime_type=actual_mime_type,
-                    doc_type="Opinia",
-                    creator=None  # TODO: current_user gdy będzie system użytkowników
-                )
-                session.add(doc)
+            # Zapisanie do bazy danych jako dokumenty główne - jedna transakcja dla całej partii
+            with Session(engine) as session:
+                docs = []
+                for item in staged:
+                    doc = Document(
+                        original_filename=item["original_filename"],
+                        stored_filename=item["stored_filename"],
+                        step="k1",  # Nowe opinie zaczynają od k1
+                        ocr_status="none",  # Word nie wymaga OCR
+                        is_main=True,  # Oznacz jako dokument główny
+                        content_type="opinion",
+                        mime_type=item["mime_type"],
+                        doc_type="Opinia",
+                        creator=None  # TODO: current_user gdy będzie system użytkowników
+                    )
+                    session.add(doc)
+                    docs.append(doc)
                 session.commit()
-                uploaded_docs.append(doc.id)
+                uploaded_docs = [doc.id for doc in docs]
+            saved = True
+        finally:
+            UploadManager._release_staged(staged, saved)
+
+        # Tekst, metadane i indeks treści nowych opinii (pula procesów w tle)
+        schedule_ingest(uploaded_docs)
 
         # Określ URL przekierowania
         if len(uploaded_docs) == 1:
@@ -100,156 +115,217 @@ class UploadManager:
     @staticmethod
     async def add_documents_to_opinion(
             opinion_id: int,
-            files: List[UploadFile],
+            files: List[Union[UploadFile, ReceivedFile]],
             doc_type: str,
-            run_ocr: bool = False
+            run_ocr: bool = False,
+            reuse_ocr: bool = False
     ) -> UploadResult:
         """
         Dodaje dokumenty do istniejącej opinii.
         Logika z routes/upload.py -> upload_to_opinion()
+
+        Przy reuse_ocr dokument będący duplikatem dokumentu z gotowym OCR
+        otrzymuje kopię jego wyniku zamiast trafiać do kolejki OCR.
+        Plikiem może być też plik złożony z uploadu wznawialnego (ReceivedFile).
         """
         # Sprawdź czy opinia istnieje
         with Session(engine) as session:
             opinion = session.get(Document, opinion_id)
             if not opinion or not opinion.is_main:
                 raise HTTPException(status_code=404, detail="Nie znaleziono opinii")
+            await asyncio.to_thread(ensure_restored, opinion)
 
         uploaded_docs = []
+        ocr_doc_ids = []
+        ocr_copy_ids = []
         has_ocr_docs = False
 
-        # Przetwarzanie wgranych plików
-        for file in files:
-            # Sprawdzenie rozszerzenia pliku
-            suffix = check_file_extension(file.filename)
-
-            # Generowanie unikalnej nazwy pliku
-            unique_name = f"{uuid.uuid4().hex}{suffix}"
-            dest = FILES_DIR / unique_name
-
-            # Zapisanie pliku
-            content = await file.read()
-            with open(dest, "wb") as buffer:
-                buffer.write(content)
-
-            # Wykrywanie właściwego MIME typu pliku
-            actual_mime_type = detect_mime_type(dest)
-
-            # Określanie content_type na podstawie MIME type
-            content_type = get_content_type_from_mime(actual_mime_type)
+        # Zapisz pliki i wykonaj analizę wstępną przed utworzeniem dokumentów
+        staged = await UploadManager._stage_uploads(files)
+        saved = False
+        try:
+            for item in staged:
+                # Jeśli to nowy dokument główny, nie powiązuj go z obecną opinią
+                item["is_main"] = item["content_type"] == "opinion" and doc_type == "Opinia"
+                item["run_ocr"] = run_ocr and item["content_type"] != "opinion"
 
-            # Jeśli to nowy dokument główny, nie powiązuj go z obecną opinią
-            is_main = content_type == "opinion" and doc_type == "Opinia"
-            parent_id = None if is_main else opinion_id
+            # Duplikaty w bazie - przed kolejką OCR (app/duplicates.py)
+            UploadManager._check_duplicates(staged, reuse_ocr)
 
-            # Ustal właściwy status OCR
-            ocr_status = "none"
-            if run_ocr and content_type != "opinion":
-                ocr_status = "pending"
-                has_ocr_docs = True
+            # Kontrola obciążenia kolejki OCR (może odrzucić cały upload)
+            admission = UploadManager._check_ocr_admission([item for item in staged if item["run_ocr"]])
 
-            # Zapisanie do bazy danych
+            # Przetwarzanie wgranych plików - jedna transakcja dla całej partii
             with Session(engine) as session:
                 # Pobierz aktualną opinię dla sygnatura
                 opinion = session.get(Document, opinion_id)
 
-                new_doc = Document(
-                    sygnatura=opinion.sygnatura,
-                    doc_type=doc_type,
-                    original_filename=file.filename,
-                    stored_filename=unique_name,
-                    step="k1" if is_main else opinion.step,
-                    ocr_status=ocr_status,
-                    parent_id=parent_id,
-                    is_main=is_main,
-                    content_type=content_type,
-                    mime_type=actual_mime_type,
-                    creator=None,  # TODO: current_user
-                    upload_time=datetime.now()
-                )
-                session.add(new_doc)
+                for item in staged:
+                    is_main = item["is_main"]
+                    parent_id = None if is_main else opinion_id
+
+                    # Ustal właściwy status OCR
+                    ocr_status = "none"
+                    if item["run_ocr"]:
+                        ocr_status = "pending"
+                        has_ocr_docs = True
+
+                    new_doc = Document(
+                        sygnatura=opinion.sygnatura,
+                        doc_type=doc_type,
+                        original_filename=item["original_filename"],
+                        stored_filename=item["stored_filename"],
+                        step="k1" if is_main else opinion.step,
+                        ocr_status=ocr_status,
+                        ocr_progress_info=UploadManager._initial_ocr_info(ocr_status, admission),
+                        parent_id=parent_id,
+                        is_main=is_main,
+                        content_type=item["content_type"],
+                        mime_type=item["mime_type"],
+                        creator=None,  # TODO: current_user
+                        upload_time=datetime.now(),
+                        file_sha256=item["fingerprint"].sha256,
+                        **item["preflight"]
+                    )
+                    session.add(new_doc)
+                    session.flush()
+                    ocr_copy_id = UploadManager._save_fingerprint(session, new_doc, item)
+                    uploaded_docs.append(new_doc.id)
+                    if ocr_copy_id is not None:
+                        ocr_copy_ids.append(ocr_copy_id)
+                    if ocr_status == "pending" and admission == "admit":
+                        ocr_doc_ids.append(new_doc.id)
                 session.commit()
-                uploaded_docs.append(new_doc.id)
+            saved = True
+        finally:
+            UploadManager._release_staged(staged, saved)
+
+        # Tekst, metadane i indeks treści nowych dokumentów (pula procesów w tle)
+        schedule_ingest(uploaded_docs + ocr_copy_ids)
 
         # Uruchom OCR dla wgranych dokumentów w tle
-        if has_ocr_docs:
-            await UploadManager._enqueue_ocr_documents_nonblocking(uploaded_docs)
+        if ocr_doc_ids:
+            await UploadManager._enqueue_ocr_documents_nonblocking(ocr_doc_ids)
 
         # Przygotuj URL przekierowania z odpowiednim komunikatem
-        redirect_url = f"/opinion/{opinion_id}"
+        duplicate_count = sum(1 for item in staged if item["duplicates"])
+        params = []
         if has_ocr_docs:
-            redirect_url += f"?ocr_started=true&count={len(uploaded_docs)}"
+            params.append(f"ocr_started=true&count={len(uploaded_docs)}")
+        if duplicate_count:
+            params.append(f"duplicates={duplicate_count}&ocr_reused={len(ocr_copy_ids)}")
+        redirect_url = f"/opinion/{opinion_id}"
+        if params:
+            redirect_url += "?" + "&".join(params)
 
         return UploadResult(
             success=True,
             uploaded_doc_ids=uploaded_docs,
             redirect_url=redirect_url,
             has_ocr_docs=has_ocr_docs,
-            ocr_count=len([doc_id for doc_id in uploaded_docs if has_ocr_docs])
+            ocr_count=len([doc_id for doc_id in uploaded_docs if has_ocr_docs]),
+            duplicate_count=duplicate_count,
+            ocr_reused_count=len(ocr_copy_ids)
         )
 
     @staticmethod
-    async def create_quick_ocr_documents(files: List[UploadFile]) -> UploadResult:
+    async def finalize_chunked_upload(upload_id: str) -> UploadResult:
+        """
+        Kończy upload wznawialny (app/uploads.py): sprawdza kompletność i skrót
+        złożonego pliku i dodaje go do opinii jak plik z formularza. Sesja jest
+        usuwana dopiero po zapisaniu dokumentu - po błędzie (np. pełna kolejka
+        OCR) zakończenie można ponowić bez ponownego wysyłania pliku.
+        """
+        get_session(upload_id)
+        async with session_lock(upload_id):
+            upload = get_session(upload_id)     # Mogła zostać zakończona w międzyczasie
+            received = await complete_session(upload)
+            result = await UploadManager.add_documents_to_opinion(
+                opinion_id=upload.opinion_id,
+                files=[received],
+                doc_type=upload.doc_type,
+                run_ocr=upload.run_ocr,
+                reuse_ocr=upload.reuse_ocr
+            )
+            await asyncio.to_thread(remove_session, upload)
+        return result
+
+    @staticmethod
+    async def create_quick_ocr_documents(files: List[UploadFile], reuse_ocr: bool = False) -> UploadResult:
         """
         Tworzy dokumenty dla szybkiego OCR bez wiązania z opinią.
         Logika z routes/upload.py -> quick_ocr()
         """
         uploaded_docs = []
+        ocr_doc_ids = []
+        ocr_copy_ids = []
 
         # Utwórz lub pobierz specjalną "opinię" dla dokumentów niezwiązanych
         special_opinion_id = await UploadManager._get_or_create_unassigned_container()
 
-        # Przetwarzanie wgranych plików
-        for file in files:
-            # Sprawdzenie rozszerzenia pliku
-            suffix = check_file_extension(file.filename)
+        # Ignorujemy pliki Word w szybkim OCR
+        files = [file for file in files if check_file_extension(file.filename).lower() not in ['.doc', '.docx']]
 
-            # Ignorujemy pliki Word w szybkim OCR
-            if suffix.lower() in ['.doc', '.docx']:
-                continue
-
-            # Generowanie unikalnej nazwy pliku
-            unique_name = f"{uuid.uuid4().hex}{suffix}"
-            dest = FILES_DIR / unique_name
+        # Zapisz pliki i wykonaj analizę wstępną przed utworzeniem dokumentów
+        staged = await UploadManager._stage_uploads(files)
+        saved = False
+        try:
+            for item in staged:
+                item["run_ocr"] = True
 
-            # Zapisanie pliku
-            content = await file.read()
-            with open(dest, "wb") as buffer:
-                buffer.write(content)
+            # Duplikaty w bazie - przed kolejką OCR (app/duplicates.py)
+            UploadManager._check_duplicates(staged, reuse_ocr)
 
-            # Wykrywanie właściwego MIME typu pliku
-            actual_mime_type = detect_mime_type(dest)
+            # Kontrola obciążenia kolejki OCR (może odrzucić cały upload)
+            admission = UploadManager._check_ocr_admission([item for item in staged if item["run_ocr"]])
 
-            # Określanie content_type na podstawie MIME type
-            content_type = get_content_type_from_mime(actual_mime_type)
-
-            # Zapisanie do bazy danych
+            # Przetwarzanie wgranych plików - jedna transakcja dla całej partii
             with Session(engine) as session:
-                new_doc = Document(
-                    doc_type="Dokument OCR",
-                    original_filename=file.filename,
-                    stored_filename=unique_name,
-                    step="k1",
-                    ocr_status="pending",  # Automatycznie uruchom OCR
-                    parent_id=special_opinion_id,
-                    is_main=False,
-                    content_type=content_type,
-                    mime_type=actual_mime_type,
-                    creator=None,
-                    upload_time=datetime.now()
-                )
-                session.add(new_doc)
+                for item in staged:
+                    new_doc = Document(
+                        doc_type="Dokument OCR",
+                        original_filename=item["original_filename"],
+                        stored_filename=item["stored_filename"],
+                        step="k1",
+                        ocr_status="pending",  # Automatycznie uruchom OCR
+                        ocr_progress_info=UploadManager._initial_ocr_info("pending", admission),
+                        parent_id=special_opinion_id,
+                        is_main=False,
+                        content_type=item["content_type"],
+                        mime_type=item["mime_type"],
+                        creator=None,
+                        upload_time=datetime.now(),
+                        file_sha256=item["fingerprint"].sha256,
+                        **item["preflight"]
+                    )
+                    session.add(new_doc)
+                    session.flush()
+                    ocr_copy_id = UploadManager._save_fingerprint(session, new_doc, item)
+                    uploaded_docs.append(new_doc.id)
+                    if ocr_copy_id is not None:
+                        ocr_copy_ids.append(ocr_copy_id)
+                    else:
+                        ocr_doc_ids.append(new_doc.id)
                 session.commit()
-                uploaded_docs.append(new_doc.id)
+            saved = True
+        finally:
+            UploadManager._release_staged(staged, saved)
+
+        # Tekst, metadane i indeks treści nowych dokumentów (pula procesów w tle)
+        schedule_ingest(uploaded_docs + ocr_copy_ids)
 
-        # Uruchom OCR dla wszystkich dokumentów
-        await UploadManager._enqueue_ocr_documents_nonblocking(uploaded_docs)
+        # Uruchom OCR dla wszystkich dokumentów (odłożone przyjmie supervisor kolejki)
+        if admission == "admit" and ocr_doc_ids:
+            await UploadManager._enqueue_ocr_documents_nonblocking(ocr_doc_ids)
 
         return UploadResult(
             success=True,
             uploaded_doc_ids=uploaded_docs,
             redirect_url="/documents",
             has_ocr_docs=True,
-            ocr_count=len(uploaded_docs)
+            ocr_count=len(uploaded_docs),
+            duplicate_count=sum(1 for item in staged if item["duplicates"]),
+            ocr_reused_count=len(ocr_copy_ids)
         )
 
     @staticmethod
@@ -323,6 +399,169 @@ class UploadManager:
             else:
                 return special_opinion.id
 
+    @staticmethod
+    async def _stage_uploads(files: List[Union[UploadFile, ReceivedFile]]) -> List[dict]:
+        """Zapisuje pliki partii (_stage_upload); przy błędzie zwalnia już zapisane."""
+        staged = []
+        try:
+            for file in files:
+                staged.append(await UploadManager._stage_upload(file))
+        except BaseException:
+            UploadManager._release_staged(staged, saved=False)
+            raise
+        return staged
+
+    @staticmethod
+    async def _stage_upload(file: Union[UploadFile, ReceivedFile]) -> dict:
+        """
+        Zapisuje przesłany plik w magazynie plików (app/uploads.py, app/blobs.py)
+        i wykonuje jego analizę wstępną oraz sygnatury tekstu do wykrywania
+        duplikatów (w puli procesów).
+        """
+        from app.duplicates import fingerprint_file
+
+        # Sprawdzenie rozszerzenia pliku
+        suffix = check_file_extension(file.filename)
+
+        item = await UploadManager._store_upload(file, suffix)
+        try:
+            preflight, fingerprint = await asyncio.gather(
+                analyze_file_in_pool(item["path"], item["mime_type"]),
+                run_in_ingest_pool(fingerprint_file, item["path"], item["mime_type"], item["sha256"]),
+            )
+        except BaseException:
+            UploadManager._release_staged([item], saved=False)
+            raise
+
+        item.update({
+            # Określanie content_type na podstawie MIME type
+            "content_type": get_content_type_from_mime(item["mime_type"]),
+            "preflight": preflight,
+            "fingerprint": fingerprint,
+        })
+        return item
+
+    @staticmethod
+    async def _store_upload(file: Union[UploadFile, ReceivedFile], suffix: str) -> dict:
+        """
+        Zapisuje plik blokami w wątku (skrót SHA-256 i MIME type przy zapisie)
+        i umieszcza go w magazynie - identyczna zawartość wskazuje istniejący plik.
+        Plik pozostaje przypięty do _release_staged. Plik z uploadu wznawialnego
+        jest już na dysku - zostaje w sesji do zapisania dokumentów.
+        """
+        if isinstance(file, ReceivedFile):
+            upload = file
+            stored = await asyncio.to_thread(store_file, upload.path, upload.sha256, upload.size, True)
+        else:
+            dest = FILES_DIR / f"{uuid.uuid4().hex}{suffix}"
+            upload = await receive_upload(file, dest)
+            try:
+                stored = await asyncio.to_thread(store_file, dest, upload.sha256, upload.size)
+            except BaseException:
+                dest.unlink(missing_ok=True)
+                raise
+        if stored.reused:
+            print(f"🔁 Plik {file.filename} jest już w magazynie: {stored.stored_filename}")
+
+        return {
+            "original_filename": file.filename,
+            "stored_filename": stored.stored_filename,
+            "path": FILES_DIR / stored.stored_filename,
+            "sha256": upload.sha256,
+            "mime_type": upload.mime_type,
+        }
+
+    @staticmethod
+    def _release_staged(staged: List[dict], saved: bool):
+        """
+        Zwalnia pliki partii w magazynie po zapisie dokumentów. Gdy dokumenty
+        nie powstały, usuwa pliki, których nie wskazują inne dokumenty.
+        """
+        unpin(item["stored_filename"] for item in staged)
+        if not saved:
+            for item in staged:
+                release_file(item["stored_filename"])
+
+    @staticmethod
+    def _check_duplicates(staged: List[dict], reuse_ocr: bool):
+        """
+        Szuka w bazie duplikatów przesłanych plików (identyczny plik, podobny tekst).
+        Plik z magazynu z gotowym OCR dla bieżącej konfiguracji modelu (app/blobs.py)
+        nie trafi do kolejki OCR; przy reuse_ocr także plik z duplikatem mającym gotowy OCR.
+        """
+        from app.blobs import find_blob_ocr
+        from app.duplicates import find_duplicates, find_reusable_ocr
+
+        with Session(engine) as session:
+            for item in staged:
+                matches = find_duplicates(session, item["fingerprint"])
+                item["duplicates"] = [match.doc_id for match in matches]
+                item["reuse_ocr_from"] = None
+                if not item["run_ocr"]:
+                    continue
+
+                reusable = find_blob_ocr(session, item["stored_filename"])
+                if reusable is None and reuse_ocr and matches:
+                    reusable = find_reusable_ocr(session, matches, item["preflight"]["page_count"])
+                if reusable is not None:
+                    source, ocr_txt = reusable
+                    item["reuse_ocr_from"] = (source.id, ocr_txt.id)
+                    item["run_ocr"] = False
+
+    @staticmethod
+    def _save_fingerprint(session: Session, doc: Document, item: dict) -> Optional[int]:
+        """
+        Zapisuje sygnatury nowego dokumentu; przy duplikacie wybranym do ponownego
+        użycia OCR kopiuje jego wynik. Zwraca id kopii wyniku OCR (lub None).
+        """
+        from app.duplicates import copy_ocr_result, save_fingerprint
+
+        save_fingerprint(session, doc.id, item["fingerprint"])
+        if item["duplicates"]:
+            print(f"🔁 Dokument {doc.id} ({doc.original_filename}) ma duplikaty: {item['duplicates']}")
+        if item["reuse_ocr_from"] is None:
+            return None
+
+        source_id, ocr_txt_id = item["reuse_ocr_from"]
+        ocr_copy = copy_ocr_result(session, doc, session.get(Document, source_id), session.get(Document, ocr_txt_id))
+        session.flush()
+        return ocr_copy.id
+
+    @staticmethod
+    def _check_ocr_admission(staged: List[dict]) -> str:
+        """
+        Sprawdza, czy kolejka OCR przyjmie nowe dokumenty.
+        Przy odrzuceniu zgłasza HTTP 503 (pliki partii zwalnia wywołujący).
+        """
+        from app.ocr_estimator import check_ocr_admission, estimate_new_documents_seconds
+
+        if not staged:
+            return "admit"
+
+        candidates = [
+            Document(original_filename=item["original_filename"], stored_filename=item["stored_filename"],
+                     step="k1", mime_type=item["mime_type"], **item["preflight"])
+            for item in staged
+        ]
+        admission = check_ocr_admission(estimate_new_documents_seconds(candidates))
+
+        if admission == "reject":
+            raise HTTPException(
+                status_code=503,
+                detail="Kolejka OCR jest przepełniona - spróbuj ponownie później"
+            )
+
+        return admission
+
+    @staticmethod
+    def _initial_ocr_info(ocr_status: str, admission: str) -> Optional[str]:
+        """Początkowa informacja o postępie dla nowego dokumentu."""
+        from app.ocr_estimator import OCR_DEFERRED_INFO
+
+        if ocr_status != "pending":
+            return None
+        return OCR_DEFERRED_INFO if admission == "defer" else "Oczekuje w kolejce"
+
     @staticmethod
     async def _enqueue_ocr_documents_nonblocking(doc_ids: List[int]):
         """
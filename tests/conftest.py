@@ -0,0 +1,28 @@
+# tests/conftest.py
+"""
+Wspólna konfiguracja testów: osobna baza SQLite w katalogu tymczasowym.
+
+Zmienne środowiskowe muszą być ustawione przed pierwszym importem app.db
+(silnik bazy tworzony jest przy imporcie modułu).
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_TEST_DIR = Path(tempfile.mkdtemp(prefix="ocr-app-tests-"))
+os.environ["DB_URL"] = f"sqlite:///{_TEST_DIR / 'test.db'}"
+os.environ.setdefault("OCR_LOG_DIR", str(_TEST_DIR))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """Schemat bazy testowej (migracje jak przy starcie aplikacji)."""
+    from app.db import init_db
+
+    init_db()
@@ -0,0 +1,224 @@
+# tests/test_semantic_index.py
+"""
+Testy wyszukiwania semantycznego (app/semantic_index.py) z lokalnym serwerem
+HTTP w miejscu llama-server - endpoint /embedding zwraca wektory worka słów.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+from sqlmodel import Session, delete
+
+from app import semantic_index, text_extraction
+from app.db import engine
+from app.models import Document, EmbeddingChunk, EmbeddingDocument
+from app.search_index import ContentHit
+
+EMBEDDING_DIM = 64
+
+
+def bag_of_words_vector(text: str) -> list:
+    """Wektor liczności słów (pierwsze 5 liter) - teksty o wspólnych słowach są podobne."""
+    vector = [0.0] * EMBEDDING_DIM
+    for word in re.findall(r"\w+", text.lower()):
+        vector[int(hashlib.md5(word[:5].encode()).hexdigest(), 16) % EMBEDDING_DIM] += 1.0
+    return vector
+
+
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    """Endpoint /embedding w formacie llama-server (lista tekstów lub pojedynczy tekst)."""
+
+    def do_POST(self):
+        if self.path != "/embedding":
+            self.send_error(404)
+            return
+
+        content = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["content"]
+        self.server.requests.append(content)
+        if isinstance(content, list) and not self.server.single_text:
+            payload = [{"index": index, "embedding": [bag_of_words_vector(text)]}
+                       for index, text in enumerate(content)]
+        else:
+            # Starszy serwer - jeden wektor niezależnie od liczby tekstów
+            text = content[0] if isinstance(content, list) else content
+            payload = {"embedding": bag_of_words_vector(text)}
+
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def embedding_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EmbeddingHandler)
+    server.requests = []
+    server.single_text = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def unused_server_url() -> str:
+    """Adres, pod którym nikt nie nasłuchuje (serwer osadzeń niedostępny)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EmbeddingHandler)
+    url = f"http://127.0.0.1:{server.server_port}"
+    server.server_close()
+    return url
+
+
+@pytest.fixture
+def semantic_setup(embedding_server, tmp_path, monkeypatch):
+    """Klient osadzeń wskazujący serwer testowy, pusty plik wektorów i pusty indeks w bazie."""
+    client = semantic_index.EmbeddingClient(f"http://127.0.0.1:{embedding_server.server_port}", timeout=5)
+    monkeypatch.setattr(semantic_index, "embedding_client", client)
+    monkeypatch.setattr(semantic_index, "vector_store",
+                        semantic_index.VectorStore(tmp_path / "chunks.f16", tmp_path / "meta.json"))
+    monkeypatch.setattr(semantic_index, "SEMANTIC_MIN_SCORE", 0.1)
+
+    with Session(engine) as session:
+        session.exec(delete(EmbeddingChunk))
+        session.exec(delete(EmbeddingDocument))
+        session.commit()
+    return client
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    """Tworzy dokumenty o podanej treści (tekst zwracany zamiast magazynu tekstów)."""
+    contents = {}
+
+    def create(*texts):
+        doc_ids = []
+        with Session(engine) as session:
+            for text in texts:
+                doc = Document(original_filename="dokument.txt", stored_filename="dokument.txt", step="k1")
+                session.add(doc)
+                session.commit()
+                contents[doc.id] = text
+                doc_ids.append(doc.id)
+        return doc_ids
+
+    monkeypatch.setattr(text_extraction, "get_document_text_content",
+                        lambda doc, session=None, parse=True: contents.get(doc.id))
+    return create
+
+
+def load_documents(doc_ids):
+    with Session(engine) as session:
+        return [session.get(Document, doc_id) for doc_id in doc_ids]
+
+
+# ==================== KLIENT OSADZEŃ ====================
+
+def test_embed_returns_normalized_vectors_in_batches(semantic_setup, embedding_server):
+    texts = [f"tekst numer {number}" for number in range(semantic_index.EMBEDDING_BATCH_SIZE + 4)]
+
+    vectors = semantic_setup.embed(texts)
+
+    assert vectors.shape == (len(texts), EMBEDDING_DIM)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert [len(request) for request in embedding_server.requests] == [semantic_index.EMBEDDING_BATCH_SIZE, 4]
+
+
+def test_embed_falls_back_to_single_texts_for_older_server(semantic_setup, embedding_server):
+    embedding_server.single_text = True
+
+    vectors = semantic_setup.embed(["biegły sądowy", "wyrok sądu"])
+
+    assert vectors.shape == (2, EMBEDDING_DIM)
+    expected = np.asarray(bag_of_words_vector("wyrok sądu"), dtype=np.float32)
+    assert np.allclose(vectors[1], expected / np.linalg.norm(expected))
+
+
+def test_embed_raises_when_server_is_down():
+    client = semantic_index.EmbeddingClient(unused_server_url(), timeout=5)
+
+    with pytest.raises(semantic_index.EmbeddingError):
+        client.embed(["biegły sądowy"])
+
+
+# ==================== OSADZANIE I WYSZUKIWANIE ====================
+
+def test_embed_document_skips_unchanged_content(semantic_setup, embedding_server, documents):
+    doc_id, = documents("Biegły sądowy stwierdził zaburzenia osobowości badanego. " * 30)
+
+    assert semantic_index.embed_document(doc_id)
+    requests_after_first = len(embedding_server.requests)
+    assert semantic_index.embed_document(doc_id)
+
+    assert len(embedding_server.requests) == requests_after_first
+    with Session(engine) as session:
+        state = session.get(EmbeddingDocument, doc_id)
+        assert state.chunk_count == semantic_index.vector_store.rows() > 1
+
+
+def test_semantic_search_ranks_similar_documents_first(semantic_setup, documents):
+    personality, alimony = documents(
+        "Biegły sądowy stwierdził zaburzenia osobowości badanego. " * 30,
+        "Wyrok sądu okręgowego w sprawie alimentów na rzecz dziecka. " * 30,
+    )
+    for doc_id in (personality, alimony):
+        semantic_index.embed_document(doc_id)
+
+    hits = semantic_index.semantic_search("zaburzenia osobowości stwierdzone przez biegłego")
+
+    assert list(hits)[0] == personality
+    assert list(semantic_index.semantic_search("alimenty na dziecko", [alimony])) == [alimony]
+    assert semantic_index.semantic_search("zaburzenia osobowości", []) == {}
+
+
+# ==================== TRYB HYBRYDOWY ====================
+
+def test_hybrid_content_matches_fuses_rankings(semantic_setup, documents, monkeypatch):
+    keyword_only, both, semantic_only = documents(
+        "Protokół rozprawy bez związku z zapytaniem. " * 30,
+        "Opinia psychiatryczna dotycząca poczytalności oskarżonego. " * 30,
+        "Poczytalność oskarżonego w chwili czynu - opinia psychiatryczna. " * 30,
+    )
+    for doc_id in (keyword_only, both, semantic_only):
+        semantic_index.embed_document(doc_id)
+
+    # Ranking pełnotekstowy: keyword_only przed both, semantic_only bez trafienia
+    keyword_hits = {keyword_only: ContentHit(keyword_only, -2.0, "<mark>opinia</mark>"),
+                    both: ContentHit(both, -1.0, "<mark>opinia</mark>")}
+    monkeypatch.setattr("app.search_index.find_content_matches", lambda term, docs, fuzzy=False, session=None: keyword_hits)
+
+    # Ranking semantyczny: both (treść = zapytanie) przed semantic_only
+    hits = semantic_index.hybrid_content_matches("Opinia psychiatryczna dotycząca poczytalności oskarżonego",
+                                                 load_documents([keyword_only, both, semantic_only]))
+
+    assert list(hits) == [both, keyword_only, semantic_only]
+    assert hits[both].snippet == "<mark>opinia</mark>" and not hits[both].semantic
+    assert hits[semantic_only].semantic and hits[semantic_only].span is not None
+    assert [hit.rank for hit in hits.values()] == sorted(hit.rank for hit in hits.values())
+
+
+def test_hybrid_content_matches_falls_back_to_keyword_results(semantic_setup, documents, monkeypatch):
+    first, second = documents(
+        "Opinia psychiatryczna dotycząca poczytalności oskarżonego. " * 30,
+        "Poczytalność oskarżonego w chwili czynu - opinia psychiatryczna. " * 30,
+    )
+    for doc_id in (first, second):
+        semantic_index.embed_document(doc_id)
+
+    keyword_hits = {second: ContentHit(second, -3.0), first: ContentHit(first, -1.0)}
+    monkeypatch.setattr("app.search_index.find_content_matches", lambda term, docs, fuzzy=False, session=None: keyword_hits)
+    monkeypatch.setattr(semantic_index, "embedding_client", semantic_index.EmbeddingClient(unused_server_url(), timeout=5))
+
+    hits = semantic_index.hybrid_content_matches("opinia psychiatryczna", load_documents([first, second]))
+
+    assert list(hits) == [second, first]
+    assert not any(hit.semantic for hit in hits.values())